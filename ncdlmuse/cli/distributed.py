@@ -0,0 +1,331 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Execution of participant workflows on a Dask cluster.
+
+Each selected T1w file becomes one Dask task that builds and runs the
+single-T1w workflow (:py:func:`~ncdlmuse.workflows.base.init_single_subject_wf`)
+with Nipype's *Linear* plugin on whichever worker picks it up.
+Once every T1w of a participant has finished, an I/O task generates the
+participant's report.
+Results are streamed back to the driver as they complete, and failed tasks
+are retried by the scheduler.
+
+Workers must see the same filesystem paths as the driver (BIDS dataset,
+output and working directories).
+If workers advertise the ``inference`` and ``io`` resources (e.g.,
+``dask worker <address> --nthreads 1 --resources "inference=1,io=4"``),
+segmentation and report tasks are annotated accordingly so the scheduler
+can keep GPUs busy with inference only.
+
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict
+
+from .. import config
+
+#: Resource annotations per task kind, honoured only if the workers advertise them.
+TASK_RESOURCES = {
+    'inference': {'inference': 1},
+    'io': {'io': 1},
+}
+
+# The configuration is a process-wide singleton, so jobs sharing a worker process
+# must not interleave.
+_JOB_LOCK = threading.Lock()
+
+
+def _load_job_config(config_file, t1w_file=None, subject_id=None, session_id=None):
+    """Load the run configuration in a worker and narrow it down to one job."""
+    config.load(config_file)
+    if t1w_file is not None:
+        config.execution.t1w_list = [t1w_file]
+    if subject_id is not None:
+        config.execution.participant_label = [subject_id]
+        config.execution.session_label = [session_id] if session_id else None
+
+
+def segment_t1w(config_file, job):
+    """Build and run the workflow of a single T1w file (inference task).
+
+    Parameters
+    ----------
+    config_file : str
+        The run's configuration file, as written by the driver.
+    job : dict
+        Job description with ``job_id``, ``t1w``, ``subject`` and ``session`` keys.
+
+    Returns
+    -------
+    result : dict
+        The job description, updated with the worker's host name and runtime.
+
+    Raises
+    ------
+    RuntimeError
+        If the workflow could not be built or run, so the scheduler retries the task.
+
+    """
+    import socket
+
+    from .workflow import build_workflow
+
+    with _JOB_LOCK:
+        start = time.time()
+        _load_job_config(config_file, job['t1w'], job['subject'], job['session'])
+        job_config = config.execution.log_dir / f'ncdlmuse_{job["job_id"]}.toml'
+        config.to_filename(job_config)
+
+        retval = build_workflow(str(job_config), {})
+        workflow = retval.get('workflow')
+        if retval.get('return_code', 1) != 0 or workflow is None:
+            raise RuntimeError(f'Could not build the workflow for {job["t1w"]}.')
+
+        workflow.config['execution']['crashdump_dir'] = str(config.execution.log_dir)
+        plugin_args = {}
+        if config.execution.prune_work_dir:
+            from ..utils.workdir import CompletionTracker
+
+            plugin_args['status_callback'] = CompletionTracker(workflow, prune=True)
+        if workflow._get_all_nodes():
+            workflow.run(plugin='Linear', plugin_args=plugin_args)
+
+        return {**job, 'host': socket.gethostname(), 'runtime': time.time() - start}
+
+
+def report_subject(config_file, subject_id):
+    """Generate the individual report of a participant (I/O task)."""
+    from .. import data
+    from ..reports.individual import generate_reports
+
+    with _JOB_LOCK:
+        _load_job_config(config_file)
+        if config.execution.layout is None:
+            config.execution.layout = _make_layout()
+        return generate_reports(
+            subject_list=[subject_id],
+            output_dir=config.execution.ncdlmuse_dir,
+            run_uuid=config.execution.run_uuid,
+            work_dir=config.execution.work_dir,
+            layout=config.execution.layout,
+            bootstrap_file=data.load('reports-spec.yml'),
+        )
+
+
+def _make_layout():
+    """Index the BIDS dataset without validation (the driver validated it already)."""
+    import re
+
+    from bids.layout import BIDSLayout, BIDSLayoutIndexer
+
+    if config.execution.fast_discovery:
+        from ..utils.bids import FastLayout
+
+        return FastLayout(config.execution.bids_dir)
+
+    indexer = BIDSLayoutIndexer(
+        validate=False,
+        ignore=('code', 'stimuli', 'sourcedata', 'models', 'derivatives', re.compile(r'^\.')),
+    )
+    return BIDSLayout(
+        str(config.execution.bids_dir),
+        database_path=config.execution.bids_database_dir,
+        reset_database=config.execution.bids_database_dir is None,
+        indexer=indexer,
+    )
+
+
+def collect_jobs(t1w_list, layout=None):
+    """Describe one job per T1w file."""
+    from ..utils.bids import parse_entities
+    from ..utils.workqueue import job_id_for
+
+    jobs = []
+    for t1w_file in t1w_list:
+        entities = parse_entities(t1w_file, layout=layout)
+        jobs.append(
+            {
+                'job_id': job_id_for(t1w_file),
+                't1w': str(t1w_file),
+                'subject': entities.get('subject'),
+                'session': entities.get('session'),
+            }
+        )
+    return jobs
+
+
+def _advertised_resources(client):
+    """Resource names advertised by *all* workers of the cluster."""
+    workers = client.scheduler_info().get('workers', {}).values()
+    resources = [set(worker.get('resources', {})) for worker in workers]
+    return set.intersection(*resources) if resources else set()
+
+
+def _task_resources(kind, advertised):
+    resources = TASK_RESOURCES[kind]
+    return resources if set(resources) <= advertised else None
+
+
+def run_jobs(client, config_file, jobs, retries=1, segment=segment_t1w, report=report_subject):
+    """Submit one task per job and stream the results back as they complete.
+
+    Parameters
+    ----------
+    client : :py:class:`distributed.Client`
+        A connected Dask client.
+    config_file : str
+        The run's configuration file, readable by all workers.
+    jobs : list of dict
+        As returned by :py:func:`collect_jobs`.
+    retries : int
+        Number of times the scheduler retries a failed task.
+    segment, report : callable
+        Task functions; overridable for testing.
+
+    Returns
+    -------
+    summary : dict
+        Lists of ``succeeded`` and ``failed`` jobs, and of participants whose
+        report could not be generated (``report_failed``).
+
+    """
+    from distributed import as_completed
+
+    advertised = _advertised_resources(client)
+    inference_resources = _task_resources('inference', advertised)
+    io_resources = _task_resources('io', advertised)
+    if inference_resources is None:
+        config.loggers.cli.info(
+            'Dask workers do not advertise "inference"/"io" resources; '
+            'tasks are scheduled without resource annotations.'
+        )
+
+    remaining_by_subject = defaultdict(int)
+    for job in jobs:
+        remaining_by_subject[job['subject']] += 1
+    succeeded_by_subject = defaultdict(int)
+
+    tasks = {}
+    for job in jobs:
+        future = client.submit(
+            segment,
+            config_file,
+            job,
+            key=f'segment-{job["job_id"]}',
+            retries=retries,
+            resources=inference_resources,
+            pure=False,
+        )
+        tasks[future] = ('segment', job)
+
+    summary = {'succeeded': [], 'failed': [], 'report_failed': []}
+    n_jobs = len(jobs)
+    completed = as_completed(list(tasks))
+    for future in completed:
+        kind, item = tasks.pop(future)
+        if kind == 'report':
+            if future.status != 'finished' or future.result() != 0:
+                summary['report_failed'].append(item)
+                config.loggers.cli.warning(f'Report generation failed for sub-{item}.')
+            future.release()
+            continue
+
+        subject_id = item['subject']
+        remaining_by_subject[subject_id] -= 1
+        if future.status == 'finished':
+            result = future.result()
+            summary['succeeded'].append(result)
+            succeeded_by_subject[subject_id] += 1
+            config.loggers.cli.info(
+                f'[{len(summary["succeeded"]) + len(summary["failed"])}/{n_jobs}] '
+                f'Finished {item["t1w"]} on {result.get("host")} '
+                f'in {result.get("runtime", 0):.0f}s.'
+            )
+        else:
+            summary['failed'].append({**item, 'error': repr(future.exception())})
+            config.loggers.cli.error(
+                f'[{len(summary["succeeded"]) + len(summary["failed"])}/{n_jobs}] '
+                f'Failed {item["t1w"]} after {retries + 1} attempt(s): {future.exception()}'
+            )
+        future.release()
+
+        # All T1w files of this participant are done: write the report.
+        if remaining_by_subject[subject_id] == 0 and succeeded_by_subject[subject_id]:
+            report_future = client.submit(
+                report,
+                config_file,
+                subject_id,
+                key=f'report-{subject_id}',
+                retries=retries,
+                resources=io_resources,
+                pure=False,
+            )
+            tasks[report_future] = ('report', subject_id)
+            completed.add(report_future)
+
+    return summary
+
+
+def run_dask_executor():
+    """Run the selected T1w files on a Dask cluster.
+
+    Connects to ``--scheduler-address`` if given, or starts a
+    :py:class:`~distributed.LocalCluster` sized after ``--nprocs`` and
+    ``--omp-nthreads`` otherwise.
+
+    Returns
+    -------
+    int
+        0 if every T1w file was processed and reported successfully, 1 otherwise.
+
+    """
+    try:
+        from distributed import Client, LocalCluster
+    except ImportError:
+        config.loggers.cli.critical(
+            'The Dask executor requires the "distributed" package '
+            '(pip install "ncdlmuse[dask]").'
+        )
+        return 1
+
+    config_file = config.execution.log_dir / 'ncdlmuse.toml'
+    config.to_filename(config_file)
+    jobs = collect_jobs(config.execution.t1w_list or [], layout=config.execution.layout)
+    if not jobs:
+        config.loggers.cli.critical('No T1w files to process.')
+        return 1
+
+    cluster = None
+    if config.execution.scheduler_address:
+        client = Client(config.execution.scheduler_address)
+    else:
+        n_workers = max(1, int(config.nipype.n_procs) // max(1, config.nipype.omp_nthreads or 1))
+        cluster = LocalCluster(
+            n_workers=min(n_workers, len(jobs)),
+            threads_per_worker=1,
+            resources={'inference': 1, 'io': 1},
+            dashboard_address=None,
+        )
+        client = Client(cluster)
+    config.loggers.cli.info(
+        f'Submitting {len(jobs)} T1w job(s) to the Dask scheduler at '
+        f'{client.scheduler.address}.'
+    )
+
+    try:
+        summary = run_jobs(
+            client, str(config_file), jobs, retries=config.execution.executor_retries
+        )
+    finally:
+        client.close()
+        if cluster is not None:
+            cluster.close()
+
+    config.loggers.cli.info(
+        f'Dask execution finished: {len(summary["succeeded"])} succeeded, '
+        f'{len(summary["failed"])} failed, {len(summary["report_failed"])} report(s) failed.'
+    )
+    return 0 if not (summary['failed'] or summary['report_failed']) else 1
@@ -0,0 +1,215 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Native execution of participant workflows with asyncio.
+
+The single-T1w workflow is a small, fixed DAG (segmentation, volumes JSON,
+metadata, sinks and reportlets).
+With ``--executor native``, the workflow built by
+:py:func:`~ncdlmuse.workflows.base.init_ncdlmuse_wf` is flattened exactly as
+:py:meth:`nipype.pipeline.engine.Workflow.run` would, and every node runs as
+an asyncio task once its inputs are ready. Results are kept in memory and
+set as the inputs of downstream nodes, so nodes are not hashed, no result
+files are written or read back, and the scheduler does not poll. Nodes run
+in the process pool still have their interface and result pickled to and
+from the worker:
+
+* NiChart_DLMUSE nodes run in the process pool, at most ``max_segmentations``
+  at a time.
+* Nodes Nipype runs without submitting them (sinks, sidecar metadata) run in
+  the driver process.
+* Other nodes (reportlets, volumes JSON) run in the process pool.
+
+Nodes run the same interfaces in the same working directories as with
+Nipype, so the derivatives are the same. The status callback
+(e.g., :py:class:`~ncdlmuse.utils.workdir.CompletionTracker`) is called as by
+Nipype's plugins. Nodes are not cached: interrupted runs resume at the
+granularity of T1w files (see :py:mod:`ncdlmuse.utils.workdir`).
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from traceback import format_exception
+
+from .. import config
+
+#: Name prefixes of the nodes that run NiChart_DLMUSE or its stages (e.g., ``dlmuse_node_<label>``)
+SEGMENTATION_NODES = ('nichartdlmuse_node', 'dlicv_node', 'dlmuse_node')
+
+
+class _FinishedNode:
+    """A node as seen by a ``status_callback``, with its result held in memory."""
+
+    def __init__(self, node, result):
+        self._node = node
+        self.result = result
+
+    def __getattr__(self, name):
+        return getattr(self._node, name)
+
+
+class _Skipped(Exception):
+    """An upstream node failed."""
+
+
+def exec_graph(workflow):
+    """Flatten ``workflow`` into its execution graph, as Nipype does before running it."""
+    from nipype import config as ncfg
+    from nipype.pipeline.engine.utils import generate_expanded_graph, merge_dict
+
+    flatgraph = workflow._create_flat_graph()
+    workflow.config = merge_dict(deepcopy(ncfg._sections), workflow.config)
+    graph = generate_expanded_graph(deepcopy(flatgraph))
+    for index, node in enumerate(graph.nodes()):
+        node.config = merge_dict(deepcopy(workflow.config), node.config)
+        node.base_dir = workflow.base_dir
+        node.index = index
+    return graph
+
+
+def _run_interface(interface, cwd):
+    """Run a node's interface in its working directory (in a worker process)."""
+    os.makedirs(cwd, exist_ok=True)
+    return interface.run(cwd=cwd)
+
+
+def _set_inputs(graph, node, results):
+    """Set the connected inputs of ``node`` from the results of its predecessors."""
+    from nipype.interfaces.base import Undefined, isdefined
+    from nipype.pipeline.engine.utils import evaluate_connect_function
+
+    for source in graph.predecessors(node):
+        outputs = results[source].outputs
+        for source_info, field in graph.get_edge_data(source, node)['connect']:
+            value = Undefined
+            if isinstance(source_info, tuple):
+                output = getattr(outputs, source_info[0])
+                if isdefined(output):
+                    value = evaluate_connect_function(source_info[1], source_info[2], output)
+            else:
+                try:
+                    value = outputs.trait_get()[source_info]
+                except AttributeError:
+                    value = outputs.dictcopy()[source_info]
+            node.set_input(field, deepcopy(value))
+
+
+async def run_graph(graph, pool, max_segmentations=1, status_callback=None, stop_on_crash=False):
+    """Run the nodes of an execution graph as asyncio tasks.
+
+    Parameters
+    ----------
+    graph : :py:class:`networkx.DiGraph`
+        As returned by :py:func:`exec_graph`.
+    pool : :py:class:`concurrent.futures.Executor`
+        Runs the nodes that are submitted (segmentation and heavier nodes).
+    max_segmentations : int
+        Maximum number of NiChart_DLMUSE nodes running at a time.
+    status_callback : callable or None
+        Called with a node and ``'start'``, ``'end'`` or ``'exception'``.
+    stop_on_crash : bool
+        Cancel the remaining nodes after the first failure.
+
+    Returns
+    -------
+    failed : list
+        The nodes that failed.
+
+    """
+    import networkx as nx
+    from nipype.pipeline.plugins.tools import report_crash
+
+    loop = asyncio.get_running_loop()
+    segmentations = asyncio.Semaphore(max_segmentations)
+    results = {}
+    # Results are released once all successors have their inputs
+    n_consumers = {node: graph.out_degree(node) for node in graph}
+    failed = []
+    tasks = {}
+
+    async def _run(node):
+        upstream = await asyncio.gather(
+            *(tasks[source] for source in graph.predecessors(node)), return_exceptions=True
+        )
+        if any(isinstance(result, BaseException) for result in upstream):
+            raise _Skipped(node.fullname)
+
+        _set_inputs(graph, node, results)
+        for source in graph.predecessors(node):
+            n_consumers[source] -= 1
+            if not n_consumers[source]:
+                results.pop(source, None)
+
+        cwd = node.output_dir()
+        if status_callback is not None:
+            status_callback(node, 'start')
+        try:
+            if node.name.startswith(SEGMENTATION_NODES):
+                async with segmentations:
+                    result = await loop.run_in_executor(pool, _run_interface, node.interface, cwd)
+            elif node.run_without_submitting:
+                result = _run_interface(node.interface, cwd)
+            else:
+                result = await loop.run_in_executor(pool, _run_interface, node.interface, cwd)
+        except Exception as exc:
+            failed.append(node)
+            report_crash(node, traceback=format_exception(exc))
+            if status_callback is not None:
+                status_callback(node, 'exception')
+            if stop_on_crash:
+                for task in tasks.values():
+                    task.cancel()
+            raise
+
+        if n_consumers[node]:
+            results[node] = result
+        if status_callback is not None:
+            status_callback(_FinishedNode(node, result), 'end')
+        return True
+
+    for node in nx.topological_sort(graph):
+        tasks[node] = asyncio.ensure_future(_run(node))
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return failed
+
+
+def run_workflow(workflow, status_callback=None):
+    """Run a participant workflow with the native engine.
+
+    Uses ``--nprocs`` worker processes, and runs up to
+    ``--nprocs // --omp-nthreads`` segmentations at a time.
+
+    Raises
+    ------
+    RuntimeError
+        If any node failed (as Nipype does).
+
+    """
+    graph = exec_graph(workflow)
+    n_procs = max(1, int(config.nipype.n_procs or 1))
+    max_segmentations = max(1, n_procs // max(1, config.nipype.omp_nthreads or 1))
+    mp_context = mp.get_context(config.nipype.plugin_args.get('mp_context'))
+    config.loggers.workflow.info(
+        f'Running {graph.number_of_nodes()} nodes natively with {n_procs} worker processes '
+        f'({max_segmentations} segmentation(s) at a time).'
+    )
+    with ProcessPoolExecutor(max_workers=n_procs, mp_context=mp_context) as pool:
+        failed = asyncio.run(
+            run_graph(
+                graph,
+                pool,
+                max_segmentations=max_segmentations,
+                status_callback=status_callback,
+                stop_on_crash=config.nipype.stop_on_first_crash,
+            )
+        )
+    if failed:
+        raise RuntimeError(
+            f'Workflow did not execute cleanly ({len(failed)} node(s) failed). '
+            'Check log for details'
+        )
@@ -0,0 +1,131 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Run the DLICV or DLMUSE stage with ONNX Runtime (``--backend onnx``).
+
+The :py:class:`~ncdlmuse.interfaces.ncdlmuse.DLICVOnnx` and
+:py:class:`~ncdlmuse.interfaces.ncdlmuse.DLMUSEOnnx` interfaces run this
+module in a subprocess, as :py:class:`~ncdlmuse.interfaces.ncdlmuse.DLICV`
+and :py:class:`~ncdlmuse.interfaces.ncdlmuse.DLMUSE` run the executables:
+every image (``.nii`` or ``.nii.gz``) of the input folder is segmented, and
+written to the output folder with the same name. The output reports the stage and the patches done,
+as the executables do (see :py:mod:`ncdlmuse.utils.progress`).
+
+"""
+
+from __future__ import annotations
+
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+_N_PROGRESS_LINES = 20  # Progress lines printed per image
+_EXTENSIONS = ('.nii.gz', '.nii')
+
+
+def _base_name(path):
+    """Name of ``path`` without its NIfTI extension.
+
+    >>> _base_name(Path('sub-01_T1w.nii'))
+    'sub-01_T1w'
+    """
+    return next(path.name.removesuffix(ext) for ext in _EXTENSIONS if path.name.endswith(ext))
+
+
+def get_parser():
+    """Build the parser of the command line."""
+    from ..utils.onnx import STAGE_MODELS
+
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stage', choices=sorted(STAGE_MODELS))
+    parser.add_argument('-i', dest='in_dir', type=Path, required=True)
+    parser.add_argument('-o', dest='out_dir', type=Path, required=True)
+    parser.add_argument('--onnx_cache', type=Path, required=True)
+    parser.add_argument('--model_folder', type=Path)
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('-step_size', type=float, default=0.5)
+    parser.add_argument('--disable_tta', action='store_true')
+    return parser
+
+
+def _print_progress(index, total):
+    if index == total or index % max(total // _N_PROGRESS_LINES, 1) == 0:
+        print(f'Patches: {index}/{total}', flush=True)
+
+
+def _postprocess_mask(mask_file):
+    """Keep the connected component of the brain, as ``DLICV`` does."""
+    try:
+        import SimpleITK as sitk
+        from DLICV.utils import analyze_connected_components_for_icv
+    except ImportError:
+        print(f'DLICV is not installed: {mask_file.name} is not post-processed.', flush=True)
+        return
+    component, _ = analyze_connected_components_for_icv(sitk.ReadImage(str(mask_file)))
+    if component is not None and component.GetNumberOfPixels() > 10:
+        sitk.WriteImage(component, str(mask_file))
+
+
+def main(argv=None):
+    """Segment the images of a folder with the ONNX graphs of a stage's model."""
+    from functools import partial
+    from tempfile import TemporaryDirectory
+
+    import nibabel as nb
+
+    from ..utils.onnx import STAGE_MODELS, export_predictor, load_predictor, make_session
+    from ..utils.onnx import predict_logits as onnx_logits
+
+    opts = get_parser().parse_args(argv)
+    tool = STAGE_MODELS[opts.stage]['tool']
+    in_files = sorted(path for path in opts.in_dir.iterdir() if path.name.endswith(_EXTENSIONS))
+    if not in_files:
+        print(f'No images found in {opts.in_dir}.', file=sys.stderr)
+        return 1
+    opts.out_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f'Running {tool} with ONNX Runtime on {len(in_files)} image(s)', flush=True)
+    predictor = load_predictor(
+        opts.stage, opts.model_folder, step_size=opts.step_size, disable_tta=opts.disable_tta
+    )
+    graphs = export_predictor(predictor, opts.stage, opts.model_folder, opts.onnx_cache)
+    predicts = [make_session(graph, opts.threads) for graph in graphs]
+    # nnU-Net preprocesses and exports as usual; only the logits come from ONNX Runtime
+    predictor.predict_logits_from_preprocessed_data = partial(
+        onnx_logits, predictor, predicts, progress=_print_progress
+    )
+    file_ending = predictor.dataset_json['file_ending']
+    with TemporaryDirectory() as tmp_dir:
+        # nnU-Net reads and writes images with the file ending of the model's dataset
+        images = []
+        for in_file in in_files:
+            image = in_file
+            if not in_file.name.endswith(file_ending):
+                image = Path(tmp_dir) / f'{_base_name(in_file)}{file_ending}'
+                nb.load(in_file).to_filename(image)
+            images.append(image)
+        predictor.predict_from_files(
+            [[str(image)] for image in images],
+            [str(opts.out_dir / _base_name(in_file)) for in_file in in_files],
+            save_probabilities=False,
+            overwrite=True,
+            num_processes_preprocessing=1,
+            num_processes_segmentation_export=1,
+        )
+
+    for in_file in in_files:
+        out_file = opts.out_dir / in_file.name
+        written = opts.out_dir / f'{_base_name(in_file)}{file_ending}'
+        if written != out_file and written.is_file():
+            nb.load(written).to_filename(out_file)
+            written.unlink()
+        if not out_file.is_file():
+            print(f'{tool} wrote no output for {in_file.name}.', file=sys.stderr)
+            return 1
+        if opts.stage == 'dlicv':
+            _postprocess_mask(out_file)
+        print(f'done with {in_file.name}', flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
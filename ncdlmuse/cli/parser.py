@@ -5,6 +5,7 @@ import logging
 import logging.handlers
 import re
 import sys
+import time
 from argparse import Action
 from pathlib import Path
 
@@ -95,6 +96,11 @@ def _to_gb(value):
     return digits_float * scale[unit_char]
 
 
+def _timeout(value):
+    """Parse a timeout in seconds, or 'auto' to estimate it."""
+    return 'auto' if str(value).lower() == 'auto' else float(value)
+
+
 def _drop_sub(value):
     """Remove 'sub-' prefix if present."""
     return value[4:] if isinstance(value, str) and value.startswith('sub-') else value
@@ -166,6 +172,8 @@ def _build_parser():
     from functools import partial
 
     from ncdlmuse.cli.version import check_latest, is_flagged
+    from ncdlmuse.utils.profiles import INFERENCE_PROFILES
+    from ncdlmuse.utils.selection import SELECTION_POLICIES
 
     verstr = f'NCDLMUSE v{config.environment.version}'
     currentv = Version(config.environment.version)
@@ -263,6 +271,56 @@ def _build_parser():
         default=False,
         help='Assume the input dataset is BIDS compliant and skip the validation.',
     )
+    g_bids.add_argument(
+        '--fast-discovery',
+        action='store_true',
+        default=False,
+        help=(
+            'Find T1w files by walking sub-*/[ses-*/]anat/ in parallel instead of indexing '
+            'the dataset with PyBIDS (much faster on large datasets). Only for well-formed '
+            'datasets: BIDS validation is skipped.'
+        ),
+    )
+    g_bids.add_argument(
+        '--skip-preflight',
+        action='store_true',
+        default=False,
+        help=(
+            'Skip the pre-flight checks of the T1w inputs (header sanity), which otherwise '
+            'exclude unsuitable files (or quarantine them with --quarantine) before the '
+            'workflow is built.'
+        ),
+    )
+    g_bids.add_argument(
+        '--full-preflight',
+        action='store_true',
+        default=False,
+        help=(
+            'Also check the integrity of the compressed T1w inputs during the pre-flight '
+            'checks, by decompressing every .nii.gz file in full (slow on large datasets).'
+        ),
+    )
+    g_bids.add_argument(
+        '--t1w-selection',
+        choices=SELECTION_POLICIES,
+        default='all',
+        help=(
+            'Which T1w file(s) to process in sessions with several runs or acquisitions: '
+            'all of them (default), the first in BIDS order, the highest resolution, the '
+            'largest SNR proxy (voxel volume, number of averages and pixel bandwidth), or '
+            'the latest run. Scans are ranked from their headers and JSON sidecars.'
+        ),
+    )
+    g_bids.add_argument(
+        '--deduplicate-inputs',
+        action='store_true',
+        default=False,
+        help=(
+            'Detect voxel-identical T1w inputs (symlinks, re-exported or recompressed copies) '
+            'and segment each only once; duplicates reuse the outputs of the first of them. '
+            'Fingerprints are cached in <output_dir>/logs/fingerprints.json.'
+        ),
+    )
     g_bids.add_argument(
         '--bids-database-dir',
         metavar='PATH',
@@ -328,11 +386,99 @@ def _build_parser():
         default=False,
         help='Disable Test-Time Augmentation during inference.',
     )
+    g_dlmuse.add_argument(
+        '--inference-profile',
+        dest='dlmuse_inference_profile',
+        choices=list(INFERENCE_PROFILES),
+        help=(
+            "Trade segmentation accuracy for throughput: accurate (the tools' defaults), "
+            'balanced (coarser sliding window), fast (no test-time augmentation) or preview '
+            '(both, and no reportlet mosaics). Defaults to accurate, or preview with --sloppy. '
+            'Profiles with a coarser sliding window require --split-stages.'
+        ),
+    )
+    g_dlmuse.add_argument(
+        '--adaptive-tta',
+        dest='dlmuse_adaptive_tta',
+        action='store_true',
+        default=False,
+        help=(
+            'Segment every T1w file without test-time augmentation, and again with it only '
+            'if fast QC checks (mask/segmentation consistency, missing labels, implausible '
+            'volumes) flag the result. The decision is recorded in the volumes JSON.'
+        ),
+    )
+    g_dlmuse.add_argument(
+        '--qc-norms',
+        dest='dlmuse_qc_norms',
+        metavar='FILE',
+        type=IsFile,
+        help=(
+            'TSV file of cohort norms of ROI volumes (columns ROI, mean and std of the volume '
+            'as a fraction of the ICV) checked by --adaptive-tta.'
+        ),
+    )
     g_dlmuse.add_argument(
         '--clear-cache',
         action='store_true',
         default=False,
-        help='Clear the NiChart_DLMUSE model download cache before running.',
+        help=(
+            'Clear the DLICV and DLMUSE model caches and download the models again, '
+            'once for the whole run (with --work-queue, once for the whole queue), before any '
+            'T1w file is processed.'
+        ),
+    )
+    g_dlmuse.add_argument(
+        '--split-stages',
+        dest='dlmuse_split_stages',
+        action='store_true',
+        default=False,
+        help=(
+            'Run the DLICV (skull-stripping) and DLMUSE (parcellation) executables as '
+            'separate workflow nodes instead of NiChart_DLMUSE, so the stages of different '
+            'T1w files overlap and DLICV results are cached on their own.'
+        ),
+    )
+    g_dlmuse.add_argument(
+        '--compare-models',
+        dest='dlmuse_extra_models',
+        action=ToDict,
+        metavar='LABEL=PATH',
+        nargs='+',
+        help=(
+            'Additional DLMUSE model folders to run on every T1w file, sharing its DLICV '
+            'mask (implies --split-stages). The outputs of each are written with its '
+            'label (e.g., DLMUSEv2=/models/v2 writes seg-DLMUSEv2).'
+        ),
+    )
+    g_dlmuse.add_argument(
+        '--backend',
+        dest='dlmuse_backend',
+        choices=['pytorch', 'onnx'],
+        default='pytorch',
+        help=(
+            'Inference backend of DLICV and DLMUSE. "onnx" (CPU only; implies --split-stages) '
+            'exports the models to ONNX once, caches the graphs and runs the sliding-window '
+            'inference with ONNX Runtime, which is faster than PyTorch on CPU-only nodes. '
+            'Requires onnx, onnxruntime and nnunetv2.'
+        ),
+    )
+    g_dlmuse.add_argument(
+        '--onnx-threads',
+        dest='dlmuse_onnx_threads',
+        metavar='N',
+        type=PositiveInt,
+        help='Intra-op threads of each ONNX Runtime session (default: --omp-nthreads).',
+    )
+    g_dlmuse.add_argument(
+        '--onnx-cache',
+        dest='onnx_cache_dir',
+        metavar='PATH',
+        type=Path,
+        help=(
+            'Directory of the ONNX graphs exported by --backend onnx, reused by later runs '
+            '(default: <work_dir>/onnx_cache).'
+        ),
     )
 
     # --- Performance Options ---
@@ -368,6 +514,14 @@ def _build_parser():
         action='store_true',
         help='Attempt to reduce memory usage (will increase disk usage in working directory).',
     )
+    g_perfm.add_argument(
+        '--warm-workers',
+        action='store_true',
+        help=(
+            'Import Nipype, NiWorkflows and the NCDLMUSE interfaces once in the forkserver, '
+            'so worker processes start warm instead of re-importing them.'
+        ),
+    )
     g_perfm.add_argument(
         '--use-plugin',
         '--nipype-plugin-file',
@@ -398,11 +552,221 @@ def _build_parser():
         default=False,
         help='Force stopping on first crash, even if a work directory was specified.',
     )
+    g_perfm.add_argument(
+        '--quarantine',
+        action='store_true',
+        default=False,
+        help=(
+            'Do not let failing T1w files stop the run: record them (with pointers to their '
+            'crash files) under <output_dir>/logs/quarantine, keep processing the rest, and '
+            'generate reports for the participants that succeeded.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--retry-failed',
+        action='store_true',
+        default=False,
+        help=(
+            'Only process the T1w files quarantined by previous --quarantine runs '
+            '(implies --quarantine).'
+        ),
+    )
+    g_perfm.add_argument(
+        '--drain-grace',
+        metavar='SECONDS',
+        type=int,
+        default=90,
+        help=(
+            'On SIGTERM (e.g., Slurm preemption or spot instance reclamation), stop starting '
+            'new T1w files, give running NiChart_DLMUSE jobs this many seconds to finish, '
+            'write the derivatives and completion manifests of finished T1w files, and exit '
+            'with code 143. A resumed run skips the completed T1w files. '
+            'A second SIGTERM exits immediately.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--scratch-dir',
+        metavar='PATH',
+        type=Path,
+        help=(
+            'Node-local scratch directory. The working directory and all derivatives are '
+            'written there, and only the final derivatives are staged out to the output '
+            'directory once participants finish; the scratch copy is then discarded. '
+            'Overrides --work-dir. Logs are still written to the output directory.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--stage-out',
+        action='store',
+        choices=['copy', 'tar'],
+        default='copy',
+        help=(
+            'How derivatives are staged out of --scratch-dir: merged into the output '
+            'directory ("copy") or written as one tar archive per stage-out under '
+            '<output_dir>/shards ("tar").'
+        ),
+    )
+    g_perfm.add_argument(
+        '--model-cache',
+        dest='model_cache_dir',
+        metavar='PATH',
+        type=Path,
+        help=(
+            'Directory (e.g., node-local fast storage) the DLICV and DLMUSE models are copied '
+            'to, once per run and after checking their checksums. The copy is read-only and '
+            'shared by all workers, and runs using the same directory reuse it.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--dlmuse-timeout',
+        metavar='SECONDS|auto',
+        type=_timeout,
+        help=(
+            'Wall-time limit of each NiChart_DLMUSE attempt (no limit by default). With '
+            '"auto", a generous limit is estimated from the image size, device and TTA '
+            'setting.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--dlmuse-inactivity-timeout',
+        metavar='SECONDS',
+        type=float,
+        help=(
+            'Kill NiChart_DLMUSE (and its children) if it prints nothing for this long '
+            '(disabled by default). nnU-Net may print nothing for long periods on slow CPUs, '
+            'so leave a wide margin (e.g., 3600).'
+        ),
+    )
+    g_perfm.add_argument(
+        '--dlmuse-retries',
+        metavar='N',
+        type=int,
+        default=0,
+        help=(
+            'Number of times a failed, timed-out or hung NiChart_DLMUSE run is retried, '
+            'with exponential backoff (default: 0, failures are not retried).'
+        ),
+    )
+    g_perfm.add_argument(
+        '--progress-interval',
+        metavar='SECONDS',
+        type=int,
+        default=60,
+        help=(
+            'Seconds between "N of M done, ETA" progress lines. Per-T1w progress is '
+            'published under <log_dir>/status and aggregated into <log_dir>/status.json. '
+            'Set to 0 to disable.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--work-dir-layout',
+        action='store',
+        choices=['flat', 'hashed'],
+        default='flat',
+        help=(
+            'Layout of the per-T1w working directories. "hashed" nests them in a shallow '
+            'hashed fan-out (<work_dir>/ncdlmuse_wf/ab/cd/single_subject_*_wf), which keeps '
+            'directory lookups fast on shared filesystems for cohorts of thousands of T1w '
+            'files.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--prune-work-dir',
+        action='store_true',
+        default=False,
+        help=(
+            'Remove the working directory of each T1w as soon as its derivatives and '
+            'reportlets are written, keeping only a small completion manifest. '
+            'Completed T1w files are skipped when the run is resumed.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--prefetch-dir',
+        metavar='PATH',
+        type=Path,
+        help=(
+            'Node-local scratch directory where upcoming T1w files are copied in the '
+            'background while the current ones are segmented. Useful when the BIDS '
+            'dataset lives on slow (e.g., network) storage.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--prefetch-depth',
+        metavar='N',
+        type=PositiveInt,
+        default=2,
+        help='Maximum number of prefetched T1w files waiting to be processed.',
+    )
+    g_perfm.add_argument(
+        '--prefetch-size',
+        metavar='SIZE',
+        type=_to_gb,
+        help='Maximum total size of prefetched T1w files waiting to be processed (e.g., 2G).',
+    )
+    g_perfm.add_argument(
+        '--executor',
+        action='store',
+        choices=['nipype', 'native', 'dask'],
+        default='nipype',
+        help=(
+            'Execution backend. "nipype" runs all T1w files in one Nipype workflow with the '
+            'configured plugin; "native" runs the same workflow as asyncio tasks, passing '
+            'results in memory (no node caching); "dask" submits one task per T1w file to a '
+            'Dask cluster.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--scheduler-address',
+        metavar='ADDRESS',
+        action='store',
+        help=(
+            'Address of the Dask scheduler (e.g., tcp://10.0.0.1:8786) for --executor dask. '
+            'A local cluster is started if not given.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--executor-retries',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Number of times a failed per-T1w task is retried by the dask executor.',
+    )
+    g_perfm.add_argument(
+        '--work-queue',
+        metavar='PATH',
+        type=Path,
+        help=(
+            'Pull T1w jobs from a queue directory on a shared filesystem instead of '
+            'processing the whole selection in one workflow. Any number of ncdlmuse '
+            'workers (on any node) can be pointed at the same queue; the queue is '
+            'populated with the selected T1w files on first use.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--queue-lease',
+        metavar='SECONDS',
+        type=PositiveInt,
+        default=600,
+        help=(
+            'Seconds without a heartbeat after which a claimed queue job is considered '
+            'abandoned and returned to the queue.'
+        ),
+    )
+    g_perfm.add_argument(
+        '--queue-max-attempts',
+        metavar='N',
+        type=PositiveInt,
+        default=3,
+        help='Number of times a queue job may be attempted before it is marked as failed.',
+    )
     g_perfm.add_argument(
         '--sloppy',
         action='store_true',
         default=False,
-        help='Run in sloppy mode (lower quality checks, faster processing) - TESTING ONLY',
+        help=(
+            'Run in sloppy mode (lower quality checks, faster processing; the preview '
+            'inference profile unless --inference-profile is given) - TESTING ONLY'
+        ),
     )
 
     # --- Workflow Subset Options ---
@@ -575,8 +939,65 @@ def parse_args(args=None, namespace=None):
         config.workflow.dlmuse_muse_roi_mappings_file = cli_vars['dlmuse_muse_roi_mappings_file']
     # Booleans are always present in cli_vars (True/False), so update directly
     config.workflow.dlmuse_all_in_gpu = cli_vars['all_in_gpu']
-    config.workflow.dlmuse_disable_tta = cli_vars['disable_tta']
     config.workflow.dlmuse_clear_cache = cli_vars['clear_cache']
+    # Inference profile (--disable-tta disables TTA whatever the profile)
+    from ..utils.profiles import DEFAULT_PROFILE, DEFAULT_STEP_SIZE, get_profile
+
+    explicit_profile = config.workflow.dlmuse_inference_profile is not None
+    if not explicit_profile:
+        config.workflow.dlmuse_inference_profile = 'preview' if opts.sloppy else DEFAULT_PROFILE
+    profile = get_profile(config.workflow.dlmuse_inference_profile)
+    config.workflow.dlmuse_disable_tta = cli_vars['disable_tta'] or profile['disable_tta']
+    # Leave the tools' default step out of their command lines (and node hashes)
+    config.workflow.dlmuse_step_size = (
+        profile['step_size'] if profile['step_size'] != DEFAULT_STEP_SIZE else None
+    )
+    config.workflow.dlmuse_reportlets = profile['reportlets']
+    if config.workflow.dlmuse_adaptive_tta:
+        if cli_vars['disable_tta']:
+            parser.error('--adaptive-tta cannot be combined with --disable-tta.')
+        # The first run is without TTA whatever the profile, and flagged ones run with it
+        config.workflow.dlmuse_disable_tta = False
+    elif config.workflow.dlmuse_qc_norms:
+        parser.error('--qc-norms requires --adaptive-tta.')
+    if config.workflow.dlmuse_extra_models:
+        for label, model_folder in config.workflow.dlmuse_extra_models.items():
+            if not label.isalnum() or label == 'DLMUSE':
+                parser.error(
+                    f'Invalid --compare-models label <{label}>: labels must be alphanumeric '
+                    'and differ from DLMUSE.'
+                )
+            if not model_folder.is_dir():
+                parser.error(f'Model folder does not exist: <{model_folder}>.')
+        # The models share the DLICV stage
+        config.workflow.dlmuse_split_stages = True
+    if config.workflow.dlmuse_backend == 'onnx':
+        if config.workflow.dlmuse_device != 'cpu':
+            parser.error('--backend onnx only runs on the CPU (--device cpu).')
+        if config.workflow.dlmuse_adaptive_tta:
+            parser.error('--adaptive-tta cannot be combined with --backend onnx.')
+        # NiChart_DLMUSE runs the models in one process; the stages run them with ONNX Runtime
+        config.workflow.dlmuse_split_stages = True
+    elif config.workflow.dlmuse_onnx_threads or config.execution.onnx_cache_dir:
+        parser.error('--onnx-threads and --onnx-cache require --backend onnx.')
+    if config.workflow.dlmuse_step_size is not None and not config.workflow.dlmuse_split_stages:
+        # Only the DLICV and DLMUSE executables take the step of the sliding window
+        if explicit_profile:
+            parser.error(
+                f'--inference-profile {config.workflow.dlmuse_inference_profile} changes the '
+                'sliding-window step, which requires --split-stages.'
+            )
+        config.loggers.cli.warning(
+            '--sloppy: keeping the default sliding-window step, which can only be changed '
+            'with --split-stages.'
+        )
+        config.workflow.dlmuse_step_size = None
+    if config.workflow.dlmuse_split_stages and config.workflow.dlmuse_derived_roi_mappings_file:
+        # Derived ROIs are read from the ROI list of the package with split stages
+        parser.error('--derived-roi-map cannot be combined with --split-stages.')
+    if config.workflow.dlmuse_split_stages and config.workflow.dlmuse_adaptive_tta:
+        # The QC checks run within NiChart_DLMUSE, on its final segmentation
+        parser.error('--adaptive-tta cannot be combined with --split-stages or --compare-models.')
 
     # --- Resolve and Finalize Paths ---
     # BIDS Dir (required, checked by PathExists in parser)
@@ -612,6 +1033,29 @@ def parse_args(args=None, namespace=None):
         config.execution.work_dir.mkdir(exist_ok=True, parents=True)
         build_log.info(f'Using working directory: {config.execution.work_dir}')
 
+        if config.execution.prefetch_dir:
+            config.execution.prefetch_dir = Path(config.execution.prefetch_dir).resolve()
+            config.execution.prefetch_dir.mkdir(exist_ok=True, parents=True)
+        if config.execution.model_cache_dir:
+            config.execution.model_cache_dir = Path(config.execution.model_cache_dir).resolve()
+        if config.workflow.dlmuse_backend == 'onnx':
+            config.execution.onnx_cache_dir = Path(
+                config.execution.onnx_cache_dir or config.execution.work_dir / 'onnx_cache'
+            ).resolve()
+
+        if config.execution.work_queue:
+            if config.execution.executor == 'dask':
+                parser.error('--work-queue cannot be combined with --executor dask.')
+            config.execution.work_queue = Path(config.execution.work_queue).resolve()
+            build_log.info(f'Pulling T1w jobs from work queue: {config.execution.work_queue}')
+
+        if config.execution.retry_failed:
+            config.execution.quarantine = True
+        if config.execution.quarantine:
+            if opts.stop_on_first_crash:
+                parser.error('--stop-on-first-crash cannot be combined with --quarantine.')
+            config.nipype.stop_on_first_crash = False
+
         # --- Log Dir & File Logging Setup ---
         log_dir_base = config.execution.ncdlmuse_dir / 'logs'
         run_uuid = config.execution.run_uuid  # Ensure run_uuid is accessed/initialized
@@ -631,6 +1075,25 @@ def parse_args(args=None, namespace=None):
         config.execution.log_dir.mkdir(exist_ok=True, parents=True)  # Create log_dir
         _setup_logging(log_level)  # Setup file-based logging into log_dir
 
+        # --- Node-local scratch (logs stay on the shared output directory) ---
+        if config.execution.scratch_dir:
+            from ..utils.scratch import scratch_root
+
+            if config.execution.executor == 'dask':
+                parser.error('--scratch-dir is not supported with --executor dask.')
+            if opts.work_dir:
+                build_log.warning('--scratch-dir overrides --work-dir.')
+            config.execution.scratch_dir = Path(config.execution.scratch_dir).resolve()
+            run_scratch = scratch_root(config.execution.scratch_dir, run_uuid)
+            config.execution.work_dir = run_scratch / 'work'
+            config.execution.ncdlmuse_dir = run_scratch / 'derivatives'
+            config.execution.work_dir.mkdir(exist_ok=True, parents=True)
+            config.execution.ncdlmuse_dir.mkdir(exist_ok=True, parents=True)
+            build_log.info(
+                f'Running in node-local scratch {run_scratch}; derivatives will be staged '
+                f'out to {config.execution.output_dir} ({config.execution.stage_out}).'
+            )
+
         # --- Nipype Configuration ---
         nipype_settings = {
             'logging': {
@@ -695,7 +1158,7 @@ def parse_args(args=None, namespace=None):
     # --- Validate BIDS Dataset and Select Subjects/Sessions ---
     if config.execution.analysis_level != 'group':
         if not config.execution.skip_bids_validation or not config.execution.layout:
-            from bids.layout import BIDSLayout, BIDSLayoutIndexer
+            from bids.layout import BIDSLayout
 
             build_log.info(f'Found BIDS dataset at: {config.execution.bids_dir}')
             # Check for dataset_description.json before creating layout
@@ -734,18 +1197,33 @@ def parse_args(args=None, namespace=None):
             )
 
             try:
-                # Create BIDSLayoutIndexer with validation and ignore settings
-                bids_indexer = BIDSLayoutIndexer(
-                    validate=bids_validate,
-                    ignore=ignore_patterns,
-                )
-                layout = BIDSLayout(
-                    root=str(config.execution.bids_dir),
-                    # Set database_path=None and reset_database=True for in-memory/fresh index
-                    database_path=None,
-                    indexer=bids_indexer,  # Pass the configured indexer
-                    reset_database=True,  # Force fresh index
-                )
+                if config.execution.fast_discovery:
+                    from ..utils.bids import FastLayout
+
+                    start = time.perf_counter()
+                    layout = FastLayout(config.execution.bids_dir)
+                    build_log.info(
+                        f'Fast discovery (no PyBIDS indexing or validation) took '
+                        f'{time.perf_counter() - start:.1f}s.'
+                    )
+                else:
+                    from ..utils.validation import VALIDATION_CACHE, CachedValidationIndexer
+
+                    # Validation verdicts are cached next to the database, or in the work dir
+                    cache_dir = config.execution.bids_database_dir or config.execution.work_dir
+                    # Create BIDSLayoutIndexer with validation and ignore settings
+                    bids_indexer = CachedValidationIndexer(
+                        cache_file=Path(cache_dir) / VALIDATION_CACHE,
+                        validate=bids_validate,
+                        ignore=ignore_patterns,
+                    )
+                    layout = BIDSLayout(
+                        root=str(config.execution.bids_dir),
+                        # Set database_path=None and reset_database=True for in-memory index
+                        database_path=None,
+                        indexer=bids_indexer,  # Pass the configured indexer
+                        reset_database=True,  # Force fresh index
+                    )
                 config.execution.layout = layout  # Store layout in config
 
             except (bids.exceptions.PyBIDSException, OSError, ValueError) as e:
@@ -809,11 +1287,15 @@ def parse_args(args=None, namespace=None):
     if config.execution.analysis_level != 'group':
         if config.execution.layout:
             try:
-                config.execution.t1w_list = config.execution.layout.get(
-                    suffix='T1w',
-                    extension=['.nii', '.nii.gz'],
-                    return_type='file',
-                )
+                t1w_query = {
+                    'subject': config.execution.participant_label,
+                    'suffix': 'T1w',
+                    'extension': ['.nii', '.nii.gz'],
+                    'return_type': 'file',
+                }
+                if config.execution.session_label:
+                    t1w_query['session'] = config.execution.session_label
+                config.execution.t1w_list = config.execution.layout.get(**t1w_query)
 
                 if not config.execution.t1w_list:
                     err_msg = (
@@ -831,6 +1313,42 @@ def parse_args(args=None, namespace=None):
             except (bids.exceptions.PyBIDSException, ValueError) as e:
                 build_log.critical(f'Error querying BIDS layout for T1w files: {e}')
                 sys.exit(1)
+
+            if config.execution.retry_failed:
+                from ..utils.quarantine import load_failures, quarantine_dir
+
+                quarantined = {
+                    str(Path(record['t1w']).absolute())
+                    for record in load_failures(config.execution.output_dir)
+                }
+                config.execution.t1w_list = [
+                    f for f in config.execution.t1w_list if str(Path(f).absolute()) in quarantined
+                ]
+                if not config.execution.t1w_list:
+                    parser.error(
+                        'No quarantined T1w files to retry for the selected participants in '
+                        f'{quarantine_dir(config.execution.output_dir)}.'
+                    )
+                build_log.info(
+                    f'Retrying {len(config.execution.t1w_list)} quarantined T1w file(s).'
+                )
+
+            if not config.execution.skip_preflight:
+                _run_preflight(parser, build_log)
+
+            if config.execution.t1w_selection != 'all':
+                from ..utils.selection import select_t1w
+
+                n_found = len(config.execution.t1w_list)
+                config.execution.t1w_list = select_t1w(
+                    config.execution.t1w_list,
+                    config.execution.t1w_selection,
+                    get_metadata=config.execution.layout.get_metadata,
+                )
+                build_log.info(
+                    f'Selected {len(config.execution.t1w_list)} of {n_found} T1w files '
+                    f'(--t1w-selection {config.execution.t1w_selection}).'
+                )
         else:
             # Handle case where layout couldn't be created earlier (e.g., skip-validation failed)
             # or if analysis_level is 'group' and layout wasn't created.
@@ -885,6 +1403,41 @@ def parse_args(args=None, namespace=None):
     config.from_dict({})
 
 
+def _run_preflight(parser, build_log):
+    """Exclude (or, with --quarantine, quarantine) T1w files failing the pre-flight checks."""
+    from ..utils.preflight import PREFLIGHT_CACHE, run_preflight
+
+    start = time.perf_counter()
+    bad = run_preflight(
+        config.execution.t1w_list,
+        cache_file=config.execution.output_dir / PREFLIGHT_CACHE,
+        full=config.execution.full_preflight,
+    )
+    build_log.info(
+        f'Pre-flight checks of {len(config.execution.t1w_list)} T1w file(s) took '
+        f'{time.perf_counter() - start:.1f}s.'
+    )
+    if not bad:
+        return
+
+    for t1w_file, reason in bad.items():
+        build_log.warning(f'Excluding {t1w_file}: {reason}.')
+    if config.execution.quarantine:
+        from ..utils.quarantine import record_failure
+
+        for t1w_file, reason in bad.items():
+            record_failure(
+                config.execution.output_dir,
+                t1w_file,
+                node='preflight',
+                reason=reason,
+                run_uuid=config.execution.run_uuid,
+            )
+    config.execution.t1w_list = [f for f in config.execution.t1w_list if f not in bad]
+    if not config.execution.t1w_list:
+        parser.error('All selected T1w files failed the pre-flight checks.')
+
+
 # --- Logging Setup ---
 
 
@@ -56,25 +56,9 @@ def main():
     from pathlib import Path
 
     from .. import config
-    from ..utils.bids import write_derivative_description
     from ..workflows.group import aggregate_volumes
     from .parser import parse_args
 
-    # Helper function to ensure dataset_description.json exists
-    def ensure_dataset_description():
-        """Create dataset_description.json if it doesn't exist."""
-        try:
-            # Check if file already exists to avoid unnecessary recreation
-            desc_path = Path(config.execution.ncdlmuse_dir) / 'dataset_description.json'
-            if not desc_path.exists():
-                write_derivative_description(
-                    config.execution.bids_dir, config.execution.ncdlmuse_dir
-                )
-            return True
-        except (OSError, PermissionError) as e:
-            config.loggers.cli.warning(f'Error creating dataset_description.json: {e}')
-            return False
-
     # 1. Parse arguments and config file, setup logging
     parse_args()
 
@@ -86,7 +70,7 @@ def main():
         retcode = 0
 
         # Ensure dataset_description.json for the output directory
-        if not ensure_dataset_description():
+        if not _ensure_dataset_description():
             # Log warning but proceed with aggregation attempt
             config.loggers.cli.warning(
                 'Failed to create dataset_description.json for the group output directory. '
@@ -110,6 +94,15 @@ def main():
         except (ValueError, OSError) as e:
             config.loggers.cli.critical(f'Group aggregation failed: {e}', exc_info=True)
             retcode = 1
+
+        from ..utils.quarantine import load_failures, quarantine_dir
+
+        n_quarantined = len(load_failures(output_dir))
+        if n_quarantined:
+            config.loggers.cli.warning(
+                f'{n_quarantined} quarantined T1w file(s) are missing from the group outputs; '
+                f'see {quarantine_dir(output_dir)}.'
+            )
         return retcode  # Exit after group processing
 
     # --- Participant-level analysis and other modes (reports-only, boilerplate) ---
@@ -160,7 +153,7 @@ def main():
         config.loggers.cli.info('Running solely the reporting module')
 
         # Ensure dataset_description.json exists
-        ensure_dataset_description()
+        _ensure_dataset_description()
 
         exit_code = generate_reports(
             subject_list=config.execution.participant_label,
@@ -227,7 +220,7 @@ def main():
         config.loggers.cli.info('Generating boilerplate text only. Workflow will not be executed.')
 
         # Ensure dataset_description.json exists
-        ensure_dataset_description()
+        _ensure_dataset_description()
 
         # Generate boilerplate
         exit_code = generate_reports(
@@ -281,16 +274,205 @@ def main():
         )
         return 1
 
-    # 4. Build workflow in an isolated process
+    # Clear, download and verify the models once, before any worker may use them
+    from ..utils.models import prepare_models
+
+    clear_cache = config.workflow.dlmuse_clear_cache
+    queue = None
+    if clear_cache and config.execution.work_queue:
+        from ..utils.workqueue import WorkQueue
+
+        # Only the first worker of the queue clears the caches other workers read from
+        queue = WorkQueue(config.execution.work_queue, lease=config.execution.queue_lease)
+        if not queue.start_setup('clear-cache'):
+            clear_cache = False
+            config.loggers.cli.info('Another worker of the queue clears the model caches.')
+            if not queue.wait_for_setup('clear-cache'):
+                config.loggers.cli.warning(
+                    'The model caches are still being cleared by another worker; going on.'
+                )
+    try:
+        models_ready, shared_models = prepare_models(
+            clear=clear_cache,
+            model_folder=config.workflow.dlmuse_model_folder,
+            cache_dir=config.execution.model_cache_dir,
+        )
+    except (OSError, RuntimeError) as e:
+        config.loggers.cli.critical(f'Error preparing the models: {e}')
+        return 1
+    finally:
+        if clear_cache and queue is not None:
+            queue.finish_setup('clear-cache')
+    if models_ready:
+        # Workers must not download (or update) the models concurrently
+        os.environ['HF_HUB_OFFLINE'] = '1'
+    if shared_models:
+        config.workflow.dlmuse_shared_models = str(shared_models)
+        config.loggers.cli.info(f'All workers read the models from <{shared_models}>.')
+    if config.workflow.dlmuse_backend == 'onnx':
+        # Export the models once; the stages of every T1w file load the cached graphs
+        from ..utils.onnx import export_models
+
+        try:
+            export_models(
+                config.execution.onnx_cache_dir,
+                model_folder=config.workflow.dlmuse_shared_models
+                or config.workflow.dlmuse_model_folder,
+                extra_models=config.workflow.dlmuse_extra_models,
+            )
+        except ImportError as e:
+            config.loggers.cli.critical(
+                f'--backend onnx requires onnx, onnxruntime and nnunetv2 ({e}).'
+            )
+            return 1
+        except (OSError, RuntimeError) as e:
+            config.loggers.cli.critical(f'Error exporting the models to ONNX: {e}')
+            return 1
+    config.to_filename(config.execution.log_dir / 'ncdlmuse.toml')
+
+    # Warm workers must be requested before the first process is started
+    if config.nipype.warm_workers:
+        from ..utils.workers import preload_workers
+
+        if preload_workers():
+            config.loggers.cli.info('Worker processes will start with common modules loaded.')
+
+    # On SIGTERM (preemption), stop starting new T1w files and let running ones finish.
+    # Workers (started from here on) ignore the SIGTERM sent to every process of the job.
+    from ..utils.drain import DRAIN_FILE, DrainHandler, record_outcome, shield_workers
+
+    drain = DrainHandler(
+        config.execution.log_dir / DRAIN_FILE,
+        config.execution.drain_grace,
+        logger=config.loggers.cli,
+    ).install()
+    shield_workers()
+
+    # 4. Pull jobs from a shared work queue or hand them to a cluster, if requested
+    if config.execution.work_queue:
+        return _run_queue_worker(drain)
+    if config.execution.executor == 'dask':
+        from .distributed import run_dask_executor
+
+        return run_dask_executor()
+
+    # 5. Build workflow in an isolated process
     config.loggers.cli.info(
         f'Building ncdlmuse workflow (analysis level: {config.execution.analysis_level}).'
     )
     config_file = config.execution.log_dir / 'ncdlmuse.toml'
+    retcode, workflow = _build_workflow(config_file)
+    if retcode != 0:
+        return retcode
+
+    # 6. Execute workflow (participant level only for now)
+    retcode = 0
+    tracker = None
+    if config.execution.analysis_level == 'participant' and workflow:
+        prefetcher = None
+        if config.execution.prefetch_dir:
+            from ..utils.prefetch import Prefetcher
+
+            prefetcher = Prefetcher(
+                config.execution.t1w_list or [],
+                config.execution.prefetch_dir,
+                depth=config.execution.prefetch_depth,
+                max_bytes=(
+                    int(config.execution.prefetch_size * 1e9)
+                    if config.execution.prefetch_size
+                    else None
+                ),
+            )
+            prefetcher.start()
+        monitor = None
+        n_t1w = sum(
+            1
+            for node in workflow._get_all_nodes()
+            if node.name in ('nichartdlmuse_node', 'dlicv_node')
+        )
+        if config.execution.progress_interval and n_t1w:
+            from ..utils.progress import ProgressMonitor
+
+            monitor = ProgressMonitor(
+                config.execution.log_dir / 'status',
+                n_t1w,
+                interval=config.execution.progress_interval,
+                logger=config.loggers.cli,
+            )
+            monitor.start()
+        tracker = _make_tracker(workflow)
+        try:
+            retcode = _run_workflow(workflow, tracker)
+        finally:
+            if prefetcher is not None:
+                prefetcher.stop()
+            if monitor is not None:
+                monitor.stop()
+
+    if drain.requested and tracker is not None:
+        record_outcome(
+            drain.drain_file,
+            completed=sorted(str(tracker.t1w_files.get(g, g)) for g in tracker.completed),
+            deferred=sorted(str(tracker.t1w_files.get(g, g)) for g in tracker.failed),
+        )
+
+    # 7. Generate reports (unless build failed), skipping quarantined participants
+    subject_list = _successful_subjects(config.execution.participant_label, tracker)
+    if retcode == 0:
+        retcode = _generate_participant_reports(subject_list)
+    else:
+        config.loggers.cli.warning('Skipping report generation due to workflow execution failure.')
+
+    # 8. Stage derivatives out of node-local scratch
+    if config.execution.scratch_dir:
+        retcode = (
+            _stage_out_scratch(
+                subject_list=subject_list if tracker is not None and tracker.failed else None,
+                shard_label='all',
+                keep_work_dir=retcode != 0,
+            )
+            or retcode
+        )
+        if retcode == 0:
+            _discard_scratch()
+
+    config.loggers.cli.info(
+        f'Execution finished. Exit code: {retcode}'
+        f' ({config.execution.participant_label or "group"})'
+    )
+    return retcode
 
-    # This section is now only for participant level, as group level exits early.
-    # Import build_workflow here as it's participant-specific.
-    # Needed for participant workflow
 
+def _ensure_dataset_description():
+    """Create dataset_description.json if it doesn't exist."""
+    from pathlib import Path
+
+    from .. import config
+    from ..utils.bids import write_derivative_description
+
+    try:
+        # Check if file already exists to avoid unnecessary recreation
+        desc_path = Path(config.execution.ncdlmuse_dir) / 'dataset_description.json'
+        if not desc_path.exists():
+            write_derivative_description(config.execution.bids_dir, config.execution.ncdlmuse_dir)
+        return True
+    except (OSError, PermissionError) as e:
+        config.loggers.cli.warning(f'Error creating dataset_description.json: {e}')
+        return False
+
+
+def _build_workflow(config_file):
+    """Build the participant workflow in an isolated process.
+
+    Returns
+    -------
+    retcode : int
+        Exit code of the building process.
+    workflow : nipype.pipeline.engine.Workflow or None
+        The workflow, ready to be run.
+
+    """
+    from .. import config
     from .workflow import build_workflow
 
     # Set up a dictionary for retrieving workflow results
@@ -305,11 +487,11 @@ def main():
     # Check exit code from build process
     if retcode != 0:
         config.loggers.cli.critical('Workflow building failed. See logs for details.')
-        return retcode
+        return retcode, None
 
     if workflow is None:
         config.loggers.cli.critical('Workflow building did not return a workflow object.')
-        return 1
+        return 1, None
 
     # Save workflow graph if requested
     if config.execution.write_graph:
@@ -328,56 +510,318 @@ def main():
             workflow.get_node(node).config = node_config  # Ensure config exists
             workflow.get_node(node).config['rules'] = False
 
-    # 5. Execute workflow (participant level only for now)
-    retcode = 0
-    if config.execution.analysis_level == 'participant' and workflow:
-        gc.collect()  # Clean up memory before running
-        config.loggers.cli.info('Starting participant-level workflow execution.')
-        try:
-            workflow.run(**config.nipype.get_plugin())
-        except (RuntimeError, OSError, ValueError) as e:
-            config.loggers.cli.critical(f'Workflow execution failed: {e}')
-            retcode = 1
-        else:
-            config.loggers.cli.info('Workflow finished successfully.')
-            # Check for final output existence?
+    return 0, workflow
 
-    # 6. Generate reports (unless build failed)
-    if retcode == 0:
-        from ..reports.individual import generate_reports
 
-        config.loggers.cli.info('Generating final reports.')
+def _make_tracker(workflow, shard_label='all'):
+    """Track per-T1w completion, writing the manifests a resumed run relies on.
 
-        # Ensure dataset_description.json exists for participant output
-        ensure_dataset_description()
+    With --prune-work-dir, completed working directories are removed; with
+    --quarantine, failed T1w files are quarantined unless a drain interrupted them.
+    With --scratch-dir, manifests are written to the shared output directory and
+    record where derivatives are staged out to (by the stage-out of ``shard_label``).
+    """
+    import time
+    from functools import partial
 
-        exit_code = generate_reports(
-            subject_list=config.execution.participant_label,
-            output_dir=config.execution.ncdlmuse_dir,
-            run_uuid=config.execution.run_uuid,
-            work_dir=config.execution.work_dir,
-            layout=config.execution.layout,
-            bootstrap_file=data.load('reports-spec.yml'),  # Explicitly provide bootstrap file
+    from .. import config
+    from ..utils.drain import DRAIN_FILE, drain_state
+    from ..utils.workdir import CompletionTracker, manifest_root
+
+    relocate = None
+    if config.execution.scratch_dir:
+        from ..utils.scratch import staged_path
+
+        relocate = partial(
+            staged_path,
+            src_dir=config.execution.ncdlmuse_dir,
+            dst_dir=config.execution.output_dir,
+            mode=config.execution.stage_out,
+            shard_name=f'{config.execution.run_uuid}_{shard_label}',
         )
-        # Update overall exit code if report generation failed
-        if exit_code != 0:
-            retcode = exit_code
-        # --- Clean up Nipype logs generated by reporting --- #
+
+    on_complete = on_failure = None
+    if config.execution.quarantine:
+        from ..utils import quarantine
+
+        output_dir = config.execution.output_dir
+        log_dir = config.execution.log_dir
+        started_at = time.time()
+
+        def on_failure(name, t1w_file, node):
+            if drain_state(log_dir / DRAIN_FILE if log_dir else None) is not None:
+                config.loggers.cli.info(f'{t1w_file} was interrupted by the drain; deferring it.')
+            elif t1w_file:
+                quarantine.record_failure(
+                    output_dir,
+                    t1w_file,
+                    node=node.fullname,
+                    crash_files=quarantine.find_crash_files(log_dir, node.name, since=started_at),
+                    log_dir=str(log_dir),
+                    run_uuid=config.execution.run_uuid,
+                )
+
+        def on_complete(name, t1w_file):
+            if t1w_file:
+                quarantine.clear_failure(output_dir, t1w_file)
+
+    return CompletionTracker(
+        workflow,
+        prune=config.execution.prune_work_dir,
+        on_complete=on_complete,
+        on_failure=on_failure,
+        manifest_root=manifest_root() if relocate is not None else None,
+        relocate=relocate,
+    )
+
+
+def _run_workflow(workflow, tracker=None):
+    """Execute a participant workflow with the configured Nipype plugin (or natively).
+
+    With --quarantine, T1w files whose workflow failed (as seen by ``tracker``)
+    are quarantined and the run only fails if none of them succeeded.
+    A run interrupted by a drain exits with :py:data:`~ncdlmuse.utils.drain.DRAIN_EXIT_CODE`.
+    """
+    from .. import config
+    from ..utils.drain import DRAIN_EXIT_CODE, DRAIN_FILE, drain_state
+
+    gc.collect()  # Clean up memory before running
+    config.loggers.cli.info('Starting participant-level workflow execution.')
+    if not workflow._get_all_nodes():
+        config.loggers.cli.info('Nothing left to run: all selected T1w files are complete.')
+        return 0
+
+    plugin_settings = config.nipype.get_plugin()
+    if tracker is not None:
+        plugin_settings['plugin_args'] = {
+            **plugin_settings['plugin_args'],
+            'status_callback': tracker,
+        }
+    try:
+        if config.execution.executor == 'native':
+            from .native import run_workflow
+
+            run_workflow(workflow, status_callback=tracker)
         else:
-            try:
-                log_file = Path(config.execution.ncdlmuse_dir) / 'pipeline.log'
-                log_file.unlink(missing_ok=True)
-                log_file = Path(config.execution.ncdlmuse_dir) / 'pypeline.log'
-                log_file.unlink(missing_ok=True)
-            except OSError:
-                pass  # Ignore errors if file couldn't be deleted
+            workflow.run(**plugin_settings)
+    except (RuntimeError, OSError, ValueError) as e:
+        log_dir = config.execution.log_dir
+        if drain_state(log_dir / DRAIN_FILE if log_dir else None) is not None:
+            completed = f' ({len(tracker.completed)} T1w file(s) completed)' if tracker else ''
+            config.loggers.cli.warning(
+                f'Run drained{completed}; unfinished T1w files will be processed when the run '
+                'is resumed.'
+            )
+            return DRAIN_EXIT_CODE
+        if config.execution.quarantine and tracker is not None and tracker.failed:
+            if not tracker.completed:
+                config.loggers.cli.critical(f'All T1w files failed and were quarantined: {e}')
+                return 1
+            config.loggers.cli.warning(
+                f'Workflow finished with {len(tracker.failed)} quarantined T1w file(s) '
+                f'({len(tracker.completed)} succeeded). Rerun with --retry-failed to retry them.'
+            )
+            return 0
+        config.loggers.cli.critical(f'Workflow execution failed: {e}')
+        return 1
+
+    config.loggers.cli.info('Workflow finished successfully.')
+    return 0
+
+
+def _successful_subjects(subject_list, tracker):
+    """Drop participants all of whose T1w files failed from ``subject_list``."""
+    import re
+    from pathlib import Path
+
+    if tracker is None or not tracker.failed:
+        return subject_list
+
+    def _subject(name):
+        match = re.search(r'sub-([a-zA-Z0-9]+)', Path(tracker.t1w_files.get(name, name)).name)
+        return match.group(1) if match else None
+
+    succeeded = {_subject(name) for name in tracker.completed}
+    failed = {_subject(name) for name in tracker.failed} - succeeded
+    return [subject for subject in subject_list or [] if subject not in failed]
+
+
+def _generate_participant_reports(subject_list):
+    """Generate the individual reports of the given participants."""
+    from pathlib import Path
+
+    from .. import config
+    from ..reports.individual import generate_reports
+
+    config.loggers.cli.info('Generating final reports.')
+
+    # Ensure dataset_description.json exists for participant output
+    _ensure_dataset_description()
+
+    exit_code = generate_reports(
+        subject_list=subject_list,
+        output_dir=config.execution.ncdlmuse_dir,
+        run_uuid=config.execution.run_uuid,
+        work_dir=config.execution.work_dir,
+        layout=config.execution.layout,
+        bootstrap_file=data.load('reports-spec.yml'),  # Explicitly provide bootstrap file
+    )
+    # --- Clean up Nipype logs generated by reporting --- #
+    if exit_code == 0:
+        try:
+            log_file = Path(config.execution.ncdlmuse_dir) / 'pipeline.log'
+            log_file.unlink(missing_ok=True)
+            log_file = Path(config.execution.ncdlmuse_dir) / 'pypeline.log'
+            log_file.unlink(missing_ok=True)
+        except OSError:
+            pass  # Ignore errors if file couldn't be deleted
+    return exit_code
+
+
+def _stage_out_scratch(subject_list=None, shard_label=None, keep_work_dir=False):
+    """Stage derivatives out of node-local scratch and discard the scratch copy.
+
+    The scratch working directory is kept when ``keep_work_dir`` is set (e.g., after
+    a failure, for debugging).
+
+    Returns
+    -------
+    int
+        0 on success, 1 if the derivatives could not be staged out.
+
+    """
+    from .. import config
+    from ..utils.scratch import discard, stage_out
+
+    try:
+        stage_out(
+            config.execution.ncdlmuse_dir,
+            config.execution.output_dir,
+            subjects=subject_list,
+            mode=config.execution.stage_out,
+            shard_name=f'{config.execution.run_uuid}_{shard_label}' if shard_label else None,
+        )
+    except OSError as e:
+        config.loggers.cli.critical(
+            f'Could not stage out derivatives from {config.execution.ncdlmuse_dir}: {e}'
+        )
+        return 1
+
+    if keep_work_dir:
+        config.loggers.cli.warning(
+            f'Keeping the scratch working directory for inspection: {config.execution.work_dir}'
+        )
     else:
-        config.loggers.cli.warning('Skipping report generation due to workflow execution failure.')
+        discard(config.execution.work_dir)
+    return 0
+
+
+def _discard_scratch():
+    """Remove this run's node-local scratch directory."""
+    from .. import config
+    from ..utils.scratch import discard, scratch_root
+
+    discard(scratch_root(config.execution.scratch_dir, config.execution.run_uuid))
+
+
+def _run_queue_worker(drain=None):
+    """Process T1w jobs pulled from a shared work queue until it is drained.
+
+    Every worker first (idempotently) populates the queue with its own T1w selection,
+    then claims one job at a time, builds and runs the single-T1w workflow for it while
+    a heartbeat keeps its lease alive, and records the outcome in the queue.
+    Workers stay alive while other workers hold claims, so that jobs of crashed or
+    preempted workers are picked up again once their leases expire.
+    Once ``drain`` is requested, the worker stops claiming jobs and puts an interrupted
+    job back in the queue without counting the attempt.
+
+    Returns
+    -------
+    int
+        0 if every job processed by this worker succeeded, 1 otherwise
+        (:py:data:`~ncdlmuse.utils.drain.DRAIN_EXIT_CODE` if it was drained).
 
+    """
+    from .. import config
+    from ..utils.bids import parse_entities
+    from ..utils.drain import DRAIN_EXIT_CODE
+    from ..utils.workqueue import WorkQueue
+
+    queue = WorkQueue(
+        config.execution.work_queue,
+        lease=config.execution.queue_lease,
+        max_attempts=config.execution.queue_max_attempts,
+    )
+    added = queue.populate(config.execution.t1w_list or [])
     config.loggers.cli.info(
-        f'Execution finished. Exit code: {retcode}'
-        f' ({config.execution.participant_label or "group"})'
+        f'Work queue at {queue.root}: added {len(added)} new job(s), '
+        f'current state {queue.counts()}. Worker ID: {queue.worker_id}.'
+    )
+
+    layout = config.execution.layout
+    poll_interval = min(30.0, max(queue.lease / 10.0, 1.0))
+    retcode = 0
+    n_jobs = 0
+    should_stop = (lambda: drain.requested) if drain is not None else None
+    while (
+        claim := queue.wait_for_job(poll_interval=poll_interval, should_stop=should_stop)
+    ) is not None:
+        with claim:
+            t1w_file = claim.job['t1w']
+            entities = parse_entities(t1w_file, layout=layout)
+            subject_id = entities.get('subject')
+            session_id = entities.get('session')
+            config.loggers.cli.info(
+                f'Claimed job {claim.job_id} (attempt {claim.job["attempts"]}): {t1w_file}'
+            )
+
+            config.execution.t1w_list = [t1w_file]
+            config.execution.participant_label = [subject_id] if subject_id else None
+            config.execution.session_label = [session_id] if session_id else None
+            config_file = config.execution.log_dir / f'ncdlmuse_{claim.job_id}.toml'
+            config.to_filename(config_file)
+
+            job_retcode, workflow = _build_workflow(config_file)
+            if job_retcode == 0:
+                job_retcode = _run_workflow(
+                    workflow, _make_tracker(workflow, shard_label=claim.job_id)
+                )
+            del workflow
+            if job_retcode == 0 and subject_id:
+                job_retcode = _generate_participant_reports([subject_id])
+            if config.execution.scratch_dir:
+                job_retcode = (
+                    _stage_out_scratch(
+                        [subject_id] if subject_id else None,
+                        shard_label=claim.job_id,
+                        keep_work_dir=job_retcode != 0,
+                    )
+                    or job_retcode
+                )
+
+            if job_retcode == 0:
+                claim.complete(log_dir=str(config.execution.log_dir))
+                n_jobs += 1
+            elif job_retcode == DRAIN_EXIT_CODE:
+                config.loggers.cli.warning(f'Returning job {claim.job_id} to the queue.')
+                claim.release()
+                retcode = DRAIN_EXIT_CODE
+            else:
+                config.loggers.cli.error(f'Job {claim.job_id} failed (exit code {job_retcode}).')
+                claim.fail(log_dir=str(config.execution.log_dir), exit_code=job_retcode)
+                retcode = 1
+
+    if drain is not None and drain.requested:
+        config.loggers.cli.warning(
+            f'Worker drained after completing {n_jobs} job(s). Queue state: {queue.counts()}.'
+        )
+        return DRAIN_EXIT_CODE
+    config.loggers.cli.info(
+        f'Work queue drained; this worker completed {n_jobs} job(s). '
+        f'Final queue state: {queue.counts()}.'
     )
+    if config.execution.scratch_dir and retcode == 0:
+        _discard_scratch()
     return retcode
 
 
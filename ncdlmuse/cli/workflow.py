@@ -13,8 +13,9 @@ a hard-limited memory-scope.
 def build_workflow(config_file, retval):
     """Create the Nipype Workflow that supports the whole execution graph."""
     import re
+    from pathlib import Path
 
-    from bids.layout import BIDSLayout, BIDSLayoutIndexer
+    from bids.layout import BIDSLayout
 
     from ncdlmuse import config, data
     from ncdlmuse.reports.individual import generate_reports
@@ -28,26 +29,37 @@ def build_workflow(config_file, retval):
     # via the config file. Recreate it here using loaded config paths.
     build_log = config.loggers.workflow  # Get logger after config load
     try:
-        indexer = BIDSLayoutIndexer(
-            validate=not config.execution.skip_bids_validation,
-            ignore=(
-                'code',
-                'stimuli',
-                'sourcedata',
-                'models',
-                'derivatives',
-                re.compile(r'^\.'),  # Ignore hidden files/dirs
-            ),
-        )
-        # Use database path from config if available, otherwise let BIDSLayout manage it
-        db_path = config.execution.bids_database_dir
-        reset_db = bool(db_path is None)  # Reset if no specific path is given
-        layout = BIDSLayout(
-            str(config.execution.bids_dir),
-            database_path=db_path,
-            reset_database=reset_db,  # Force fresh index if db_path is None or reuse if specified
-            indexer=indexer,
-        )
+        if config.execution.fast_discovery:
+            from ncdlmuse.utils.bids import FastLayout
+
+            # config.load() already walked the dataset
+            layout = config.execution._layout or FastLayout(config.execution.bids_dir)
+        else:
+            from ncdlmuse.utils.validation import VALIDATION_CACHE, CachedValidationIndexer
+
+            cache_dir = config.execution.bids_database_dir or config.execution.work_dir
+            indexer = CachedValidationIndexer(
+                cache_file=Path(cache_dir) / VALIDATION_CACHE if cache_dir else None,
+                validate=not config.execution.skip_bids_validation,
+                ignore=(
+                    'code',
+                    'stimuli',
+                    'sourcedata',
+                    'models',
+                    'derivatives',
+                    re.compile(r'^\.'),  # Ignore hidden files/dirs
+                ),
+            )
+            # Use database path from config if available, otherwise let BIDSLayout manage it
+            db_path = config.execution.bids_database_dir
+            reset_db = bool(db_path is None)  # Reset if no specific path is given
+            layout = BIDSLayout(
+                str(config.execution.bids_dir),
+                database_path=db_path,
+                # Force fresh index if db_path is None or reuse if specified
+                reset_database=reset_db,
+                indexer=indexer,
+            )
         config.execution.layout = layout  # Store the layout object back into config
         build_log.info('Successfully re-initialized BIDS Layout for workflow building process.')
     except (OSError, ValueError, RuntimeError) as e:
@@ -321,6 +321,8 @@ class nipype(_Config):
     """Enable resource monitor."""
     stop_on_first_crash = True
     """Whether the workflow should stop or continue after the first error."""
+    warm_workers = False
+    """Preload common modules in the forkserver, so worker processes start warm."""
 
     @classmethod
     def get_plugin(cls):
@@ -413,6 +415,16 @@ class execution(_Config):
     """Unique identifier of this particular run."""
     skip_bids_validation = False
     """Skip BIDS validation."""
+    fast_discovery = False
+    """Discover T1w files by walking the dataset instead of indexing it with PyBIDS."""
+    skip_preflight = False
+    """Skip the pre-flight header checks of the T1w inputs."""
+    full_preflight = False
+    """Decompress compressed T1w inputs in full to check their integrity during pre-flight."""
+    t1w_selection = 'all'
+    """Policy selecting which T1w file(s) of each session are processed."""
+    deduplicate_inputs = False
+    """Segment voxel-identical T1w inputs once and reuse the results for their duplicates."""
     participant_label = None
     """List of participant identifiers that are to be preprocessed."""
     session_label = None
@@ -431,6 +443,50 @@ class execution(_Config):
     """Path(s) to pre-computed derivatives."""
     t1w_list: list[str] | None = None
     """List of T1w file paths identified for processing."""
+    scratch_dir = None
+    """Node-local scratch directory where the run executes before staging out derivatives."""
+    stage_out = 'copy'
+    """How derivatives are staged out of scratch ('copy' the trees or one 'tar' per shard)."""
+    prefetch_dir = None
+    """Node-local directory where upcoming T1w inputs are staged ahead of processing."""
+    model_cache_dir = None
+    """Directory (e.g., node-local) the verified models are copied to, read-only, for the run."""
+    onnx_cache_dir = None
+    """Directory of the ONNX graphs exported from the models (``--backend onnx``)."""
+    prefetch_depth = 2
+    """Maximum number of staged T1w inputs waiting to be processed."""
+    prefetch_size = None
+    """Maximum total size (GB) of staged T1w inputs waiting to be processed."""
+    prune_work_dir = False
+    """Prune the working directory of each T1w once done, keeping a completion manifest."""
+    work_dir_layout = 'flat'
+    """Layout of per-T1w working directories ('flat' or 'hashed' fan-out)."""
+    progress_interval = 60
+    """Seconds between cohort-wide progress lines (0 disables progress monitoring)."""
+    dlmuse_timeout = None
+    """Wall-time limit (seconds) per NiChart_DLMUSE attempt ('auto': estimated; None: none)."""
+    dlmuse_inactivity_timeout = None
+    """Seconds without NiChart_DLMUSE output after which it is considered hung (None disables)."""
+    dlmuse_retries = 0
+    """Number of times a failed or hung NiChart_DLMUSE run is retried."""
+    quarantine = False
+    """Record failed T1w files in a failure manifest and keep processing the others."""
+    retry_failed = False
+    """Only process the T1w files quarantined by previous runs."""
+    drain_grace = 90
+    """Seconds running NiChart_DLMUSE jobs may finish in after SIGTERM, before the run drains."""
+    executor = 'nipype'
+    """Execution backend for participant workflows ('nipype', 'native' or 'dask')."""
+    executor_retries = 1
+    """Number of times a failed per-T1w task is retried by distributed executors."""
+    scheduler_address = None
+    """Address of the Dask scheduler (a ``LocalCluster`` is started if unset)."""
+    work_queue = None
+    """Path to a shared-filesystem queue directory to pull T1w jobs from."""
+    queue_lease = 600
+    """Seconds without heartbeat after which a claimed queue job is considered abandoned."""
+    queue_max_attempts = 3
+    """Number of times a queue job may be claimed before it is marked as failed."""
 
     _layout = None
 
@@ -442,6 +498,11 @@ class execution(_Config):
         'log_dir',
         'templateflow_home',
         'bids_database_dir',
+        'work_queue',
+        'prefetch_dir',
+        'scratch_dir',
+        'model_cache_dir',
+        'onnx_cache_dir',
     )
 
     @classmethod
@@ -461,10 +522,24 @@ class execution(_Config):
             return
 
         # --- The following is for non-group (participant) analysis only ---
+        if cls.fast_discovery:
+            from ncdlmuse.utils.bids import FastLayout
+
+            cls._layout = FastLayout(cls.bids_dir)
+            if cls.participant_label is None:
+                cls.participant_label = cls._layout.get_subjects()
+            return
+
         import re
 
         import bids.exceptions
-        from bids.layout import BIDSLayout, BIDSLayoutIndexer
+        from bids.layout import BIDSLayout
+
+        from ncdlmuse.utils.validation import (
+            VALIDATION_CACHE,
+            CachedValidationIndexer,
+            description_hash,
+        )
 
         # Determine and set the BIDS database path for BIDSLayout
         cls._db_path = None  # Initialize class attribute _db_path
@@ -491,7 +566,9 @@ class execution(_Config):
 
         # Setup the BIDSLayout
         try:
-            indexer = BIDSLayoutIndexer(
+            cache_dir = cls.bids_database_dir or cls.work_dir
+            indexer = CachedValidationIndexer(
+                cache_file=Path(cache_dir) / VALIDATION_CACHE if cache_dir else None,
                 validate=not cls.skip_bids_validation,
                 ignore=(
                     'code',  # Irrelevant folders for BIDS Layout
@@ -510,7 +587,7 @@ class execution(_Config):
                                (cls.bids_database_dir is None and cls._db_path is not None),
                 indexer=indexer,
             )
-            cls.bids_description_hash = cls._layout.description.__hash__()
+            cls.bids_description_hash = description_hash(cls.bids_dir)
 
         except (bids.exceptions.PyBIDSException, OSError, ValueError, TypeError) as e:
             # Handle layout initialization errors
@@ -549,8 +626,30 @@ class workflow(_Config):
     """Load and run the entire DLMUSE model on GPU."""
     dlmuse_disable_tta = False
     """Disable Test-Time Augmentation for DLMUSE inference."""
+    dlmuse_inference_profile = None
+    """Inference profile (see :py:mod:`ncdlmuse.utils.profiles`)."""
+    dlmuse_step_size = None
+    """Sliding-window step of DLICV and DLMUSE inference (``None``: the tools' default)."""
+    dlmuse_adaptive_tta = False
+    """Run TTA only on the T1w files whose segmentation without TTA is flagged by QC."""
+    dlmuse_qc_norms = None
+    """TSV file of cohort norms of ROI volumes used by the QC checks of adaptive TTA."""
+    dlmuse_reportlets = True
+    """Draw the brain mask and segmentation reportlets."""
     dlmuse_clear_cache = False
-    """Clear the DLMUSE model download cache before running."""
+    """Clear the DLICV and DLMUSE model caches (once per run) before running."""
+    dlmuse_shared_models = None
+    """Read-only copy of the verified models that all nodes read (see ``--model-cache``)."""
+    dlmuse_split_stages = False
+    """Run the DLICV and DLMUSE stages as separate nodes instead of NiChart_DLMUSE."""
+    dlmuse_backend = 'pytorch'
+    """Inference backend of the DLICV and DLMUSE stages (see :py:mod:`ncdlmuse.utils.onnx`)."""
+    dlmuse_onnx_threads = None
+    """Intra-op threads of each ONNX Runtime session (``None``: ``omp_nthreads``)."""
+    dlmuse_extra_models = None
+    """Additional DLMUSE model folders, by derivative label, sharing the DLICV stage."""
+
+    _paths = ('dlmuse_extra_models', 'dlmuse_qc_norms')
 
     @classmethod
     def init(cls):
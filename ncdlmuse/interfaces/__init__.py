@@ -3,12 +3,14 @@
 """Nipype interfaces for ncdlmuse."""
 
 from .bids import DerivativesDataSink
-from .ncdlmuse import NiChartDLMUSE
+from .ncdlmuse import DLICV, DLMUSE, NiChartDLMUSE
 from .reports import SubjectSummary
 from .utility import CopyFile, CSVToTSV
 
 __all__ = [
     'NiChartDLMUSE',
+    'DLICV',
+    'DLMUSE',
     'DerivativesDataSink',
     'SubjectSummary',
     'CSVToTSV',
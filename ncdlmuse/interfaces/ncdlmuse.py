@@ -1,24 +1,40 @@
 # interfaces/ncdlmuse.py
 """Interface to NiChart_DLMUSE."""
 
+import json
 import logging
 import os
 import shutil
+import signal
 import subprocess
+import sys
+import threading
+import time
+from collections import deque
 
 # Use importlib.resources for package data
 from importlib import resources as importlib_resources
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+from nibabel.filebasedimages import ImageFileError
 from nipype.interfaces.base import (
     BaseInterfaceInputSpec,
     File,
+    InputMultiObject,
+    OutputMultiObject,
     SimpleInterface,
     TraitedSpec,
+    isdefined,
     traits,
 )
 
+from ncdlmuse.utils.drain import DrainRequested, drain_state, sigterm_blocked
+from ncdlmuse.utils.prefetch import consume, release
+from ncdlmuse.utils.progress import ProgressParser, publish
+from ncdlmuse.utils.qc import assess_segmentation, load_norms
+
 # Configure logger
 logger = logging.getLogger('nipype.interface')  # Use standard nipype logger name
 _logger = logging.getLogger('nipype.interface')  # Define _logger for _list_outputs
@@ -32,22 +48,95 @@ _DLICV_SUFFIX = '_DLICV.nii.gz'
 _VOLUMES_CSV_SUFFIX = '_DLMUSE_Volumes.csv'
 _PROCESSED_VOLUMES_TSV = 'dlmuse_volumes_renamed.tsv'
 _ROI_MAPPING_FILE = 'MUSE_ROI_complete_list.csv'
+_TAIL_LINES = 50  # Lines of output echoed to the Nipype log on failure
+_PUBLISH_INTERVAL = 10.0  # Seconds between progress updates without a stage change
+_WATCHDOG_INTERVAL = 0.5  # Seconds between watchdog checks
+_DRAIN_REASON = 'stopped at the end of the drain grace period'
+# Conservative runtime per million voxels (with TTA) used to estimate timeouts
+_SECONDS_PER_MVOXEL = {'cpu': 120.0, 'gpu': 15.0}
+_TIMEOUT_SAFETY_FACTOR = 3.0
+_MIN_TIMEOUT = 1800.0
 # ---------------------------------------------
 
 
-class NiChartDLMUSEInputSpec(BaseInterfaceInputSpec):
-    """Input specification for NiChart_DLMUSE."""
+def estimate_timeout(image, device='cpu', disable_tta=False):
+    """Estimate a generous wall-time limit (seconds) for one NiChart_DLMUSE run.
+
+    The estimate scales with the number of voxels in the image header, with a
+    floor of 30 minutes.
+    """
+    import nibabel as nb
+
+    n_voxels = float(np.prod(nb.load(str(image)).shape[:3]))
+    rate = _SECONDS_PER_MVOXEL['cpu' if device == 'cpu' else 'gpu']
+    expected = rate * n_voxels / 1e6 * (0.25 if disable_tta else 1.0)
+    return max(_MIN_TIMEOUT, _TIMEOUT_SAFETY_FACTOR * expected)
+
+
+def _kill_process_group(process):
+    """Kill ``process`` and all its children.
+
+    The tools are started with ``SIGTERM`` blocked (to survive preemption
+    until the drain deadline), so they are killed with ``SIGKILL``.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        return
+    process.wait()
+
+
+class _SegmentationToolInputSpec(BaseInterfaceInputSpec):
+    """Inputs shared by the interfaces to NiChart_DLMUSE and its stages."""
 
-    input_image = File(exists=True, mandatory=True, desc='Input T1w image')
     device = traits.Enum('cpu', 'cuda', 'mps', usedefault=True, desc='Device to use')
     model_folder = traits.Str(desc='Path to custom model folder')
-    derived_roi_mappings_file = traits.Str(desc='Path to derived ROI mappings file')
-    muse_roi_mappings_file = traits.Str(desc='Path to MUSE ROI mappings file')
     all_in_gpu = traits.Bool(False, usedefault=True, desc='Run all operations on GPU')
     disable_tta = traits.Bool(False, usedefault=True, desc='Disable Test-Time Augmentation')
     clear_cache = traits.Bool(False, usedefault=True, desc='Clear model cache')
+    job_id = traits.Str(nohash=True, desc='Identifier of the job in progress reports')
+    log_file = traits.Str(
+        nohash=True, desc='File the tool output is streamed to (default: in the working dir)'
+    )
+    status_file = traits.Str(nohash=True, desc='JSON file where progress is published')
+    timeout = traits.Float(
+        nohash=True, desc='Wall-time limit of each attempt in seconds (0 or unset disables)'
+    )
+    auto_timeout = traits.Bool(
+        False, usedefault=True, nohash=True,
+        desc='Estimate the wall-time limit from the image size if timeout is unset',
+    )
+    inactivity_timeout = traits.Float(
+        0.0, usedefault=True, nohash=True,
+        desc='Kill the tool after this many seconds without output (0 disables)',
+    )
+    max_retries = traits.Int(
+        0, usedefault=True, nohash=True, desc='Number of times a failed run is retried'
+    )
+    retry_backoff = traits.Float(
+        30.0, usedefault=True, nohash=True,
+        desc='Seconds before the first retry, doubled for every further retry',
+    )
+    drain_file = traits.Str(
+        nohash=True, desc='Drain document of the run (see ncdlmuse.utils.drain)'
+    )
     # Dummy input to force re-run by invalidating cache
     _timestamp = traits.Float(desc='Timestamp for cache invalidation')
+
+
+class NiChartDLMUSEInputSpec(_SegmentationToolInputSpec):
+    """Input specification for NiChart_DLMUSE."""
+
+    input_image = File(exists=True, mandatory=True, desc='Input T1w image')
+    derived_roi_mappings_file = traits.Str(desc='Path to derived ROI mappings file')
+    muse_roi_mappings_file = traits.Str(desc='Path to MUSE ROI mappings file')
+    prefetch_dir = traits.Str(
+        desc='Directory where the input may have been staged by the prefetcher'
+    )
+    adaptive_tta = traits.Bool(
+        desc='Run without TTA, and again with TTA only if the QC checks flag the segmentation'
+    )
+    qc_norms = File(exists=True, desc='TSV file of cohort norms of ROI volumes (adaptive TTA)')
     # Dummy input to enforce dependency on workdir clearing
     _depends_on_workdir_clear = traits.Any(desc='Dummy input for workflow graph dependency')
 
@@ -59,9 +148,255 @@ class NiChartDLMUSEOutputSpec(TraitedSpec):
     dlicv_mask = File(desc='DLICV brain mask file (NIfTI)')
     dlmuse_volumes = File(desc='DLMUSE volumes TSV file (with renamed headers or original CSV as fallback)')
     dlmuse_volumes_csv = File(desc='Original DLMUSE volumes CSV file (copied to output dir)')
+    n_attempts = traits.Int(desc='Number of NiChart_DLMUSE attempts until success')
+    tta_decision = traits.Dict(
+        desc='QC signals and flags, and whether the run was repeated with TTA (adaptive TTA)'
+    )
+
+
+class _SegmentationTool(SimpleInterface):
+    """Base class of the interfaces to NiChart_DLMUSE and its stages.
+
+    Runs the ``_tool`` executable in its own process group, streaming its
+    output to a log file, publishing the job's progress, retrying failed
+    attempts and honouring drains (see :py:class:`NiChartDLMUSE`).
+    """
+
+    #: Name of the executable
+    _tool = None
+    #: Progress stage the tool starts at (see :py:data:`ncdlmuse.utils.progress.STAGES`)
+    _first_stage = None
+    #: Whether the job is done when the tool finishes
+    _last_stage = True
+    _cwd = None  # Stores runtime.cwd for use in _list_outputs
+    _n_attempts = 1
+
+    def _source(self):
+        """The input(s) of the job, as shown in logs and progress reports.
+
+        Subclasses name their input images; by default, the job identifier
+        (or the tool) is shown.
+        """
+        return self.inputs.job_id if isdefined(self.inputs.job_id) else self._tool
+
+    def _run_tool(self, cmd, raw_output_dir, images, disable_tta=None, log_header=None):
+        """Run ``cmd`` until it succeeds or the retries are exhausted.
+
+        Each attempt is streamed by :py:meth:`_stream_command`; ``raw_output_dir``
+        is emptied before every retry, and ``images`` (the inputs of the tool)
+        are used to estimate the timeout (with ``auto_timeout``). If
+        ``log_header`` is given, the output is appended to the log file after
+        it, instead of replacing the log.
+        """
+        source = self._source()
+        logger.info(f'Running command: {" ".join(cmd)}')
+        log_file = Path(self.inputs.log_file or self._cwd / f'{self._tool}.log')
+        status_file = Path(self.inputs.status_file) if self.inputs.status_file else None
+        timeout = self._get_timeout(images, disable_tta)
+        max_attempts = 1 + max(self.inputs.max_retries, 0)
+        for attempt in range(1, max_attempts + 1):
+            if drain_state(self.inputs.drain_file) is not None:
+                raise DrainRequested(
+                    f'The run is draining; not starting {self._tool} on {source}.'
+                )
+            if attempt > 1:
+                delay = self.inputs.retry_backoff * 2 ** (attempt - 2)
+                logger.warning(
+                    f'Retrying {self._tool} in {delay:.0f}s (attempt {attempt}/{max_attempts}).'
+                )
+                time.sleep(delay)
+                shutil.rmtree(raw_output_dir, ignore_errors=True)
+                raw_output_dir.mkdir(parents=True)
+            try:
+                returncode, tail, killed = self._stream_command(
+                    cmd,
+                    log_file,
+                    status_file,
+                    timeout=timeout,
+                    inactivity_timeout=self.inputs.inactivity_timeout,
+                    attempt=attempt,
+                    last_attempt=attempt == max_attempts,
+                    header=f'--- Attempt {attempt} ---' if attempt > 1 else log_header,
+                )
+            except FileNotFoundError:
+                logger.error(f'{self._tool} command not found. Is it installed and in PATH?')
+                raise
+            except Exception as e:
+                logger.error(f'An unexpected error occurred running {self._tool}: {e}')
+                raise
+            if returncode == 0:
+                break
+            if killed == _DRAIN_REASON:
+                raise DrainRequested(f'{self._tool} on {source} was {killed}.')
+            reason = killed or f'exit code {returncode}'
+            logger.error(f'{self._tool} failed ({reason}) on attempt {attempt}/{max_attempts}.')
+            logger.error(f'  Last lines of output (full log: {log_file}):\n' + '\n'.join(tail))
+        else:
+            error = subprocess.CalledProcessError(returncode, cmd)
+            logger.error(f'{self._tool} command failed: {" ".join(cmd)}')
+            # Log contents of raw output dir for debugging
+            self._log_dir_contents(raw_output_dir, "raw output")
+            raise RuntimeError(
+                f'{self._tool} execution failed after {max_attempts} attempt(s).'
+            ) from error
+        self._n_attempts = attempt
+
+    def _get_timeout(self, images, disable_tta=None):
+        """Wall-time limit of one attempt in seconds (``None`` if disabled)."""
+        if isdefined(self.inputs.timeout):
+            return self.inputs.timeout or None
+        if not self.inputs.auto_timeout:
+            return None
+        if disable_tta is None:
+            disable_tta = self.inputs.disable_tta
+        try:
+            timeout = sum(
+                estimate_timeout(image, self.inputs.device, disable_tta) for image in images
+            )
+        except (OSError, ValueError, ImageFileError) as e:
+            logger.warning(f'Could not estimate a timeout from {self._source()}: {e}')
+            return _MIN_TIMEOUT * 4 * len(images)
+        logger.info(f'{self._tool} timeout estimated from the image size: {timeout:.0f}s')
+        return timeout
+
+    def _stream_command(
+        self,
+        cmd,
+        log_file,
+        status_file=None,
+        timeout=None,
+        inactivity_timeout=None,
+        attempt=1,
+        last_attempt=True,
+        header=None,
+    ):
+        """Run ``cmd``, streaming its output to ``log_file`` and publishing progress.
+
+        The command runs in its own process group, which a watchdog thread kills
+        if it exceeds ``timeout``, prints nothing for ``inactivity_timeout`` seconds,
+        or is still running at the deadline of a drain. The command ignores the
+        ``SIGTERM`` of a preemption, so it may finish within the drain's grace
+        period. The log file is replaced, unless a ``header`` line is given to
+        append the output after.
+
+        Returns the exit code, the last lines of output, and the reason the
+        watchdog killed the process (``None`` if it did not).
+        """
+        parser = ProgressParser(first_stage=self._first_stage)
+        tail = deque(maxlen=_TAIL_LINES)
+        status = {
+            'job_id': self.inputs.job_id or None,
+            't1w': self._source(),
+            'log_file': str(log_file),
+            'attempt': attempt,
+            'started_at': time.time(),
+        }
+
+        def _publish(state):
+            if status_file is None:
+                return
+            try:
+                publish(
+                    status_file, **status, state=state, stage=parser.stage,
+                    progress=parser.progress, steps=parser.steps,
+                )
+            except OSError as e:
+                logger.debug(f'Could not publish progress to {status_file}: {e}')
+
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        _publish('running')
+        start = last_published = last_output = time.monotonic()
+        killed = []
+        finished = threading.Event()
+
+        def _watchdog():
+            drain_deadline = None
+            while not finished.wait(_WATCHDOG_INTERVAL):
+                elapsed = time.monotonic() - start
+                if state := drain_state(self.inputs.drain_file):
+                    if drain_deadline is None:
+                        logger.warning(
+                            f'Draining: {self._tool} on {self._source()} will be '
+                            f'stopped in {max(state["deadline"] - time.time(), 0):.0f}s.'
+                        )
+                    # A second SIGTERM moves the deadline to now
+                    drain_deadline = state['deadline']
+                if drain_deadline is not None and time.time() > drain_deadline:
+                    killed.append(_DRAIN_REASON)
+                elif timeout and elapsed > timeout:
+                    killed.append(f'timed out after {timeout:.0f}s')
+                elif inactivity_timeout and time.monotonic() - last_output > inactivity_timeout:
+                    killed.append(f'no output for {inactivity_timeout:.0f}s')
+                else:
+                    continue
+                logger.error(f'{self._tool} {killed[0]}; killing its process group.')
+                _kill_process_group(process)
+                return
+
+        with sigterm_blocked():
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                env={**os.environ, 'PYTHONUNBUFFERED': '1'},
+                start_new_session=True,
+            )
+        with open(log_file, 'a' if header else 'w') as log_fobj, process:
+            if header:
+                log_fobj.write(f'\n{header}\n')
+            watchdog = threading.Thread(target=_watchdog, name='ncdlmuse-watchdog', daemon=True)
+            watchdog.start()
+            try:
+                for line in process.stdout:
+                    last_output = time.monotonic()
+                    log_fobj.write(line)
+                    log_fobj.flush()
+                    line = line.rstrip()
+                    if not line:
+                        continue
+                    tail.append(line)
+                    if parser.feed(line):
+                        logger.info(f'{self._tool}: {parser.stage} ({line})')
+                        _publish('running')
+                        last_published = time.monotonic()
+                    elif time.monotonic() - last_published > _PUBLISH_INTERVAL:
+                        _publish('running')
+                        last_published = time.monotonic()
+                returncode = process.wait()
+            finally:
+                finished.set()
+                watchdog.join()
+                if process.poll() is None:
+                    _kill_process_group(process)
+
+        if returncode == 0 and not self._last_stage:
+            state = 'running'  # The job goes on with the next stage
+        elif returncode == 0:
+            parser.progress = 1.0
+            state = 'done'
+        elif killed and killed[0] == _DRAIN_REASON:
+            state = 'interrupted'
+        else:
+            state = 'failed' if last_attempt else 'retrying'
+        status['finished_at'] = time.time()
+        _publish(state)
+        return returncode, list(tail), killed[0] if killed else None
+
+    def _log_dir_contents(self, directory, label="directory"):
+        """Helper to log the contents of a directory, especially on error."""
+        try:
+            if Path(directory).is_dir():
+                dir_contents = os.listdir(directory)
+                logger.info(f'Contents of {label} ({directory}): {dir_contents}')
+            else:
+                logger.warning(f'{label.capitalize()} directory not found or not a directory: {directory}')
+        except OSError as list_e:
+            logger.error(f'Could not list contents of {label} directory {directory}: {list_e}')
 
 
-class NiChartDLMUSE(SimpleInterface):
+class NiChartDLMUSE(_SegmentationTool):
     """Nipype interface for running the NiChart_DLMUSE command-line tool.
 
     This interface wraps the ``NiChart_DLMUSE`` executable.
@@ -77,6 +412,18 @@ class NiChartDLMUSE(SimpleInterface):
             The `-i` argument for `NiChart_DLMUSE` points to this separated input directory.
         *   The `-o` argument points to the ``ncdlmuse_raw_out`` subdirectory.
     2.  **Command Execution:** Runs ``NiChart_DLMUSE`` with appropriate arguments.
+        *   Its output is streamed line by line to ``log_file`` (``{cwd}/NiChart_DLMUSE.log``
+            by default); only stage changes, and the last lines on failure, reach the
+            Nipype log.
+        *   If ``status_file`` is set, the job's stage and progress are published there
+            (see :py:mod:`ncdlmuse.utils.progress`).
+        *   If the run is draining (``drain_file`` exists), no new run is started, and a
+            running one is stopped once the drain deadline passes
+            (see :py:mod:`ncdlmuse.utils.drain`).
+        *   With ``adaptive_tta``, the tool first runs without test-time augmentation;
+            it runs again with TTA (its output appended to the same log) only if the
+            QC checks of :py:mod:`ncdlmuse.utils.qc` flag the segmentation. The
+            decision is returned as ``tta_decision``.
     3.  **Output Handling:**
         *   Checks if essential raw output files (segmentation, mask, volumes CSV) exist
             in the ``ncdlmuse_raw_out`` directory. Raises an error if not found.
@@ -101,7 +448,11 @@ class NiChartDLMUSE(SimpleInterface):
 
     input_spec = NiChartDLMUSEInputSpec
     output_spec = NiChartDLMUSEOutputSpec
-    _cwd = None  # Stores runtime.cwd for use in _list_outputs
+    _tool = 'NiChart_DLMUSE'
+    _tta_decision = None  # QC signals and decision of adaptive TTA
+
+    def _source(self):
+        return str(self.inputs.input_image)
 
     def _run_interface(self, runtime):
         """Execute the NiChart_DLMUSE command and process outputs."""
@@ -130,16 +481,31 @@ class NiChartDLMUSE(SimpleInterface):
             logger.error(f'Error creating execution directories: {e}')
             raise
 
-        # Copy input file to the separated input directory
+        # Copy input file to the separated input directory, preferring a prefetched copy
         input_file_copy = internal_in_dir / input_image_path.name
+        staged_copy = None
+        if self.inputs.prefetch_dir:
+            staged_copy = consume(input_image_path, self.inputs.prefetch_dir)
         try:
-            shutil.copy2(self.inputs.input_image, input_file_copy)
-            logger.info(f'Copied input {self.inputs.input_image} to {input_file_copy}')
+            moved = False
+            if staged_copy is not None:
+                try:
+                    shutil.move(staged_copy, input_file_copy)
+                    moved = True
+                    logger.info(f'Moved prefetched input {staged_copy} to {input_file_copy}')
+                except FileNotFoundError:
+                    logger.warning(f'Prefetched input {staged_copy} vanished, using the original')
+            if not moved:
+                shutil.copy2(self.inputs.input_image, input_file_copy)
+                logger.info(f'Copied input {self.inputs.input_image} to {input_file_copy}')
             if not input_file_copy.is_file():
                 raise FileNotFoundError(f'Failed to verify input copy at {input_file_copy}')
         except Exception as e:
             logger.error(f'Error copying input file to {internal_in_dir}: {e}')
             raise
+        finally:
+            if staged_copy is not None:
+                release(staged_copy)
 
         # --- 2. Build and Run Command --- #
         cmd = [
@@ -158,60 +524,24 @@ class NiChartDLMUSE(SimpleInterface):
             cmd.extend(['--MUSE_ROI_mappings_file', self.inputs.muse_roi_mappings_file])
         if self.inputs.all_in_gpu:
             cmd.append('--all_in_gpu')
-        if self.inputs.disable_tta:
-            cmd.append('--disable_tta')
         if self.inputs.clear_cache:
             cmd.append('--clear_cache')
 
-        logger.info(f'Running command: {" ".join(cmd)}')
-        try:
-            process = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            if process.stdout:
-                logger.info(f'NiChart_DLMUSE stdout:\n{process.stdout.strip()}')
-            if process.stderr:
-                logger.warning(f'NiChart_DLMUSE stderr:\n{process.stderr.strip()}')
-        except subprocess.CalledProcessError as e:
-            logger.error(f'NiChart_DLMUSE command failed (exit code {e.returncode}): {" ".join(e.cmd)}')
-            if e.stdout:
-                logger.error(f'  Stdout:\n{e.stdout.strip()}')
-            if e.stderr:
-                logger.error(f'  Stderr:\n{e.stderr.strip()}')
-            # Log contents of raw output dir for debugging
-            self._log_dir_contents(raw_output_dir, "raw output")
-            raise RuntimeError('NiChart_DLMUSE execution failed.') from e
-        except FileNotFoundError:
-            logger.error('NiChart_DLMUSE command not found. Is it installed and in PATH?')
-            raise
-        except Exception as e:
-            logger.error(f'An unexpected error occurred running NiChart_DLMUSE: {e}')
-            raise
-
-        # --- 3. Check Raw Outputs and Copy to Final Location (cwd) --- #
         raw_seg_path = raw_output_dir / f'{base_name}{_DLMUSE_SUFFIX}'
         raw_mask_path = raw_output_dir / _S2_DLICV_SUBDIR / f'{base_name}{_DLICV_SUFFIX}'
         raw_volumes_csv_path = raw_output_dir / f'{base_name}{_VOLUMES_CSV_SUFFIX}'
+        raw_files = (raw_seg_path, raw_mask_path, raw_volumes_csv_path)
 
-        # Check essential raw files exist
-        missing_raw_files = []
-        if not raw_seg_path.exists():
-            missing_raw_files.append(str(raw_seg_path))
-        if not raw_mask_path.exists():
-            missing_raw_files.append(str(raw_mask_path))
-            if not raw_mask_path.parent.exists(): # Log missing subdir as well
-                 logger.warning(f'Raw mask subdirectory missing: {raw_mask_path.parent}')
-        if not raw_volumes_csv_path.exists():
-            missing_raw_files.append(str(raw_volumes_csv_path))
-
-        if missing_raw_files:
-            error_msg = (
-                'NiChart_DLMUSE finished but essential raw output files are missing: '
-                + ', '.join(missing_raw_files)
-            )
-            logger.error(error_msg)
-            self._log_dir_contents(raw_output_dir, "raw output")
-            raise FileNotFoundError(error_msg)
+        if self.inputs.adaptive_tta:
+            self._run_adaptive(cmd, raw_output_dir, raw_files)
         else:
-            logger.info('Essential raw output files found. Copying to final location.')
+            if self.inputs.disable_tta:
+                cmd.append('--disable_tta')
+            self._run_tool(cmd, raw_output_dir, [input_image_path])
+            self._check_raw_outputs(raw_output_dir, raw_files)
+
+        # --- 3. Copy Raw Outputs to Final Location (cwd) --- #
+        logger.info('Essential raw output files found. Copying to final location.')
 
         # Define final paths in cwd
         final_seg_path = self._cwd / raw_seg_path.name
@@ -240,6 +570,70 @@ class NiChartDLMUSE(SimpleInterface):
         # _list_outputs will handle finding files and setting self._results
         return runtime
 
+    def _check_raw_outputs(self, raw_output_dir, raw_files):
+        """Raise if any of the essential ``raw_files`` (segmentation, mask, CSV) is missing."""
+        missing_raw_files = [str(raw_file) for raw_file in raw_files if not raw_file.exists()]
+        if missing_raw_files:
+            error_msg = (
+                'NiChart_DLMUSE finished but essential raw output files are missing: '
+                + ', '.join(missing_raw_files)
+            )
+            logger.error(error_msg)
+            self._log_dir_contents(raw_output_dir, "raw output")
+            raise FileNotFoundError(error_msg)
+
+    def _run_adaptive(self, cmd, raw_output_dir, raw_files):
+        """Run ``cmd`` without TTA, and again with TTA if the QC checks flag the outputs.
+
+        The checks (see :py:mod:`ncdlmuse.utils.qc`) run on the segmentation and
+        mask of the first run; their signals and flags, and whether the tool was
+        run again, are kept as the ``tta_decision`` output. Attempts of both runs
+        count towards ``n_attempts``.
+        """
+        images = [Path(self.inputs.input_image)]
+        # The job is not done until the QC checks pass
+        self._last_stage = False
+        self._run_tool([*cmd, '--disable_tta'], raw_output_dir, images, disable_tta=True)
+        self._check_raw_outputs(raw_output_dir, raw_files)
+        n_attempts = self._n_attempts
+        try:
+            norms = load_norms(self.inputs.qc_norms) if self.inputs.qc_norms else None
+            qc = assess_segmentation(raw_files[0], raw_files[1], norms=norms)
+        except Exception as e:  # noqa: BLE001 - unreadable outputs get the safer run
+            logger.warning(f'QC checks failed on {self._source()} ({e}); assuming a flag.')
+            qc = {'flags': ['qc_error'], 'signals': {}}
+        self._last_stage = True
+
+        if qc['flags']:
+            logger.warning(
+                f'QC flagged the segmentation of {self._source()} ({", ".join(qc["flags"])}); '
+                f'running {self._tool} again with test-time augmentation.'
+            )
+            shutil.rmtree(raw_output_dir, ignore_errors=True)
+            raw_output_dir.mkdir(parents=True)
+            self._run_tool(
+                cmd, raw_output_dir, images, disable_tta=False,
+                log_header='--- Test-time augmentation (flagged by QC) ---',
+            )
+            self._check_raw_outputs(raw_output_dir, raw_files)
+            n_attempts += self._n_attempts
+        else:
+            logger.info(f'QC passed on {self._source()}; keeping the run without TTA.')
+            self._publish_done()
+        self._n_attempts = n_attempts
+        self._tta_decision = {'rerun': bool(qc['flags']), **qc}
+
+    def _publish_done(self):
+        """Mark the job done in its progress document, once no further run is needed."""
+        if not self.inputs.status_file:
+            return
+        try:
+            status = json.loads(Path(self.inputs.status_file).read_text())
+            status.pop('updated_at', None)
+            publish(self.inputs.status_file, **{**status, 'state': 'done', 'progress': 1.0})
+        except (OSError, ValueError) as e:
+            logger.debug(f'Could not publish progress to {self.inputs.status_file}: {e}')
+
     def _process_volumes(self, input_csv_path, output_tsv_path):
         """Load volumes CSV, rename headers based on mapping, save as TSV."""
         logger.info(f'Processing volumes: {input_csv_path} -> {output_tsv_path}')
@@ -256,7 +650,7 @@ class NiChartDLMUSE(SimpleInterface):
                         logger.info(f'Loaded {len(id_to_name)} ROI mappings from package data.')
                 else:
                     logger.warning(f'ROI mapping file not found: {mapping_file_res}')
-            except Exception as e:
+            except (OSError, ValueError, KeyError) as e:
                 logger.error(f'Error loading ROI mapping file: {e}. Proceeding without renaming.')
 
             # Load the original volumes CSV (already copied to cwd)
@@ -279,21 +673,10 @@ class NiChartDLMUSE(SimpleInterface):
         except pd.errors.EmptyDataError:
             logger.error(f'Input volumes CSV is empty: {input_csv_path}. Cannot generate TSV.')
             # Do not raise error here, _list_outputs will handle fallback
-        except Exception as e:
+        except (OSError, ValueError) as e:
             logger.error(f'Error processing volumes file {input_csv_path}: {e}')
             # Do not raise error here, _list_outputs will handle fallback
 
-    def _log_dir_contents(self, directory, label="directory"):
-        """Helper to log the contents of a directory, especially on error."""
-        try:
-            if Path(directory).is_dir():
-                dir_contents = os.listdir(directory)
-                logger.info(f'Contents of {label} ({directory}): {dir_contents}')
-            else:
-                logger.warning(f'{label.capitalize()} directory not found or not a directory: {directory}')
-        except Exception as list_e:
-            logger.error(f'Could not list contents of {label} directory {directory}: {list_e}')
-
     def _list_outputs(self):
         """Find output files in the working directory (cwd) and return paths."""
         outputs = self.output_spec().get()  # Initialize outputs dictionary
@@ -374,6 +757,165 @@ class NiChartDLMUSE(SimpleInterface):
             logger.warning(f'[_list_outputs] Copied original CSV not found: {final_volumes_csv_path}')
             # Don't assign if not found
 
+        outputs['n_attempts'] = self._n_attempts
+        if self._tta_decision is not None:
+            outputs['tta_decision'] = self._tta_decision
+
         # Log final state before returning
         logger.info(f'[_list_outputs] Returning outputs: {outputs}')
         return outputs
+
+
+class _SegmentationStageInputSpec(_SegmentationToolInputSpec):
+    in_files = InputMultiObject(
+        File(exists=True), mandatory=True, desc='Images segmented in one run of the tool'
+    )
+    step_size = traits.Float(
+        desc='Step of the sliding window, as a fraction of the patch size (tool default: 0.5)'
+    )
+
+
+class _SegmentationStageOutputSpec(TraitedSpec):
+    out_files = OutputMultiObject(File(exists=True), desc='Outputs, in the order of in_files')
+    n_attempts = traits.Int(desc='Number of attempts until success')
+
+
+class _SegmentationStage(_SegmentationTool):
+    """Run one stage of NiChart_DLMUSE (``DLICV`` or ``DLMUSE``) on a batch of images.
+
+    The ``in_files`` are linked into one input folder (``{cwd}/inputs``), so a
+    single run of the tool loads its model once for the whole batch; their
+    names must be unique. The tool writes to ``{cwd}/ncdlmuse_raw_out`` and its
+    outputs are matched to the inputs by name (the input's name, or its base
+    name with the stage's suffix). Streaming, progress, drains, timeouts and
+    retries work as in :py:class:`NiChartDLMUSE`.
+    """
+
+    input_spec = _SegmentationStageInputSpec
+    output_spec = _SegmentationStageOutputSpec
+    #: Suffix of the outputs (after the base name of the input)
+    _out_suffix = None
+
+    def _source(self):
+        return ', '.join(str(in_file) for in_file in self.inputs.in_files)
+
+    def _run_interface(self, runtime):
+        self._cwd = Path(runtime.cwd).resolve()
+        in_dir = self._cwd / 'inputs'
+        raw_output_dir = self._cwd / _RAW_OUT_SUBDIR
+        for directory in (in_dir, raw_output_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            directory.mkdir(parents=True)
+
+        in_files = [Path(in_file).absolute() for in_file in self.inputs.in_files]
+        names = [in_file.name for in_file in in_files]
+        if len(set(names)) < len(names):
+            raise ValueError(f'{self._tool} inputs must have unique names: {names}')
+        for in_file in in_files:
+            (in_dir / in_file.name).symlink_to(in_file)
+
+        self._run_tool(self._command(in_dir, raw_output_dir), raw_output_dir, in_files)
+
+        out_files = []
+        for name in names:
+            base_name = name.replace('.nii.gz', '').replace('.nii', '')
+            candidates = [raw_output_dir / name, raw_output_dir / f'{base_name}{self._out_suffix}']
+            out_file = next((path for path in candidates if path.exists()), None)
+            if out_file is None:
+                self._log_dir_contents(raw_output_dir, 'raw output')
+                raise FileNotFoundError(f'{self._tool} finished but wrote no output for {name}.')
+            out_files.append(str(out_file))
+        self._results['out_files'] = out_files
+        self._results['n_attempts'] = self._n_attempts
+        return runtime
+
+    def _command(self, in_dir, raw_output_dir):
+        """Command line segmenting the images of ``in_dir`` into ``raw_output_dir``."""
+        cmd = [
+            self._tool,
+            '-i', str(in_dir),
+            '-o', str(raw_output_dir),
+            '-device', self.inputs.device,
+        ]
+        if self.inputs.model_folder:
+            cmd.extend(['--model_folder', self.inputs.model_folder])
+        if self.inputs.all_in_gpu:
+            cmd.append('--all_in_gpu')
+        if self.inputs.disable_tta:
+            cmd.append('--disable_tta')
+        if isdefined(self.inputs.step_size):
+            cmd.extend(['-step_size', str(self.inputs.step_size)])
+        if self.inputs.clear_cache:
+            cmd.append('--clear_cache')
+        return cmd
+
+
+class DLICV(_SegmentationStage):
+    """Compute intracranial-volume (brain) masks with ``DLICV``.
+
+    This is the first stage of NiChart_DLMUSE; ``out_files`` are binary masks
+    in the space of ``in_files``.
+    """
+
+    _tool = 'DLICV'
+    _first_stage = 'dlicv'
+    _last_stage = False
+    _out_suffix = _DLICV_SUFFIX
+
+
+class DLMUSE(_SegmentationStage):
+    """Parcellate skull-stripped images with ``DLMUSE``.
+
+    This is the second stage of NiChart_DLMUSE; ``out_files`` are labelled with
+    consecutive indices (see ``MUSE_mapping_consecutive_indices.tsv``).
+    """
+
+    _tool = 'DLMUSE'
+    _first_stage = 'dlmuse'
+    _out_suffix = _DLMUSE_SUFFIX
+
+
+class _OnnxStageInputSpec(_SegmentationStageInputSpec):
+    onnx_cache = traits.Str(
+        mandatory=True, nohash=True, desc='Directory of the exported ONNX graphs'
+    )
+    onnx_threads = traits.Int(
+        0, usedefault=True, nohash=True, desc='Intra-op threads of ONNX Runtime (0: all cores)'
+    )
+
+
+class _OnnxStage(_SegmentationStage):
+    """Run a stage with ONNX Runtime instead of its executable (``--backend onnx``).
+
+    The stage runs :py:mod:`ncdlmuse.cli.onnx_predict` in a subprocess, with
+    the graphs of its model exported to ``onnx_cache`` (see
+    :py:mod:`ncdlmuse.utils.onnx`). Inputs, outputs, logs, progress, timeouts
+    and retries are those of the executable. Inference runs on the CPU;
+    ``all_in_gpu`` and ``clear_cache`` are ignored.
+    """
+
+    input_spec = _OnnxStageInputSpec
+
+    def _command(self, in_dir, raw_output_dir):
+        cmd = [
+            sys.executable, '-m', 'ncdlmuse.cli.onnx_predict', self._first_stage,
+            '-i', str(in_dir),
+            '-o', str(raw_output_dir),
+            '--onnx_cache', self.inputs.onnx_cache,
+            '--threads', str(self.inputs.onnx_threads),
+        ]
+        if self.inputs.model_folder:
+            cmd.extend(['--model_folder', self.inputs.model_folder])
+        if self.inputs.disable_tta:
+            cmd.append('--disable_tta')
+        if isdefined(self.inputs.step_size):
+            cmd.extend(['-step_size', str(self.inputs.step_size)])
+        return cmd
+
+
+class DLICVOnnx(_OnnxStage, DLICV):
+    """Compute brain masks as :py:class:`DLICV` does, with ONNX Runtime."""
+
+
+class DLMUSEOnnx(_OnnxStage, DLMUSE):
+    """Parcellate skull-stripped images as :py:class:`DLMUSE` does, with ONNX Runtime."""
@@ -27,6 +27,7 @@ from bids.layout import BIDSLayout, BIDSLayoutIndexer
 from nireports.assembler.report import Report as NireportsReport
 
 from ncdlmuse import config, data
+from ncdlmuse.utils.bids import parse_entities
 
 
 # Custom Report class to safely handle the layout object
@@ -404,9 +405,7 @@ class SafeReport(NireportsReport):
             reportlet_path = Path(reportlet)
             if reportlet_path.suffix.lower() == '.svg':
                 # Extract subject ID from the SVG filename if it contains one
-                svg_subject_id = subject_id
-                if 'sub-' in reportlet_path.name:
-                    svg_subject_id = reportlet_path.name.split('_')[0].replace('sub-', '')
+                svg_subject_id = parse_entities(reportlet_path).get('subject', subject_id)
 
                 content = \
                     (f'<img src="sub-{svg_subject_id}/figures/{reportlet_path.name}" '
@@ -0,0 +1,164 @@
+"""Tests for the BIDS input utilities."""
+
+import gc
+import logging
+import time
+import weakref
+
+import pytest
+from bids.layout import BIDSLayout
+
+from ncdlmuse.utils import bids
+from ncdlmuse.utils.bids import (
+    FastLayout,
+    collect_t1w_files,
+    get_entities_from_file,
+    parse_entities,
+)
+
+
+def _make_dataset(root, n_subjects, sessions=(None,)):
+    """Write a BIDS dataset of empty T1w files (enough for indexing)."""
+    root.mkdir(parents=True, exist_ok=True)
+    (root / 'dataset_description.json').write_text('{"Name": "test", "BIDSVersion": "1.10.0"}')
+    for i in range(n_subjects):
+        for session in sessions:
+            anat_dir = root / f'sub-{i:05d}'
+            prefix = f'sub-{i:05d}'
+            if session:
+                anat_dir /= f'ses-{session}'
+                prefix += f'_ses-{session}'
+            anat_dir /= 'anat'
+            anat_dir.mkdir(parents=True)
+            (anat_dir / f'{prefix}_T1w.nii.gz').touch()
+    return root
+
+
+def test_collect_t1w_files(tmp_path):
+    root = _make_dataset(tmp_path / 'bids', 3, sessions=('1', '2'))
+    anat_dir = root / 'sub-00001' / 'ses-2' / 'anat'
+    (anat_dir / 'sub-00001_ses-2_run-2_T1w.nii.gz').touch()
+    (anat_dir / 'sub-00001_ses-2_run-2_T1w.json').write_text('{"RepetitionTime": 2.3}')
+    layout = BIDSLayout(str(root), validate=False)
+
+    records = collect_t1w_files(layout, ['00001', '00002'], ['2'], chunk_size=2)
+    assert [r[0] for r in records] == [
+        str(anat_dir / 'sub-00001_ses-2_T1w.nii.gz'),
+        str(anat_dir / 'sub-00001_ses-2_run-2_T1w.nii.gz'),
+        str(root / 'sub-00002' / 'ses-2' / 'anat' / 'sub-00002_ses-2_T1w.nii.gz'),
+    ]
+    for t1w_file, entities, _ in records:
+        assert entities == get_entities_from_file(t1w_file, layout=layout)
+    assert records[1][1]['run'] == 2
+    assert [r[2] for r in records] == [
+        None,
+        str(anat_dir / 'sub-00001_ses-2_run-2_T1w.json'),
+        None,
+    ]
+    assert len(collect_t1w_files(layout, ['00000', '00001', '00002'])) == 7
+
+
+def test_parse_entities(tmp_path, monkeypatch):
+    root = _make_dataset(tmp_path / 'bids', 1, sessions=('1',))
+    anat_dir = root / 'sub-00000' / 'ses-1' / 'anat'
+    t1w_file = anat_dir / 'sub-00000_ses-1_acq-mp_run-02_T1w.nii.gz'
+    odd_file = anat_dir / 'sub-00000_ses-1_acq-mp.rage_T1w.nii.gz'
+    layout = BIDSLayout(str(root), validate=False)
+    assert parse_entities(t1w_file) == layout.parse_file_entities(str(t1w_file))
+    assert parse_entities(odd_file) == {}
+    assert parse_entities(odd_file, layout=layout)['session'] == '1'
+
+    calls = []
+    monkeypatch.setattr(
+        layout, 'parse_file_entities', lambda path: calls.append(path) or {'subject': 'x'}
+    )
+    monkeypatch.setattr('bids.layout.BIDSLayout', None)  # No layout is ever built
+    entities = get_entities_from_file(t1w_file, layout=layout)
+    assert entities['session'] == '1'  # Cached from the call above
+    assert calls == []
+    entities['subject'] = 'changed'
+    assert parse_entities(t1w_file, layout=layout)['subject'] == '00000'
+    assert parse_entities(odd_file, layout=layout) == {'subject': 'x'}
+    assert calls == [str(odd_file)]
+    assert get_entities_from_file(anat_dir / 'T1w.nii.gz')['session'] is None  # placeholders
+    assert bids._parse_entities.cache_info().currsize >= 3
+
+    # The cache does not keep layouts alive
+    class _Layout:
+        def parse_file_entities(self, path):
+            return {'subject': 'y'}
+
+    other_layout = _Layout()
+    assert parse_entities(odd_file, layout=other_layout) == {'subject': 'y'}
+    layout_ref = weakref.ref(other_layout)
+    del other_layout
+    gc.collect()
+    assert layout_ref() is None
+
+
+def test_fast_layout(tmp_path):
+    root = _make_dataset(tmp_path / 'bids', 3, sessions=('1', '2'))
+    anat_dir = root / 'sub-00001' / 'ses-2' / 'anat'
+    (anat_dir / 'sub-00001_ses-2_acq-mp_run-02_T1w.nii').touch()
+    (anat_dir / 'sub-00001_ses-2_acq-mp_run-02_T1w.json').write_text('{"EchoTime": 0.003}')
+    (anat_dir / 'sub-00001_ses-2_bold.nii.gz').touch()
+    (root / 'sub-00001' / 'ses-1' / 'anat' / 'sub-00002_ses-1_T1w.nii.gz').touch()  # misplaced
+    (root / 'acq-mp_T1w.json').write_text('{"EchoTime": 0.002, "RepetitionTime": 2.3}')
+    (root / 'T1w.json').write_text('{"FlipAngle": 8}')
+    bids_layout = BIDSLayout(str(root), validate=False)
+    fast_layout = FastLayout(root)
+
+    query = {'suffix': 'T1w', 'extension': ['.nii', '.nii.gz'], 'return_type': 'file'}
+    assert fast_layout.get_subjects() == bids_layout.get_subjects()
+    assert fast_layout.get_sessions(subject='00001') == bids_layout.get_sessions(subject='00001')
+    assert fast_layout.get(subject=['00001', '00002'], session='2', **query) == sorted(
+        bids_layout.get(subject=['00001', '00002'], session='2', **query)
+    )
+    assert collect_t1w_files(fast_layout, ['00001'], ['2']) == collect_t1w_files(
+        bids_layout, ['00001'], ['2']
+    )
+    t1w_file = str(anat_dir / 'sub-00001_ses-2_acq-mp_run-02_T1w.nii')
+    assert fast_layout.get_metadata(t1w_file) == {
+        'EchoTime': 0.003,
+        'RepetitionTime': 2.3,
+        'FlipAngle': 8,
+    }
+    assert fast_layout.get_metadata(t1w_file) == bids_layout.get_metadata(t1w_file)
+
+
+@pytest.mark.benchmark
+def test_benchmark_fast_discovery(tmp_path):
+    root = _make_dataset(tmp_path / 'bids', 25000, sessions=('1', '2'))
+    start = time.perf_counter()
+    layout = FastLayout(root)
+    elapsed = time.perf_counter() - start
+    logging.getLogger(__name__).info(f'Fast discovery of 50000 T1w files: {elapsed:.2f}s')
+    assert len(layout.get(suffix='T1w')) == 50000
+
+
+@pytest.mark.benchmark
+def test_benchmark_collect_t1w_files(tmp_path):
+    n_subjects = 10000
+    root = _make_dataset(tmp_path / 'bids', n_subjects)
+    layout = BIDSLayout(str(root), validate=False)
+    subjects = [f'{i:05d}' for i in range(n_subjects)]
+
+    start = time.perf_counter()
+    per_subject = []
+    for subject in subjects:
+        for t1w_file in layout.get(
+            subject=subject, suffix='T1w', extension=['.nii', '.nii.gz'], return_type='file'
+        ):
+            per_subject.append((t1w_file, get_entities_from_file(t1w_file, layout=layout)))
+    per_subject_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = collect_t1w_files(layout, subjects)
+    bulk_time = time.perf_counter() - start
+
+    logging.getLogger(__name__).info(
+        f'{n_subjects} subjects: per-subject queries {per_subject_time:.1f}s, '
+        f'bulk query {bulk_time:.1f}s ({per_subject_time / bulk_time:.0f}x)'
+    )
+    assert [(r[0], r[1]) for r in records] == sorted(per_subject)
+    assert bulk_time < per_subject_time
@@ -0,0 +1,135 @@
+"""Tests for the detection and reuse of duplicate T1w inputs."""
+
+import os
+
+import nibabel as nb
+import numpy as np
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+
+from ncdlmuse.utils import dedup
+from ncdlmuse.utils.dedup import data_checksum, find_duplicates
+from ncdlmuse.utils.workdir import CompletionTracker
+from ncdlmuse.workflows.base import (
+    _add_to_fanout,
+    _connect_reused_outputs,
+    _reuse_dlmuse_outputs,
+)
+
+
+def _write_image(path, seed=0, descrip=b''):
+    data = np.random.default_rng(seed).random((8, 8, 8)).astype(np.float32)
+    img = nb.Nifti1Image(data, np.diag([1.0, 1.0, 1.2, 1.0]))
+    img.header['descrip'] = descrip
+    img.to_filename(path)
+    return str(path)
+
+
+def test_find_duplicates(tmp_path):
+    original = _write_image(tmp_path / 'sub-01_T1w.nii.gz')
+    # Same voxels, but uncompressed and with another header description
+    copy = _write_image(tmp_path / 'sub-01_acq-copy_T1w.nii', descrip=b're-exported')
+    link = tmp_path / 'sub-02_T1w.nii.gz'
+    link.symlink_to(original)
+    other = _write_image(tmp_path / 'sub-03_T1w.nii.gz', seed=1)
+
+    assert data_checksum(original) == data_checksum(copy)
+    assert data_checksum(original) != data_checksum(other)
+    assert find_duplicates([original, copy, str(link), other]) == {
+        copy: original,
+        str(link): original,
+    }
+    # The first file (in the given order) of a group is its representative
+    assert find_duplicates([copy, original]) == {original: copy}
+
+
+def test_find_duplicates_cache(tmp_path, monkeypatch):
+    files = [_write_image(tmp_path / f'sub-0{i}_T1w.nii.gz', seed=i // 2) for i in range(4)]
+    cache_file = tmp_path / 'logs' / 'fingerprints.json'
+    expected = {files[1]: files[0], files[3]: files[2]}
+    assert find_duplicates(files, cache_file=cache_file) == expected
+
+    checksummed = []
+    monkeypatch.setattr(
+        dedup, 'data_checksum', lambda path: checksummed.append(path) or data_checksum(path)
+    )
+    assert find_duplicates(files, cache_file=cache_file) == expected
+    assert checksummed == []
+
+    # Modified files are fingerprinted again
+    _write_image(files[3], seed=5)
+    assert find_duplicates(files, cache_file=cache_file) == {files[1]: files[0]}
+    assert checksummed == [files[3]]
+
+
+def _run_dlmuse(in_file):
+    import os
+    from pathlib import Path
+
+    outputs = []
+    for suffix in ('dseg.nii.gz', 'mask.nii.gz', 'volumes.tsv'):
+        out_file = Path(os.getcwd()) / f'{Path(in_file).name}_{suffix}'
+        out_file.write_text(suffix)
+        outputs.append(str(out_file))
+    return (*outputs, 1)
+
+
+def _subject_wf(name, t1w_file, reuse_from=None):
+    sub_wf = pe.Workflow(name=name)
+    bidssrc = pe.Node(niu.IdentityInterface(fields=['subject_data']), name='bidssrc')
+    bidssrc.inputs.subject_data = {'t1w': [t1w_file]}
+    fields = ['dlmuse_segmentation', 'dlicv_mask', 'dlmuse_volumes', 'n_attempts']
+    if reuse_from:
+        dlmuse_node = pe.Node(
+            niu.Function(
+                function=_reuse_dlmuse_outputs,
+                input_names=[*fields, 'source_t1w'],
+                output_names=fields,
+            ),
+            name='reuse_dlmuse_node',
+        )
+        dlmuse_node.inputs.source_t1w = reuse_from
+    else:
+        dlmuse_node = pe.Node(
+            niu.Function(function=_run_dlmuse, input_names=['in_file'], output_names=fields),
+            name='nichartdlmuse_node',
+        )
+        dlmuse_node.inputs.in_file = t1w_file
+    sink = pe.Node(niu.IdentityInterface(fields=['in_file']), name='outputnode')
+    sub_wf.connect(dlmuse_node, 'dlmuse_segmentation', sink, 'in_file')
+    sub_wf.add_nodes([bidssrc])
+    return sub_wf
+
+
+def test_reused_outputs(tmp_path):
+    t1w_files = [str(tmp_path / f'sub-0{i}_T1w.nii.gz') for i in range(2)]
+    workflow = pe.Workflow(name='ncdlmuse_wf', base_dir=str(tmp_path / 'work'))
+    source_wf = _subject_wf('single_subject_sub-00_wf', t1w_files[0])
+    dup_wf = _subject_wf('single_subject_sub-01_wf', t1w_files[1], reuse_from=t1w_files[0])
+    for sub_wf in (source_wf, dup_wf):
+        _add_to_fanout(workflow, sub_wf)
+    _connect_reused_outputs(workflow, source_wf, dup_wf, hashed_layout=True)
+
+    tracker = CompletionTracker(workflow, prune=True)
+    assert tracker.reused_by == {'single_subject_sub-00_wf': {'single_subject_sub-01_wf'}}
+    workflow.run(plugin='Linear', plugin_args={'status_callback': tracker})
+
+    assert sorted(tracker.completed) == ['single_subject_sub-00_wf', 'single_subject_sub-01_wf']
+    # Both working directories are pruned, the source only after its duplicate
+    assert all(not path.exists() for path in tracker.node_dirs.values())
+
+    # The reused files are links into the duplicate's node directory
+    in_dir = tmp_path / 'in'
+    in_dir.mkdir()
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    seg = in_dir / 'seg.nii.gz'
+    seg.write_text('seg')
+    cwd = os.getcwd()
+    os.chdir(out_dir)
+    try:
+        outputs = _reuse_dlmuse_outputs(str(seg), str(seg), str(seg), n_attempts=2)
+    finally:
+        os.chdir(cwd)
+    assert outputs == (str(out_dir / 'seg.nii.gz'),) * 3 + (2,)
+    assert (out_dir / 'seg.nii.gz').stat().st_ino == seg.stat().st_ino
@@ -0,0 +1,77 @@
+"""Tests for the Dask execution backend."""
+
+import pytest
+
+distributed = pytest.importorskip('distributed')
+
+from ncdlmuse.cli.distributed import (  # noqa: E402
+    _advertised_resources,
+    _task_resources,
+    collect_jobs,
+    run_jobs,
+)
+
+
+def _jobs():
+    files = [
+        '/bids/sub-01/ses-1/anat/sub-01_ses-1_T1w.nii.gz',
+        '/bids/sub-01/ses-2/anat/sub-01_ses-2_T1w.nii.gz',
+        '/bids/sub-02/anat/sub-02_T1w.nii.gz',
+        '/bids/sub-03/anat/sub-03_T1w.nii.gz',
+    ]
+    jobs = collect_jobs(files)
+    for job, subject in zip(jobs, ('01', '01', '02', '03'), strict=True):
+        job['subject'] = subject
+    return jobs
+
+
+def _flaky_segment(config_file, job):
+    """Fail on the first attempt of every job, and always for sub-03."""
+    from pathlib import Path
+
+    marker = Path(config_file) / f'{job["job_id"]}.attempted'
+    if job['subject'] == '03' or not marker.exists():
+        marker.touch()
+        raise RuntimeError(f'transient failure for {job["t1w"]}')
+    return {**job, 'host': 'test', 'runtime': 0.0}
+
+
+def _report(config_file, subject_id):
+    from pathlib import Path
+
+    (Path(config_file) / f'report-{subject_id}').touch()
+    return 0
+
+
+@pytest.fixture
+def client():
+    with distributed.LocalCluster(
+        n_workers=2,
+        threads_per_worker=1,
+        processes=False,
+        resources={'inference': 1, 'io': 1},
+        dashboard_address=None,
+    ) as cluster, distributed.Client(cluster) as client:
+        yield client
+
+
+def test_resources(client):
+    advertised = _advertised_resources(client)
+    assert {'inference', 'io'} <= advertised
+    assert _task_resources('inference', advertised) == {'inference': 1}
+    assert _task_resources('io', set()) is None
+
+
+def test_run_jobs_retries_and_reports(client, tmp_path):
+    summary = run_jobs(
+        client, str(tmp_path), _jobs(), retries=1, segment=_flaky_segment, report=_report
+    )
+    assert sorted(r['t1w'] for r in summary['succeeded']) == [
+        '/bids/sub-01/ses-1/anat/sub-01_ses-1_T1w.nii.gz',
+        '/bids/sub-01/ses-2/anat/sub-01_ses-2_T1w.nii.gz',
+        '/bids/sub-02/anat/sub-02_T1w.nii.gz',
+    ]
+    assert [job['subject'] for job in summary['failed']] == ['03']
+    assert summary['report_failed'] == []
+    # One report per participant with at least one successful T1w
+    assert sorted(p.name for p in tmp_path.glob('report-*')) == ['report-01', 'report-02']
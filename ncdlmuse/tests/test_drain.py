@@ -0,0 +1,136 @@
+"""Tests for the graceful drain of a run."""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from ncdlmuse import config
+from ncdlmuse.cli.run import _make_tracker, _run_workflow
+from ncdlmuse.tests.test_workdir import _make_workflow, _t1w_files
+from ncdlmuse.utils.drain import (
+    DRAIN_EXIT_CODE,
+    DRAIN_FILE,
+    DrainHandler,
+    drain_state,
+    record_outcome,
+    request_drain,
+    sigterm_blocked,
+)
+from ncdlmuse.utils.quarantine import load_failures
+from ncdlmuse.utils.workdir import is_complete, settings_signature
+
+
+def test_drain_handler(tmp_path):
+    drain_file = tmp_path / DRAIN_FILE
+    previous = signal.getsignal(signal.SIGTERM)
+    with DrainHandler(drain_file, grace_period=30) as drain:
+        assert not drain.requested
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert drain.requested
+    assert signal.getsignal(signal.SIGTERM) == previous
+
+    state = drain_state(drain_file)
+    assert state['reason'] == 'SIGTERM'
+    assert state['deadline'] == state['requested_at'] + 30
+    # A later request keeps the original deadline
+    assert request_drain(drain_file, 1000)['deadline'] == state['deadline']
+
+    record_outcome(drain_file, completed=['a'], deferred=['b'])
+    state = json.loads(drain_file.read_text())
+    assert state['completed'] == ['a']
+    assert state['deferred'] == ['b']
+
+
+def test_drained_run(tmp_path, monkeypatch):
+    output_dir = tmp_path / 'out'
+    log_dir = output_dir / 'logs' / 'run'
+    log_dir.mkdir(parents=True)
+    monkeypatch.setattr(config.execution, 'output_dir', output_dir)
+    monkeypatch.setattr(config.execution, 'log_dir', log_dir)
+    monkeypatch.setattr(config.execution, 'quarantine', True)
+    monkeypatch.setattr(config.execution, 'prune_work_dir', False)
+    monkeypatch.setattr(config.nipype, 'plugin', 'Linear')
+    monkeypatch.setattr(config.nipype, 'plugin_args', {})
+
+    t1w_files = _t1w_files(tmp_path, n=2)
+    workflow = _make_workflow(tmp_path, t1w_files, fail=(1,))
+    workflow.config['execution'].update(
+        {'crashdump_dir': str(log_dir), 'stop_on_first_crash': False}
+    )
+    request_drain(log_dir / DRAIN_FILE, 0)
+
+    tracker = _make_tracker(workflow)
+    assert _run_workflow(workflow, tracker) == DRAIN_EXIT_CODE
+    # The finished T1w can be skipped on resume, the interrupted one is not quarantined
+    assert is_complete(tmp_path / 'work', t1w_files[0], settings_signature())
+    assert not is_complete(tmp_path / 'work', t1w_files[1], settings_signature())
+    assert load_failures(output_dir) == []
+
+
+WORKER_SCRIPT = """
+import multiprocessing as mp
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ncdlmuse.utils.drain import shield_workers
+
+TOOLS = []
+
+
+def start_tool():
+    TOOLS.append(subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']))
+    return os.getpid(), TOOLS[-1].pid
+
+
+def stop_tool():
+    alive = TOOLS[-1].poll() is None
+    TOOLS[-1].kill()
+    return os.getpid(), alive
+
+
+if __name__ == '__main__':
+    mp.set_start_method('forkserver')
+    assert shield_workers()
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        worker, tool = pool.submit(start_tool).result()
+        # Schedulers signal every process of a preempted job
+        os.kill(worker, signal.SIGTERM)
+        os.kill(tool, signal.SIGTERM)
+        time.sleep(1)
+        assert pool.submit(stop_tool).result() == (worker, True)
+    print('shielded')
+"""
+
+
+def test_workers_ignore_sigterm(tmp_path):
+    script = tmp_path / 'workers.py'
+    script.write_text(WORKER_SCRIPT)
+    result = subprocess.run(
+        [sys.executable, str(script)], capture_output=True, text=True, timeout=120, check=False
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'shielded'
+
+
+def test_sigterm_blocked():
+    """Tools started from the main process are shielded as well."""
+    with sigterm_blocked():
+        tool = subprocess.Popen(
+            [sys.executable, '-c', 'import time; time.sleep(60)'], start_new_session=True
+        )
+    try:
+        os.killpg(tool.pid, signal.SIGTERM)
+        time.sleep(1)
+        assert tool.poll() is None
+        # The calling thread receives SIGTERM again
+        assert signal.SIGTERM not in signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    finally:
+        tool.kill()
+        tool.wait()
@@ -0,0 +1,29 @@
+"""Tests for the group-level aggregation of volumes."""
+
+import json
+
+import pandas as pd
+
+from ncdlmuse.workflows.group import aggregate_volumes
+
+
+def test_aggregate_volumes_default_model(tmp_path):
+    """Volumes of the models of ``--compare-models`` are not aggregated."""
+    derivatives_dir = tmp_path / 'ncdlmuse'
+    derivatives_dir.mkdir()
+    (derivatives_dir / 'dataset_description.json').write_text(
+        '{"Name": "test", "BIDSVersion": "1.10.0", "DatasetType": "derivative"}'
+    )
+    for subject, volume in (('01', 10.0), ('02', 20.0)):
+        anat_dir = derivatives_dir / f'sub-{subject}' / 'anat'
+        anat_dir.mkdir(parents=True)
+        (anat_dir / f'sub-{subject}_T1w.json').write_text(json.dumps({'volumes': {'4': volume}}))
+        (anat_dir / f'sub-{subject}_seg-DLMUSEv2_T1w.json').write_text(
+            json.dumps({'volumes': {'4': -1.0}})
+        )
+
+    output_file = tmp_path / 'group_ncdlmuse_volumes.tsv'
+    aggregate_volumes(derivatives_dir, output_file)
+    volumes = pd.read_csv(output_file, sep='\t', dtype={'4': float})
+    assert volumes['subject'].tolist() == ['sub-01', 'sub-02']
+    assert volumes['4'].tolist() == [10.0, 20.0]
@@ -1,5 +1,8 @@
 """Tests for ncdlmuse interfaces."""
 
+import json
+import os
+import time
 from pathlib import Path
 
 import nibabel as nib
@@ -77,3 +80,250 @@ def test_nichartdlmuse_missing_input():
     """Test that the interface raises an error if input_image is missing."""
     with pytest.raises( ValueError,match="NiChartDLMUSE requires a value for input 'input_image'"):
         NiChartDLMUSE().run()
+
+
+FAKE_NICHART_DLMUSE = """#!{python}
+import os, sys, time
+from pathlib import Path
+
+in_dir = Path(sys.argv[sys.argv.index('-i') + 1])
+out_dir = Path(sys.argv[sys.argv.index('-o') + 1])
+counter = Path(os.environ['FAKE_DLMUSE_COUNTER'])
+attempt = int(counter.read_text()) + 1 if counter.exists() else 1
+counter.write_text(str(attempt))
+print('Running DLICV', flush=True)
+if attempt < int(os.environ.get('FAKE_DLMUSE_SUCCEED_AT', '1')):
+    time.sleep(60)  # Hang
+base = next(in_dir.iterdir()).name.replace('.nii.gz', '')
+(out_dir / 's2_dlicv').mkdir(parents=True, exist_ok=True)
+(out_dir / f'{{base}}_DLMUSE.nii.gz').write_bytes(b'seg')
+(out_dir / 's2_dlicv' / f'{{base}}_DLICV.nii.gz').write_bytes(b'mask')
+(out_dir / f'{{base}}_DLMUSE_Volumes.csv').write_text('MRID,702\\nsynth,1.0\\n')
+print('done with', base)
+"""
+
+
+@pytest.fixture
+def fake_nichart_dlmuse(tmp_path, monkeypatch):
+    """Put a fake ``NiChart_DLMUSE`` that hangs until a given attempt on the PATH."""
+    import sys
+
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    executable = bin_dir / 'NiChart_DLMUSE'
+    executable.write_text(FAKE_NICHART_DLMUSE.format(python=sys.executable))
+    executable.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}:{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_DLMUSE_COUNTER', str(tmp_path / 'attempts'))
+    return tmp_path / 'attempts'
+
+
+def test_nichartdlmuse_inactivity_retry(synthetic_t1w_file, fake_nichart_dlmuse, monkeypatch):
+    """A hung run is killed by the watchdog and retried."""
+    monkeypatch.setenv('FAKE_DLMUSE_SUCCEED_AT', '2')
+    work_dir = Path(synthetic_t1w_file).parent / 'work'
+    work_dir.mkdir()
+    iface = NiChartDLMUSE(
+        input_image=synthetic_t1w_file,
+        inactivity_timeout=1.0,
+        max_retries=1,
+        retry_backoff=0.0,
+    )
+    start = time.monotonic()
+    result = iface.run(cwd=str(work_dir))
+    assert time.monotonic() - start < 30
+    assert fake_nichart_dlmuse.read_text() == '2'
+    assert result.outputs.n_attempts == 2
+    assert Path(result.outputs.dlmuse_segmentation).is_file()
+    log = (work_dir / 'NiChart_DLMUSE.log').read_text()
+    assert '--- Attempt 2 ---' in log
+
+
+def test_nichartdlmuse_timeout_exhausts_retries(
+    synthetic_t1w_file, fake_nichart_dlmuse, monkeypatch
+):
+    """Runs that exceed the timeout fail after the allowed number of retries."""
+    monkeypatch.setenv('FAKE_DLMUSE_SUCCEED_AT', '10')
+    work_dir = Path(synthetic_t1w_file).parent / 'work'
+    work_dir.mkdir()
+    iface = NiChartDLMUSE(
+        input_image=synthetic_t1w_file, timeout=1.0, max_retries=1, retry_backoff=0.0
+    )
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match='after 2 attempt'):
+        iface.run(cwd=str(work_dir))
+    assert time.monotonic() - start < 30
+    assert fake_nichart_dlmuse.read_text() == '2'
+
+
+def test_estimate_timeout(synthetic_t1w_file):
+    from ncdlmuse.interfaces.ncdlmuse import estimate_timeout
+
+    # Small images get the floor; TTA and devices scale larger ones
+    assert estimate_timeout(synthetic_t1w_file) == 1800.0
+    big = Path(synthetic_t1w_file).parent / 'big_T1w.nii.gz'
+    nib.Nifti1Image(np.zeros((256, 256, 256), dtype=np.uint8), np.eye(4)).to_filename(big)
+    cpu = estimate_timeout(big, 'cpu')
+    assert cpu > estimate_timeout(big, 'cpu', disable_tta=True)
+    assert cpu > estimate_timeout(big, 'cuda')
+
+    # The interface only applies an estimated limit when asked to
+    iface = NiChartDLMUSE(input_image=synthetic_t1w_file)
+    assert iface._get_timeout([synthetic_t1w_file]) is None
+    iface.inputs.auto_timeout = True
+    assert iface._get_timeout([synthetic_t1w_file]) == 1800.0
+    # Unreadable images fall back to a generous limit
+    not_nifti = Path(synthetic_t1w_file).parent / 'broken_T1w.nii.gz'
+    not_nifti.write_bytes(b'not a NIfTI file')
+    assert iface._get_timeout([not_nifti, big]) == 1800.0 * 4 * 2
+
+
+def test_nichartdlmuse_drain(synthetic_t1w_file, fake_nichart_dlmuse, monkeypatch):
+    """A running job is stopped at the drain deadline, and no new job is started."""
+    import threading
+
+    from ncdlmuse.utils.drain import DrainRequested, request_drain
+
+    monkeypatch.setenv('FAKE_DLMUSE_SUCCEED_AT', '10')
+    work_dir = Path(synthetic_t1w_file).parent / 'work'
+    work_dir.mkdir()
+    drain_file = work_dir / 'drain.json'
+    iface = NiChartDLMUSE(
+        input_image=synthetic_t1w_file,
+        drain_file=str(drain_file),
+        max_retries=1,
+        retry_backoff=0.0,
+    )
+    timer = threading.Timer(0.5, request_drain, args=(drain_file, 1.0))
+    timer.start()
+    start = time.monotonic()
+    with pytest.raises(DrainRequested):
+        iface.run(cwd=str(work_dir))
+    assert time.monotonic() - start < 30
+    assert fake_nichart_dlmuse.read_text() == '1'  # Not retried
+
+    fake_nichart_dlmuse.unlink()
+    with pytest.raises(DrainRequested, match='not starting'):
+        iface.run(cwd=str(work_dir))
+    assert not fake_nichart_dlmuse.exists()
+
+
+def test_nichartdlmuse_adaptive_tta(synthetic_t1w_file, fake_nichart_dlmuse):
+    """Flagged segmentations (here, unreadable ones) are run again with TTA."""
+    work_dir = Path(synthetic_t1w_file).parent / 'work'
+    work_dir.mkdir()
+    status_file = work_dir / 'status.json'
+    iface = NiChartDLMUSE(
+        input_image=synthetic_t1w_file, adaptive_tta=True, status_file=str(status_file)
+    )
+    result = iface.run(cwd=str(work_dir))
+    assert fake_nichart_dlmuse.read_text() == '2'
+    assert result.outputs.n_attempts == 2
+    assert result.outputs.tta_decision == {'rerun': True, 'flags': ['qc_error'], 'signals': {}}
+    log = (work_dir / 'NiChart_DLMUSE.log').read_text()
+    assert log.count('Running DLICV') == 2
+    assert '--- Test-time augmentation (flagged by QC) ---' in log
+    assert json.loads(status_file.read_text())['state'] == 'done'
+
+
+FAKE_STAGE = """#!{python}
+import sys
+from pathlib import Path
+
+in_dir = Path(sys.argv[sys.argv.index('-i') + 1])
+out_dir = Path(sys.argv[sys.argv.index('-o') + 1])
+print('Running DLICV', *sys.argv[5:], flush=True)
+for in_file in sorted(in_dir.iterdir()):
+    base = in_file.name.replace('.nii.gz', '')
+    (out_dir / f'{{base}}_DLICV.nii.gz').write_bytes(in_file.read_bytes())
+    print('done with', base, flush=True)
+"""
+
+
+def test_dlicv_batch(tmp_path, monkeypatch):
+    """One run of a stage processes a batch, and outputs follow the order of the inputs."""
+    import sys
+
+    from ncdlmuse.interfaces.ncdlmuse import DLICV
+
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    executable = bin_dir / 'DLICV'
+    executable.write_text(FAKE_STAGE.format(python=sys.executable))
+    executable.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}:{os.environ["PATH"]}')
+    in_files = []
+    for subject in ('02', '01'):
+        in_file = tmp_path / f'sub-{subject}_T1w.nii.gz'
+        in_file.write_bytes(subject.encode())
+        in_files.append(str(in_file))
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    result = DLICV(
+        in_files=in_files, step_size=0.75, status_file=str(tmp_path / 'status.json')
+    ).run(cwd=str(work_dir))
+    assert result.outputs.n_attempts == 1
+    assert [Path(out_file).read_bytes() for out_file in result.outputs.out_files] == [
+        b'02',
+        b'01',
+    ]
+    assert 'Running DLICV -device cpu -step_size 0.75' in (work_dir / 'DLICV.log').read_text()
+    # DLICV is not the last stage
+    assert json.loads((tmp_path / 'status.json').read_text())['state'] == 'running'
+
+
+def test_segmentation_tool_source(tmp_path):
+    from ncdlmuse.interfaces.ncdlmuse import (
+        DLICV,
+        _SegmentationTool,
+        _SegmentationToolInputSpec,
+    )
+
+    class _Tool(_SegmentationTool):
+        input_spec = _SegmentationToolInputSpec
+        _tool = 'tool'
+
+    assert _Tool()._source() == 'tool'
+    assert _Tool(job_id='sub-01_T1w')._source() == 'sub-01_T1w'
+    in_file = tmp_path / 'sub-01_T1w.nii.gz'
+    in_file.write_bytes(b'')
+    assert DLICV(in_files=[str(in_file)])._source() == str(in_file)
+
+
+def test_dlmuse_onnx_command(tmp_path):
+    """The ONNX backend runs the stage module with the same inputs as the executable."""
+    import sys
+
+    from ncdlmuse.interfaces.ncdlmuse import DLMUSEOnnx
+
+    in_file = tmp_path / 'sub-01_T1w.nii.gz'
+    in_file.write_bytes(b'01')
+    iface = DLMUSEOnnx(
+        in_files=[str(in_file)],
+        onnx_cache=str(tmp_path / 'onnx'),
+        onnx_threads=4,
+        model_folder='/models',
+        step_size=0.75,
+    )
+    cmd = iface._command(tmp_path / 'inputs', tmp_path / 'out')
+    assert cmd[:4] == [sys.executable, '-m', 'ncdlmuse.cli.onnx_predict', 'dlmuse']
+    onnx_cache = tmp_path / 'onnx'
+    assert f'--onnx_cache {onnx_cache} --threads 4 --model_folder /models -step_size 0.75' in (
+        ' '.join(cmd)
+    )
+    assert iface._tool == 'DLMUSE'
+
+
+def test_nichartdlmuse_prefetched_copy_vanished(
+    synthetic_t1w_file, fake_nichart_dlmuse, monkeypatch
+):
+    """The original input is used if the claimed prefetched copy disappears."""
+    from ncdlmuse.interfaces import ncdlmuse
+
+    work_dir = Path(synthetic_t1w_file).parent / 'work'
+    work_dir.mkdir()
+    monkeypatch.setattr(ncdlmuse, 'consume', lambda source, prefetch_dir: work_dir / 'gone')
+    iface = NiChartDLMUSE(input_image=synthetic_t1w_file, prefetch_dir=str(work_dir))
+    result = iface.run(cwd=str(work_dir))
+    assert Path(result.outputs.dlmuse_segmentation).is_file()
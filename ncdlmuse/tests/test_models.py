@@ -0,0 +1,79 @@
+"""Tests for the run-level management of the model cache."""
+
+import hashlib
+
+import pytest
+
+from ncdlmuse.utils.models import copy_models, prepare_models, verify_models
+
+
+def _fake_package(tmp_path, tool):
+    """A tool package directory with a downloaded model and its HF metadata."""
+    pkg_dir = tmp_path / tool
+    files = {
+        f'nnunet_results/Dataset_{tool}/checkpoint_final.pth': (b'weights' * 100, 'sha256'),
+        f'nnunet_results/Dataset_{tool}/plans.json': (b'{"plans": 1}', 'git'),
+    }
+    for relpath, (content, algorithm) in files.items():
+        path = pkg_dir / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        if algorithm == 'git':
+            blob = f'blob {len(content)}\0'.encode() + content
+            etag = hashlib.sha1(blob, usedforsecurity=False).hexdigest()
+        else:
+            etag = hashlib.sha256(content).hexdigest()
+        metadata = pkg_dir / '.cache' / 'huggingface' / 'download' / f'{relpath}.metadata'
+        metadata.parent.mkdir(parents=True, exist_ok=True)
+        metadata.write_text(f'{"0" * 40}\n{etag}\n1700000000.0\n')
+    return pkg_dir
+
+
+def test_verify_models(tmp_path):
+    pkg_dir = _fake_package(tmp_path, 'DLICV')
+    assert verify_models(pkg_dir) == 2
+
+    (pkg_dir / 'nnunet_results' / 'Dataset_DLICV' / 'plans.json').write_text('{}')
+    with pytest.raises(RuntimeError, match=r'plans.json \(checksum mismatch\).*--clear-cache'):
+        verify_models(pkg_dir)
+
+
+def test_prepare_models_shared_copy(tmp_path):
+    packages = {tool: _fake_package(tmp_path, tool) for tool in ('DLICV', 'DLMUSE')}
+    cache_dir = tmp_path / 'local'
+
+    ready, shared = prepare_models(cache_dir=cache_dir, packages=packages)
+    assert ready
+    assert sorted(path.name for path in shared.iterdir()) == ['Dataset_DLICV', 'Dataset_DLMUSE']
+    weights = shared / 'Dataset_DLMUSE' / 'checkpoint_final.pth'
+    assert weights.read_bytes() == b'weights' * 100
+    assert weights.stat().st_mode & 0o777 == 0o444
+    assert shared.stat().st_mode & 0o777 == 0o555
+
+    # Runs sharing the directory reuse the copy; changed models get a new one
+    sources = [pkg_dir / 'nnunet_results' for pkg_dir in packages.values()]
+    assert copy_models(sources, cache_dir) == shared
+    (packages['DLICV'] / 'nnunet_results' / 'Dataset_DLICV' / 'extra.txt').write_text('new')
+    assert copy_models([packages['DLICV'] / 'nnunet_results'], cache_dir) != shared
+    assert not list(cache_dir.glob('.ncdlmuse-models-*'))
+
+
+def test_prepare_models_clear(tmp_path, monkeypatch):
+    packages = {tool: _fake_package(tmp_path, tool) for tool in ('DLICV', 'DLMUSE')}
+    downloads = []
+
+    def snapshot_download(repo_id, local_dir):
+        downloads.append(repo_id)
+        _fake_package(local_dir.parent, local_dir.name)
+
+    monkeypatch.setattr('huggingface_hub.snapshot_download', snapshot_download)
+    assert prepare_models(packages=packages) == (True, None)
+    assert downloads == []
+
+    assert prepare_models(clear=True, packages=packages) == (True, None)
+    assert downloads == ['nichart/DLICV', 'nichart/DLMUSE']
+
+    # Offline, snapshot_download returns the (now empty) directory without error
+    monkeypatch.setattr('huggingface_hub.snapshot_download', lambda repo_id, local_dir: None)
+    with pytest.raises(RuntimeError, match='Could not download the DLICV models'):
+        prepare_models(clear=True, packages=packages)
@@ -0,0 +1,150 @@
+"""Tests for the native (asyncio) executor."""
+
+import logging
+import time
+from pathlib import Path
+
+import pytest
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+
+from ncdlmuse import config
+from ncdlmuse.cli.native import run_workflow
+from ncdlmuse.utils.workdir import CompletionTracker
+
+
+def _segment(in_file, out_dir):
+    from pathlib import Path
+
+    if not Path(out_dir).is_dir():
+        raise FileNotFoundError(out_dir)
+    out_file = Path(out_dir) / (Path(in_file).name.split('.')[0] + '_dseg.txt')
+    out_file.write_text(f'segmentation of {Path(in_file).read_text()}')
+    return str(out_file)
+
+
+def _volumes(in_file, scale):
+    from pathlib import Path
+
+    out_file = Path(in_file).with_name(Path(in_file).name.replace('_dseg', '_volumes'))
+    out_file.write_text(f'{len(Path(in_file).read_text()) * scale}\n')
+    return str(out_file)
+
+
+def _first_t1w(subject_data):
+    return subject_data['t1w'][0]
+
+
+def _noop(value):
+    return value
+
+
+def _make_workflow(base_dir, t1w_files, out_dir, fail=()):
+    workflow = pe.Workflow(name='ncdlmuse_wf', base_dir=str(base_dir))
+    workflow.config['execution']['crashdump_dir'] = str(base_dir / 'crash')
+    for i, t1w_file in enumerate(t1w_files):
+        sub_wf = pe.Workflow(name=f'single_subject_sub-{i:02d}_wf')
+        bidssrc = pe.Node(niu.IdentityInterface(fields=['subject_data']), name='bidssrc')
+        bidssrc.inputs.subject_data = {'t1w': [str(t1w_file)]}
+        segment = pe.Node(
+            niu.Function(function=_segment, input_names=['in_file', 'out_dir']),
+            name='nichartdlmuse_node',
+        )
+        segment.inputs.out_dir = str(out_dir) if i not in fail else '/nonexistent/dir'
+        volumes = pe.Node(
+            niu.Function(function=_volumes, input_names=['in_file', 'scale']), name='volumes'
+        )
+        volumes.inputs.scale = 2
+        sink = pe.Node(
+            niu.Function(function=_noop, input_names=['value']),
+            name='ds_volumes',
+            run_without_submitting=True,
+        )
+        sub_wf.connect([
+            (bidssrc, segment, [(('subject_data', _first_t1w), 'in_file')]),
+            (segment, volumes, [('out', 'in_file')]),
+            (volumes, sink, [('out', 'value')]),
+        ])  # fmt:skip
+        workflow.add_nodes([sub_wf])
+    return workflow
+
+
+def _t1w_files(tmp_path, n):
+    files = []
+    for i in range(n):
+        t1w_file = tmp_path / f'sub-{i:02d}_T1w.nii.gz'
+        t1w_file.write_text(f't1w {i}')
+        files.append(t1w_file)
+    return files
+
+
+def _outputs(out_dir):
+    return {path.name: path.read_bytes() for path in sorted(Path(out_dir).iterdir())}
+
+
+def test_native_matches_nipype(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.nipype, 'n_procs', 2)
+    monkeypatch.setattr(config.nipype, 'omp_nthreads', 1)
+    t1w_files = _t1w_files(tmp_path, 3)
+    outputs = {}
+    for executor in ('nipype', 'native'):
+        out_dir = tmp_path / executor
+        out_dir.mkdir()
+        workflow = _make_workflow(tmp_path / f'work_{executor}', t1w_files, out_dir)
+        tracker = CompletionTracker(workflow)
+        if executor == 'nipype':
+            workflow.run(plugin='Linear', plugin_args={'status_callback': tracker})
+        else:
+            run_workflow(workflow, status_callback=tracker)
+        assert sorted(tracker.completed) == [f'single_subject_sub-{i:02d}_wf' for i in range(3)]
+        outputs[executor] = _outputs(out_dir)
+
+    assert len(outputs['native']) == 6
+    assert outputs['native'] == outputs['nipype']
+
+
+def test_native_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.nipype, 'n_procs', 2)
+    monkeypatch.setattr(config.nipype, 'stop_on_first_crash', False)
+    t1w_files = _t1w_files(tmp_path, 2)
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    workflow = _make_workflow(tmp_path / 'work', t1w_files, out_dir, fail=(1,))
+    failures = []
+    tracker = CompletionTracker(
+        workflow, on_failure=lambda name, t1w, node: failures.append((name, node.name))
+    )
+    with pytest.raises(RuntimeError, match='did not execute cleanly'):
+        run_workflow(workflow, status_callback=tracker)
+
+    # The other T1w file completes, downstream nodes of the failed one are skipped
+    assert tracker.completed == ['single_subject_sub-00_wf']
+    assert failures == [('single_subject_sub-01_wf', 'nichartdlmuse_node')]
+    assert sorted(_outputs(out_dir)) == ['sub-00_T1w_dseg.txt', 'sub-00_T1w_volumes.txt']
+    assert len(list((tmp_path / 'work' / 'crash').glob('crash-*nichartdlmuse_node*'))) == 1
+
+
+@pytest.mark.benchmark
+def test_benchmark_orchestration_overhead(tmp_path, monkeypatch):
+    n_procs = 4
+    monkeypatch.setattr(config.nipype, 'n_procs', n_procs)
+    monkeypatch.setattr(config.nipype, 'omp_nthreads', 1)
+    t1w_files = _t1w_files(tmp_path, 20)
+    elapsed = {}
+    for executor in ('nipype', 'native'):
+        out_dir = tmp_path / executor
+        out_dir.mkdir()
+        workflow = _make_workflow(tmp_path / f'work_{executor}', t1w_files, out_dir)
+        start = time.perf_counter()
+        if executor == 'nipype':
+            workflow.run(plugin='MultiProc', plugin_args={'n_procs': n_procs})
+        else:
+            run_workflow(workflow)
+        elapsed[executor] = time.perf_counter() - start
+
+    n_nodes = 3 * len(t1w_files)
+    logging.getLogger(__name__).info(
+        f'Orchestration overhead per node: {elapsed["nipype"] / n_nodes * 1000:.0f}ms (nipype), '
+        f'{elapsed["native"] / n_nodes * 1000:.0f}ms (native)'
+    )
+    assert elapsed['native'] < elapsed['nipype']
@@ -0,0 +1,169 @@
+"""Tests for the ONNX Runtime inference backend."""
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from ncdlmuse.utils.onnx import (  # noqa: E402
+    export_onnx,
+    graph_file,
+    sliding_window_inference,
+)
+
+PATCH_SIZE = (8, 8, 8)
+
+
+def _network(kernel_size=3):
+    """A small fully convolutional network with 2 input channels and 3 classes."""
+    torch.manual_seed(0)
+    return torch.nn.Sequential(
+        torch.nn.Conv3d(2, 4, kernel_size, padding=kernel_size // 2),
+        torch.nn.LeakyReLU(),
+        torch.nn.Conv3d(4, 3, 1),
+    ).eval()
+
+
+def _torch_predict(network):
+    def predict(patches):
+        with torch.no_grad():
+            return network(torch.from_numpy(patches)).numpy()
+
+    return predict
+
+
+def _synthetic_volume(shape=(2, 19, 13, 22)):
+    rng = np.random.default_rng(0)
+    return rng.standard_normal(shape).astype(np.float32)
+
+
+def test_sliding_window_inference():
+    image = _synthetic_volume()
+    network = _network(kernel_size=1)
+
+    # Voxel-wise networks give the same logits whatever the patches
+    logits = sliding_window_inference(_torch_predict(network), image, PATCH_SIZE)
+    expected = _torch_predict(network)(image[None])[0]
+    assert logits.shape == (3, 19, 13, 22)
+    np.testing.assert_allclose(logits, expected, atol=1e-5)
+
+    # Images smaller than a patch are padded, and mirroring averages the flipped predictions
+    small = image[:, :5, :6, :7]
+    logits = sliding_window_inference(
+        _torch_predict(network), small, PATCH_SIZE, mirror_axes=(0, 1, 2)
+    )
+    np.testing.assert_allclose(logits, _torch_predict(network)(small[None])[0], atol=1e-5)
+
+    with pytest.raises(ValueError, match='step size'):
+        sliding_window_inference(_torch_predict(network), image, PATCH_SIZE, step_size=0)
+
+
+def test_graph_file(tmp_path):
+    checkpoint = tmp_path / 'checkpoint_final.pth'
+    checkpoint.write_bytes(b'weights')
+    graph = graph_file(checkpoint, tmp_path / 'cache', PATCH_SIZE, 2, name='dlicv-fold0')
+    assert graph.parent == tmp_path / 'cache'
+    assert graph.name.startswith('dlicv-fold0-')
+    assert graph == graph_file(checkpoint, tmp_path / 'cache', PATCH_SIZE, 2, name='dlicv-fold0')
+
+    # New weights or patch sizes are exported again
+    assert graph != graph_file(checkpoint, tmp_path / 'cache', (16, 16, 16), 2, name='dlicv-fold0')
+    checkpoint.write_bytes(b'new weights')
+    assert graph != graph_file(checkpoint, tmp_path / 'cache', PATCH_SIZE, 2, name='dlicv-fold0')
+
+
+def test_onnx_matches_pytorch(tmp_path):
+    """Sliding-window inference with ONNX Runtime matches PyTorch on a synthetic volume."""
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from ncdlmuse.utils.onnx import make_session
+
+    network = _network()
+    graph = export_onnx(network, PATCH_SIZE, 2, tmp_path / 'model.onnx')
+    assert graph.is_file()
+    assert not list(tmp_path.glob('.model.onnx.*'))
+
+    image = _synthetic_volume()
+    kwargs = {'patch_size': PATCH_SIZE, 'step_size': 0.5, 'mirror_axes': (0, 1, 2)}
+    expected = sliding_window_inference(_torch_predict(network), image, **kwargs)
+    logits = sliding_window_inference(make_session(graph, intra_op_threads=2), image, **kwargs)
+    np.testing.assert_allclose(logits, expected, rtol=1e-4, atol=1e-4)
+    assert (logits.argmax(0) == expected.argmax(0)).all()
+
+
+def test_predict_logits_matches_nnunet():
+    """The logits of predict_logits match those of nnU-Net's sliding window.
+
+    Both run the same network (PyTorch here; test_onnx_matches_pytorch checks
+    that the ONNX graph predicts as the network does).
+    """
+    nnunet = pytest.importorskip('nnunetv2.inference.predict_from_raw_data')
+    from types import SimpleNamespace
+
+    from ncdlmuse.utils.onnx import predict_logits
+
+    network = _network()
+    predictor = nnunet.nnUNetPredictor(
+        tile_step_size=0.5,
+        use_gaussian=True,
+        use_mirroring=True,
+        perform_everything_on_device=False,
+        device=torch.device('cpu'),
+        verbose=False,
+        verbose_preprocessing=False,
+        allow_tqdm=False,
+    )
+    # The parts of an initialized predictor its sliding window uses
+    predictor.network = network
+    predictor.configuration_manager = SimpleNamespace(patch_size=list(PATCH_SIZE))
+    predictor.label_manager = SimpleNamespace(num_segmentation_heads=3)
+    predictor.allowed_mirroring_axes = (0, 1, 2)
+
+    image = torch.from_numpy(_synthetic_volume())
+    with torch.no_grad():
+        expected = predictor.predict_sliding_window_return_logits(image).float().numpy()
+    logits = predict_logits(predictor, [_torch_predict(network)], image).numpy()
+
+    # nnU-Net accumulates the logits in half precision, where the Gaussian weights
+    # of the patch corners underflow: leave out the voxels on the image border.
+    interior = (slice(None), *(slice(1, -1),) * 3)
+    logits, expected = logits[interior], expected[interior]
+    np.testing.assert_allclose(logits, expected, rtol=1e-3, atol=2e-3)
+    top2 = np.sort(expected, axis=0)[-2:]
+    clear = top2[1] - top2[0] > 4e-3
+    assert (logits.argmax(0) == expected.argmax(0))[clear].all()
+
+
+def test_onnx_predict_inputs(tmp_path, monkeypatch):
+    """Uncompressed and compressed images are segmented, and written with their names."""
+    import nibabel as nb
+
+    from ncdlmuse.cli import onnx_predict
+    from ncdlmuse.utils import onnx
+
+    class _Predictor:
+        def __init__(self):
+            self.dataset_json = {'file_ending': '.nii.gz'}
+
+        def predict_from_files(self, images, outputs, **kwargs):
+            for (image,), output in zip(images, outputs, strict=True):
+                assert image.endswith('.nii.gz')
+                nb.load(image).to_filename(f'{output}.nii.gz')
+
+    monkeypatch.setattr(onnx, 'load_predictor', lambda *args, **kwargs: _Predictor())
+    monkeypatch.setattr(onnx, 'export_predictor', lambda *args: [tmp_path / 'model.onnx'])
+    monkeypatch.setattr(onnx, 'make_session', lambda *args: None)
+    in_dir = tmp_path / 'inputs'
+    in_dir.mkdir()
+    for name in ('sub-01_T1w.nii', 'sub-02_T1w.nii.gz'):
+        nb.Nifti1Image(np.ones((4, 4, 4), dtype=np.float32), np.eye(4)).to_filename(in_dir / name)
+    (in_dir / 'sub-03_T1w.json').write_text('{}')
+
+    out_dir = tmp_path / 'out'
+    args = ['dlmuse', '-i', str(in_dir), '-o', str(out_dir), '--onnx_cache', str(tmp_path)]
+    assert onnx_predict.main(args) == 0
+    assert sorted(path.name for path in out_dir.iterdir()) == [
+        'sub-01_T1w.nii',
+        'sub-02_T1w.nii.gz',
+    ]
+    assert nb.load(out_dir / 'sub-01_T1w.nii').get_fdata().sum() == 64
@@ -1,5 +1,7 @@
 """Test parser."""
 
+from copy import deepcopy
+
 import pytest
 from packaging.version import Version
 
@@ -9,6 +11,35 @@ from ncdlmuse.cli.parser import _build_parser, parse_args
 
 MIN_ARGS = ['data/', 'out/', 'participant']
 
+# Settings of the sections parse_args() writes to, before any test parses a command line
+_DEFAULTS = {
+    section: {
+        key: deepcopy(value)
+        for key, value in vars(section).items()
+        if not key.startswith('_') and not isinstance(value, classmethod | staticmethod)
+    }
+    for section in (config.execution, config.workflow, config.nipype)
+}
+
+
+@pytest.fixture
+def bids_args(tmp_path, monkeypatch, bids_skeleton_single):
+    """Run parse_args() on a BIDS skeleton, from the default settings.
+
+    The returned function takes the options that follow the positional
+    arguments (the skeleton, an output directory and ``participant``).
+    """
+    for section, defaults in _DEFAULTS.items():
+        for key, value in defaults.items():
+            monkeypatch.setattr(section, key, deepcopy(value))
+
+    def _parse(options):
+        return parse_args(
+            [str(bids_skeleton_single), str(tmp_path / 'out'), 'participant', *options]
+        )
+
+    return _parse
+
 
 @pytest.mark.parametrize(
     ('args', 'code'),
@@ -44,6 +75,39 @@ def test_parser_valid(tmp_path, args):
     assert opts.bids_dir == datapath
 
 
+@pytest.mark.parametrize(('profile', 'valid'), [('fast', True), ('turbo', False)])
+def test_parser_inference_profile(tmp_path, profile, valid):
+    """Check the choices of --inference-profile."""
+    args = [str(tmp_path), str(tmp_path / 'out'), 'participant', '--inference-profile', profile]
+    if not valid:
+        with pytest.raises(SystemExit):
+            _build_parser().parse_args(args)
+        return
+
+    assert _build_parser().parse_args(args).dlmuse_inference_profile == profile
+
+
+@pytest.mark.parametrize(
+    ('args', 'step_size'),
+    [
+        (['--inference-profile', 'balanced', '--split-stages'], 0.75),
+        (['--inference-profile', 'fast'], None),
+        (['--sloppy'], None),  # preview keeps the default step without --split-stages
+        (['--sloppy', '--split-stages'], 1.0),
+        (['--inference-profile', 'balanced'], SystemExit),
+    ],
+)
+def test_parser_step_size(bids_args, args, step_size):
+    """Only the split stages take the step of the sliding window."""
+    if step_size is SystemExit:
+        with pytest.raises(SystemExit):
+            bids_args(args)
+        return
+
+    bids_args(args)
+    assert config.workflow.dlmuse_step_size == step_size
+
+
 @pytest.mark.parametrize(
     ('argval', 'gb'),
     [
@@ -115,69 +179,96 @@ def test_get_parser_blacklist(monkeypatch, capsys, flagged):
     ('arg_list', 'config_section', 'config_key', 'expected_value'),
     [
         # Test default device
-        (MIN_ARGS, 'workflow', 'dlmuse_device', 'cpu'),
+        ([], 'workflow', 'dlmuse_device', 'cpu'),
         # Test explicit device
-        ([*MIN_ARGS, '--device=cuda'], 'workflow', 'dlmuse_device', 'cuda'),
+        (['--device=cuda'], 'workflow', 'dlmuse_device', 'cuda'),
         # Test boolean flags (default False)
-        (MIN_ARGS, 'workflow', 'dlmuse_disable_tta', False),
-        ([*MIN_ARGS, '--disable-tta'], 'workflow', 'dlmuse_disable_tta', True),
-        (MIN_ARGS, 'workflow', 'dlmuse_clear_cache', False),
-        ([*MIN_ARGS, '--clear-cache'], 'workflow', 'dlmuse_clear_cache', True),
-        (MIN_ARGS, 'workflow', 'dlmuse_all_in_gpu', False),
-        ([*MIN_ARGS, '--all-in-gpu'], 'workflow', 'dlmuse_all_in_gpu', True),
-        # Test string arguments
-        ([*MIN_ARGS, '--model-folder=/custom/model'], 'workflow', 'dlmuse_model_folder', '/custom/model'),
+        ([], 'workflow', 'dlmuse_disable_tta', False),
+        (['--disable-tta'], 'workflow', 'dlmuse_disable_tta', True),
+        ([], 'workflow', 'dlmuse_clear_cache', False),
+        (['--clear-cache'], 'workflow', 'dlmuse_clear_cache', True),
+        ([], 'workflow', 'dlmuse_all_in_gpu', False),
+        (['--all-in-gpu'], 'workflow', 'dlmuse_all_in_gpu', True),
+        # Adaptive TTA starts without TTA whatever the profile
+        (
+            ['--inference-profile', 'fast', '--adaptive-tta'],
+            'workflow', 'dlmuse_disable_tta', False,
+        ),
+        # The ONNX backend runs the DLICV and DLMUSE stages as separate nodes
+        (['--backend', 'onnx'], 'workflow', 'dlmuse_split_stages', True),
         # Test participant label
-        ([*MIN_ARGS, '--participant-label', '01', '02'], 'execution', 'participant_label', ['01', '02']),
+        (['--participant-label', 'sub-01'], 'execution', 'participant_label', ['01']),
         # Test BIDS validation skipping
-        (MIN_ARGS, 'execution', 'skip_bids_validation', False),
-        ([*MIN_ARGS, '--skip-bids-validation'], 'execution', 'skip_bids_validation', True),
+        ([], 'execution', 'skip_bids_validation', False),
+        (['--skip-bids-validation'], 'execution', 'skip_bids_validation', True),
+        # Pre-flight only checks the headers unless asked to decompress the inputs
+        ([], 'execution', 'full_preflight', False),
+        (['--full-preflight'], 'execution', 'full_preflight', True),
         # Test resource limits (example)
-        ([*MIN_ARGS, '--nthreads=4'], 'nipype', 'n_procs', 4),
+        (['--nthreads=4'], 'nipype', 'n_procs', 4),
     ]
 )
-def test_parser_arguments(arg_list, config_section, config_key, expected_value):
+def test_parser_arguments(bids_args, arg_list, config_section, config_key, expected_value):
     """Test parsing of various command line arguments."""
-    # We don't need actual directories for parser tests
-    # Add dummy paths if Path validation is strict
-    processed_args = []
-    for arg in arg_list:
-        if arg == 'data/':
-            processed_args.append('/tmp/data') # Use dummy path
-        elif arg == 'out/':
-            processed_args.append('/tmp/out') # Use dummy path
-        else:
-            processed_args.append(arg)
-
-    parse_args(processed_args) # This populates the global config
+    bids_args(arg_list)  # This populates the global config
 
     # Retrieve the section and check the key
     section = getattr(config, config_section)
     assert getattr(section, config_key) == expected_value
 
+
+def test_parser_model_folder(bids_args, tmp_path):
+    """Test string arguments."""
+    model_folder = tmp_path / 'models'
+    model_folder.mkdir()
+    bids_args([f'--model-folder={model_folder}'])
+    assert config.workflow.dlmuse_model_folder == model_folder
+
+
 @pytest.mark.parametrize(
     ('arg_list', 'error_type', 'error_match'),
     [
         # Test invalid device choice
-        ([*MIN_ARGS, '--device=tpu'], SystemExit, ''), # ArgumentParser raises SystemExit
-        # Test missing participant label when needed
-        (['data/', 'out/', 'participant'], SystemExit, ''),
-        # Test missing positional args
-        (['participant'], SystemExit, ''),
-        (['data/', 'participant'], SystemExit, ''),
+        (['--device=tpu'], SystemExit, 'invalid choice'),
+        # Test conflicting TTA options
+        (
+            ['--adaptive-tta', '--disable-tta'],
+            SystemExit, '--adaptive-tta cannot be combined with --disable-tta',
+        ),
+        (
+            ['--adaptive-tta', '--split-stages'],
+            SystemExit, '--adaptive-tta cannot be combined with --split-stages',
+        ),
+        # The ONNX backend only runs on the CPU, and its options require it
+        (
+            ['--backend', 'onnx', '--device=cuda'],
+            SystemExit, '--backend onnx only runs on the CPU',
+        ),
+        (
+            ['--onnx-threads', '4'],
+            SystemExit, '--onnx-threads and --onnx-cache require --backend onnx',
+        ),
     ]
 )
-def test_parser_failures(arg_list, error_type, error_match):
+def test_parser_failures(bids_args, capsys, arg_list, error_type, error_match):
     """Test parser failures for invalid arguments."""
-    # Add dummy paths if Path validation is strict
-    processed_args = []
-    for arg in arg_list:
-        if arg == 'data/':
-            processed_args.append('/tmp/data') # Use dummy path
-        elif arg == 'out/':
-            processed_args.append('/tmp/out') # Use dummy path
-        else:
-            processed_args.append(arg)
-
-    with pytest.raises(error_type, match=error_match):
-        parse_args(processed_args)
+    with pytest.raises(error_type):
+        bids_args(arg_list)
+    assert error_match in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    ('arg_list', 'error_match'),
+    [
+        # Test missing BIDS directory
+        (['/nonexistent/data', 'out/', 'participant'], 'Path does not exist'),
+        # Test missing positional args
+        (['participant'], ''),
+        (['data/', 'participant'], ''),
+    ],
+)
+def test_parser_positional_failures(capsys, arg_list, error_match):
+    """Test parser failures for missing positional arguments."""
+    with pytest.raises(SystemExit):
+        parse_args(arg_list)
+    assert error_match in capsys.readouterr().err
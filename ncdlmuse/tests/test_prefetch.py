@@ -0,0 +1,119 @@
+"""Tests for the input prefetcher."""
+
+import time
+from pathlib import Path
+
+from ncdlmuse.utils.prefetch import Prefetcher, consume, release, stage, staged_path
+
+
+def _sources(tmp_path, n, size=1024):
+    src_dir = tmp_path / 'bids'
+    src_dir.mkdir()
+    sources = []
+    for i in range(n):
+        src = src_dir / f'sub-{i:02d}_T1w.nii.gz'
+        src.write_bytes(bytes([i]) * size)
+        sources.append(str(src))
+    return sources
+
+
+def _wait_for(condition, timeout=10.0):
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:
+            raise TimeoutError
+        time.sleep(0.02)
+
+
+def test_stage_consume_release(tmp_path):
+    (source,) = _sources(tmp_path, 1)
+    prefetch_dir = tmp_path / 'scratch'
+
+    staged = stage(source, prefetch_dir)
+    assert staged == staged_path(prefetch_dir, source)
+    assert staged.read_bytes() == Path(source).read_bytes()
+    assert not list(staged.parent.glob('.*.tmp'))
+
+    claimed = consume(source, prefetch_dir)
+    assert claimed.parent == staged.parent
+    assert claimed.read_bytes() == Path(source).read_bytes()
+    assert not staged.exists()
+    release(claimed)
+    assert not staged.parent.exists()
+
+    # Not staged: the caller falls back to the original file
+    assert consume(source, prefetch_dir) is None
+
+
+def test_prefetcher_is_bounded(tmp_path):
+    sources = _sources(tmp_path, 5)
+    prefetch_dir = tmp_path / 'scratch'
+    prefetcher = Prefetcher(sources, prefetch_dir, depth=2, poll_interval=0.01)
+    prefetcher.start()
+    try:
+        _wait_for(lambda: len(prefetcher.staged) == 2)
+        time.sleep(0.1)
+        assert len(prefetcher.staged) == 2
+
+        # Consuming a staged file frees a slot for the next one
+        staged = consume(sources[0], prefetch_dir)
+        assert staged is not None
+        release(staged)
+        _wait_for(lambda: len(prefetcher.staged) == 3)
+        assert staged_path(prefetch_dir, sources[2]).exists()
+    finally:
+        prefetcher.stop()
+    assert not any(prefetch_dir.iterdir())
+
+
+def test_prefetcher_size_bound(tmp_path):
+    sources = _sources(tmp_path, 3, size=1000)
+    prefetch_dir = tmp_path / 'scratch'
+    prefetcher = Prefetcher(sources, prefetch_dir, depth=5, max_bytes=1500, poll_interval=0.01)
+    prefetcher.start()
+    try:
+        _wait_for(lambda: len(prefetcher.staged) == 1)
+        time.sleep(0.1)
+        assert len(prefetcher.staged) == 1
+    finally:
+        prefetcher.stop()
+
+
+def test_prefetcher_skips_consumed(tmp_path):
+    sources = _sources(tmp_path, 3)
+    prefetch_dir = tmp_path / 'scratch'
+    # The first file was processed from its original location before staging
+    assert consume(sources[0], prefetch_dir) is None
+
+    prefetcher = Prefetcher(sources, prefetch_dir, depth=3, poll_interval=0.01)
+    prefetcher.start()
+    prefetcher.join(timeout=10)
+    assert prefetcher.staged == sources[1:]
+    assert not staged_path(prefetch_dir, sources[0]).exists()
+    prefetcher.stop()
+
+
+def test_prefetcher_never_deletes_claimed_copy(tmp_path, monkeypatch):
+    """A copy consumed right after staging survives the prefetcher's clean-up."""
+    from ncdlmuse.utils import prefetch
+
+    (source,) = _sources(tmp_path, 1)
+    prefetch_dir = tmp_path / 'scratch'
+    claimed = []
+
+    def stage_then_consume(src, directory):
+        # The interface consumes the file between its staging and the
+        # prefetcher's check of the consumed marker
+        staged = stage(src, directory)
+        claimed.append(consume(src, directory))
+        return staged
+
+    monkeypatch.setattr(prefetch, 'stage', stage_then_consume)
+    prefetcher = Prefetcher([source], prefetch_dir, poll_interval=0.01)
+    prefetcher.start()
+    prefetcher.join(timeout=10)
+    assert claimed[0] is not None
+    assert claimed[0].read_bytes() == Path(source).read_bytes()
+    release(claimed[0])
+    prefetcher.stop()
+    assert not any(prefetch_dir.iterdir())
@@ -0,0 +1,95 @@
+"""Tests for the pre-flight checks of T1w inputs."""
+
+import nibabel as nb
+import numpy as np
+
+from ncdlmuse.utils import preflight
+from ncdlmuse.utils.preflight import check_t1w, run_preflight
+
+
+def _write_image(path, shape=(32, 32, 32), zooms=(1.0, 1.0, 1.0)):
+    img = nb.Nifti1Image(np.ones(shape, dtype=np.float32), np.eye(4))
+    img.header.set_zooms(zooms + (1.0,) * (len(shape) - 3))
+    img.to_filename(path)
+    return str(path)
+
+
+def test_check_t1w(tmp_path):
+    good = _write_image(tmp_path / 'sub-01_T1w.nii.gz')
+    assert check_t1w(good) is None
+    assert check_t1w(_write_image(tmp_path / 'sub-02_T1w.nii')) is None
+
+    truncated = tmp_path / 'sub-03_T1w.nii.gz'
+    data = (tmp_path / 'sub-01_T1w.nii.gz').read_bytes()
+    truncated.write_bytes(data[: len(data) // 2])
+    assert check_t1w(truncated, full=True).startswith('corrupted file')
+
+    short = tmp_path / 'sub-04_T1w.nii'
+    short.write_bytes((tmp_path / 'sub-02_T1w.nii').read_bytes()[:-100])
+    assert check_t1w(short).startswith('truncated data')
+
+    assert check_t1w(_write_image(tmp_path / 'sub-05_T1w.nii.gz', (32, 32, 32, 2))) == (
+        '4D image with 2 volume(s)'
+    )
+    assert check_t1w(_write_image(tmp_path / 'sub-06_T1w.nii.gz', (32, 32, 0))).startswith(
+        'empty image'
+    )
+    nan_zooms = _write_image(tmp_path / 'sub-07_T1w.nii.gz', zooms=(1.0, np.nan, 1.0))
+    assert check_t1w(nan_zooms).startswith('invalid voxel sizes')
+
+
+def test_check_t1w_header_only(tmp_path, monkeypatch):
+    """By default, compressed files are not decompressed past their header."""
+    good = _write_image(tmp_path / 'sub-01_T1w.nii.gz')
+    truncated = tmp_path / 'sub-02_T1w.nii.gz'
+    data = (tmp_path / 'sub-01_T1w.nii.gz').read_bytes()
+    truncated.write_bytes(data[: len(data) // 2])
+
+    read = []
+    monkeypatch.setattr(preflight, 'read_gzip', lambda path: read.append(path))
+    assert check_t1w(good) is None
+    assert check_t1w(truncated) is None
+    assert read == []
+
+
+def test_check_t1w_unusual(tmp_path, caplog):
+    """Small matrices and large voxels can be segmented: they are only reported."""
+    assert check_t1w(_write_image(tmp_path / 'sub-01_T1w.nii.gz', (10, 10, 10))) is None
+    assert 'unusual matrix (10, 10, 10)' in caplog.text
+    caplog.clear()
+    assert check_t1w(_write_image(tmp_path / 'sub-02_T1w.nii.gz', zooms=(1.0, 1.0, 12.0))) is None
+    assert 'unusual matrix' in caplog.text
+
+
+def test_run_preflight_cache(tmp_path, monkeypatch):
+    good = _write_image(tmp_path / 'sub-01_T1w.nii.gz')
+    bad = _write_image(tmp_path / 'sub-02_T1w.nii.gz', (32, 32, 32, 3))
+    cache_file = tmp_path / 'logs' / 'preflight.json'
+
+    assert run_preflight([good, bad], cache_file=cache_file) == {
+        bad: '4D image with 3 volume(s)'
+    }
+
+    checked = []
+    monkeypatch.setattr(
+        preflight,
+        'check_t1w',
+        lambda path, full=False: checked.append((path, full)) or check_t1w(path, full),
+    )
+    assert list(run_preflight([good, bad], cache_file=cache_file)) == [bad]
+    assert checked == []
+
+    # Modified files are checked again
+    _write_image(tmp_path / 'sub-02_T1w.nii.gz')
+    assert run_preflight([good, bad], cache_file=cache_file) == {}
+    assert checked == [(bad, False)]
+
+    # Verdicts of the header-only check are not reused for the full check (the converse is)
+    checked.clear()
+    assert run_preflight([good, bad], cache_file=cache_file, full=True) == {}
+    assert sorted(checked) == [(good, True), (bad, True)]
+    assert run_preflight([good, bad], cache_file=cache_file) == {}
+    assert len(checked) == 2
+    assert list(run_preflight([str(tmp_path / 'missing_T1w.nii.gz')])) == [
+        str(tmp_path / 'missing_T1w.nii.gz')
+    ]
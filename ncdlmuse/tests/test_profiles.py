@@ -0,0 +1,19 @@
+"""Tests for inference profiles."""
+
+from ncdlmuse.utils.profiles import DEFAULT_STEP_SIZE, INFERENCE_PROFILES, get_profile
+
+
+def test_get_profile():
+    # The default profile runs the tools with their own settings
+    assert get_profile() == {
+        'disable_tta': False,
+        'step_size': DEFAULT_STEP_SIZE,
+        'reportlets': True,
+    }
+    preview = get_profile('preview')
+    assert preview['disable_tta']
+    assert not preview['reportlets']
+    assert preview['step_size'] == max(p['step_size'] for p in INFERENCE_PROFILES.values())
+    # Profiles are returned as copies
+    get_profile('fast')['step_size'] = 2.0
+    assert INFERENCE_PROFILES['fast']['step_size'] == DEFAULT_STEP_SIZE
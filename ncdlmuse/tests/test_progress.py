@@ -0,0 +1,111 @@
+"""Tests for NiChart_DLMUSE progress streaming and reporting."""
+
+import json
+import sys
+
+from ncdlmuse.interfaces.ncdlmuse import NiChartDLMUSE
+from ncdlmuse.utils.progress import (
+    ProgressMonitor,
+    ProgressParser,
+    format_summary,
+    publish,
+    read_statuses,
+    summarize,
+)
+
+FAKE_OUTPUT = [
+    'NiChart_DLMUSE v1.0',
+    'Running DLICV',
+    '50%|#####     | 2/4',
+    'done with sub-01_T1w',
+    'Running DLMUSE',
+    '100%|##########| 8/8',
+    'done with sub-01_T1w',
+    'Calculating ROI volumes',
+]
+
+
+def test_progress_parser():
+    parser = ProgressParser()
+    stages = []
+    for line in FAKE_OUTPUT:
+        if parser.feed(line):
+            stages.append(parser.stage)
+        if line.startswith('50%'):
+            assert parser.steps == (2, 4)
+            assert 0.05 < parser.progress < 0.45
+    assert stages == ['dlicv', 'dlicv_done', 'dlmuse', 'dlmuse_done', 'volumes']
+    assert parser.progress == 0.95
+
+
+def test_progress_parser_first_stage():
+    parser = ProgressParser(first_stage='dlmuse')
+    assert parser.stage == 'dlmuse'
+    for line in FAKE_OUTPUT[4:7]:
+        parser.feed(line)
+    assert parser.stage == 'dlmuse_done'
+    assert parser.progress > 0.5
+
+
+def test_summarize(tmp_path):
+    status_dir = tmp_path / 'status'
+    publish(status_dir / 'a.json', job_id='a', state='done', progress=1.0)
+    publish(status_dir / 'b.json', job_id='b', state='failed')
+    publish(status_dir / 'c.json', job_id='c', state='running', progress=0.5, updated_at=1150)
+    publish(status_dir / 'd.json', job_id='d', state='running', progress=0.5, updated_at=0)
+    (status_dir / '.e.json.tmp').write_text('{')
+
+    statuses = read_statuses(status_dir)
+    assert len(statuses) == 4
+    summary = summarize(statuses, total=6, started_at=1000.0, now=1200.0, stall_timeout=600)
+    assert summary['done'] == 1
+    assert summary['failed'] == 1
+    assert summary['running'] == 2
+    assert summary['pending'] == 2
+    assert summary['stalled'] == ['d']
+    # 2 T1w worth of work in 200s, 3 left
+    assert summary['eta'] == 300.0
+    assert format_summary(summary) == (
+        '1 of 6 T1w done (1 failed, 2 running, 1 stalled), ETA 5m00s'
+    )
+
+
+def test_monitor_writes_run_status(tmp_path):
+    status_dir = tmp_path / 'log' / 'status'
+    publish(status_dir / 'a.json', job_id='a', state='done', progress=1.0)
+    monitor = ProgressMonitor(status_dir, total=2, interval=0.01)
+    monitor.start()
+    summary = monitor.stop()
+    assert summary['done'] == 1
+    run_status = json.loads((tmp_path / 'log' / 'status.json').read_text())
+    assert run_status['total'] == 2
+    assert run_status['pending'] == 1
+
+
+def test_stream_command(tmp_path):
+    script = 'import sys\nfor line in sys.argv[2:]:\n    print(line)\nsys.exit(int(sys.argv[1]))\n'
+    t1w_file = tmp_path / 'sub-01_T1w.nii.gz'
+    t1w_file.write_bytes(b'')
+    interface = NiChartDLMUSE(input_image=str(t1w_file), job_id='sub-01_T1w')
+    log_file = tmp_path / 'logs' / 'sub-01_T1w_NiChart_DLMUSE.log'
+    status_file = tmp_path / 'logs' / 'status' / 'sub-01_T1w.json'
+
+    cmd = [sys.executable, '-c', script, '0', *FAKE_OUTPUT]
+    returncode, tail, killed = interface._stream_command(cmd, log_file, status_file)
+    assert returncode == 0
+    assert killed is None
+    assert tail == FAKE_OUTPUT
+    assert log_file.read_text().splitlines() == FAKE_OUTPUT
+    status = json.loads(status_file.read_text())
+    assert status['job_id'] == 'sub-01_T1w'
+    assert status['state'] == 'done'
+    assert status['progress'] == 1.0
+    assert status['log_file'] == str(log_file)
+
+    cmd = [sys.executable, '-c', script, '3', 'Running DLICV', 'CUDA out of memory']
+    returncode, tail, _ = interface._stream_command(cmd, log_file, status_file)
+    assert returncode == 3
+    assert tail[-1] == 'CUDA out of memory'
+    status = json.loads(status_file.read_text())
+    assert status['state'] == 'failed'
+    assert status['stage'] == 'dlicv'
@@ -0,0 +1,47 @@
+"""Tests for the QC checks of adaptive test-time augmentation."""
+
+import nibabel as nib
+import numpy as np
+
+from ncdlmuse.utils.qc import _roi_components, assess_segmentation, load_norms
+
+
+def _write_segmentation(tmp_path, drop_label=None, leak=False):
+    """A 1000 mm³-voxel segmentation with every ICV label, 20% of it CSF."""
+    labels = [label for label in _roi_components()[702] if label != drop_label]
+    seg = np.zeros((14, 14, 14), dtype=np.int16)
+    mask = np.zeros(seg.shape, dtype=np.uint8)
+    mask[1:-1, 1:-1, 1:-1] = 1
+    n_voxels = int(mask.sum())
+    values = np.resize(labels, n_voxels)
+    values[: n_voxels // 5] = 46  # CSF, outside the total brain volume
+    seg[mask > 0] = values
+    if leak:
+        seg[0] = 4
+    affine = np.diag([10.0, 10.0, 10.0, 1.0])
+    nib.Nifti1Image(seg, affine).to_filename(tmp_path / 'seg.nii.gz')
+    nib.Nifti1Image(mask, affine).to_filename(tmp_path / 'mask.nii.gz')
+    return tmp_path / 'seg.nii.gz', tmp_path / 'mask.nii.gz'
+
+
+def test_assess_segmentation(tmp_path):
+    qc = assess_segmentation(*_write_segmentation(tmp_path))
+    assert qc['flags'] == []
+    assert qc['signals']['icv'] == 1728000.0
+    assert qc['signals']['outside_mask'] == qc['signals']['unlabelled_mask'] == 0
+
+    qc = assess_segmentation(*_write_segmentation(tmp_path, drop_label=47, leak=True))
+    assert qc['flags'] == ['outside_mask', 'missing_labels']
+    assert qc['signals']['missing_labels'] == [47]
+
+
+def test_assess_segmentation_norms(tmp_path):
+    norms_file = tmp_path / 'norms.tsv'
+    norms_file.write_text('ROI\tmean\tstd\n46\t0.2\t0.01\n701\t0.5\t0.05\n')
+    norms = load_norms(norms_file)
+    assert norms[46] == (0.2, 0.01)
+
+    qc = assess_segmentation(*_write_segmentation(tmp_path), norms=norms)
+    # The total brain volume (80% of the ICV) is 6 standard deviations off
+    assert qc['flags'] == ['volume_z']
+    assert list(qc['signals']['volume_z']) == ['701']
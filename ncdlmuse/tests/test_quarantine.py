@@ -0,0 +1,83 @@
+"""Tests for the failure quarantine."""
+
+import json
+
+from ncdlmuse import config
+from ncdlmuse.cli.run import _make_tracker, _run_workflow, _successful_subjects
+from ncdlmuse.tests.test_workdir import _make_workflow, _t1w_files
+from ncdlmuse.utils.quarantine import (
+    clear_failure,
+    find_crash_files,
+    load_failures,
+    quarantine_dir,
+    record_failure,
+)
+
+
+def test_record_and_clear(tmp_path):
+    t1w_file = tmp_path / 'sub-01_T1w.nii.gz'
+    record_failure(tmp_path, t1w_file, node='wf.dlmuse', crash_files=['crash.txt'])
+    path = record_failure(tmp_path, t1w_file, node='wf.dlmuse')
+    assert path.parent == quarantine_dir(tmp_path)
+
+    (record,) = load_failures(tmp_path)
+    assert record['t1w'] == str(t1w_file)
+    assert record['failures'] == 2
+    assert record['first_failed_at'] <= record['failed_at']
+
+    assert clear_failure(tmp_path, t1w_file)
+    assert not clear_failure(tmp_path, t1w_file)
+    assert load_failures(tmp_path) == []
+
+
+def test_find_crash_files(tmp_path):
+    (tmp_path / 'crash-20250101-000000-user-dlmuse-1234.txt').write_text('boom')
+    (tmp_path / 'crash-20250101-000000-user-ds_seg-5678.txt').write_text('boom')
+    assert [p.split('/')[-1] for p in find_crash_files(tmp_path, 'dlmuse')] == [
+        'crash-20250101-000000-user-dlmuse-1234.txt'
+    ]
+    assert find_crash_files(tmp_path / 'missing', 'dlmuse') == []
+
+
+def test_quarantine_run(tmp_path, monkeypatch):
+    output_dir = tmp_path / 'out'
+    log_dir = output_dir / 'logs' / 'run'
+    log_dir.mkdir(parents=True)
+    monkeypatch.setattr(config.execution, 'output_dir', output_dir)
+    monkeypatch.setattr(config.execution, 'log_dir', log_dir)
+    monkeypatch.setattr(config.execution, 'quarantine', True)
+    monkeypatch.setattr(config.execution, 'prune_work_dir', False)
+    monkeypatch.setattr(config.nipype, 'plugin', 'Linear')
+    monkeypatch.setattr(config.nipype, 'plugin_args', {})
+
+    t1w_files = _t1w_files(tmp_path, n=3)
+    # A previous failure of a T1w that now succeeds is cleared
+    record_failure(output_dir, t1w_files[0], node='old')
+    workflow = _make_workflow(tmp_path, t1w_files, fail=(1,))
+    workflow.config['execution'].update(
+        {'crashdump_dir': str(log_dir), 'stop_on_first_crash': False, 'crashfile_format': 'txt'}
+    )
+
+    tracker = _make_tracker(workflow)
+    assert _run_workflow(workflow, tracker) == 0
+
+    (record,) = load_failures(output_dir)
+    assert record['t1w'] == str(t1w_files[1])
+    assert record['node'] == 'ncdlmuse_wf.single_subject_sub-01_wf.dlmuse'
+    assert record['crash_files']
+    assert 'dlmuse' in json.dumps(record['crash_files'])
+    assert _successful_subjects(['00', '01', '02'], tracker) == ['00', '02']
+
+
+def test_quarantine_all_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.execution, 'output_dir', tmp_path / 'out')
+    monkeypatch.setattr(config.execution, 'log_dir', tmp_path / 'out' / 'logs')
+    monkeypatch.setattr(config.execution, 'quarantine', True)
+    monkeypatch.setattr(config.nipype, 'plugin', 'Linear')
+    monkeypatch.setattr(config.nipype, 'plugin_args', {})
+
+    workflow = _make_workflow(tmp_path, _t1w_files(tmp_path, n=1), fail=(0,))
+    workflow.config['execution']['stop_on_first_crash'] = False
+    workflow.config['execution']['crashdump_dir'] = str(tmp_path / 'crash')
+    assert _run_workflow(workflow, _make_tracker(workflow)) == 1
+    assert len(load_failures(tmp_path / 'out')) == 1
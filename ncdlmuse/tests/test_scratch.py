@@ -0,0 +1,101 @@
+"""Tests for node-local scratch stage-out."""
+
+import json
+import tarfile
+
+import pytest
+
+from ncdlmuse.utils.scratch import discard, scratch_root, stage_out
+
+
+def _derivatives(root):
+    root.mkdir(parents=True)
+    (root / 'dataset_description.json').write_text(json.dumps({'Name': 'test'}))
+    for subject in ('01', '02'):
+        anat = root / f'sub-{subject}' / 'anat'
+        anat.mkdir(parents=True)
+        (anat / f'sub-{subject}_T1w_dseg.nii.gz').write_bytes(b'seg')
+        (root / f'sub-{subject}.html').write_text('<html/>')
+    (root / 'logs').mkdir()
+    (root / 'logs' / 'crash.txt').write_text('crash')
+    return root
+
+
+def test_stage_out_copy(tmp_path):
+    src = _derivatives(tmp_path / 'scratch' / 'derivatives')
+    dst = tmp_path / 'shared'
+    dst.mkdir()
+    (dst / 'sub-01' / 'ses-0').mkdir(parents=True)
+
+    staged = stage_out(src, dst, subjects=['sub-01'])
+    assert sorted(p.name for p in staged) == ['dataset_description.json', 'sub-01', 'sub-01.html']
+    assert (dst / 'sub-01' / 'anat' / 'sub-01_T1w_dseg.nii.gz').read_bytes() == b'seg'
+    # Existing trees are merged, not replaced
+    assert (dst / 'sub-01' / 'ses-0').is_dir()
+    assert not (dst / 'sub-02').exists()
+    assert not (dst / 'logs').exists()
+    # Staged participants are removed from scratch, others are kept
+    assert not (src / 'sub-01').exists()
+    assert (src / 'sub-02').exists()
+    assert (src / 'dataset_description.json').exists()
+
+
+def test_stage_out_tar(tmp_path):
+    src = _derivatives(tmp_path / 'scratch' / 'derivatives')
+    dst = tmp_path / 'shared'
+
+    (shard,) = stage_out(src, dst, mode='tar', shard_name='run_all')
+    assert shard == dst / 'shards' / 'run_all.tar'
+    with tarfile.open(shard) as tar:
+        names = set(tar.getnames())
+    assert 'sub-02/anat/sub-02_T1w_dseg.nii.gz' in names
+    assert 'dataset_description.json' in names
+    assert not any(name.startswith('logs') for name in names)
+    assert not list((dst / 'shards').glob('.*'))
+    assert not (src / 'sub-01').exists()
+
+
+def test_stage_out_errors(tmp_path):
+    assert stage_out(tmp_path / 'missing', tmp_path / 'shared') == []
+    with pytest.raises(ValueError, match='Unknown stage-out mode'):
+        stage_out(tmp_path, tmp_path / 'shared', mode='rsync')
+
+
+def test_discard(tmp_path):
+    root = scratch_root(tmp_path, 'uuid')
+    assert root == tmp_path / 'ncdlmuse_uuid'
+    (root / 'work' / 'node').mkdir(parents=True)
+    discard(root)
+    assert not root.exists()
+    discard(root)  # no error if already gone
+
+
+def test_manifests_outlive_scratch(tmp_path, monkeypatch):
+    """Completion manifests are kept on shared storage and point to staged-out files."""
+    import shutil
+
+    from ncdlmuse import config
+    from ncdlmuse.cli.run import _make_tracker, _run_workflow
+    from ncdlmuse.tests.test_workdir import _make_workflow, _t1w_files
+    from ncdlmuse.utils.workdir import is_complete, manifest_root, settings_signature
+
+    shared = tmp_path / 'shared'
+    monkeypatch.setattr(config.execution, 'scratch_dir', tmp_path / 'scratch')
+    monkeypatch.setattr(config.execution, 'output_dir', shared)
+    monkeypatch.setattr(config.execution, 'ncdlmuse_dir', tmp_path / 'derivatives')
+    monkeypatch.setattr(config.execution, 'work_dir', tmp_path / 'work')
+    monkeypatch.setattr(config.execution, 'stage_out', 'copy')
+    monkeypatch.setattr(config.execution, 'quarantine', False)
+    monkeypatch.setattr(config.execution, 'prune_work_dir', False)
+    monkeypatch.setattr(config.nipype, 'plugin', 'Linear')
+    monkeypatch.setattr(config.nipype, 'plugin_args', {})
+
+    (t1w_file,) = _t1w_files(tmp_path, n=1)
+    workflow = _make_workflow(tmp_path, [t1w_file])
+    assert _run_workflow(workflow, _make_tracker(workflow)) == 0
+    assert manifest_root() == shared / 'logs'
+    assert not is_complete(manifest_root(), t1w_file, settings_signature())
+
+    stage_out(tmp_path / 'derivatives', shared)
+    shutil.rmtree(tmp_path / 'work')
+    assert is_complete(manifest_root(), t1w_file, settings_signature())
@@ -0,0 +1,77 @@
+"""Tests for the selection of one T1w scan per session."""
+
+import json
+
+import nibabel as nb
+import numpy as np
+import pytest
+
+from ncdlmuse.utils.selection import SELECTION_POLICIES, select_t1w
+
+
+def _write_t1w(anat_dir, name, zooms, shape=(16, 16, 16), **metadata):
+    img = nb.Nifti1Image(np.zeros(shape, dtype=np.uint8), np.diag([*zooms, 1.0]))
+    img.header.set_zooms(zooms)
+    t1w_file = anat_dir / f'{name}_T1w.nii.gz'
+    img.to_filename(t1w_file)
+    if metadata:
+        (anat_dir / f'{name}_T1w.json').write_text(json.dumps(metadata))
+    return str(t1w_file)
+
+
+@pytest.fixture
+def t1w_files(tmp_path):
+    anat_dir = tmp_path / 'sub-01' / 'ses-1' / 'anat'
+    anat_dir.mkdir(parents=True)
+    other_dir = tmp_path / 'sub-02' / 'anat'
+    other_dir.mkdir(parents=True)
+    return [
+        _write_t1w(
+            anat_dir,
+            'sub-01_ses-1_run-1',
+            (1.0, 1.0, 1.0),
+            AcquisitionTime='10:00:00',
+            NumberOfAverages=1,
+            PixelBandwidth=200,
+        ),
+        _write_t1w(
+            anat_dir,
+            'sub-01_ses-1_run-2',
+            (1.2, 1.2, 1.2),
+            AcquisitionTime='10:30:00',
+            NumberOfAverages=2,
+            PixelBandwidth=100,
+        ),
+        _write_t1w(
+            anat_dir,
+            'sub-01_ses-1_acq-fast_run-1',
+            (1.0, 1.0, 1.0),
+            shape=(16, 16, 20),
+            NumberOfAverages=1,
+            PixelBandwidth=400,
+        ),
+        _write_t1w(other_dir, 'sub-02', (1.0, 1.0, 1.0)),
+    ]
+
+
+@pytest.mark.parametrize(
+    ('policy', 'expected'),
+    [
+        ('first', 2),  # acq-fast sorts first
+        ('highest-resolution', 2),  # same voxel size as run-1, larger field of view
+        ('largest-snr-proxy', 1),
+        ('latest-run', 1),
+    ],
+)
+def test_select_t1w(t1w_files, policy, expected):
+    assert policy in SELECTION_POLICIES
+    assert select_t1w(t1w_files, policy) == [t1w_files[expected], t1w_files[3]]
+
+
+def test_select_all_and_metadata(t1w_files):
+    assert select_t1w(t1w_files) == t1w_files
+    # Sidecar factors are only used when every candidate reports them
+    metadata = {t1w_files[0]: {'NumberOfAverages': 4}}
+    assert select_t1w(
+        t1w_files, 'largest-snr-proxy', get_metadata=lambda f: metadata.get(f)
+    ) == [t1w_files[1], t1w_files[3]]
@@ -0,0 +1,61 @@
+"""Tests for the cached BIDS validation."""
+
+import os
+
+from bids.layout import BIDSLayout
+
+from ncdlmuse.utils.validation import CachedValidationIndexer, tree_fingerprint
+
+
+def _write_dataset(root):
+    (root / 'dataset_description.json').parent.mkdir(parents=True)
+    (root / 'dataset_description.json').write_text('{"Name": "test", "BIDSVersion": "1.10.0"}')
+    for subject in ('01', '02'):
+        anat_dir = root / f'sub-{subject}' / 'anat'
+        anat_dir.mkdir(parents=True)
+        (anat_dir / f'sub-{subject}_T1w.nii.gz').touch()
+        (anat_dir / f'sub-{subject}_notbids.nii.gz').touch()
+    return root
+
+
+def _index(root, cache_file):
+    indexer = CachedValidationIndexer(cache_file=cache_file, validate=True)
+    layout = BIDSLayout(str(root), indexer=indexer)
+    return sorted(os.path.basename(f) for f in layout.get(return_type='file'))
+
+
+def test_cached_validation(tmp_path, monkeypatch):
+    root = _write_dataset(tmp_path / 'bids')
+    cache_file = tmp_path / 'work' / 'bids_validation.json'
+    expected = ['dataset_description.json', 'sub-01_T1w.nii.gz', 'sub-02_T1w.nii.gz']
+    assert _index(root, cache_file) == expected
+    assert cache_file.exists()
+
+    from bids_validator import BIDSValidator
+
+    checked = []
+    is_bids = BIDSValidator.is_bids
+    monkeypatch.setattr(
+        BIDSValidator, 'is_bids', staticmethod(lambda path: checked.append(path) or is_bids(path))
+    )
+    assert _index(root, cache_file) == expected
+    assert checked == ['/dataset_description.json']  # Files outside subject folders
+
+    # Only the modified subject folder is validated again
+    checked.clear()
+    (root / 'sub-02' / 'anat' / 'sub-02_T2w.nii.gz').touch()
+    assert _index(root, cache_file) == [*expected, 'sub-02_T2w.nii.gz']
+    assert sorted(checked)[1:] == [
+        '/sub-02/anat/sub-02_T1w.nii.gz',
+        '/sub-02/anat/sub-02_T2w.nii.gz',
+        '/sub-02/anat/sub-02_notbids.nii.gz',
+    ]
+
+    # A new dataset description invalidates every verdict
+    fingerprint = tree_fingerprint(root)
+    (root / 'dataset_description.json').write_text('{"Name": "new", "BIDSVersion": "1.10.0"}')
+    assert tree_fingerprint(root)['description'] != fingerprint['description']
+    assert tree_fingerprint(root)['subjects'] == fingerprint['subjects']
+    checked.clear()
+    _index(root, cache_file)
+    assert len(checked) == 6
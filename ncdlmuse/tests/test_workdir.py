@@ -0,0 +1,170 @@
+"""Tests for completion tracking and working-directory layout and pruning."""
+
+import logging
+import os
+import random
+import time
+from collections import Counter
+
+import pytest
+from nipype.interfaces import utility as niu
+from nipype.pipeline import engine as pe
+
+from ncdlmuse.utils.workdir import (
+    CompletionTracker,
+    hashed_subdir,
+    is_complete,
+    manifest_path,
+    settings_signature,
+)
+
+
+def _write_derivative(in_file, out_dir):
+    from pathlib import Path
+
+    out_file = Path(out_dir) / (Path(in_file).name + '.dseg')
+    out_file.write_text('seg')
+    return str(out_file)
+
+
+def _sink(in_file):
+    return in_file
+
+
+def _make_workflow(tmp_path, t1w_files, fail=(), hashed=False):
+    workflow = pe.Workflow(name='ncdlmuse_wf', base_dir=str(tmp_path / 'work'))
+    out_dir = tmp_path / 'derivatives'
+    out_dir.mkdir(exist_ok=True)
+    for i, t1w_file in enumerate(t1w_files):
+        sub_wf = pe.Workflow(name=f'single_subject_sub-{i:02d}_wf')
+        bidssrc = pe.Node(niu.IdentityInterface(fields=['subject_data']), name='bidssrc')
+        bidssrc.inputs.subject_data = {'t1w': [str(t1w_file)]}
+        heavy = pe.Node(
+            niu.Function(function=_write_derivative, input_names=['in_file', 'out_dir']),
+            name='dlmuse',
+        )
+        heavy.inputs.in_file = str(t1w_file)
+        heavy.inputs.out_dir = str(out_dir) if i not in fail else '/nonexistent/dir'
+        sink = pe.Node(niu.Function(function=_sink, input_names=['in_file']), name='ds_seg')
+        sub_wf.connect(heavy, 'out', sink, 'in_file')
+        sub_wf.add_nodes([bidssrc])
+        if hashed:
+            from ncdlmuse.workflows.base import _add_to_fanout
+
+            _add_to_fanout(workflow, sub_wf)
+        else:
+            workflow.add_nodes([sub_wf])
+    return workflow
+
+
+def _t1w_files(tmp_path, n=2):
+    files = []
+    for i in range(n):
+        t1w_file = tmp_path / f'sub-{i:02d}_T1w.nii.gz'
+        t1w_file.write_bytes(b't1w')
+        files.append(t1w_file)
+    return files
+
+
+def test_prune_completed_subjects(tmp_path):
+    t1w_files = _t1w_files(tmp_path)
+    workflow = _make_workflow(tmp_path, t1w_files)
+    tracker = CompletionTracker(workflow, prune=True)
+    workflow.run(plugin='Linear', plugin_args={'status_callback': tracker})
+
+    work_dir = tmp_path / 'work'
+    assert sorted(tracker.completed) == ['single_subject_sub-00_wf', 'single_subject_sub-01_wf']
+    for name in tracker.completed:
+        assert not (work_dir / 'ncdlmuse_wf' / name).exists()
+
+    signature = settings_signature()
+    for t1w_file in t1w_files:
+        assert manifest_path(work_dir, t1w_file).exists()
+        assert is_complete(work_dir, t1w_file, signature)
+
+    # A changed input, changed settings or a missing derivative invalidates the manifest
+    t1w_files[0].write_bytes(b'new t1w')
+    assert not is_complete(work_dir, t1w_files[0], signature)
+    assert not is_complete(work_dir, t1w_files[1], 'other-settings')
+    (tmp_path / 'derivatives' / f'{t1w_files[1].name}.dseg').unlink()
+    assert not is_complete(work_dir, t1w_files[1], signature)
+
+
+def test_failed_subject_is_kept(tmp_path):
+    t1w_files = _t1w_files(tmp_path)
+    workflow = _make_workflow(tmp_path, t1w_files, fail=(1,))
+    failures = []
+    tracker = CompletionTracker(
+        workflow, prune=True, on_failure=lambda name, t1w, node: failures.append(name)
+    )
+    workflow.config['execution']['crashdump_dir'] = str(tmp_path / 'crash')
+    workflow.config['execution']['stop_on_first_crash'] = False
+    try:
+        workflow.run(plugin='Linear', plugin_args={'status_callback': tracker})
+    except RuntimeError:
+        pass
+
+    work_dir = tmp_path / 'work'
+    assert tracker.completed == ['single_subject_sub-00_wf']
+    assert failures == ['single_subject_sub-01_wf']
+    assert (work_dir / 'ncdlmuse_wf' / 'single_subject_sub-01_wf').exists()
+    assert not manifest_path(work_dir, t1w_files[1]).exists()
+
+
+def test_prune_hashed_layout(tmp_path):
+    t1w_files = _t1w_files(tmp_path, n=3)
+    workflow = _make_workflow(tmp_path, t1w_files, hashed=True)
+    tracker = CompletionTracker(workflow, prune=True)
+    assert len(tracker.remaining) == 3
+
+    workflow.run(plugin='Linear', plugin_args={'status_callback': tracker})
+    root = tmp_path / 'work' / 'ncdlmuse_wf'
+    assert len(tracker.completed) == 3
+    for name in tracker.completed:
+        assert tracker.node_dirs[name] == root / hashed_subdir(name) / name
+        assert (root / hashed_subdir(name)).is_dir()
+        assert not tracker.node_dirs[name].exists()
+    assert not any(root.glob('single_subject_*'))
+
+
+def test_hashed_subdir_fanout():
+    names = [f'single_subject_sub-{i:05d}_wf' for i in range(20000)]
+    subdirs = [hashed_subdir(name) for name in names]
+    assert all(len(subdir.parts) == 2 for subdir in subdirs)
+    assert hashed_subdir(names[0]) == subdirs[0]  # Stable
+    # 20k T1w files: at most 256 entries per level, a handful per leaf directory
+    assert len({subdir.parts[0] for subdir in subdirs}) <= 256
+    assert max(Counter(subdirs).values()) < 10
+
+
+def _lookup_time(root, names, layout, n_lookups=2000):
+    random.seed(0)
+    sample = random.sample(names, min(n_lookups, len(names)))
+    start = time.perf_counter()
+    for name in sample:
+        parent = root / hashed_subdir(name) if layout == 'hashed' else root
+        # Nipype and the interface list and stat node directories and their parents
+        os.stat(parent / name)
+        with os.scandir(parent) as entries:
+            sum(1 for _ in entries)
+    return (time.perf_counter() - start) / len(sample)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('layout', ['flat', 'hashed'])
+def test_benchmark_work_dir_layout(tmp_path, layout):
+    timings = {}
+    for n_subjects in (1000, 20000):
+        root = tmp_path / f'{layout}_{n_subjects}'
+        names = [f'single_subject_sub-{i:05d}_wf' for i in range(n_subjects)]
+        for name in names:
+            parent = root / hashed_subdir(name) if layout == 'hashed' else root
+            (parent / name).mkdir(parents=True)
+        timings[n_subjects] = _lookup_time(root, names, layout)
+
+    ratio = timings[20000] / timings[1000]
+    logging.getLogger(__name__).info(
+        f'{layout}: {timings[1000] * 1e6:.1f}us -> {timings[20000] * 1e6:.1f}us ({ratio:.1f}x)'
+    )
+    if layout == 'hashed':
+        assert ratio < 3
@@ -0,0 +1,60 @@
+"""Tests for warm worker processes."""
+
+import logging
+import subprocess
+import sys
+
+import pytest
+
+from ncdlmuse.utils.misc import torch_versions
+
+# Starts one worker per task (as with maxtasksperchild=1), each unpickling an interface
+_OVERHEAD_SCRIPT = """
+import importlib
+import multiprocessing as mp
+import sys
+import time
+
+from ncdlmuse.utils.workers import preload_workers
+
+if __name__ == '__main__':
+    mp.set_start_method('forkserver', force=True)
+    if sys.argv[1] == 'warm':
+        preload_workers()
+    # Start the forkserver (and have it import its modules) before timing
+    process = mp.Process(target=time.sleep, args=(0,))
+    process.start()
+    process.join()
+    start = time.perf_counter()
+    for _ in range(3):
+        process = mp.Process(target=importlib.import_module, args=('ncdlmuse.interfaces.bids',))
+        process.start()
+        process.join()
+    print((time.perf_counter() - start) / 3)
+"""
+
+
+def test_torch_versions():
+    torch = pytest.importorskip('torch')
+    assert torch_versions() == (torch.__version__, 'N/A', 'N/A')
+    assert torch_versions('cuda') == (
+        torch.__version__,
+        torch.version.cuda,
+        torch.backends.cudnn.version(),
+    )
+
+
+@pytest.mark.benchmark
+def test_benchmark_worker_overhead(tmp_path):
+    script = tmp_path / 'overhead.py'
+    script.write_text(_OVERHEAD_SCRIPT)
+    overhead = {}
+    for mode in ('cold', 'warm'):
+        result = subprocess.run(
+            [sys.executable, str(script), mode], capture_output=True, text=True, check=True
+        )
+        overhead[mode] = float(result.stdout.split()[-1])
+    logging.getLogger(__name__).info(
+        f'Per-task overhead: {overhead["cold"]:.2f}s (cold), {overhead["warm"]:.3f}s (warm)'
+    )
+    assert overhead['warm'] < overhead['cold'] / 10
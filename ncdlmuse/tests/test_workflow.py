@@ -101,4 +101,184 @@ def test_init_ncdlmuse_wf_param_passing(bids_skeleton_single, # Use the simple f
         # TODO: Add introspection checks as before if needed
 
     finally:
-        config.execution.layout = None 
\ No newline at end of file
+        config.execution.layout = None 
+
+def test_dlmuse_outputs(tmp_path, monkeypatch):
+    """Stage outputs are relabelled to MUSE indices, reoriented and measured."""
+    from importlib import resources
+
+    import nibabel as nib
+    import numpy as np
+    import pandas as pd
+
+    from ncdlmuse.workflows.ncdlmuse.ncdlmuse import _dlmuse_outputs
+
+    monkeypatch.chdir(tmp_path)
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    t1w_file = tmp_path / 'sub-01_T1w.nii.gz'
+    nib.Nifti1Image(np.ones((6, 6, 6), dtype=np.float32), affine).to_filename(t1w_file)
+    # Stage outputs are in LPS
+    lps_affine = np.diag([-2.0, -2.0, 2.0, 1.0])
+    mask = np.zeros((6, 6, 6), dtype=np.uint8)
+    mask[1:5, 1:5, 1:5] = 1
+    seg = np.zeros((6, 6, 6), dtype=np.uint8)
+    seg[2:4, 2:4, 2:4] = 1  # 3rd ventricle (MUSE 4)
+    seg[0, 0, 0] = 2  # 4th ventricle (MUSE 11)
+    nib.Nifti1Image(mask, lps_affine).to_filename(tmp_path / 'mask.nii.gz')
+    nib.Nifti1Image(seg, lps_affine).to_filename(tmp_path / 'seg.nii.gz')
+
+    data = resources.files('ncdlmuse.data')
+    segmentation, dlicv_mask, _, volumes_csv, n_attempts = _dlmuse_outputs(
+        str(t1w_file),
+        str(tmp_path / 'mask.nii.gz'),
+        str(tmp_path / 'seg.nii.gz'),
+        str(data / 'MUSE_mapping_consecutive_indices.tsv'),
+        str(data / 'MUSE_ROI_complete_list.tsv'),
+        [1, 2],
+    )
+    assert n_attempts == 2
+    seg_img = nib.load(segmentation)
+    assert np.allclose(seg_img.affine, affine)
+    labels = np.asanyarray(seg_img.dataobj)
+    assert labels[5, 5, 0] == 11  # Flipped back from LPS
+    assert sorted(np.unique(labels)) == [0, 1, 4, 11]
+    assert np.asanyarray(nib.load(dlicv_mask).dataobj).sum() == 64
+
+    volumes = pd.read_csv(volumes_csv).iloc[0]
+    assert volumes['MRID'] == 'sub-01_T1w'
+    assert volumes['4'] == 8 * 8.0
+    assert volumes['702'] == (64 + 1) * 8.0  # Unlabelled mask voxels count as label 1
+    assert volumes['600'] == (64 - 8) * 8.0  # Cortical CSF is label 1
+
+
+def _stage_outputs(tmp_path, shape=(12, 10, 8)):
+    """Random DLICV mask and DLMUSE (consecutive) parcellation, in LPS."""
+    import nibabel as nib
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    affine = np.diag([-1.5, -1.5, 2.0, 1.0])
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[1:-1, 1:-1, 1:-1] = 1
+    seg = (rng.integers(0, 152, size=shape) * mask).astype(np.uint8)
+    nib.Nifti1Image(mask, affine).to_filename(tmp_path / 'mask.nii.gz')
+    nib.Nifti1Image(seg, affine).to_filename(tmp_path / 'seg.nii.gz')
+    t1w_file = tmp_path / 'sub-01_T1w.nii.gz'
+    nib.Nifti1Image(np.ones(shape, dtype=np.float32), np.abs(affine)).to_filename(t1w_file)
+    return t1w_file, tmp_path / 'mask.nii.gz', tmp_path / 'seg.nii.gz'
+
+
+def test_dlmuse_outputs_match_nichart(tmp_path, monkeypatch):
+    """The split-stage volumes are those NiChart_DLMUSE writes for the same segmentation."""
+    monkeypatch.chdir(tmp_path)  # NiChart_DLMUSE logs to pipeline.log when imported
+    calc_roi_vol = pytest.importorskip('NiChart_DLMUSE.CalcROIVol')
+    from importlib import resources
+
+    import pandas as pd
+
+    from ncdlmuse.workflows.ncdlmuse.ncdlmuse import _dlmuse_outputs
+
+    data = resources.files('ncdlmuse.data')
+    t1w_file, mask_file, seg_file = _stage_outputs(tmp_path)
+    segmentation, _, _, volumes_csv, _ = _dlmuse_outputs(
+        str(t1w_file),
+        str(mask_file),
+        str(seg_file),
+        str(data / 'MUSE_mapping_consecutive_indices.tsv'),
+        str(data / 'MUSE_ROI_complete_list.tsv'),
+        [1],
+    )
+
+    dicts = resources.files('NiChart_DLMUSE') / 'shared' / 'dicts'
+    expected_csv = tmp_path / 'nichart_volumes.csv'
+    calc_roi_vol.create_roi_csv(
+        'sub-01_T1w',
+        segmentation,
+        str(dicts / 'MUSE_mapping_consecutive_indices.csv'),
+        str(dicts / 'MUSE_mapping_derived_rois.csv'),
+        str(expected_csv),
+    )
+    expected = pd.read_csv(expected_csv).iloc[0]
+    volumes = pd.read_csv(volumes_csv).iloc[0]
+    assert expected['600'] > 0
+    for roi in expected.index.drop('MRID'):
+        assert volumes[roi] == pytest.approx(expected[roi]), roi
+
+
+def test_dlmuse_outputs_unknown_label(tmp_path, monkeypatch):
+    """ROIs made of labels the parcellation cannot contain are an error."""
+    from importlib import resources
+
+    from ncdlmuse.workflows.ncdlmuse.ncdlmuse import _dlmuse_outputs
+
+    monkeypatch.chdir(tmp_path)
+    roi_list = tmp_path / 'roi_list.tsv'
+    roi_list.write_text('ID\tName\tFull_Name\tConsisting_of_ROIS\n800\tX\tX\t4, 999\n')
+    with pytest.raises(ValueError, match=r'ROI 800 .* labels \[999\]'):
+        _dlmuse_outputs(
+            *map(str, _stage_outputs(tmp_path)),
+            str(resources.files('ncdlmuse.data') / 'MUSE_mapping_consecutive_indices.tsv'),
+            str(roi_list),
+            [1],
+        )
+
+
+def test_split_stage_inputs_are_compressed(tmp_path, monkeypatch):
+    """Uncompressed T1w images are reoriented and masked into ``<base>.nii.gz``."""
+    import nibabel as nib
+    import numpy as np
+
+    from ncdlmuse.workflows.ncdlmuse.ncdlmuse import _apply_mask, _reorient_to_lps
+
+    monkeypatch.chdir(tmp_path)
+    t1w_dir = tmp_path / 'bids'
+    t1w_dir.mkdir()
+    t1w_file = t1w_dir / 'sub-01_T1w.nii'
+    nib.Nifti1Image(np.ones((4, 4, 4), dtype=np.float32), np.eye(4)).to_filename(t1w_file)
+    mask = np.zeros((4, 4, 4), dtype=np.uint8)
+    mask[:2] = 1
+    mask_file = t1w_dir / 'sub-01_T1w_DLICV.nii.gz'
+    nib.Nifti1Image(mask, np.eye(4)).to_filename(mask_file)
+
+    reoriented = _reorient_to_lps(str(t1w_file))
+    assert reoriented == str(tmp_path / 'sub-01_T1w.nii.gz')
+    assert nib.aff2axcodes(nib.load(reoriented).affine) == ('L', 'P', 'S')
+    masked = _apply_mask(str(t1w_file), str(mask_file))
+    assert masked == str(tmp_path / 'sub-01_T1w.nii.gz')
+    assert nib.load(masked).get_fdata().sum() == 32
+
+
+def test_dlmuse_split_wf_extra_models(tmp_path):
+    """Additional models get their own DLMUSE stage, fed by the shared DLICV stage."""
+    from nipype.interfaces.base import isdefined
+
+    from ncdlmuse.workflows.ncdlmuse.ncdlmuse import init_dlmuse_split_wf
+
+    wf = init_dlmuse_split_wf(extra_models={'DLMUSEv2': tmp_path})
+    assert not isdefined(wf.get_node('dlmuse_node').inputs.model_folder)
+    assert wf.get_node('dlmuse_node_DLMUSEv2').inputs.model_folder == str(tmp_path)
+    graph = wf._graph
+    for name in ('dlmuse_node', 'dlmuse_node_DLMUSEv2'):
+        assert [node.name for node in graph.predecessors(wf.get_node(name))] == [
+            'apply_mask_node'
+        ]
+    outputs = wf.get_node('outputnode').inputs.copyable_trait_names()
+    assert 'dlmuse_segmentation_DLMUSEv2' in outputs
+    assert 'dlicv_mask_DLMUSEv2' not in outputs
+
+
+def test_extra_models_require_split_stages(tmp_path):
+    """Additional models cannot be run by NiChart_DLMUSE."""
+    with pytest.raises(ValueError, match='split_stages=True'):
+        init_single_subject_wf(
+            '01',
+            str(tmp_path / 'sub-01_T1w.nii.gz'),
+            None,
+            {'subject': '01', 'datatype': 'anat', 'suffix': 'T1w'},
+            mapping_tsv=None,
+            io_spec=None,
+            roi_list_tsv=None,
+            derivatives_dir=tmp_path,
+            reportlets_dir=tmp_path,
+            extra_models={'DLMUSEv2': tmp_path},
+        )
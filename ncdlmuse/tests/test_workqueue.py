@@ -0,0 +1,161 @@
+"""Tests for the shared-filesystem work queue."""
+
+import json
+import multiprocessing as mp
+import os
+import time
+
+import pytest
+
+from ncdlmuse.utils.workqueue import WorkQueue, job_id_for
+
+
+def _t1w_files(n):
+    return [f'/bids/sub-{i:03d}/anat/sub-{i:03d}_T1w.nii.gz' for i in range(n)]
+
+
+def _drain(queue_dir, out_dir):
+    """Worker loop used by the multi-process test."""
+    queue = WorkQueue(queue_dir, lease=30, max_attempts=1)
+    processed = []
+    while (claim := queue.wait_for_job(poll_interval=0.05)) is not None:
+        with claim:
+            time.sleep(0.01)
+            processed.append(claim.job['t1w'])
+            claim.complete()
+    (out_dir / f'{os.getpid()}.json').write_text(json.dumps(processed))
+
+
+def test_populate_is_idempotent(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue')
+    files = _t1w_files(5)
+    assert len(queue.populate(files)) == 5
+    assert queue.populate(files) == []
+
+    with queue.claim() as claim:
+        claim.complete()
+    # Jobs in any state are not added again
+    assert queue.populate(files) == []
+    assert queue.counts() == {'pending': 4, 'claimed': 0, 'done': 1, 'failed': 0}
+
+
+def test_setup_runs_once(tmp_path):
+    first = WorkQueue(tmp_path / 'queue')
+    other = WorkQueue(tmp_path / 'queue')
+    assert first.start_setup('clear-cache')
+    assert not other.start_setup('clear-cache')
+    assert not other.wait_for_setup('clear-cache', timeout=0.1, poll_interval=0.02)
+
+    first.finish_setup('clear-cache')
+    assert other.wait_for_setup('clear-cache', poll_interval=0.02)
+    # Workers joining the queue later do not run it again
+    assert not WorkQueue(tmp_path / 'queue').start_setup('clear-cache')
+    assert WorkQueue(tmp_path / 'queue').start_setup('other-step')
+    assert first.counts() == {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 0}
+
+
+def test_job_ids_are_stable_and_unique():
+    files = _t1w_files(50)
+    ids = {job_id_for(f) for f in files}
+    assert len(ids) == 50
+    assert job_id_for(files[0]) == job_id_for(files[0])
+    assert job_id_for(files[0]).startswith('sub-000_T1w-')
+
+
+def test_claim_and_complete(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue')
+    queue.populate(_t1w_files(1))
+
+    claim = queue.claim()
+    assert claim is not None
+    assert claim.job['attempts'] == 1
+    assert queue.claim() is None
+    assert not queue.is_drained()
+
+    claim.complete(exit_code=0)
+    assert queue.is_drained()
+    record = json.loads((tmp_path / 'queue' / 'done' / f'{claim.job_id}.json').read_text())
+    assert record['exit_code'] == 0
+    assert record['worker'] == queue.worker_id
+
+
+def test_expired_claims_are_reclaimed(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue', lease=0.2, max_attempts=2)
+    queue.populate(_t1w_files(1))
+
+    abandoned = queue.claim()  # never heartbeats
+    assert queue.reclaim_expired() == []
+    time.sleep(0.3)
+    assert queue.reclaim_expired() == [abandoned.job_id]
+    assert not abandoned.heartbeat()
+
+    other = WorkQueue(tmp_path / 'queue', lease=0.2, max_attempts=2)
+    claim = other.claim()
+    assert claim.job_id == abandoned.job_id
+    assert claim.job['attempts'] == 2
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue', lease=0.3)
+    queue.populate(_t1w_files(1))
+
+    with queue.claim() as claim:
+        time.sleep(0.8)
+        assert queue.reclaim_expired() == []
+        assert not claim.lease_lost.is_set()
+        claim.complete()
+    assert queue.is_drained()
+
+
+def test_max_attempts(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue', max_attempts=2)
+    queue.populate(_t1w_files(1))
+
+    queue.claim().fail(error='boom')
+    assert queue.counts()['pending'] == 1
+    queue.claim().fail(error='boom')
+    assert queue.counts() == {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 1}
+
+
+def test_release_does_not_count_attempt(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue', max_attempts=1)
+    queue.populate(_t1w_files(1))
+
+    queue.claim().release()
+    assert queue.counts()['pending'] == 1
+    claim = queue.claim()
+    assert claim.job['attempts'] == 1
+    assert queue.wait_for_job(poll_interval=0.01, should_stop=lambda: True) is None
+    claim.complete()
+
+
+def test_exception_releases_claim(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue', max_attempts=1)
+    queue.populate(_t1w_files(1))
+
+    with pytest.raises(RuntimeError), queue.claim():
+        raise RuntimeError('crash')
+    assert queue.counts()['failed'] == 1
+
+
+def test_multiple_workers(tmp_path):
+    queue_dir = tmp_path / 'queue'
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    files = _t1w_files(40)
+    WorkQueue(queue_dir).populate(files)
+
+    ctx = mp.get_context('spawn')
+    workers = [ctx.Process(target=_drain, args=(queue_dir, out_dir)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+
+    processed = [
+        t1w for result in out_dir.glob('*.json') for t1w in json.loads(result.read_text())
+    ]
+    # Every job was processed exactly once
+    assert sorted(processed) == sorted(files)
+    assert WorkQueue(queue_dir).counts()['done'] == 40
@@ -12,6 +12,7 @@ import os
 # """BIDS utilities for NCDLMUSE."""
 import re
 import shutil
+from functools import lru_cache
 from pathlib import Path
 
 from ncdlmuse import data as ncdlmuse_data_module
@@ -19,16 +20,58 @@ from ncdlmuse import data as ncdlmuse_data_module
 LOGGER = logging.getLogger('ncdlmuse.utils.bids')
 
 
+#: Number of file names whose entities are kept by :py:func:`parse_entities`
+ENTITY_CACHE_SIZE = 65536
+
+
+def parse_entities(file_path, layout=None):
+    """Parse the BIDS entities of a file, with a cache keyed by path.
+
+    Well-formed BIDS names are parsed with a compiled regex, without touching
+    the filesystem or any index, and the result is cached. Other names are
+    handed to ``layout`` (the shared layout of the run), if given, outside of
+    the cache, which therefore never keeps a layout alive. A new layout is
+    never built.
+
+    Parameters
+    ----------
+    file_path : str or :py:class:`~pathlib.Path`
+        The path to the file.
+    layout : :py:class:`bids.layout.BIDSLayout` or None
+        The layout of the dataset, only used for names the regex does not parse.
+
+    Returns
+    -------
+    entities : dict
+        The entities of the file (empty if they could not be parsed). The
+        dictionary is a copy and may be modified.
+
+    """
+    path = os.fspath(file_path)
+    entities = dict(_parse_entities(path))
+    if not entities and layout is not None:
+        try:
+            entities = layout.parse_file_entities(path)
+        except Exception as e:  # Catch potential layout errors
+            LOGGER.warning(f'Could not parse BIDS entities for {path} using provided layout: {e}')
+    return entities
+
+
+@lru_cache(maxsize=ENTITY_CACHE_SIZE)
+def _parse_entities(path):
+    return _extract_entities_regex(path)
+
+
 def get_entities_from_file(file_path, layout=None):
-    """Safely get BIDS entities from a file path using a layout.
+    """Safely get BIDS entities from a file path.
 
     Parameters
     ----------
     file_path : str or :py:class:`~pathlib.Path`
         The path to the NIfTI file.
     layout : :py:class:`bids.layout.BIDSLayout` or None
-        An initialized BIDSLayout. If None, attempts to create one,
-        assuming the file is within a valid BIDS structure.
+        The layout of the dataset, used for names that are not plain BIDS
+        (see :py:func:`parse_entities`).
 
     Returns
     -------
@@ -36,46 +79,11 @@ def get_entities_from_file(file_path, layout=None):
         A dictionary of BIDS entities found for the file.
         Returns a dictionary with default/placeholder values if parsing fails.
 
-    Notes
-    -----
-    Creating a BIDSLayout for every file can be inefficient. It's best
-    to pass an existing layout when possible.
-    The fallback mechanism assumes a standard BIDS structure relative to the file
-    (e.g., file is in ``<root>/sub-XX/ses-YY/anat/``), which might not always hold.
-
     """
-
-    if layout:
-        try:
-            entities = layout.parse_file_entities(str(file_path))
-            # Ensure essential entities have defaults if missing (though layout usually provides)
-            entities.setdefault('subject', 'UNKNOWN')
-            entities.setdefault('session', None)
-            entities.setdefault('datatype', 'anat')  # Assume anat if missing
-            entities.setdefault('suffix', Path(file_path).name.split('_')[-1].split('.')[0])
-            return entities
-        except Exception as e:  # Catch potential layout errors
-            LOGGER.warning(
-                f'Could not parse BIDS entities for {file_path} using provided layout: {e}'
-            )
-            # Fall through to fallback
-
-    # Fallback: Try to create layout from file path (less robust)
-    try:
-        from bids.layout import BIDSLayout
-
-        # Attempt to find BIDS root by navigating up. This is fragile!
-        # Adjust the number of parents based on typical depth if needed
-        possible_root = Path(file_path).parent.parent.parent  # Assumes anat/ses/sub structure
-        layout = BIDSLayout(str(possible_root), validate=False)
-        entities = layout.parse_file_entities(str(file_path))
-        entities.setdefault('subject', 'UNKNOWN')
-        entities.setdefault('session', None)
-        entities.setdefault('datatype', 'anat')
-        entities.setdefault('suffix', Path(file_path).name.split('_')[-1].split('.')[0])
-        return entities
-    except (ValueError, AttributeError, FileNotFoundError, ImportError) as e:
-        LOGGER.warning(f'Could not parse BIDS entities for {file_path} via fallback layout: {e}')
+    entities = parse_entities(file_path, layout=layout)
+    suffix = Path(file_path).name.split('_')[-1].split('.')[0]
+    if not entities:
+        LOGGER.warning(f'Could not parse BIDS entities for {file_path}, using placeholders.')
         # Provide default/dummy values to avoid crashing downstream nodes
         return {
             'subject': Path(file_path).stem.split('_')[0].replace('sub-', '') or 'UNKNOWN',
@@ -83,62 +91,234 @@ def get_entities_from_file(file_path, layout=None):
             'task': None,
             'run': None,
             'datatype': 'anat',
-            'suffix': Path(file_path).name.split('_')[-1].split('.')[0],
+            'suffix': suffix,
             'desc': None,  # Add common optional entities
             'space': None,
         }
 
+    entities.setdefault('subject', 'UNKNOWN')
+    entities.setdefault('session', None)
+    entities.setdefault('datatype', 'anat')  # Assume anat if missing
+    entities.setdefault('suffix', suffix)
+    return entities
+
+
+# BIDS entity keys (as in file names) and their PyBIDS names
+_ENTITY_NAMES = {
+    'sub': 'subject',
+    'ses': 'session',
+    'sample': 'sample',
+    'task': 'task',
+    'acq': 'acquisition',
+    'ce': 'ceagent',
+    'stain': 'staining',
+    'trc': 'tracer',
+    'rec': 'reconstruction',
+    'dir': 'direction',
+    'run': 'run',
+    'proc': 'proc',
+    'echo': 'echo',
+    'flip': 'flip',
+    'inv': 'inv',
+    'mt': 'mt',
+    'part': 'part',
+    'space': 'space',
+    'chunk': 'chunk',
+}
+_FILENAME_RE = re.compile(
+    r'^(?P<entities>sub-[a-zA-Z0-9]+(?:_[a-zA-Z]+-[a-zA-Z0-9]+)*)'
+    r'_(?P<suffix>[a-zA-Z0-9]+)(?P<extension>\.[a-zA-Z0-9.]+)$'
+)
+_DATATYPES = frozenset(('anat', 'func', 'dwi', 'fmap', 'perf', 'pet', 'beh', 'meg', 'eeg'))
+
 
 def _extract_entities_regex(file_path):
-    """Extract basic BIDS entities using regex when layout parsing fails."""
-    file_path = str(file_path)
+    """Parse the BIDS entities of a file name with a compiled regex.
+
+    Returns the entities with the names and types of
+    :py:meth:`bids.layout.BIDSLayout.parse_file_entities` (e.g., ``run`` is an
+    integer), or an empty dictionary if the name does not follow BIDS.
+    """
+    from bids.layout.utils import PaddedInt
+
+    path = Path(file_path)
+    match = _FILENAME_RE.match(path.name)
+    if match is None:
+        return {}
+
     entities = {}
+    for pair in match.group('entities').split('_'):
+        key, value = pair.split('-', 1)
+        if key in _ENTITY_NAMES:
+            entities[_ENTITY_NAMES[key]] = PaddedInt(value) if key == 'run' else value
+    entities['suffix'] = match.group('suffix')
+    if path.parent.name in _DATATYPES:
+        entities['datatype'] = path.parent.name
+    entities['extension'] = match.group('extension')
+    return entities
+
 
-    # Extract subject ID
-    subject_match = re.search(r'sub-([a-zA-Z0-9]+)', file_path)
-    if subject_match:
-        entities['subject'] = subject_match.group(1)
-
-    # Extract session ID
-    session_match = re.search(r'ses-([a-zA-Z0-9]+)', file_path)
-    if session_match:
-        entities['session'] = session_match.group(1)
-
-    # Extract acquisition
-    acq_match = re.search(r'acq-([a-zA-Z0-9]+)', file_path)
-    if acq_match:
-        entities['acquisition'] = acq_match.group(1)
-
-    # Extract run
-    run_match = re.search(r'run-(\d+)', file_path)
-    if run_match:
-        entities['run'] = run_match.group(1)
-
-    # Extract echo
-    echo_match = re.search(r'echo-(\d+)', file_path)
-    if echo_match:
-        entities['echo'] = echo_match.group(1)
-
-    # Extract part
-    part_match = re.search(r'part-(mag|phase|real|imag)', file_path)
-    if part_match:
-        entities['part'] = part_match.group(1)
-
-    # Extract chunk
-    chunk_match = re.search(r'chunk-(\d+)', file_path)
-    if chunk_match:
-        entities['chunk'] = chunk_match.group(1)
-
-    # Extract contrast enhancement
-    ce_match = re.search(r'ce-([a-zA-Z0-9]+)', file_path)
-    if ce_match:
-        entities['ce'] = ce_match.group(1)
-
-    # Extract reconstruction
-    rec_match = re.search(r'rec-([a-zA-Z0-9]+)', file_path)
-    if rec_match:
-        entities['reconstruction'] = rec_match.group(1)
+def _as_list(value):
+    return None if value is None else [value] if isinstance(value, str) else list(value)
 
+
+class FastLayout:
+    """Filesystem-native discovery of T1w images, a stand-in for a PyBIDS layout.
+
+    Walks ``sub-*/[ses-*/]anat/`` with parallel :py:func:`os.scandir` calls and
+    parses entities with :py:func:`_extract_entities_regex`, without indexing or
+    validating the dataset. It implements the parts of the
+    :py:class:`bids.layout.BIDSLayout` interface used to select and build the
+    participant workflows (T1w files only).
+
+    Parameters
+    ----------
+    root : str or :py:class:`~pathlib.Path`
+        Root of a well-formed BIDS dataset.
+    n_workers : int or None
+        Number of threads scanning subject directories.
+
+    """
+
+    def __init__(self, root, n_workers=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.root = str(Path(root).absolute())
+        with os.scandir(self.root) as entries:
+            subject_dirs = [
+                entry.path
+                for entry in entries
+                if entry.name.startswith('sub-') and entry.is_dir()
+            ]
+        self._entities = {}
+        self._listings = {}
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            for entities, listings in pool.map(self._scan_subject, subject_dirs):
+                self._entities.update(entities)
+                self._listings.update(listings)
+        LOGGER.info(f'Fast discovery found {len(self._entities)} T1w file(s) in {self.root}.')
+
+    @staticmethod
+    def _scan_subject(subject_dir):
+        """Find the T1w files of one subject, keeping the listing of their folders."""
+        subject = Path(subject_dir).name[4:]
+        anat_dirs = [Path(subject_dir) / 'anat']
+        with os.scandir(subject_dir) as entries:
+            anat_dirs += [
+                Path(entry.path) / 'anat'
+                for entry in entries
+                if entry.name.startswith('ses-') and entry.is_dir()
+            ]
+
+        found = {}
+        listings = {}
+        for anat_dir in anat_dirs:
+            try:
+                names = os.listdir(anat_dir)
+            except OSError:
+                continue
+            listings[str(anat_dir)] = set(names)
+            for name in names:
+                if not name.endswith(('_T1w.nii.gz', '_T1w.nii')):
+                    continue
+                path = str(anat_dir / name)
+                entities = _extract_entities_regex(path)
+                session_dir = anat_dir.parent.name
+                expected_session = session_dir[4:] if session_dir.startswith('ses-') else None
+                # Files must sit in the folders of their subject and session
+                if (
+                    entities.get('subject') == subject
+                    and entities.get('session') == expected_session
+                ):
+                    found[path] = entities
+        return found, listings
+
+    def get_subjects(self):
+        return sorted({entities['subject'] for entities in self._entities.values()})
+
+    def get_sessions(self, subject=None):
+        subjects = _as_list(subject)
+        return sorted({
+            entities['session']
+            for entities in self._entities.values()
+            if entities.get('session') and (subjects is None or entities['subject'] in subjects)
+        })
+
+    def get(self, return_type='file', **filters):
+        """Return the T1w files matching the entity ``filters`` (only file paths)."""
+        if return_type not in ('file', 'filename'):
+            raise ValueError(f'FastLayout.get() only returns files, not {return_type!r}.')
+        if 'extension' in filters:
+            filters['extension'] = [
+                ext if ext.startswith('.') else f'.{ext}'
+                for ext in _as_list(filters['extension'])
+            ]
+        filters = {key: _as_list(value) for key, value in filters.items() if value is not None}
+        return sorted(
+            path
+            for path, entities in self._entities.items()
+            if all(
+                key in entities and str(entities[key]) in map(str, values)
+                for key, values in filters.items()
+            )
+        )
+
+    def parse_file_entities(self, filename):
+        entities = self._entities.get(str(filename))
+        return dict(entities) if entities is not None else _extract_entities_regex(filename)
+
+    def sidecar(self, filename):
+        """Path of the JSON sidecar next to ``filename``, or ``None``."""
+        path = Path(filename)
+        stem = path.name[:-7] if path.name.endswith('.nii.gz') else path.stem
+        sidecar = path.with_name(f'{stem}.json')
+        listing = self._listings.get(str(path.parent))
+        found = sidecar.name in listing if listing is not None else sidecar.exists()
+        return str(sidecar) if found else None
+
+    def get_metadata(self, filename):
+        """Sidecar metadata of ``filename``, following the BIDS inheritance principle."""
+        path = Path(filename)
+        entities = self.parse_file_entities(path)
+        metadata = {}
+        # From the dataset root down to the file's folder, deeper sidecars take precedence
+        folders = [path.parent, *path.parent.parents]
+        for folder in reversed(folders[: len(path.parent.relative_to(self.root).parts) + 1]):
+            try:
+                names = sorted(os.listdir(folder))
+            except OSError:
+                continue
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                candidate = _extract_entities_regex(name) or _top_level_entities(name)
+                if candidate.get('suffix') != entities.get('suffix'):
+                    continue
+                if any(
+                    key not in ('suffix', 'extension', 'datatype')
+                    and str(entities.get(key)) != str(value)
+                    for key, value in candidate.items()
+                ):
+                    continue
+                try:
+                    metadata.update(json.loads((folder / name).read_text()))
+                except (OSError, ValueError) as e:
+                    LOGGER.warning(f'Could not read sidecar {folder / name}: {e}')
+        return metadata
+
+
+def _top_level_entities(name):
+    """Entities of a sidecar name without a subject (e.g., ``acq-mp_T1w.json``)."""
+    match = re.match(r'^(?:(?P<entities>[a-zA-Z]+-[a-zA-Z0-9]+(?:_[a-zA-Z]+-[a-zA-Z0-9]+)*)_)?'
+                     r'(?P<suffix>[a-zA-Z0-9]+)\.json$', name)
+    if match is None:
+        return {}
+    entities = {'suffix': match.group('suffix')}
+    for pair in (match.group('entities') or '').split('_'):
+        if pair:
+            key, value = pair.split('-', 1)
+            if key in _ENTITY_NAMES:
+                entities[_ENTITY_NAMES[key]] = value
     return entities
 
 
@@ -171,6 +351,105 @@ def collect_data(
     return subj_data
 
 
+def _tag_value(value, dtype):
+    """Convert a tag value stored in the PyBIDS database to its Python type."""
+    from bids.layout.utils import PaddedInt
+
+    if dtype == 'json':
+        return json.loads(value)
+    if dtype == 'bool':
+        return value == 'True'
+    return {'int': PaddedInt, 'float': float}.get(dtype, str)(value)
+
+
+def _query_entities(layout, files, chunk_size):
+    """Read the (non-metadata) entities of ``files`` from the PyBIDS database."""
+    from bids.layout.models import Tag
+
+    entities = {path: {} for path in files}
+    for start in range(0, len(files), chunk_size):
+        rows = (
+            layout.session.query(Tag.file_path, Tag.entity_name, Tag._value, Tag._dtype)
+            .filter(Tag.file_path.in_(files[start : start + chunk_size]))
+            .filter(Tag.is_metadata.is_(False))
+        )
+        for file_path, name, value, dtype in rows:
+            entities[file_path][name] = _tag_value(value, dtype)
+    return entities
+
+
+class _SidecarFinder:
+    """Find adjacent JSON sidecars with one listing per folder instead of a stat per file."""
+
+    def __init__(self):
+        self.listings = {}
+
+    def __call__(self, filename):
+        path = Path(filename)
+        if path.parent not in self.listings:
+            try:
+                self.listings[path.parent] = set(os.listdir(path.parent))
+            except OSError:
+                self.listings[path.parent] = set()
+        stem = path.name[:-7] if path.name.endswith('.nii.gz') else path.stem
+        sidecar = path.with_name(f'{stem}.json')
+        return str(sidecar) if sidecar.name in self.listings[path.parent] else None
+
+
+def collect_t1w_files(layout, participant_label, session_label=None, chunk_size=500):
+    """Retrieve all T1w files of the given participants with their entities and sidecars.
+
+    A single query returns the T1w files of all participants (and sessions),
+    and their entities are read from the database in bulk, instead of one
+    query per participant and session and one entity parse per file.
+
+    Parameters
+    ----------
+    layout : :py:class:`bids.layout.BIDSLayout`
+        An indexed BIDS layout.
+    participant_label : list of str
+        Participant labels (without ``sub-``).
+    session_label : list of str or None
+        Session labels (without ``ses-``); all sessions if ``None``.
+    chunk_size : int
+        Number of files per entity query (bounded by SQLite's variable limit).
+
+    Returns
+    -------
+    t1w_records : list of tuple
+        ``(t1w_file, entities, sidecar)`` for every T1w file, sorted by path,
+        where ``sidecar`` is the path of the adjacent JSON sidecar or ``None``.
+
+    """
+    query = {
+        'subject': participant_label,
+        'suffix': 'T1w',
+        'extension': ['.nii', '.nii.gz'],
+        'return_type': 'file',
+    }
+    if session_label:
+        query['session'] = session_label
+    t1w_files = sorted(layout.get(**query))
+
+    if isinstance(layout, FastLayout):
+        # Entities were parsed, and folders listed, during discovery
+        entities = {t1w_file: layout.parse_file_entities(t1w_file) for t1w_file in t1w_files}
+        find_sidecar = layout.sidecar
+    else:
+        entities = _query_entities(layout, t1w_files, chunk_size)
+        find_sidecar = _SidecarFinder()
+
+    t1w_records = []
+    for t1w_file in t1w_files:
+        file_entities = entities[t1w_file] or parse_entities(t1w_file, layout=layout)
+        file_entities.setdefault('subject', 'UNKNOWN')
+        file_entities.setdefault('session', None)
+        file_entities.setdefault('datatype', 'anat')
+        file_entities.setdefault('suffix', 'T1w')
+        t1w_records.append((t1w_file, file_entities, find_sidecar(t1w_file)))
+    return t1w_records
+
+
 def write_bidsignore(deriv_dir):
     """Write .bidsignore file."""
     bids_ignore = (
@@ -0,0 +1,158 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Detection of duplicate T1w inputs.
+
+Datasets often contain the same volume more than once (symlinked sessions,
+re-exported runs, ``acq-`` variants of the same acquisition).
+Inputs are fingerprinted in two passes, both in a thread pool:
+
+1. A *header key* (matrix size, data type, scaling and affine) is computed
+   for every file from its header alone.
+2. Files sharing a header key get a checksum of their voxel data (the
+   uncompressed stream after the header), so files are voxel-identical
+   even if their compression or header descriptions differ.
+
+Only one representative per group of duplicates is segmented; the others
+reuse its outputs (see :py:func:`ncdlmuse.workflows.base.init_ncdlmuse_wf`).
+Fingerprints are cached by path, size and modification time.
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from ncdlmuse.utils.preflight import file_stamp, load_cache, read_gzip, read_header, save_cache
+
+LOGGER = logging.getLogger('ncdlmuse.utils.dedup')
+
+FINGERPRINT_CACHE = Path('logs') / 'fingerprints.json'
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def header_key(path):
+    """Digest of the header fields that define the voxel grid and intensities."""
+    header = read_header(path)
+    slope, inter = header.get_slope_inter()
+    key = {
+        'shape': [int(n) for n in header.get_data_shape()],
+        'dtype': header.get_data_dtype().str,
+        'scaling': [str(slope), str(inter)],
+        'affine': np.round(header.get_best_affine(), 4).tolist(),
+    }
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+class _DataHasher:
+    """Hash a stream of bytes, skipping the first ``offset`` of them."""
+
+    def __init__(self, offset):
+        self.skip = offset
+        self.digest = hashlib.blake2b(digest_size=20)
+
+    def update(self, chunk):
+        if self.skip:
+            skipped = min(self.skip, len(chunk))
+            chunk = chunk[skipped:]
+            self.skip -= skipped
+        self.digest.update(chunk)
+
+
+def data_checksum(path):
+    """Checksum of the voxel data of a NIfTI file (independent of its compression)."""
+    path = str(path)
+    offset = int(read_header(path)['vox_offset'])
+    hasher = _DataHasher(offset)
+    if path.endswith('.gz'):
+        read_gzip(path, on_chunk=hasher.update)
+    else:
+        with open(path, 'rb') as fobj:
+            while chunk := fobj.read(_CHUNK_SIZE):
+                hasher.update(chunk)
+    return hasher.digest.hexdigest()
+
+
+def _cached(cache, kind, func, files, n_workers):
+    """Compute ``func`` for ``files``, reusing cached values of unchanged files."""
+    results = {}
+    to_compute = []
+    for path in files:
+        key = str(Path(path).absolute())
+        stamp = file_stamp(path)
+        entry = cache.get(key)
+        if entry is not None and entry['stamp'] == stamp and kind in entry:
+            results[path] = entry[kind]
+        else:
+            to_compute.append((path, key, stamp))
+    if to_compute:
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            values = pool.map(func, [path for path, _, _ in to_compute])
+            for (path, key, stamp), value in zip(to_compute, values, strict=True):
+                results[path] = value
+                entry = cache.get(key)
+                if entry is None or entry['stamp'] != stamp:
+                    entry = cache[key] = {'stamp': stamp}
+                entry[kind] = value
+    return results
+
+
+def find_duplicates(t1w_files, cache_file=None, n_workers=None):
+    """Group voxel-identical T1w files.
+
+    Parameters
+    ----------
+    t1w_files : list of str
+        T1w files to compare. The first file of each group of duplicates (in
+        this order) is its representative.
+    cache_file : str or :py:class:`~pathlib.Path` or None
+        JSON file where fingerprints are cached (no caching if ``None``).
+    n_workers : int or None
+        Number of threads.
+
+    Returns
+    -------
+    duplicates : dict
+        The representative of every duplicate T1w file, keyed by the duplicate.
+
+    """
+    t1w_files = [str(f) for f in t1w_files]
+    cache = load_cache(cache_file) if cache_file else {}
+
+    # Symlinks and hard links to the same file are duplicates without reading them
+    by_inode = defaultdict(list)
+    for path in t1w_files:
+        stat = os.stat(path)
+        by_inode[(stat.st_dev, stat.st_ino)].append(path)
+    duplicates = {dup: paths[0] for paths in by_inode.values() for dup in paths[1:]}
+    unique = [paths[0] for paths in by_inode.values()]
+
+    by_header = defaultdict(list)
+    for path, key in _cached(cache, 'header', header_key, unique, n_workers).items():
+        by_header[key].append(path)
+    candidates = [path for paths in by_header.values() if len(paths) > 1 for path in paths]
+
+    by_data = defaultdict(list)
+    for path, checksum in _cached(cache, 'data', data_checksum, candidates, n_workers).items():
+        by_data[checksum].append(path)
+    for paths in by_data.values():
+        paths.sort(key=t1w_files.index)
+        duplicates.update(dict.fromkeys(paths[1:], paths[0]))
+
+    if cache_file:
+        save_cache(cache_file, cache)
+
+    # Duplicates of a linked file point to the representative of its group
+    duplicates = {dup: duplicates.get(rep, rep) for dup, rep in duplicates.items()}
+    LOGGER.info(
+        f'Fingerprinted {len(t1w_files)} T1w file(s): {len(duplicates)} duplicate(s) of '
+        f'{len(set(duplicates.values()))} other file(s).'
+    )
+    return duplicates
@@ -0,0 +1,223 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Graceful drain of a run on preemption.
+
+When the scheduler preempts the job or the cloud reclaims a spot node, every
+process of the job receives ``SIGTERM``. Instead of dying mid-inference, a
+:py:class:`DrainHandler` puts the run in *draining* mode by writing a small
+JSON document (``<log_dir>/drain.json``) with a deadline:
+
+* :py:class:`~ncdlmuse.interfaces.ncdlmuse.NiChartDLMUSE` refuses to start
+  new runs (raising :py:class:`DrainRequested`), so no new T1w file is admitted.
+* In-flight ``NiChart_DLMUSE`` runs are given until the deadline to finish,
+  and are then stopped by their watchdog.
+* Every other node keeps running, so the derivatives and completion manifests
+  of the T1w files that did finish are written before the run exits.
+
+A second ``SIGTERM`` terminates the run immediately, and moves the deadline
+to now, so in-flight runs are stopped too.
+
+Only the main process drains: :py:func:`shield_workers` starts the forkserver
+with ``SIGTERM`` ignored, so the Nipype workers forked from it, and the
+``NiChart_DLMUSE`` processes they start, keep running until the deadline.
+
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.drain')
+
+DRAIN_FILE = 'drain.json'
+#: Exit code of a drained run (as if terminated by SIGTERM), so that schedulers requeue it
+DRAIN_EXIT_CODE = 128 + signal.SIGTERM
+
+
+class DrainRequested(RuntimeError):
+    """The run is draining: no new NiChart_DLMUSE run may start."""
+
+
+def _write_json_atomic(path, content):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    tmp_path.write_text(json.dumps(content, indent=2))
+    os.replace(tmp_path, path)
+
+
+def drain_state(drain_file):
+    """The drain document of a run, or ``None`` if it is not draining."""
+    if not drain_file:
+        return None
+    try:
+        return json.loads(Path(drain_file).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def request_drain(drain_file, grace_period, reason=None):
+    """Put the run in draining mode, keeping the deadline of an earlier request."""
+    state = drain_state(drain_file)
+    if state is None:
+        now = time.time()
+        state = {
+            'requested_at': now,
+            'deadline': now + grace_period,
+            'grace_period': grace_period,
+            'reason': reason,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+        }
+        _write_json_atomic(drain_file, state)
+    return state
+
+
+def expire_drain(drain_file):
+    """Move the deadline of a drain to now, so in-flight runs are stopped."""
+    state = drain_state(drain_file)
+    if state is not None:
+        _write_json_atomic(drain_file, {**state, 'deadline': time.time()})
+
+
+def shield_workers():
+    """Start the forkserver with ``SIGTERM`` ignored.
+
+    Ignored signals are inherited through ``fork`` and ``exec``, so the
+    worker processes forked from the server (and the tools they run) survive
+    the ``SIGTERM`` schedulers send to every process of a preempted job; the
+    drain deadline stops them instead.
+    Must be called before the first process is started (and after
+    :py:func:`~ncdlmuse.utils.workers.preload_workers`).
+
+    Returns
+    -------
+    shielded : bool
+        Whether the workers will ignore ``SIGTERM``.
+
+    """
+    import multiprocessing as mp
+    from multiprocessing import forkserver
+
+    if mp.get_start_method() != 'forkserver':
+        LOGGER.warning('Only forkserver workers can be shielded from SIGTERM.')
+        return False
+    if forkserver._forkserver._forkserver_pid is not None:
+        LOGGER.warning('The forkserver is already running; workers will not ignore SIGTERM.')
+        return False
+    previous = signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    try:
+        forkserver.ensure_running()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return True
+
+
+@contextmanager
+def sigterm_blocked():
+    """Block ``SIGTERM`` in the calling thread while processes are started.
+
+    Processes started meanwhile inherit the blocked signal, so a job-wide
+    ``SIGTERM`` does not stop them; the drain deadline does (with ``SIGKILL``).
+    """
+    previous = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, previous)
+
+
+def record_outcome(drain_file, **fields):
+    """Add the outcome of the drain (e.g., completed and deferred T1w files)."""
+    state = drain_state(drain_file)
+    if state is not None:
+        _write_json_atomic(drain_file, {**state, **fields, 'finished_at': time.time()})
+
+
+class DrainHandler:
+    """Turn termination signals into a graceful drain of the run.
+
+    Use as a context manager around the execution of the workflow::
+
+        with DrainHandler(log_dir / DRAIN_FILE, grace_period=90) as drain:
+            retcode = run()
+        if drain.requested:
+            ...
+
+    Only the process that installed the handler drains; see
+    :py:func:`shield_workers` for its worker processes.
+
+    Parameters
+    ----------
+    drain_file : str or :py:class:`~pathlib.Path`
+        The drain document of the run.
+    grace_period : float
+        Seconds in-flight NiChart_DLMUSE runs are given to finish.
+    signals : tuple
+        Signals that trigger the drain.
+    logger : :py:class:`logging.Logger` or None
+        Where the drain is reported.
+
+    """
+
+    def __init__(self, drain_file, grace_period, signals=(signal.SIGTERM,), logger=None):
+        self.drain_file = Path(drain_file)
+        self.grace_period = float(grace_period)
+        self.signals = signals
+        self.logger = logger or LOGGER
+        self._pid = None
+        self._previous = {}
+
+    @property
+    def requested(self):
+        """Whether the run is draining."""
+        return drain_state(self.drain_file) is not None
+
+    def _handle(self, signum, frame):
+        if os.getpid() != self._pid:
+            return
+        name = signal.Signals(signum).name
+        if self.requested:
+            self.logger.critical(f'Received {name} again while draining; exiting immediately.')
+            expire_drain(self.drain_file)
+            self.restore()
+            signal.raise_signal(signum)
+            return
+        state = request_drain(self.drain_file, self.grace_period, reason=name)
+        self.logger.warning(
+            f'Received {name}: draining the run. No new T1w file will be started and '
+            f'running NiChart_DLMUSE jobs have {self.grace_period:.0f}s to finish '
+            f'(until {time.strftime("%H:%M:%S", time.localtime(state["deadline"]))}).'
+        )
+
+    def install(self):
+        """Install the signal handlers (only possible from the main thread)."""
+        if threading.current_thread() is not threading.main_thread():
+            self.logger.debug('Not in the main thread; graceful drain is disabled.')
+            return self
+        self._pid = os.getpid()
+        for signum in self.signals:
+            self._previous[signum] = signal.signal(signum, self._handle)
+        return self
+
+    def restore(self):
+        """Restore the signal handlers that were in place before :py:meth:`install`."""
+        while self._previous:
+            signum, handler = self._previous.popitem()
+            signal.signal(signum, handler)
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.restore()
+        return False
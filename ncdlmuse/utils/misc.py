@@ -20,6 +20,54 @@ def check_deps(workflow):
     )
 
 
+def torch_versions(device='cpu'):
+    """Get the versions of PyTorch, CUDA and cuDNN.
+
+    PyTorch and CUDA versions are read from the installed packages (CUDA is the
+    version PyTorch was built against). CUDA and cuDNN are reported as ``'N/A'``
+    unless ``device`` is ``'cuda'``; only then is PyTorch imported, for the
+    cuDNN version. Every version is ``None`` if unknown.
+    """
+    import ast
+    import importlib.util
+    from importlib import metadata
+    from pathlib import Path
+
+    spec = importlib.util.find_spec('torch')
+    if spec is None or not spec.submodule_search_locations:
+        return None, None, None
+
+    # torch/version.py only holds literal assignments (__version__, cuda, ...)
+    versions = {}
+    try:
+        version_py = Path(spec.submodule_search_locations[0]) / 'version.py'
+        for node in ast.parse(version_py.read_text()).body:
+            if isinstance(node, ast.AnnAssign | ast.Assign) and node.value is not None:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        versions[target.id] = ast.literal_eval(node.value)
+    except (OSError, SyntaxError, ValueError):
+        pass
+
+    torch_version = versions.get('__version__')
+    if torch_version is None:
+        try:
+            torch_version = metadata.version('torch')
+        except metadata.PackageNotFoundError:
+            pass
+    if device != 'cuda':
+        return torch_version, 'N/A', 'N/A'
+
+    # cuDNN is only known to the PyTorch build itself (pip wheels, conda or
+    # system libraries), and is recorded as torch.backends.cudnn.version()
+    try:
+        import torch
+    except ImportError:
+        return torch_version, versions.get('cuda'), None
+    return torch_version, versions.get('cuda'), torch.backends.cudnn.version()
+
+
 def get_n_volumes(fname):
     """Get the number of volumes in a niimg file."""
     img = nb.load(fname)
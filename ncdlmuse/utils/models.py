@@ -0,0 +1,306 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Run-level management of the DLICV and DLMUSE model cache.
+
+DLICV and DLMUSE keep their nnU-Net models in their package directories
+(``<package>/nnunet_results``), and download them from the Hugging Face Hub
+(``nichart/DLICV`` and ``nichart/DLMUSE``) the first time they run.
+Their ``--clear_cache`` deletes the models, so passing it to every node made
+each T1w file download them again, while concurrent workers raced on the same
+files.
+
+:py:func:`prepare_models` runs once per run, before any workflow is built
+(see :py:func:`ncdlmuse.cli.run.main`):
+
+1. With ``--clear-cache``, the caches are cleared (once).
+2. Missing models are downloaded (once).
+3. Model files are verified against the checksums recorded by the download
+   (SHA-256 of large files, git blob SHA-1 of the others).
+4. With ``--model-cache``, the verified models are copied to a (e.g.,
+   node-local) directory and made read-only; all nodes read them from there.
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import shutil
+import stat
+import uuid
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.models')
+
+#: Hugging Face Hub repository of the models of each tool
+MODEL_REPOS = {'DLICV': 'nichart/DLICV', 'DLMUSE': 'nichart/DLMUSE'}
+
+#: Folder of the models within a package directory
+MODELS_SUBDIR = 'nnunet_results'
+
+#: Download metadata of ``huggingface_hub`` within a package directory
+_HF_METADATA = Path('.cache') / 'huggingface' / 'download'
+
+_CHUNK = 1 << 20
+
+
+def package_dirs():
+    """Package directories of the installed DLICV and DLMUSE tools, by tool name."""
+    from importlib.util import find_spec
+
+    dirs = {}
+    for tool in MODEL_REPOS:
+        spec = find_spec(tool)
+        if spec is not None and spec.origin:
+            dirs[tool] = Path(spec.origin).parent
+    return dirs
+
+
+def _has_models(folder):
+    folder = Path(folder)
+    return folder.is_dir() and any(folder.iterdir())
+
+
+def file_digest(path, algorithm='sha256'):
+    """Hex digest of a file (``algorithm='git'``: its git blob SHA-1)."""
+    path = Path(path)
+    if algorithm == 'git':
+        digest = hashlib.sha1(usedforsecurity=False)
+        digest.update(f'blob {path.stat().st_size}\0'.encode())
+    else:
+        digest = hashlib.new(algorithm)
+    with path.open('rb') as fobj:
+        for chunk in iter(lambda: fobj.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recorded_checksums(root):
+    """Checksums ``huggingface_hub`` recorded when downloading into ``root``.
+
+    Returns
+    -------
+    checksums : dict
+        ``(algorithm, hex digest)`` of each downloaded file, by path relative
+        to ``root``. Large (LFS) files are recorded by SHA-256, the others by
+        git blob SHA-1.
+
+    """
+    root = Path(root)
+    checksums = {}
+    for metadata in sorted((root / _HF_METADATA).rglob('*.metadata')):
+        lines = metadata.read_text().splitlines()
+        if len(lines) < 2:
+            continue
+        etag = lines[1].strip().strip('"')
+        algorithm = {64: 'sha256', 40: 'git'}.get(len(etag))
+        if algorithm is None:
+            continue
+        relpath = metadata.relative_to(root / _HF_METADATA).as_posix()[: -len('.metadata')]
+        checksums[relpath] = (algorithm, etag)
+    return checksums
+
+
+def verify_models(root, checksums=None, subdir=MODELS_SUBDIR):
+    """Check the model files under ``root/subdir`` against their checksums.
+
+    Parameters
+    ----------
+    root : os.PathLike
+        Directory the models were downloaded into.
+    checksums : dict or None
+        Expected checksums (default: :py:func:`recorded_checksums` of ``root``).
+    subdir : str
+        Only files within this subdirectory of ``root`` are checked.
+
+    Returns
+    -------
+    n_verified : int
+        Number of files checked.
+
+    Raises
+    ------
+    RuntimeError
+        If files are missing or corrupted.
+
+    """
+    root = Path(root)
+    checksums = recorded_checksums(root) if checksums is None else checksums
+    prefix = f'{subdir}/' if subdir else ''
+    bad = []
+    n_verified = 0
+    for relpath, (algorithm, expected) in sorted(checksums.items()):
+        if not relpath.startswith(prefix):
+            continue
+        path = root / relpath
+        if not path.is_file():
+            bad.append(f'{relpath} (missing)')
+        elif file_digest(path, algorithm) != expected:
+            bad.append(f'{relpath} (checksum mismatch)')
+        n_verified += 1
+    if bad:
+        raise RuntimeError(
+            f'Corrupted models in <{root}>: {", ".join(bad)}. '
+            'Run again with --clear-cache to download them again.'
+        )
+    return n_verified
+
+
+def _set_read_only(root):
+    for path in sorted(Path(root).rglob('*'), reverse=True):
+        if not path.is_symlink():
+            path.chmod(0o555 if path.is_dir() else 0o444)
+    Path(root).chmod(0o555)
+
+
+def _make_writable(root):
+    root = Path(root)
+    if not root.exists():
+        return
+    root.chmod(stat.S_IRWXU)
+    for path in root.rglob('*'):
+        if path.is_dir() and not path.is_symlink():
+            path.chmod(stat.S_IRWXU)
+
+
+def copy_models(sources, cache_dir):
+    """Copy verified model folders into one read-only folder within ``cache_dir``.
+
+    The contents of all ``sources`` are merged into
+    ``<cache_dir>/ncdlmuse-models-<digest>``, named after the checksums of
+    the copied files, so runs sharing ``cache_dir`` reuse an existing copy
+    and a change of models gets a new one. The copy is written to a
+    temporary folder and renamed into place, so concurrent runs never see a
+    partial copy.
+
+    Parameters
+    ----------
+    sources : list of os.PathLike
+        Model folders (e.g., ``<package>/nnunet_results``).
+    cache_dir : os.PathLike
+        Directory to copy the models into (e.g., node-local fast storage).
+
+    Returns
+    -------
+    models : pathlib.Path
+        The read-only folder of models.
+
+    """
+    checksums = {}
+    for source in sources:
+        source = Path(source)
+        for path in sorted(source.rglob('*')):
+            if path.is_file():
+                relpath = path.relative_to(source).as_posix()
+                checksums[relpath] = ('sha256', file_digest(path))
+    key = hashlib.sha256(
+        ''.join(f'{relpath}:{digest}\n' for relpath, (_, digest) in sorted(checksums.items()))
+        .encode()
+    ).hexdigest()[:12]
+
+    cache_dir = Path(cache_dir)
+    target = cache_dir / f'ncdlmuse-models-{key}'
+    if target.is_dir():
+        try:
+            verify_models(target, checksums, subdir='')
+        except RuntimeError:
+            LOGGER.warning(f'Replacing corrupted model copy <{target}>.')
+            _make_writable(target)
+            shutil.rmtree(target)
+        else:
+            LOGGER.info(f'Reusing verified models in <{target}>.')
+            return target
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = cache_dir / f'.{target.name}.{uuid.uuid4().hex[:8]}'
+    try:
+        for source in sources:
+            shutil.copytree(source, tmp_dir, dirs_exist_ok=True)
+        verify_models(tmp_dir, checksums, subdir='')
+        _set_read_only(tmp_dir)
+        try:
+            tmp_dir.rename(target)
+        except OSError:
+            if not target.is_dir():
+                raise
+            # Another run finished its copy first
+    finally:
+        if tmp_dir.exists():
+            _make_writable(tmp_dir)
+            shutil.rmtree(tmp_dir)
+    LOGGER.info(f'Copied verified models to <{target}>.')
+    return target
+
+
+def prepare_models(clear=False, model_folder=None, cache_dir=None, packages=None):
+    """Clear, download, verify and copy the models once for the whole run.
+
+    Parameters
+    ----------
+    clear : bool
+        Delete the models of the tools (and their download metadata) first.
+        User-provided ``model_folder`` are never deleted.
+    model_folder : os.PathLike or None
+        Custom model folder (``--model-folder``), used instead of the tools' own.
+    cache_dir : os.PathLike or None
+        Directory to copy the verified models into (``--model-cache``).
+    packages : dict or None
+        Package directory of each tool (default: :py:func:`package_dirs`).
+
+    Returns
+    -------
+    ready : bool
+        Whether all models are present and verified, so that no worker needs
+        to download them.
+    shared : pathlib.Path or None
+        The read-only copy of the models, if ``cache_dir`` is given.
+
+    """
+    if model_folder is not None:
+        model_folder = Path(model_folder)
+        if clear:
+            LOGGER.warning(f'--clear-cache does not delete the custom models in <{model_folder}>.')
+        if (model_folder / _HF_METADATA).is_dir():
+            n_verified = verify_models(model_folder, subdir='')
+            LOGGER.info(f'Verified {n_verified} model files in <{model_folder}>.')
+        else:
+            LOGGER.info(f'No checksums recorded for the models in <{model_folder}>.')
+        shared = copy_models([model_folder], cache_dir) if cache_dir else None
+        return True, shared
+
+    packages = package_dirs() if packages is None else packages
+    missing_tools = sorted(set(MODEL_REPOS).difference(packages))
+    if missing_tools:
+        LOGGER.warning(
+            f'Cannot locate the package(s) of {", ".join(missing_tools)}; '
+            'their models are left to the tools.'
+        )
+        return False, None
+
+    for tool, pkg_dir in sorted(packages.items()):
+        models = pkg_dir / MODELS_SUBDIR
+        if clear:
+            LOGGER.info(f'Clearing the {tool} model cache.')
+            shutil.rmtree(models, ignore_errors=True)
+            shutil.rmtree(pkg_dir / '.cache', ignore_errors=True)
+        if not _has_models(models):
+            try:
+                from huggingface_hub import snapshot_download
+            except ImportError:
+                LOGGER.warning(f'huggingface_hub is unavailable; {tool} will download its models.')
+                return False, None
+            LOGGER.info(f'Downloading the {tool} models from {MODEL_REPOS[tool]}.')
+            snapshot_download(repo_id=MODEL_REPOS[tool], local_dir=pkg_dir)
+            if not _has_models(models):
+                raise RuntimeError(
+                    f'Could not download the {tool} models from {MODEL_REPOS[tool]}.'
+                )
+        n_verified = verify_models(pkg_dir)
+        LOGGER.info(f'Verified {n_verified} {tool} model files.')
+
+    shared = None
+    if cache_dir:
+        shared = copy_models(
+            [packages[tool] / MODELS_SUBDIR for tool in sorted(packages)], cache_dir
+        )
+    return True, shared
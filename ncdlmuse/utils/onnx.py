@@ -0,0 +1,358 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""ONNX Runtime inference of the DLICV and DLMUSE models.
+
+With ``--backend onnx`` (CPU only), the DLICV and DLMUSE stages do not run
+the PyTorch models of the tools.
+Instead, the nnU-Net networks of the model folder are exported to ONNX once
+per run (:py:func:`export_models`), and the graphs are cached by the checksum
+of their checkpoint, so later runs load them directly.
+Each stage (:py:mod:`ncdlmuse.cli.onnx_predict`) keeps nnU-Net's
+preprocessing and export of the segmentation, but computes the logits with
+:py:func:`sliding_window_inference` on ONNX Runtime sessions
+(:py:func:`make_session`), whose intra-op thread count is tunable
+(``--onnx-threads``).
+
+:py:func:`sliding_window_inference` reproduces nnU-Net's sliding window:
+Gaussian-weighted patches (:py:func:`gaussian_importance`) placed at
+:py:func:`sliding_window_steps`, with test-time augmentation by mirroring.
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import logging
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from ncdlmuse.utils.models import MODELS_SUBDIR, file_digest, package_dirs
+
+LOGGER = logging.getLogger('ncdlmuse.utils.onnx')
+
+#: nnU-Net model of each stage: tool, folder within ``nnunet_results`` and folds
+STAGE_MODELS = {
+    'dlicv': {'tool': 'DLICV', 'folder': 'Dataset901_Task901_dlicv', 'folds': (0,)},
+    'dlmuse': {'tool': 'DLMUSE', 'folder': 'Dataset903_Task903_DLMUSEV2', 'folds': (0,)},
+}
+
+#: ONNX opset the graphs are exported with
+OPSET = 17
+
+_TRAINER = 'nnUNetTrainer__nnUNetPlans__3d_fullres'
+_CHECKPOINT = 'checkpoint_final.pth'
+_INPUT_NAME = 'image'
+_OUTPUT_NAME = 'logits'
+
+
+def model_dir(stage, model_folder=None):
+    """Trained model folder of ``stage`` (in ``model_folder`` or the tool's package)."""
+    tool = STAGE_MODELS[stage]['tool']
+    if model_folder:
+        root = Path(model_folder)
+    else:
+        packages = package_dirs()
+        if tool not in packages:
+            raise FileNotFoundError(f'Cannot locate the {tool} package and its models.')
+        root = packages[tool] / MODELS_SUBDIR
+    path = root / STAGE_MODELS[stage]['folder'] / _TRAINER
+    if not path.is_dir():
+        raise FileNotFoundError(f'No {tool} model in <{path}>.')
+    return path
+
+
+def sliding_window_steps(image_size, patch_size, step_size):
+    """Start of the patches along each axis, as nnU-Net places them.
+
+    The patches overlap by at least ``1 - step_size`` of their size, and the
+    first and last ones are aligned with the edges of the image.
+
+    >>> sliding_window_steps((20, 8), (8, 8), 0.5)
+    [[0, 4, 8, 12], [0]]
+    >>> sliding_window_steps((21, 8), (8, 8), 0.5)
+    [[0, 3, 6, 10, 13], [0]]
+
+    """
+    if not 0 < step_size <= 1:
+        raise ValueError(f'The step size must be in (0, 1], got {step_size}.')
+    steps = []
+    for size, patch in zip(image_size, patch_size, strict=True):
+        n_steps = int(np.ceil((size - patch) / (patch * step_size))) + 1
+        step = (size - patch) / (n_steps - 1) if n_steps > 1 else 0
+        steps.append([int(np.round(step * index)) for index in range(n_steps)])
+    return steps
+
+
+def gaussian_importance(patch_size, sigma_scale=1 / 8, value_scaling_factor=10):
+    """Weights of the voxels of a patch, decreasing from its center (as nnU-Net's)."""
+    from scipy.ndimage import gaussian_filter
+
+    center = np.zeros(patch_size)
+    center[tuple(size // 2 for size in patch_size)] = 1
+    weights = gaussian_filter(
+        center, [size * sigma_scale for size in patch_size], 0, mode='constant', cval=0
+    )
+    weights = (weights / weights.max() * value_scaling_factor).astype(np.float32)
+    weights[weights == 0] = weights[weights > 0].min()
+    return weights
+
+
+def sliding_window_inference(
+    predict, image, patch_size, step_size=0.5, mirror_axes=(), progress=None
+):
+    """Compute the logits of a whole image from those of overlapping patches.
+
+    Parameters
+    ----------
+    predict : callable
+        Logits of a batch of patches, ``(N, C, *patch_size)`` to
+        ``(N, K, *patch_size)`` (e.g., an ONNX Runtime session).
+    image : numpy.ndarray
+        Preprocessed image, of shape ``(C, X, Y, Z)``.
+    patch_size : tuple of int
+        Spatial size of the patches.
+    step_size : float
+        Step between patches, as a fraction of the patch size.
+    mirror_axes : tuple of int
+        Spatial axes the patches are also predicted mirrored along
+        (test-time augmentation), and the predictions averaged.
+    progress : callable or None
+        Called with the number of patches done and their total.
+
+    Returns
+    -------
+    logits : numpy.ndarray
+        Logits of shape ``(K, X, Y, Z)``.
+
+    """
+    image = np.asarray(image, dtype=np.float32)
+    spatial = image.shape[1:]
+    # Images smaller than a patch are padded with zeros, evenly on both sides
+    padding = [
+        (max(patch - size, 0) // 2, max(patch - size, 0) - max(patch - size, 0) // 2)
+        for size, patch in zip(spatial, patch_size, strict=True)
+    ]
+    image = np.pad(image, [(0, 0), *padding])
+    weights = gaussian_importance(patch_size)
+    slicers = [
+        tuple(slice(start, start + patch) for start, patch in zip(starts, patch_size, strict=True))
+        for starts in itertools.product(
+            *sliding_window_steps(image.shape[1:], patch_size, step_size)
+        )
+    ]
+    flips = [
+        tuple(axis + 2 for axis in axes)
+        for n_axes in range(1, len(mirror_axes) + 1)
+        for axes in itertools.combinations(mirror_axes, n_axes)
+    ]
+
+    logits = None
+    counts = np.zeros(image.shape[1:], dtype=np.float32)
+    for index, slicer in enumerate(slicers, 1):
+        patch = np.ascontiguousarray(image[(slice(None), *slicer)][None])
+        prediction = predict(patch)
+        for flip in flips:
+            mirrored = np.ascontiguousarray(np.flip(patch, flip))
+            prediction = prediction + np.flip(predict(mirrored), flip)
+        prediction = prediction[0] / (len(flips) + 1)
+        if logits is None:
+            logits = np.zeros((prediction.shape[0], *image.shape[1:]), dtype=np.float32)
+        logits[(slice(None), *slicer)] += prediction * weights
+        counts[slicer] += weights
+        if progress is not None:
+            progress(index, len(slicers))
+    logits /= counts
+    crop = tuple(
+        slice(before, before + size) for (before, _), size in zip(padding, spatial, strict=True)
+    )
+    return logits[(slice(None), *crop)]
+
+
+def graph_file(checkpoint, cache_dir, patch_size, n_channels, name='model'):
+    """Path of the cached ONNX graph of ``checkpoint`` (whether it exists or not).
+
+    The graph is named after the checksum of the checkpoint, the input shape,
+    and the versions of PyTorch and of the ONNX opset it is exported with.
+    """
+    import torch
+
+    key = hashlib.sha256(
+        ':'.join(
+            [
+                file_digest(checkpoint),
+                'x'.join(str(size) for size in patch_size),
+                str(n_channels),
+                torch.__version__,
+                str(OPSET),
+            ]
+        ).encode()
+    ).hexdigest()[:16]
+    return Path(cache_dir) / f'{name}-{key}.onnx'
+
+
+def export_onnx(network, patch_size, n_channels, out_file):
+    """Export a PyTorch network to an ONNX graph taking batches of patches.
+
+    The graph is written next to ``out_file`` and renamed into place, so
+    concurrent exports never leave a partial graph behind.
+    """
+    import torch
+
+    out_file = Path(out_file)
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = out_file.with_name(f'.{out_file.name}.{uuid.uuid4().hex[:8]}')
+    network.eval()
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                network,
+                torch.zeros((1, n_channels, *patch_size), dtype=torch.float32),
+                str(tmp_file),
+                input_names=[_INPUT_NAME],
+                output_names=[_OUTPUT_NAME],
+                dynamic_axes={_INPUT_NAME: {0: 'batch'}, _OUTPUT_NAME: {0: 'batch'}},
+                opset_version=OPSET,
+            )
+        tmp_file.replace(out_file)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+    return out_file
+
+
+def make_session(graph, intra_op_threads=0):
+    """Predict with an ONNX graph on the CPU.
+
+    Parameters
+    ----------
+    graph : os.PathLike
+        ONNX graph, as written by :py:func:`export_onnx`.
+    intra_op_threads : int
+        Threads ONNX Runtime parallelizes each operator over (0: one per
+        physical core).
+
+    Returns
+    -------
+    predict : callable
+        Logits of a batch of patches (see :py:func:`sliding_window_inference`).
+
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(intra_op_threads or 0)
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(str(graph), options, providers=['CPUExecutionProvider'])
+
+    def predict(patches):
+        return session.run([_OUTPUT_NAME], {_INPUT_NAME: patches})[0]
+
+    return predict
+
+
+def load_predictor(stage, model_folder=None, step_size=0.5, disable_tta=False):
+    """Initialize nnU-Net's predictor with the model of ``stage``, on the CPU."""
+    import torch
+    from nnunetv2.inference.predict_from_raw_data import nnUNetPredictor
+
+    predictor = nnUNetPredictor(
+        tile_step_size=step_size,
+        use_gaussian=True,
+        use_mirroring=not disable_tta,
+        perform_everything_on_device=False,
+        device=torch.device('cpu'),
+        verbose=False,
+        verbose_preprocessing=False,
+        allow_tqdm=False,
+    )
+    predictor.initialize_from_trained_model_folder(
+        str(model_dir(stage, model_folder)),
+        list(STAGE_MODELS[stage]['folds']),
+        checkpoint_name=_CHECKPOINT,
+    )
+    return predictor
+
+
+def export_predictor(predictor, stage, model_folder, cache_dir):
+    """Export the network of each fold of an initialized predictor, unless cached.
+
+    Returns
+    -------
+    graphs : list of pathlib.Path
+        The ONNX graph of each fold.
+
+    """
+    patch_size = tuple(predictor.configuration_manager.patch_size)
+    n_channels = len(predictor.dataset_json['channel_names'])
+    folds = STAGE_MODELS[stage]['folds']
+    graphs = []
+    for fold, params in zip(folds, predictor.list_of_parameters, strict=True):
+        checkpoint = model_dir(stage, model_folder) / f'fold_{fold}' / _CHECKPOINT
+        name = f'{stage}-fold{fold}'
+        graph = graph_file(checkpoint, cache_dir, patch_size, n_channels, name=name)
+        if not graph.is_file():
+            LOGGER.info(f'Exporting the {STAGE_MODELS[stage]["tool"]} model to <{graph}>.')
+            predictor.network.load_state_dict(params)
+            export_onnx(predictor.network, patch_size, n_channels, graph)
+        graphs.append(graph)
+    return graphs
+
+
+def export_models(cache_dir, model_folder=None, extra_models=None):
+    """Export the DLICV and DLMUSE models (and ``extra_models``) once, before the run.
+
+    Parameters
+    ----------
+    cache_dir : os.PathLike
+        Directory of the cached graphs.
+    model_folder : os.PathLike or None
+        Model folder (``--model-folder`` or the shared copy of the models).
+    extra_models : dict or None
+        Additional DLMUSE model folders, by label (``--compare-models``).
+
+    Returns
+    -------
+    graphs : dict
+        ONNX graphs of each model, by stage (and ``dlmuse_<label>``).
+
+    """
+    # Fail before loading any model if graphs cannot be exported or run
+    import onnx  # noqa: F401
+    import onnxruntime  # noqa: F401
+
+    models = [('dlicv', 'dlicv', model_folder), ('dlmuse', 'dlmuse', model_folder)]
+    models += [
+        (f'dlmuse_{label}', 'dlmuse', folder) for label, folder in (extra_models or {}).items()
+    ]
+    graphs = {}
+    for key, stage, folder in models:
+        predictor = load_predictor(stage, folder)
+        graphs[key] = export_predictor(predictor, stage, folder, cache_dir)
+    return graphs
+
+
+def predict_logits(predictor, predicts, data, progress=None):
+    """Logits of a preprocessed image, averaged over the folds (``predicts``).
+
+    Stands in for ``nnUNetPredictor.predict_logits_from_preprocessed_data``,
+    with ONNX Runtime sessions instead of the PyTorch network.
+    """
+    import torch
+
+    image = data.numpy() if isinstance(data, torch.Tensor) else np.asarray(data)
+    mirror_axes = (predictor.allowed_mirroring_axes or ()) if predictor.use_mirroring else ()
+    logits = sum(
+        sliding_window_inference(
+            predict,
+            image,
+            tuple(predictor.configuration_manager.patch_size),
+            step_size=predictor.tile_step_size,
+            mirror_axes=tuple(mirror_axes),
+            progress=progress,
+        )
+        for predict in predicts
+    )
+    return torch.from_numpy(logits / len(predicts))
@@ -0,0 +1,181 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Asynchronous staging of input T1w files to node-local scratch.
+
+A :py:class:`Prefetcher` runs in a background thread of the main process and
+copies the next few T1w files of the run from (possibly slow, networked)
+storage into a local prefetch directory while the current scans are being
+segmented.
+The :py:class:`~ncdlmuse.interfaces.ncdlmuse.NiChartDLMUSE` interface looks
+up the staged copy with :py:func:`consume` and falls back to the original
+file if it has not been staged (yet).
+
+Staging is atomic (copy to a temporary name, then rename), so a staged copy is
+either complete or absent.
+Consuming a file leaves a ``.consumed`` marker next to where the staged copy
+lives, which tells the prefetcher that the slot is free and that the file must
+not be staged anymore, and renames the staged copy to a claimed name, so the
+prefetcher never deletes a copy the consumer is using.
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.prefetch')
+
+_CONSUMED_SUFFIX = '.consumed'
+_CLAIMED_SUFFIX = '.claimed'
+
+
+def staged_path(prefetch_dir, source):
+    """Location of the staged copy of ``source`` within ``prefetch_dir``.
+
+    >>> str(staged_path('/scratch', '/bids/sub-01/anat/sub-01_T1w.nii.gz'))[:9]
+    '/scratch/'
+    >>> staged_path('/scratch', '/bids/sub-01/anat/sub-01_T1w.nii.gz').name
+    'sub-01_T1w.nii.gz'
+    """
+    digest = hashlib.sha256(str(Path(source).absolute()).encode()).hexdigest()[:16]
+    return Path(prefetch_dir) / digest / Path(source).name
+
+
+def _consumed_marker(staged):
+    return staged.with_name(staged.name.removesuffix(_CLAIMED_SUFFIX) + _CONSUMED_SUFFIX)
+
+
+def stage(source, prefetch_dir):
+    """Copy ``source`` into ``prefetch_dir`` atomically and return the staged path."""
+    target = staged_path(prefetch_dir, source)
+    if target.exists():
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_target = target.with_name(f'.{target.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        shutil.copy2(source, tmp_target)
+        os.replace(tmp_target, target)
+    finally:
+        tmp_target.unlink(missing_ok=True)
+    return target
+
+
+def consume(source, prefetch_dir):
+    """Claim the staged copy of ``source``, if any.
+
+    Marks ``source`` as consumed (so that it will not be staged afterwards)
+    and atomically renames the staged copy to a claimed name, which the
+    prefetcher never deletes. Returns the claimed path, or ``None`` if
+    ``source`` was not staged.
+    The caller owns the returned file and should remove it once done
+    (:py:func:`release`).
+    """
+    target = staged_path(prefetch_dir, source)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    _consumed_marker(target).touch()
+    claimed = target.with_name(target.name + _CLAIMED_SUFFIX)
+    try:
+        os.rename(target, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def release(staged):
+    """Delete a staged (or claimed) copy and its marker, freeing its prefetch slot."""
+    staged = Path(staged)
+    staged.unlink(missing_ok=True)
+    _consumed_marker(staged).unlink(missing_ok=True)
+    try:
+        staged.parent.rmdir()
+    except OSError:
+        pass
+
+
+class Prefetcher(threading.Thread):
+    """Stage upcoming input files into local scratch in the background.
+
+    Parameters
+    ----------
+    sources : list of str
+        Files to stage, in the order they are expected to be processed.
+    prefetch_dir : str or :py:class:`~pathlib.Path`
+        Local directory where staged copies are written.
+    depth : int
+        Maximum number of staged files not yet consumed.
+    max_bytes : int or None
+        Maximum total size of staged files not yet consumed.
+    poll_interval : float
+        Seconds between checks for free slots.
+
+    """
+
+    def __init__(self, sources, prefetch_dir, depth=2, max_bytes=None, poll_interval=1.0):
+        super().__init__(name='ncdlmuse-prefetcher', daemon=True)
+        self.sources = [str(src) for src in sources]
+        self.prefetch_dir = Path(prefetch_dir)
+        self.depth = max(int(depth), 1)
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.staged = []
+        self._stop_event = threading.Event()
+
+    def _in_flight(self):
+        """Staged files that have not been consumed yet."""
+        in_flight = []
+        for source in self.staged:
+            target = staged_path(self.prefetch_dir, source)
+            if target.exists() and not _consumed_marker(target).exists():
+                in_flight.append(target)
+        return in_flight
+
+    def _has_room(self, size):
+        in_flight = self._in_flight()
+        if len(in_flight) >= self.depth:
+            return False
+        if self.max_bytes is None or not in_flight:
+            return True
+        used = sum(target.stat().st_size for target in in_flight if target.exists())
+        return used + size <= self.max_bytes
+
+    def run(self):
+        self.prefetch_dir.mkdir(parents=True, exist_ok=True)
+        for source in self.sources:
+            target = staged_path(self.prefetch_dir, source)
+            try:
+                size = os.path.getsize(source)
+            except OSError as e:
+                LOGGER.warning(f'Cannot prefetch {source}: {e}')
+                continue
+            while not self._has_room(size):
+                if self._stop_event.wait(self.poll_interval):
+                    return
+            if self._stop_event.is_set():
+                return
+            if _consumed_marker(target).exists():
+                continue  # Already processed from the original location
+            try:
+                stage(source, self.prefetch_dir)
+            except OSError as e:
+                LOGGER.warning(f'Failed to prefetch {source}: {e}')
+                continue
+            self.staged.append(source)
+            if _consumed_marker(target).exists():
+                # Consumed while we were copying: the copy is useless, unless
+                # the consumer claimed it (then it is no longer at ``target``).
+                release(target)
+            LOGGER.debug(f'Prefetched {source} into {target}')
+
+    def stop(self):
+        """Stop staging and remove staged copies and markers left behind."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        for source in self.sources:
+            release(staged_path(self.prefetch_dir, source))
@@ -0,0 +1,229 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Pre-flight integrity checks of the T1w inputs.
+
+Corrupted or unsuitable inputs (truncated gzip streams, 4D images, empty
+matrices, NaN-filled headers) would otherwise only be discovered when
+``NiChart_DLMUSE`` crashes after loading its models.
+Only images that cannot be segmented are rejected: unusual but valid ones
+(e.g., very small matrices or very large voxels) are reported with a warning.
+Before the workflow is built, the header (dimensions, voxel sizes, affine) of
+every selected T1w file is checked here, as well as the data size of
+uncompressed files. This only reads the first bytes of each file.
+The full check (``--full-preflight``) also decompresses the whole gzip stream
+of ``.nii.gz`` files to verify its CRC and data size, which reads every input
+in full.
+Files are checked in a thread pool (decompression releases the GIL), and
+verdicts are cached by path, size and modification time so that a rerun only
+checks new or modified files.
+
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import logging
+import os
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from nibabel.nifti1 import Nifti1Header
+from nibabel.nifti2 import Nifti2Header
+from nibabel.spatialimages import HeaderDataError
+
+LOGGER = logging.getLogger('ncdlmuse.utils.preflight')
+
+PREFLIGHT_CACHE = Path('logs') / 'preflight.json'
+_CHUNK_SIZE = 4 * 1024 * 1024
+_HEADER_BYTES = 540  # Size of a NIfTI-2 header (NIfTI-1 headers are 348 bytes)
+_MIN_DIM = 32  # Smaller matrices (along any axis) are unusual for a T1w image
+_MAX_ZOOM = 10.0  # Larger voxels (mm) are unusual for a T1w image
+
+
+def read_gzip(path, on_chunk=None):
+    """Decompress the whole gzip stream, verifying its CRC and length.
+
+    Returns the first bytes of the uncompressed stream (enough for a NIfTI
+    header) and the total uncompressed size. ``on_chunk`` is called with every
+    chunk of uncompressed data.
+    """
+    head = b''
+    size = 0
+    decompressor = zlib.decompressobj(wbits=31)
+    with open(path, 'rb') as fobj:
+        while data := fobj.read(_CHUNK_SIZE):
+            while data:
+                out = decompressor.decompress(data)
+                if on_chunk is not None:
+                    on_chunk(out)
+                if len(head) < _HEADER_BYTES:
+                    head += out[: _HEADER_BYTES - len(head)]
+                size += len(out)
+                data = b''
+                if decompressor.eof and decompressor.unused_data:  # Multi-member gzip
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=31)
+    if not decompressor.eof:
+        raise EOFError('compressed file ended before the end-of-stream marker was reached')
+    return head, size
+
+
+def _parse_header(head):
+    """Parse a NIfTI-1 or NIfTI-2 header from its raw bytes."""
+    if head[344:348] in (b'n+1\x00', b'ni1\x00'):
+        return Nifti1Header.from_fileobj(io.BytesIO(head), check=False)
+    if head[4:12] in (b'n+2\x00\r\n\x1a\n', b'ni2\x00\r\n\x1a\n'):
+        return Nifti2Header.from_fileobj(io.BytesIO(head), check=False)
+    raise ValueError('not a NIfTI-1 or NIfTI-2 file')
+
+
+def read_header(path):
+    """Read the NIfTI header of ``path`` (without reading the data)."""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rb') as fobj:
+        return _parse_header(fobj.read(_HEADER_BYTES))
+
+
+def check_t1w(path, full=False):
+    """Check that ``path`` is a 3D image with a sane header.
+
+    Only the header is read, and the data size of uncompressed files checked.
+    With ``full``, the whole file is read once: ``.nii.gz`` files are
+    decompressed to verify the gzip CRC and the data size, and the header is
+    parsed from the decompressed stream.
+
+    Returns
+    -------
+    reason : str or None
+        Why the file is unsuitable, or ``None`` if it passed all checks.
+
+    """
+    path = str(path)
+    try:
+        if path.endswith('.gz') and full:
+            head, size = read_gzip(path)
+        elif path.endswith('.gz'):
+            with gzip.open(path, 'rb') as fobj:
+                head = fobj.read(_HEADER_BYTES)
+            size = None  # Only known once the whole stream is decompressed
+        else:
+            with open(path, 'rb') as fobj:
+                head = fobj.read(_HEADER_BYTES)
+            size = os.path.getsize(path)
+        header = _parse_header(head)
+    except (OSError, EOFError, zlib.error) as e:
+        return f'corrupted file ({e})'
+    except (ValueError, HeaderDataError) as e:
+        return f'unreadable header ({e})'
+
+    # Same convention as get_n_volumes: 3D images have no volumes
+    shape = header.get_data_shape()
+    if len(shape) == 4:
+        return f'4D image with {shape[3]} volume(s)'
+    if len(shape) != 3:
+        return f'image has {len(shape)} dimensions'
+    if min(shape) < 1:
+        return f'empty image {shape}'
+    expected_size = int(header['vox_offset']) + int(
+        np.prod(shape) * header.get_data_dtype().itemsize
+    )
+    if size is not None and size < expected_size:
+        return f'truncated data ({size} of {expected_size} bytes)'
+    zooms = np.asarray(header.get_zooms()[:3], dtype=float)
+    if not np.all(np.isfinite(zooms)) or np.any(zooms <= 0):
+        return f'invalid voxel sizes {tuple(zooms.tolist())}'
+    affine = header.get_best_affine()
+    if not np.all(np.isfinite(affine)) or abs(np.linalg.det(affine[:3, :3])) < 1e-6:
+        return 'invalid (non-finite or singular) affine'
+    if min(shape) < _MIN_DIM or np.any(zooms > _MAX_ZOOM):
+        LOGGER.warning(
+            f'Pre-flight: {path} has an unusual matrix {shape} or voxel size '
+            f'{tuple(zooms.tolist())} for a T1w image; segmenting it anyway.'
+        )
+    return None
+
+
+def file_stamp(path):
+    """Size and modification time of ``path``, which key cached verdicts."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def load_cache(cache_file):
+    """Load a JSON cache of per-file results (empty if missing or unreadable)."""
+    try:
+        return json.loads(Path(cache_file).read_text())
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def save_cache(cache_file, cache):
+    """Atomically write a JSON cache of per-file results."""
+    cache_file = Path(cache_file)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(f'.{cache_file.name}.{uuid.uuid4().hex}.tmp')
+        tmp_file.write_text(json.dumps(cache))
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        LOGGER.warning(f'Could not write the cache {cache_file}: {e}')
+
+
+def run_preflight(t1w_files, cache_file=None, n_workers=None, full=False):
+    """Check T1w files in parallel, reusing cached verdicts of unchanged files.
+
+    Parameters
+    ----------
+    t1w_files : list of str
+        T1w files to check.
+    cache_file : str or :py:class:`~pathlib.Path` or None
+        JSON file where verdicts are cached (no caching if ``None``).
+    n_workers : int or None
+        Number of threads (defaults to :py:class:`~concurrent.futures.ThreadPoolExecutor`'s).
+    full : bool
+        Decompress ``.nii.gz`` files in full (see :py:func:`check_t1w`). Verdicts
+        cached by the header-only check are not reused for the full check.
+
+    Returns
+    -------
+    bad : dict
+        Reasons for rejecting each unsuitable T1w file, keyed by path.
+
+    """
+    cache = load_cache(cache_file) if cache_file else {}
+    verdicts = {}
+    to_check = []
+    for t1w_file in t1w_files:
+        key = str(Path(t1w_file).absolute())
+        try:
+            stamp = file_stamp(t1w_file)
+        except OSError as e:
+            verdicts[str(t1w_file)] = f'missing file ({e})'
+            continue
+        cached = cache.get(key)
+        if cached is not None and cached['stamp'] == stamp and (cached.get('full') or not full):
+            verdicts[str(t1w_file)] = cached['reason']
+        else:
+            to_check.append((str(t1w_file), key, stamp))
+
+    if to_check:
+        LOGGER.info(
+            f'Pre-flight: checking {len(to_check)} T1w file(s) '
+            f'({len(verdicts)} verdict(s) cached{", full read" if full else ""}).'
+        )
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            reasons = pool.map(
+                check_t1w, [t1w_file for t1w_file, _, _ in to_check], [full] * len(to_check)
+            )
+            for (t1w_file, key, stamp), reason in zip(to_check, reasons, strict=True):
+                verdicts[t1w_file] = reason
+                cache[key] = {'stamp': stamp, 'reason': reason, 'full': full}
+        if cache_file:
+            save_cache(cache_file, cache)
+
+    return {t1w_file: reason for t1w_file, reason in verdicts.items() if reason is not None}
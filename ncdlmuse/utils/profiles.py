@@ -0,0 +1,49 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Inference profiles.
+
+A profile (``--inference-profile``) trades segmentation accuracy for
+throughput by setting how DLICV and DLMUSE run inference, and whether the
+SVG reportlets are drawn:
+
+* ``disable_tta``: skip test-time augmentation. nnU-Net mirrors every patch
+  along all the axes allowed by the model, so TTA multiplies inference time
+  by up to 8; the tools only expose it as on or off.
+* ``step_size``: step of the sliding window, as a fraction of the patch size
+  (nnU-Net's ``-step_size``, 0.5 by default). Larger steps mean fewer,
+  less overlapping windows. Only the DLICV and DLMUSE executables take it, so
+  profiles that change it require ``--split-stages``.
+* ``reportlets``: draw the brain mask and segmentation mosaics.
+
+``accurate`` runs the tools with their own defaults. ``--disable-tta``
+disables TTA whatever the profile.
+
+"""
+
+from __future__ import annotations
+
+#: Settings of each inference profile, from slowest to fastest
+INFERENCE_PROFILES = {
+    'accurate': {'disable_tta': False, 'step_size': 0.5, 'reportlets': True},
+    'balanced': {'disable_tta': False, 'step_size': 0.75, 'reportlets': True},
+    'fast': {'disable_tta': True, 'step_size': 0.5, 'reportlets': True},
+    'preview': {'disable_tta': True, 'step_size': 1.0, 'reportlets': False},
+}
+
+#: Profile used unless another one is requested
+DEFAULT_PROFILE = 'accurate'
+
+#: Step size the tools use if not given one
+DEFAULT_STEP_SIZE = 0.5
+
+
+def get_profile(name=None):
+    """Settings of the inference profile ``name`` (the default profile if ``None``).
+
+    >>> get_profile('fast')['disable_tta']
+    True
+    >>> get_profile()['step_size']
+    0.5
+
+    """
+    return dict(INFERENCE_PROFILES[name or DEFAULT_PROFILE])
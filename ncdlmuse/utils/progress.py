@@ -0,0 +1,250 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Progress reporting of NiChart_DLMUSE runs.
+
+The :py:class:`~ncdlmuse.interfaces.ncdlmuse.NiChartDLMUSE` interface streams
+the output of ``NiChart_DLMUSE`` line by line, feeds it to a
+:py:class:`ProgressParser` and publishes the job's progress as a small JSON
+document in the run's status directory (``<log_dir>/status/<job_id>.json``).
+A :py:class:`ProgressMonitor` thread in the main process aggregates these
+documents into a run-level ``status.json`` and logs a cohort-wide
+"N of M done, ETA" line, flagging jobs whose output stalled.
+
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.progress')
+
+#: Progress stages of a NiChart_DLMUSE run, in order: (name, pattern, fraction done).
+#: The patterns are matched case-insensitively against the tool's output; a stage is
+#: only entered after the ones before it, so generic nnU-Net messages (``done with``)
+#: are attributed to the model currently running.
+STAGES = (
+    ('dlicv', re.compile(r'(run|start|predict|segment)\w*\W.*dlicv', re.IGNORECASE), 0.05),
+    ('dlicv_done', re.compile(r'dlicv\W.*(done|finish|complet)|done with', re.IGNORECASE), 0.45),
+    ('dlmuse', re.compile(r'(run|start|predict|segment)\w*\W.*dlmuse', re.IGNORECASE), 0.5),
+    ('dlmuse_done', re.compile(r'dlmuse\W.*(done|finish|complet)|done with', re.IGNORECASE), 0.9),
+    ('volumes', re.compile(r'(comput|calculat)\w*\W.*volume', re.IGNORECASE), 0.95),
+)
+
+# Test-time augmentation and sliding-window steps, as reported by tqdm ("12/32")
+_STEP_PATTERN = re.compile(r'(\d+)/(\d+)')
+
+
+class ProgressParser:
+    """Track the stage and fraction done of a NiChart_DLMUSE run from its output.
+
+    ``first_stage`` is the stage the run starts at, when the tool only runs part
+    of NiChart_DLMUSE (e.g., ``'dlmuse'`` for the ``DLMUSE`` executable).
+    """
+
+    def __init__(self, first_stage=None):
+        self.stage_index = -1
+        self.progress = 0.0
+        self.steps = None
+        if first_stage is not None:
+            self.stage_index = [name for name, _, _ in STAGES].index(first_stage)
+            self.progress = STAGES[self.stage_index][2]
+
+    @property
+    def stage(self):
+        return STAGES[self.stage_index][0] if self.stage_index >= 0 else 'starting'
+
+    def feed(self, line):
+        """Parse one line of output. Returns ``True`` if the stage changed."""
+        for index in range(self.stage_index + 1, len(STAGES)):
+            if STAGES[index][1].search(line):
+                self.stage_index = index
+                self.progress = STAGES[index][2]
+                self.steps = None
+                return True
+
+        match = _STEP_PATTERN.search(line)
+        if match and self.stage in ('dlicv', 'dlmuse'):
+            step, n_steps = int(match.group(1)), int(match.group(2))
+            if 0 < n_steps and step <= n_steps:
+                start = STAGES[self.stage_index][2]
+                end = STAGES[self.stage_index + 1][2]
+                self.steps = (step, n_steps)
+                self.progress = max(self.progress, start + (end - start) * step / n_steps)
+        return False
+
+
+def publish(status_file, **fields):
+    """Atomically write the progress document of a job."""
+    status_file = Path(status_file)
+    status_file.parent.mkdir(parents=True, exist_ok=True)
+    status = {'host': socket.gethostname(), 'pid': os.getpid(), 'updated_at': time.time()}
+    status.update(fields)
+    tmp_file = status_file.with_name(f'.{status_file.name}.{uuid.uuid4().hex}.tmp')
+    tmp_file.write_text(json.dumps(status, indent=2))
+    os.replace(tmp_file, status_file)
+
+
+def read_statuses(status_dir):
+    """Load the progress documents of all jobs in ``status_dir``."""
+    statuses = []
+    for status_file in sorted(Path(status_dir).glob('*.json')):
+        try:
+            statuses.append(json.loads(status_file.read_text()))
+        except (OSError, ValueError):
+            continue  # Being replaced
+    return statuses
+
+
+def summarize(statuses, total, started_at, now=None, stall_timeout=1800.0):
+    """Aggregate job progress documents into cohort-wide counts and an ETA.
+
+    Parameters
+    ----------
+    statuses : list of dict
+        As returned by :py:func:`read_statuses`.
+    total : int
+        Number of jobs in the run.
+    started_at : float
+        Start time of the run (seconds since the epoch).
+    now : float or None
+        Current time; defaults to :py:func:`time.time`.
+    stall_timeout : float
+        Seconds without output after which a running job is reported as stalled.
+
+    Returns
+    -------
+    summary : dict
+        Counts of ``done``, ``failed``, ``running`` and ``pending`` jobs, the
+        ``stalled`` job identifiers and the ``eta`` in seconds (``None`` until
+        it can be estimated).
+
+    """
+    now = time.time() if now is None else now
+    done = [s for s in statuses if s.get('state') == 'done']
+    failed = [s for s in statuses if s.get('state') == 'failed']
+    running = [s for s in statuses if s.get('state') in ('running', 'retrying')]
+    stalled = [
+        s.get('job_id') for s in running if now - s.get('updated_at', now) > stall_timeout
+    ]
+
+    effective_done = len(done) + sum(float(s.get('progress', 0.0)) for s in running)
+    remaining = max(total - len(failed) - effective_done, 0.0)
+    elapsed = now - started_at
+    eta = None
+    if effective_done > 0 and elapsed > 0:
+        eta = remaining * elapsed / effective_done
+
+    return {
+        'total': total,
+        'done': len(done),
+        'failed': len(failed),
+        'running': len(running),
+        'pending': max(total - len(done) - len(failed) - len(running), 0),
+        'stalled': stalled,
+        'eta': eta,
+        'updated_at': now,
+    }
+
+
+def _format_duration(seconds):
+    seconds = round(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes = rest // 60
+    return f'{hours}h{minutes:02d}m' if hours else f'{minutes}m{seconds % 60:02d}s'
+
+
+def format_summary(summary):
+    """One-line rendering of :py:func:`summarize`'s output.
+
+    >>> format_summary({'total': 10, 'done': 4, 'failed': 1, 'running': 2,
+    ...                 'pending': 3, 'stalled': [], 'eta': 3720})
+    '4 of 10 T1w done (1 failed, 2 running), ETA 1h02m'
+    """
+    line = f'{summary["done"]} of {summary["total"]} T1w done'
+    details = []
+    if summary['failed']:
+        details.append(f'{summary["failed"]} failed')
+    if summary['running']:
+        details.append(f'{summary["running"]} running')
+    if summary['stalled']:
+        details.append(f'{len(summary["stalled"])} stalled')
+    if details:
+        line += f' ({", ".join(details)})'
+    if summary['eta'] is not None and summary['done'] + summary['failed'] < summary['total']:
+        line += f', ETA {_format_duration(summary["eta"])}'
+    return line
+
+
+class ProgressMonitor(threading.Thread):
+    """Periodically log the cohort-wide progress of the run.
+
+    Parameters
+    ----------
+    status_dir : str or :py:class:`~pathlib.Path`
+        Directory where jobs publish their progress.
+    total : int
+        Number of jobs in the run.
+    interval : float
+        Seconds between progress lines.
+    stall_timeout : float
+        Seconds without output after which a running job is reported as stalled.
+    logger : :py:class:`logging.Logger` or None
+        Where progress lines are logged.
+
+    """
+
+    def __init__(self, status_dir, total, interval=60.0, stall_timeout=1800.0, logger=None):
+        super().__init__(name='ncdlmuse-progress', daemon=True)
+        self.status_dir = Path(status_dir)
+        self.total = int(total)
+        self.interval = interval
+        self.stall_timeout = stall_timeout
+        self.logger = logger or LOGGER
+        self.started_at = time.time()
+        self._reported_stalled = set()
+        self._stop_event = threading.Event()
+
+    @property
+    def status_file(self):
+        """The run-level status document."""
+        return self.status_dir.parent / 'status.json'
+
+    def report(self):
+        """Aggregate the jobs' progress, write ``status.json`` and log one line."""
+        summary = summarize(
+            read_statuses(self.status_dir),
+            self.total,
+            self.started_at,
+            stall_timeout=self.stall_timeout,
+        )
+        try:
+            publish(self.status_file, **summary)
+        except OSError as e:
+            self.logger.debug(f'Could not write {self.status_file}: {e}')
+        self.logger.info(format_summary(summary))
+        for job_id in set(summary['stalled']) - self._reported_stalled:
+            self.logger.warning(
+                f'No output from NiChart_DLMUSE for job {job_id} in the last '
+                f'{self.stall_timeout:.0f}s; it may be stalled.'
+            )
+        self._reported_stalled = set(summary['stalled'])
+        return summary
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        """Stop monitoring and log the final counts."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        return self.report()
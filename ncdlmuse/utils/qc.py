@@ -0,0 +1,162 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Fast quality-control signals of DLMUSE segmentations.
+
+With ``--adaptive-tta``, NiChart_DLMUSE segments every T1w file without
+test-time augmentation (TTA), and runs again with TTA only if these checks
+flag the result (see :py:class:`~ncdlmuse.interfaces.ncdlmuse.NiChartDLMUSE`).
+They read the segmentation and the DLICV mask once, in well under a second:
+
+* ``outside_mask``: fraction of the labelled voxels outside the brain mask.
+* ``unlabelled_mask``: fraction of the brain mask left unlabelled.
+* ``missing_labels``: MUSE labels of the intracranial volume (ROI 702) that
+  are absent from the segmentation.
+* ``icv`` and ``tbv_fraction``: intracranial volume (mm³) and total brain
+  volume (ROI 701) as a fraction of it, against plausible adult ranges.
+* ``volume_z``: z-scores of the ROI volumes (as fractions of the ICV) that
+  deviate from cohort norms, if a norms file is given (see :py:func:`load_norms`).
+
+The default :py:data:`QC_THRESHOLDS` are generous: they catch gross failures
+(truncated or mislabelled regions, masks leaking into the skull), not the
+subtle differences TTA makes on scans that segment well.
+
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+
+#: Thresholds above (or ranges outside) which a check flags a segmentation
+QC_THRESHOLDS = {
+    'outside_mask': 0.01,
+    'unlabelled_mask': 0.1,
+    'missing_labels': 0,
+    'icv': (7.0e5, 2.5e6),
+    'tbv_fraction': (0.5, 0.98),
+    'volume_z': 4.0,
+}
+
+_ICV_ROI = 702
+_TBV_ROI = 701
+
+
+@lru_cache
+def _roi_components():
+    """MUSE labels composing each (single or derived) ROI of the package's ROI list."""
+    from importlib import resources as importlib_resources
+
+    import pandas as pd
+
+    data_dir = importlib_resources.files('ncdlmuse.data')
+    with importlib_resources.as_file(data_dir / 'MUSE_ROI_complete_list.tsv') as roi_list:
+        rois = pd.read_csv(roi_list, sep='\t')
+    with importlib_resources.as_file(
+        data_dir / 'MUSE_mapping_consecutive_indices.tsv'
+    ) as mapping:
+        labels = set(pd.read_csv(mapping, sep='\t')['IndexMUSE']) - {0}
+    return {
+        int(roi): [int(label) for label in str(components).split(',') if int(label) in labels]
+        for roi, components in zip(rois['ID'], rois['Consisting_of_ROIS'], strict=True)
+    }
+
+
+def load_norms(norms_file):
+    """Read cohort norms of ROI volumes from a TSV file.
+
+    The file has one row per ROI, with columns ``ROI`` (MUSE index of a single
+    or derived ROI), ``mean`` and ``std`` (of the ROI volume as a fraction of
+    the ICV), e.g. computed from the volumes of a reference cohort.
+
+    Returns
+    -------
+    norms : dict
+        ``(mean, std)`` of each ROI, by MUSE index.
+
+    """
+    import pandas as pd
+
+    norms = pd.read_csv(norms_file, sep='\t')
+    missing = {'ROI', 'mean', 'std'}.difference(norms.columns)
+    if missing:
+        raise ValueError(f'Norms file {norms_file} lacks column(s): {", ".join(sorted(missing))}')
+    return {
+        int(roi): (float(mean), float(std))
+        for roi, mean, std in zip(norms['ROI'], norms['mean'], norms['std'], strict=True)
+    }
+
+
+def assess_segmentation(segmentation, mask, norms=None, thresholds=None):
+    """Compute the QC signals of a MUSE segmentation and flag the failed checks.
+
+    Parameters
+    ----------
+    segmentation : str or os.PathLike
+        Segmentation in MUSE labels.
+    mask : str or os.PathLike
+        DLICV brain mask, on the grid of ``segmentation``.
+    norms : dict or None
+        Cohort norms, as returned by :py:func:`load_norms`.
+    thresholds : dict or None
+        Overrides of :py:data:`QC_THRESHOLDS`.
+
+    Returns
+    -------
+    qc : dict
+        The ``signals``, and the names of the failed checks (``flags``).
+
+    """
+    import nibabel as nb
+
+    thresholds = {**QC_THRESHOLDS, **(thresholds or {})}
+    seg_img = nb.load(str(segmentation))
+    labels = np.asanyarray(seg_img.dataobj).astype(np.int64)
+    brain = np.asanyarray(nb.load(str(mask)).dataobj) > 0
+    if labels.shape != brain.shape:
+        raise ValueError(
+            f'The segmentation {labels.shape} and the mask {brain.shape} have different shapes.'
+        )
+
+    voxel_volume = float(np.prod(seg_img.header.get_zooms()[:3]))
+    labelled = labels > 0
+    n_labelled = int(np.count_nonzero(labelled))
+    n_brain = int(np.count_nonzero(brain))
+    counts = np.bincount(labels[labelled])
+    volumes = {label: count * voxel_volume for label, count in enumerate(counts) if count}
+    components = _roi_components()
+
+    icv = n_brain * voxel_volume
+    tbv = sum(volumes.get(label, 0.0) for label in components[_TBV_ROI])
+    signals = {
+        'outside_mask': round(np.count_nonzero(labelled & ~brain) / max(n_labelled, 1), 4),
+        'unlabelled_mask': round(np.count_nonzero(brain & ~labelled) / max(n_brain, 1), 4),
+        'missing_labels': sorted(set(components[_ICV_ROI]).difference(volumes)),
+        'icv': round(icv, 1),
+        'tbv_fraction': round(tbv / icv, 4) if icv else 0.0,
+    }
+    if norms:
+        z_scores = {}
+        for roi, (mean, std) in norms.items():
+            if not std or not icv:
+                continue
+            volume = sum(volumes.get(label, 0.0) for label in components.get(roi, [roi]))
+            z_score = (volume / icv - mean) / std
+            if abs(z_score) > thresholds['volume_z']:
+                z_scores[str(roi)] = round(z_score, 2)
+        signals['volume_z'] = z_scores
+
+    flags = [
+        check
+        for check in ('outside_mask', 'unlabelled_mask')
+        if signals[check] > thresholds[check]
+    ]
+    if len(signals['missing_labels']) > thresholds['missing_labels']:
+        flags.append('missing_labels')
+    for check in ('icv', 'tbv_fraction'):
+        low, high = thresholds[check]
+        if not low <= signals[check] <= high:
+            flags.append(check)
+    if signals.get('volume_z'):
+        flags.append('volume_z')
+    return {'flags': flags, 'signals': signals}
@@ -0,0 +1,95 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Quarantine of T1w files whose processing failed.
+
+In ``--quarantine`` mode, a failing T1w does not stop the run: each failure is
+recorded as a small JSON document in the failure manifest directory
+(``<output_dir>/logs/quarantine/<job_id>.json``), with pointers to the crash
+files Nipype wrote for the failing node, and the remaining T1w files keep
+being processed.
+A later run with ``--retry-failed`` processes only the quarantined T1w files,
+and a T1w file leaves the quarantine as soon as it is processed successfully.
+
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.quarantine')
+
+QUARANTINE_DIR = Path('logs') / 'quarantine'
+
+
+def quarantine_dir(output_dir):
+    """The failure manifest directory of a derivatives dataset."""
+    return Path(output_dir) / QUARANTINE_DIR
+
+
+def _record_path(output_dir, t1w_file):
+    from ncdlmuse.utils.workqueue import job_id_for
+
+    return quarantine_dir(output_dir) / f'{job_id_for(t1w_file)}.json'
+
+
+def find_crash_files(crashdump_dir, node_name, since=None):
+    """Crash files written by Nipype for ``node_name`` (newest first)."""
+    if not crashdump_dir or not Path(crashdump_dir).is_dir():
+        return []
+    crash_files = [
+        path
+        for path in Path(crashdump_dir).glob(f'crash-*-{node_name}-*')
+        if since is None or path.stat().st_mtime >= since
+    ]
+    return [str(p) for p in sorted(crash_files, key=lambda p: p.stat().st_mtime, reverse=True)]
+
+
+def record_failure(output_dir, t1w_file, node=None, crash_files=(), **extra):
+    """Quarantine ``t1w_file``, keeping track of how many times it failed."""
+    path = _record_path(output_dir, t1w_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        previous = json.loads(path.read_text())
+    except (OSError, ValueError):
+        previous = {}
+    record = {
+        't1w': str(t1w_file),
+        'node': node,
+        'crash_files': list(crash_files),
+        'failures': int(previous.get('failures', 0)) + 1,
+        'first_failed_at': previous.get('first_failed_at', time.time()),
+        'failed_at': time.time(),
+        **extra,
+    }
+    tmp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    tmp_path.write_text(json.dumps(record, indent=2))
+    os.replace(tmp_path, path)
+    LOGGER.warning(f'Quarantined {t1w_file} (failed in {node}); see {path}.')
+    return path
+
+
+def clear_failure(output_dir, t1w_file):
+    """Release ``t1w_file`` from the quarantine. Returns whether it was quarantined."""
+    path = _record_path(output_dir, t1w_file)
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        return False
+    LOGGER.info(f'{t1w_file} was processed successfully and left the quarantine.')
+    return True
+
+
+def load_failures(output_dir):
+    """Load all quarantine records of a derivatives dataset."""
+    records = []
+    for path in sorted(quarantine_dir(output_dir).glob('*.json')):
+        try:
+            records.append(json.loads(path.read_text()))
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f'Skipping unreadable quarantine record {path}: {e}')
+    return records
@@ -0,0 +1,155 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Node-local scratch execution and bulk stage-out of derivatives.
+
+With ``--scratch-dir``, the Nipype working directory and the derivatives being
+written live in node-local scratch (``<scratch_dir>/ncdlmuse_<run_uuid>/``),
+so the thousands of small files Nipype creates per subject never hit the
+shared filesystem.
+Once participants are done, only their final derivatives (and reports) are
+staged out to the shared output directory, either by copying the trees or as
+a single tar archive per stage-out (``<output_dir>/shards/``), and the scratch
+copy is discarded.
+
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import socket
+import tarfile
+import uuid
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.scratch')
+
+STAGE_OUT_MODES = ('copy', 'tar')
+
+
+def scratch_root(scratch_dir, run_uuid):
+    """Per-run directory within the node-local scratch space."""
+    return Path(scratch_dir) / f'ncdlmuse_{run_uuid}'
+
+
+def shard_path(dst_dir, shard_name):
+    """Tar archive of a stage-out named ``shard_name`` within ``dst_dir``."""
+    return Path(dst_dir) / 'shards' / f'{shard_name}.tar'
+
+
+def staged_path(path, src_dir, dst_dir, mode='copy', shard_name=None):
+    """Where ``path``, within the scratch ``src_dir``, is staged out to.
+
+    Files are copied to the same relative path within ``dst_dir``, or end up
+    in the tar archive of the stage-out. Files outside of ``src_dir`` are not
+    staged out and keep their path.
+
+    >>> str(staged_path('/scratch/d/sub-01/anat/a.nii.gz', '/scratch/d', '/out'))
+    '/out/sub-01/anat/a.nii.gz'
+    >>> str(staged_path('/scratch/d/sub-01/a.nii.gz', '/scratch/d', '/out', 'tar', 'run_all'))
+    '/out/shards/run_all.tar'
+    """
+    path = Path(path)
+    if not path.is_relative_to(src_dir):
+        return path
+    if mode == 'tar':
+        return shard_path(dst_dir, shard_name)
+    return Path(dst_dir) / path.relative_to(src_dir)
+
+
+def _items_to_stage(src_dir, subjects=None):
+    """Top-level entries of ``src_dir`` belonging to ``subjects`` (all if None)."""
+    items = []
+    for item in sorted(Path(src_dir).iterdir()):
+        if item.name.startswith('sub-'):
+            subject = item.name[4:].split('.')[0].split('_')[0]
+            if subjects is not None and subject not in subjects:
+                continue
+        elif item.name in ('logs', 'shards'):
+            continue
+        items.append(item)
+    return items
+
+
+def _copy_atomic(src, dst):
+    tmp_dst = dst.with_name(f'.{dst.name}.{uuid.uuid4().hex}.tmp')
+    shutil.copy2(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+
+
+def stage_out(src_dir, dst_dir, subjects=None, mode='copy', shard_name=None):
+    """Move the final derivatives of ``subjects`` from scratch to shared storage.
+
+    Parameters
+    ----------
+    src_dir : str or :py:class:`~pathlib.Path`
+        Derivatives directory in node-local scratch.
+    dst_dir : str or :py:class:`~pathlib.Path`
+        Shared derivatives directory.
+    subjects : list of str or None
+        Participant labels (without ``sub-``) to stage out; all if ``None``.
+        Dataset-level files (e.g., ``dataset_description.json``) are always included.
+    mode : {'copy', 'tar'}
+        Merge the trees into ``dst_dir``, or write one tar archive into
+        ``<dst_dir>/shards/`` for the whole stage-out.
+    shard_name : str or None
+        Name of the tar archive (without extension); a unique name is derived
+        from the host name if not given.
+
+    Returns
+    -------
+    staged : list of :py:class:`~pathlib.Path`
+        The destination files or directories (or the single tar archive).
+
+    """
+    src_dir, dst_dir = Path(src_dir), Path(dst_dir)
+    if mode not in STAGE_OUT_MODES:
+        raise ValueError(f'Unknown stage-out mode {mode!r}; use one of {STAGE_OUT_MODES}.')
+    if subjects is not None:
+        subjects = {str(s).removeprefix('sub-') for s in subjects}
+    if not src_dir.is_dir():
+        return []
+
+    items = _items_to_stage(src_dir, subjects)
+    if not items:
+        return []
+    dst_dir.mkdir(parents=True, exist_ok=True)
+
+    if mode == 'tar':
+        shard = shard_path(
+            dst_dir, shard_name or f'{socket.gethostname()}_{uuid.uuid4().hex[:12]}'
+        )
+        shard_dir = shard.parent
+        shard_dir.mkdir(exist_ok=True)
+        tmp_shard = shard_dir / f'.{shard.name}.{uuid.uuid4().hex}.tmp'
+        with tarfile.open(tmp_shard, 'w') as tar:
+            for item in items:
+                tar.add(item, arcname=item.name)
+        os.replace(tmp_shard, shard)
+        staged = [shard]
+    else:
+        staged = []
+        for item in items:
+            target = dst_dir / item.name
+            if item.is_dir():
+                shutil.copytree(item, target, dirs_exist_ok=True, copy_function=shutil.copy2)
+            else:
+                _copy_atomic(item, target)
+            staged.append(target)
+
+    # Participant outputs have been staged out; dataset-level files stay for later stage-outs
+    for item in items:
+        if item.name.startswith('sub-'):
+            discard(item)
+    LOGGER.info(f'Staged out {len(items)} item(s) from {src_dir} to {dst_dir} ({mode}).')
+    return staged
+
+
+def discard(path):
+    """Remove a scratch file or directory tree, ignoring errors."""
+    path = Path(path)
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
@@ -0,0 +1,144 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Selection of one T1w scan per session.
+
+Sessions often contain repeat runs, rescans or several acquisitions of the
+T1w image, all of which would otherwise be segmented.
+With a policy other than ``all``, only one T1w file is kept per
+subject/session, chosen from headers and JSON sidecars when the workflow is
+built (only sessions with several T1w files are inspected):
+
+``first``
+    The first file in BIDS (lexicographic) order.
+``highest-resolution``
+    The smallest voxel volume (ties go to the larger field of view).
+``largest-snr-proxy``
+    The largest SNR proxy: voxel volume, scaled by the square root of the
+    number of averages and the inverse square root of the pixel bandwidth
+    when all candidate sidecars report them.
+``latest-run``
+    The highest ``run-`` entity, then the latest ``AcquisitionTime``.
+
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import re
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from ncdlmuse.utils.preflight import read_header
+
+LOGGER = logging.getLogger('ncdlmuse.utils.selection')
+
+SELECTION_POLICIES = ('all', 'first', 'highest-resolution', 'largest-snr-proxy', 'latest-run')
+
+_ENTITY_RE = {key: re.compile(rf'(?:^|_){key}-([a-zA-Z0-9]+)') for key in ('sub', 'ses', 'run')}
+
+# Sidecar fields of the SNR proxy and their exponents
+_SNR_FACTORS = {'NumberOfAverages': 0.5, 'PixelBandwidth': -0.5}
+
+
+def _read_sidecar(t1w_file):
+    """Metadata from the JSON sidecar next to ``t1w_file`` (empty if there is none)."""
+    name = Path(t1w_file).name
+    stem = name[:-7] if name.endswith('.nii.gz') else Path(name).stem
+    try:
+        return json.loads((Path(t1w_file).parent / f'{stem}.json').read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _entity(t1w_file, key):
+    match = _ENTITY_RE[key].search(Path(t1w_file).name)
+    return match.group(1) if match else None
+
+
+def _geometry(t1w_file):
+    """Voxel volume and field of view (both in mm^3) of a T1w file."""
+    header = read_header(t1w_file)
+    zooms = header.get_zooms()[:3]
+    voxel_volume = float(np.prod(zooms))
+    return voxel_volume, voxel_volume * float(np.prod(header.get_data_shape()[:3]))
+
+
+def _snr_proxies(t1w_files, metadata):
+    proxies = {f: _geometry(f)[0] for f in t1w_files}
+    for field, exponent in _SNR_FACTORS.items():
+        values = [metadata[f].get(field) for f in t1w_files]
+        # A factor is only comparable if every candidate reports it
+        if all(isinstance(v, int | float) and v > 0 for v in values):
+            for t1w_file, value in zip(t1w_files, values, strict=True):
+                proxies[t1w_file] *= math.pow(value, exponent)
+    return proxies
+
+
+def _run_key(t1w_file, metadata):
+    run = _entity(t1w_file, 'run')
+    return (int(run) if run else 0, str(metadata[t1w_file].get('AcquisitionTime') or ''))
+
+
+def _choose(t1w_files, policy, get_metadata):
+    """Choose one of the T1w files of a session according to ``policy``."""
+    t1w_files = sorted(t1w_files)
+    if policy == 'first':
+        return t1w_files[0]
+    if policy == 'highest-resolution':
+        geometry = {f: _geometry(f) for f in t1w_files}
+        # max() keeps the first of equally ranked files
+        return max(t1w_files, key=lambda f: (-geometry[f][0], geometry[f][1]))
+
+    metadata = {f: get_metadata(f) or {} for f in t1w_files}
+    if policy == 'largest-snr-proxy':
+        proxies = _snr_proxies(t1w_files, metadata)
+        return max(t1w_files, key=proxies.get)
+    if policy == 'latest-run':
+        return max(reversed(t1w_files), key=lambda f: _run_key(f, metadata))
+    raise ValueError(f'Unknown T1w selection policy {policy!r}.')
+
+
+def select_t1w(t1w_files, policy='all', get_metadata=None):
+    """Keep one T1w file per subject/session according to ``policy``.
+
+    Parameters
+    ----------
+    t1w_files : list of str
+        T1w files to select from.
+    policy : str
+        One of :py:data:`SELECTION_POLICIES`.
+    get_metadata : callable or None
+        Returns the sidecar metadata of a file (e.g.,
+        :py:meth:`bids.layout.BIDSLayout.get_metadata`, which follows the BIDS
+        inheritance principle). Defaults to reading the adjacent JSON sidecar.
+
+    Returns
+    -------
+    selected : list of str
+        The selected T1w files, in the order of ``t1w_files``.
+
+    """
+    if policy == 'all':
+        return list(t1w_files)
+
+    sessions = defaultdict(list)
+    for t1w_file in t1w_files:
+        sessions[(_entity(t1w_file, 'sub'), _entity(t1w_file, 'ses'))].append(t1w_file)
+
+    chosen = set()
+    for (subject, session), candidates in sessions.items():
+        if len(candidates) == 1:
+            chosen.add(candidates[0])
+            continue
+        selected = _choose(candidates, policy, get_metadata or _read_sidecar)
+        chosen.add(selected)
+        label = f'sub-{subject}' + (f'_ses-{session}' if session else '')
+        LOGGER.info(
+            f'{label}: selected {Path(selected).name} out of {len(candidates)} T1w files '
+            f'({policy}).'
+        )
+    return [t1w_file for t1w_file in t1w_files if t1w_file in chosen]
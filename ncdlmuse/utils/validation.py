@@ -0,0 +1,146 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Cached BIDS validation.
+
+PyBIDS validates a dataset file by file while indexing it (unless
+``--skip-bids-validation`` is given).
+:py:class:`CachedValidationIndexer` keeps the verdicts in a JSON file, keyed
+by a tree fingerprint: the hash of ``dataset_description.json`` plus a digest
+of the names, sizes and modification times under each subject folder.
+Re-runs on an unchanged dataset reuse every verdict, and only the subject
+folders that changed are validated again. Files outside subject folders are
+always validated (there are only a few).
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+from bids.layout import BIDSLayoutIndexer
+
+from ncdlmuse.utils.preflight import load_cache, save_cache
+
+LOGGER = logging.getLogger('ncdlmuse.utils.validation')
+
+VALIDATION_CACHE = 'bids_validation.json'
+
+
+def description_hash(bids_dir):
+    """SHA256 of the ``dataset_description.json`` of a dataset (``None`` if missing)."""
+    try:
+        description = (Path(bids_dir) / 'dataset_description.json').read_bytes()
+    except OSError:
+        return None
+    return hashlib.sha256(description).hexdigest()
+
+
+def _folder_digest(path):
+    """Digest of the names, sizes and modification times of everything under ``path``."""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames) + dirnames:
+            entry = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:  # Broken symlink
+                stat = os.lstat(entry)
+            digest.update(
+                f'{os.path.relpath(entry, path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode()
+            )
+    return digest.hexdigest()
+
+
+def tree_fingerprint(bids_dir):
+    """Fingerprint of a dataset: description hash and a digest per subject folder."""
+    subjects = {
+        entry.name: _folder_digest(entry.path)
+        for entry in os.scandir(bids_dir)
+        if entry.name.startswith('sub-') and entry.is_dir()
+    }
+    return {'description': description_hash(bids_dir), 'subjects': subjects}
+
+
+class _CachedValidator:
+    """Wraps a :py:class:`bids_validator.BIDSValidator`, reusing cached verdicts."""
+
+    def __init__(self, validator, invalid):
+        self._validator = validator
+        #: Invalid paths of the subject folders whose verdicts are reused
+        self.reused = invalid
+        #: Invalid paths found in the subject folders validated in this run
+        self.invalid = {}
+
+    def is_bids(self, path):
+        parts = path.split('/', 2)  # Paths are relative to the root, with a leading slash
+        subject = parts[1] if len(parts) == 3 and parts[1].startswith('sub-') else None
+        if subject in self.reused:
+            return path not in self.reused[subject]
+
+        valid = self._validator.is_bids(path)
+        if subject is not None:
+            invalid = self.invalid.setdefault(subject, set())
+            if not valid:
+                invalid.add(path)
+        return valid
+
+
+class CachedValidationIndexer(BIDSLayoutIndexer):
+    """A :py:class:`~bids.layout.BIDSLayoutIndexer` caching validation verdicts.
+
+    Parameters
+    ----------
+    cache_file : str or :py:class:`~pathlib.Path` or None
+        JSON file where verdicts are cached (no caching if ``None``).
+    **kwargs
+        Passed to :py:class:`~bids.layout.BIDSLayoutIndexer`.
+
+    """
+
+    def __init__(self, cache_file=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_file = cache_file
+
+    def __call__(self, layout):
+        if self.validator is None or self.cache_file is None:
+            return super().__call__(layout)
+
+        root = str(Path(layout._root.path).resolve())
+        fingerprint = tree_fingerprint(root)
+        cache = load_cache(self.cache_file)
+        reused = {}
+        if cache.get('root') == root and cache.get('description') == fingerprint['description']:
+            cached = cache.get('subjects', {})
+            reused = {
+                subject: set(cached[subject]['invalid'])
+                for subject, digest in fingerprint['subjects'].items()
+                if cached.get(subject, {}).get('digest') == digest
+            }
+        LOGGER.info(
+            f'Reusing the BIDS validation of {len(reused)} out of '
+            f'{len(fingerprint["subjects"])} subject folders.'
+        )
+
+        validator = self.validator
+        self.validator = _CachedValidator(validator, reused)
+        try:
+            super().__call__(layout)
+            invalid = {**self.validator.invalid, **self.validator.reused}
+        finally:
+            self.validator = validator
+
+        save_cache(
+            self.cache_file,
+            {
+                'root': root,
+                'description': fingerprint['description'],
+                'subjects': {
+                    subject: {'digest': digest, 'invalid': sorted(invalid.get(subject, ()))}
+                    for subject, digest in fingerprint['subjects'].items()
+                },
+            },
+        )
@@ -0,0 +1,310 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Tracking of per-T1w workflow completion and working-directory pruning.
+
+:py:class:`CompletionTracker` is plugged into Nipype's ``status_callback``
+plugin argument and counts finished nodes for each single-T1w workflow
+(:py:func:`~ncdlmuse.workflows.base.init_single_subject_wf`).
+When every node of one of them has finished (including its data sinks and
+reportlets), the tracker writes a small completion manifest and, optionally,
+removes that workflow's working directory: the raw NiChart_DLMUSE outputs,
+the copy of the input T1w and all Nipype node directories.
+Scratch usage then stays bounded by the number of T1w files in flight.
+
+Completion manifests live in ``<work_dir>/completed/`` and let a later run
+skip T1w files whose outputs are still in place (see :py:func:`is_complete`).
+With ``--scratch-dir``, the working directory is new for every run and
+discarded, so manifests live in the shared ``<output_dir>/logs/completed/``
+instead, and record the staged-out derivatives (see :py:func:`manifest_root`).
+
+For large cohorts, :py:func:`hashed_subdir` spreads per-T1w directories over
+a shallow, hashed fan-out (``ab/cd/<name>``), so that no single directory of
+the working tree holds more than a few entries per thousand T1w files.
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from collections import defaultdict
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.workdir')
+
+MANIFEST_DIR = 'completed'
+
+WORK_DIR_LAYOUTS = ('flat', 'hashed')
+
+# Nodes whose outputs are final derivatives or reportlets
+_DERIVATIVE_NODE_PREFIXES = ('ds_', 'copy_volumes_json', 'plot_')
+
+# Settings that change the derivatives (device placement and caching do not)
+_SIGNATURE_SETTINGS = (
+    'dlmuse_model_folder',
+    'dlmuse_derived_roi_mappings_file',
+    'dlmuse_muse_roi_mappings_file',
+    'dlmuse_disable_tta',
+    'dlmuse_step_size',
+    'dlmuse_adaptive_tta',
+    'dlmuse_qc_norms',
+    'dlmuse_split_stages',
+    'dlmuse_backend',
+    'dlmuse_extra_models',
+)
+
+
+def hashed_subdir(key, levels=2, width=2):
+    """Relative fan-out directory of ``key``, from the leading digits of its hash.
+
+    >>> str(hashed_subdir('single_subject_sub-01_ses-1_wf'))
+    '56/81'
+    """
+    digest = hashlib.sha256(str(key).encode()).hexdigest()
+    return Path(*(digest[i * width : (i + 1) * width] for i in range(levels)))
+
+
+def settings_signature():
+    """Digest of the settings that determine the derivatives of a T1w file."""
+    from ncdlmuse import config
+
+    settings = {
+        'version': config.environment.version,
+        'workflow': {key: str(getattr(config.workflow, key)) for key in _SIGNATURE_SETTINGS},
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def manifest_root():
+    """Directory of the ``completed/`` manifests of the configured run.
+
+    The working directory, or the shared ``<output_dir>/logs`` (next to the
+    quarantine) with ``--scratch-dir``.
+    """
+    from ncdlmuse import config
+
+    if config.execution.scratch_dir:
+        return Path(config.execution.output_dir) / 'logs'
+    return config.execution.work_dir
+
+
+def manifest_path(work_dir, t1w_file):
+    """Location of the completion manifest of ``t1w_file``."""
+    from ncdlmuse.utils.workqueue import job_id_for
+
+    job_id = job_id_for(t1w_file)
+    return Path(work_dir) / MANIFEST_DIR / hashed_subdir(job_id) / f'{job_id}.json'
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def write_manifest(work_dir, t1w_file, derivatives, signature, **extra):
+    """Record that ``t1w_file`` was processed into ``derivatives``."""
+    path = manifest_path(work_dir, t1w_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        't1w': str(t1w_file),
+        't1w_stamp': _file_stamp(t1w_file),
+        'signature': signature,
+        'derivatives': sorted({str(f) for f in derivatives}),
+        'completed_at': time.time(),
+        **extra,
+    }
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, path)
+    return path
+
+
+def is_complete(work_dir, t1w_file, signature):
+    """Whether a valid completion manifest exists for ``t1w_file``.
+
+    The manifest is valid if the input file is unchanged, the settings
+    signature matches and every recorded derivative still exists.
+    """
+    path = manifest_path(work_dir, t1w_file)
+    try:
+        manifest = json.loads(path.read_text())
+        stamp = _file_stamp(t1w_file)
+    except (OSError, ValueError):
+        return False
+    return (
+        manifest.get('signature') == signature
+        and manifest.get('t1w_stamp') == stamp
+        and bool(manifest.get('derivatives'))
+        and all(Path(f).exists() for f in manifest['derivatives'])
+    )
+
+
+def _collect_paths(value):
+    if isinstance(value, str | os.PathLike):
+        return [str(value)] if Path(value).is_file() else []
+    if isinstance(value, list | tuple):
+        return [p for v in value for p in _collect_paths(v)]
+    return []
+
+
+def _is_executed(node):
+    """Whether ``node`` is kept in the execution graph (identity nodes are removed)."""
+    from nipype.interfaces.utility import IdentityInterface
+
+    return not isinstance(node.interface, IdentityInterface) or hasattr(node, 'joinsource')
+
+
+def _t1w_workflows(workflow, rel_path):
+    """Single-T1w workflows nested in ``workflow``, possibly within fan-out workflows."""
+    for sub_wf in workflow._graph.nodes():
+        if not hasattr(sub_wf, '_get_all_nodes'):
+            continue
+        is_bucket = sub_wf.get_node('bidssrc') is None and any(
+            hasattr(node, '_get_all_nodes') for node in sub_wf._graph.nodes()
+        )
+        if is_bucket:
+            yield from _t1w_workflows(sub_wf, rel_path / sub_wf.name)
+        else:
+            yield sub_wf, rel_path / sub_wf.name
+
+
+class CompletionTracker:
+    """Nipype ``status_callback`` that detects completion of single-T1w workflows.
+
+    Parameters
+    ----------
+    workflow : :py:class:`~nipype.pipeline.engine.Workflow`
+        The top-level workflow, whose children are single-T1w workflows,
+        either directly or within hashed fan-out workflows.
+    prune : bool
+        Remove the working directory of each single-T1w workflow once it completes.
+    on_complete, on_failure : callable or None
+        Called with the name of the single-T1w workflow and its T1w file when it
+        completes, or (with the failing node) when the first of its nodes fails.
+    manifest_root : str or :py:class:`~pathlib.Path` or None
+        Where completion manifests are written (default: the working directory).
+    relocate : callable or None
+        Maps each derivative to the path recorded in the manifest (e.g., where
+        it is staged out to).
+
+    """
+
+    def __init__(
+        self,
+        workflow,
+        prune=False,
+        on_complete=None,
+        on_failure=None,
+        manifest_root=None,
+        relocate=None,
+    ):
+        self.prune = prune
+        self.on_complete = on_complete
+        self.on_failure = on_failure
+        self.work_dir = Path(workflow.base_dir) if workflow.base_dir else None
+        self.manifest_root = Path(manifest_root) if manifest_root else self.work_dir
+        self.relocate = relocate
+        self.signature = settings_signature()
+        self.remaining = {}
+        self.t1w_files = {}
+        self.node_dirs = {}
+        self.derivatives = defaultdict(list)
+        self.completed = []
+        self.failed = {}
+        reused = {}
+        for sub_wf, rel_path in _t1w_workflows(workflow, Path(workflow.name)):
+            self.remaining[sub_wf.name] = sum(
+                1 for node in sub_wf._get_all_nodes() if _is_executed(node)
+            )
+            bidssrc = sub_wf.get_node('bidssrc')
+            if bidssrc is not None:
+                self.t1w_files[sub_wf.name] = bidssrc.inputs.subject_data['t1w'][0]
+            if self.work_dir is not None:
+                self.node_dirs[sub_wf.name] = self.work_dir / rel_path
+            reuse_node = sub_wf.get_node('reuse_dlmuse_node')
+            if reuse_node is not None:
+                reused[sub_wf.name] = reuse_node.inputs.source_t1w
+
+        # Workflows whose results are reused by duplicates are pruned after them
+        groups = {t1w_file: name for name, t1w_file in self.t1w_files.items()}
+        self.reused_by = defaultdict(set)
+        for name, source_t1w in reused.items():
+            if source_t1w in groups:
+                self.reused_by[groups[source_t1w]].add(name)
+        self._prune_pending = set()
+
+    def _group(self, node):
+        for name in (node._hierarchy or '').split('.')[1:]:
+            if name in self.remaining:
+                return name
+        return None
+
+    def __call__(self, node, status):
+        group = self._group(node)
+        if group not in self.remaining:
+            return
+        if status == 'exception':
+            if group in self.failed:
+                return
+            self.failed[group] = node.fullname
+            self._release(group)
+            if self.on_failure is not None:
+                self.on_failure(group, self.t1w_files.get(group), node)
+            return
+        if status != 'end':
+            return
+
+        if node.name.startswith(_DERIVATIVE_NODE_PREFIXES):
+            try:
+                outputs = node.result.outputs.get() if node.result.outputs else {}
+            except (OSError, AttributeError, ValueError) as e:
+                LOGGER.debug(f'Could not read outputs of {node.fullname}: {e}')
+                outputs = {}
+            for value in outputs.values():
+                self.derivatives[group].extend(_collect_paths(value))
+
+        self.remaining[group] -= 1
+        if self.remaining[group] == 0 and group not in self.failed:
+            self._complete(group)
+
+    def _complete(self, group):
+        t1w_file = self.t1w_files.get(group)
+        self.completed.append(group)
+        derivatives = self.derivatives.pop(group, [])
+        if self.relocate is not None:
+            derivatives = [self.relocate(path) for path in derivatives]
+        if t1w_file and self.manifest_root is not None:
+            try:
+                write_manifest(
+                    self.manifest_root,
+                    t1w_file,
+                    derivatives,
+                    self.signature,
+                    workflow=group,
+                )
+            except OSError as e:
+                LOGGER.warning(f'Could not write the completion manifest of {group}: {e}')
+        if self.prune and group in self.node_dirs:
+            if self.reused_by.get(group):
+                self._prune_pending.add(group)
+            else:
+                self._prune(group)
+        self._release(group)
+        if self.on_complete is not None:
+            self.on_complete(group, t1w_file)
+
+    def _prune(self, group):
+        shutil.rmtree(self.node_dirs[group], ignore_errors=True)
+        LOGGER.info(f'{group} completed; pruned its working directory.')
+
+    def _release(self, group):
+        """Prune the workflows whose results ``group`` was the last to reuse."""
+        for source, users in self.reused_by.items():
+            users.discard(group)
+            if not users and source in self._prune_pending:
+                self._prune_pending.discard(source)
+                self._prune(source)
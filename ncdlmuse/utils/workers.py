@@ -0,0 +1,62 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""Warm worker processes.
+
+NCDLMUSE runs Nipype in *forkserver* mode (see :py:mod:`ncdlmuse.config`):
+every worker is forked from a server process, and unpickling its first node
+imports Nipype, NiWorkflows and the NCDLMUSE interfaces again, which takes
+several seconds.
+With ``--warm-workers``, the forkserver imports :py:data:`WARM_MODULES` once
+when it starts, so every worker (and the workflow building process) starts
+with them already loaded and lightweight nodes run in milliseconds.
+Workers are still recycled as before (``maxtasksperchild``), so leaks in one
+node cannot accumulate.
+
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+
+LOGGER = logging.getLogger('ncdlmuse.utils.workers')
+
+#: Modules imported by the forkserver with ``--warm-workers``.
+#: PyTorch is left out: NiChart_DLMUSE runs in its own process.
+WARM_MODULES = (
+    '__main__',  # Preloaded by default
+    'numpy',
+    'pandas',
+    'nibabel',
+    'nipype.pipeline.engine',
+    'nipype.interfaces.utility',
+    'niworkflows.interfaces.bids',
+    'ncdlmuse.config',
+    'ncdlmuse.interfaces.bids',
+    'ncdlmuse.interfaces.ncdlmuse',
+    'ncdlmuse.interfaces.reports',
+)
+
+
+def preload_workers(modules=WARM_MODULES):
+    """Have the forkserver import ``modules`` before forking any worker.
+
+    Must be called before the first process is started, as the forkserver
+    only imports its preload modules when it starts.
+
+    Returns
+    -------
+    preloaded : bool
+        Whether the modules will be preloaded.
+
+    """
+    from multiprocessing import forkserver
+
+    if mp.get_start_method() != 'forkserver':
+        LOGGER.warning('Warm workers need the forkserver start method; ignoring them.')
+        return False
+    if forkserver._forkserver._forkserver_pid is not None:
+        LOGGER.warning('The forkserver is already running; workers will not be warm.')
+        return False
+    mp.set_forkserver_preload(list(modules))
+    return True
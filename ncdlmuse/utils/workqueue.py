@@ -0,0 +1,382 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+"""A shared-filesystem work queue for pull-based execution.
+
+Any number of *ncdlmuse* workers (possibly on different compute nodes) can
+pull single-T1w jobs from a queue directory that lives on a shared filesystem.
+The queue is a plain directory tree::
+
+    <queue_dir>/
+        pending/<job_id>.json
+        claimed/<job_id>.json.<token>
+        done/<job_id>.json
+        failed/<job_id>.json
+        setup/<step>.started, setup/<step>.done
+
+Every state transition is a single :py:func:`os.rename`, which is atomic on
+POSIX filesystems (including NFS and Lustre within a single directory tree),
+so exactly one worker can win a given job.
+A claim carries a lease: the worker that owns it periodically refreshes the
+modification time of its claim file (the heartbeat).
+Claims whose heartbeat is older than the lease are considered abandoned
+(e.g., the node died or was preempted) and are put back into ``pending/``
+by whichever worker notices first.
+One-off steps of the whole queue (e.g., clearing the model caches) are run by
+the first worker that starts them, while the others wait for them to finish
+(see :py:meth:`WorkQueue.start_setup`).
+
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+LOGGER = logging.getLogger('ncdlmuse.utils.workqueue')
+
+_STATES = ('pending', 'claimed', 'done', 'failed')
+
+
+def job_id_for(t1w_file):
+    """Derive a stable, human-readable job identifier for a T1w file.
+
+    >>> job_id_for('/data/sub-01/ses-1/anat/sub-01_ses-1_T1w.nii.gz')[:17]
+    'sub-01_ses-1_T1w-'
+    """
+    t1w_file = str(t1w_file)
+    name = Path(t1w_file).name
+    for ext in ('.nii.gz', '.nii'):
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+            break
+    digest = hashlib.sha256(t1w_file.encode()).hexdigest()[:10]
+    return f'{name}-{digest}'
+
+
+def _write_json_atomic(path, content):
+    """Write a JSON document through a temporary file and an atomic rename."""
+    path = Path(path)
+    tmp_path = path.with_name(f'.tmp-{uuid.uuid4().hex}')
+    tmp_path.write_text(json.dumps(content, indent=2))
+    os.replace(tmp_path, path)
+
+
+class WorkQueue:
+    """A lease-based job queue stored in a directory on a shared filesystem.
+
+    Parameters
+    ----------
+    queue_dir : str or :py:class:`~pathlib.Path`
+        Root of the queue. Created if it does not exist.
+    lease : float
+        Seconds after which a claim without heartbeat is considered abandoned.
+    max_attempts : int
+        Number of times a job may be claimed before it is moved to ``failed/``.
+
+    """
+
+    def __init__(self, queue_dir, lease=600.0, max_attempts=3):
+        self.root = Path(queue_dir)
+        self.lease = float(lease)
+        self.max_attempts = int(max_attempts)
+        self.worker_id = f'{socket.gethostname()}.{os.getpid()}.{uuid.uuid4().hex[:8]}'
+        for state in _STATES:
+            (self.root / state).mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, state):
+        return self.root / state
+
+    def start_setup(self, step):
+        """Whether this worker is the first to start the one-off setup ``step``.
+
+        Exactly one worker of the queue, over its whole life, gets ``True``; it
+        must call :py:meth:`finish_setup` when done. Other workers should
+        :py:meth:`wait_for_setup` instead of running the step.
+        """
+        setup_dir = self.root / 'setup'
+        setup_dir.mkdir(exist_ok=True)
+        try:
+            fd = os.open(setup_dir / f'{step}.started', os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as fobj:
+            fobj.write(self.worker_id)
+        return True
+
+    def finish_setup(self, step):
+        """Record that the setup ``step`` started by this worker is finished."""
+        (self.root / 'setup' / f'{step}.done').write_text(self.worker_id)
+
+    def wait_for_setup(self, step, timeout=None, poll_interval=5.0):
+        """Block until the setup ``step`` is finished by the worker that started it.
+
+        Returns ``False`` if it is still running after ``timeout`` seconds (by
+        default, the lease), e.g. because that worker died.
+        """
+        timeout = self.lease if timeout is None else timeout
+        done = self.root / 'setup' / f'{step}.done'
+        start = time.monotonic()
+        while not done.exists():
+            if time.monotonic() - start > timeout:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def _find_claims(self, job_id):
+        return list(self._dir('claimed').glob(f'{job_id}.json.*'))
+
+    def populate(self, t1w_files, **metadata):
+        """Add jobs for ``t1w_files`` that are not yet known to the queue.
+
+        Populating is idempotent, so every worker of a run can call it with the
+        same list of files and the first one wins.
+        Extra keyword arguments are stored verbatim in each new job.
+
+        Returns
+        -------
+        added : list of str
+            Identifiers of the jobs that were newly created.
+
+        """
+        added = []
+        for t1w_file in t1w_files:
+            job_id = job_id_for(t1w_file)
+            # The order follows the job life cycle so a job moving forward
+            # while we look cannot be missed.
+            if (self._dir('pending') / f'{job_id}.json').exists():
+                continue
+            if self._find_claims(job_id):
+                continue
+            if any((self._dir(state) / f'{job_id}.json').exists() for state in ('done', 'failed')):
+                continue
+            job = {'job_id': job_id, 't1w': str(t1w_file), 'attempts': 0, **metadata}
+            try:
+                fd = os.open(
+                    self._dir('pending') / f'{job_id}.json', os.O_CREAT | os.O_EXCL | os.O_WRONLY
+                )
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, 'w') as fobj:
+                json.dump(job, fobj, indent=2)
+            added.append(job_id)
+        return added
+
+    def claim(self):
+        """Claim the next pending job.
+
+        Returns
+        -------
+        claim : :py:class:`Claim` or None
+            The claimed job, or ``None`` if no job could be claimed.
+
+        """
+        token = uuid.uuid4().hex[:12]
+        for pending in sorted(self._dir('pending').glob('*.json')):
+            job_id = pending.name[: -len('.json')]
+            claimed = self._dir('claimed') / f'{job_id}.json.{token}'
+            try:
+                # Refresh the mtime first: the rename carries it over, so a
+                # fresh claim can never look expired to other workers.
+                os.utime(pending)
+                os.rename(pending, claimed)
+            except FileNotFoundError:
+                continue  # Another worker was faster
+
+            try:
+                job = json.loads(claimed.read_text())
+            except (OSError, ValueError) as e:
+                LOGGER.warning(f'Discarding unreadable job file {pending.name}: {e}')
+                self._finish(claimed, job_id, 'failed', {'job_id': job_id, 'error': str(e)})
+                continue
+
+            job['attempts'] = int(job.get('attempts', 0)) + 1
+            job['worker'] = self.worker_id
+            job['claimed_at'] = time.time()
+            if job['attempts'] > self.max_attempts:
+                LOGGER.warning(
+                    f'Job {job_id} exceeded {self.max_attempts} attempts; marking as failed.'
+                )
+                job['error'] = 'maximum number of attempts exceeded'
+                self._finish(claimed, job_id, 'failed', job)
+                continue
+
+            _write_json_atomic(claimed, job)
+            return Claim(self, claimed, job)
+        return None
+
+    def reclaim_expired(self):
+        """Return abandoned claims to ``pending/``.
+
+        Returns
+        -------
+        reclaimed : list of str
+            Identifiers of the jobs that were put back in the queue.
+
+        """
+        reclaimed = []
+        now = time.time()
+        for claimed in self._dir('claimed').glob('*.json.*'):
+            try:
+                if now - claimed.stat().st_mtime < self.lease:
+                    continue
+            except FileNotFoundError:
+                continue
+            job_id = claimed.name.split('.json.')[0]
+            try:
+                os.rename(claimed, self._dir('pending') / f'{job_id}.json')
+            except FileNotFoundError:
+                continue  # Completed or reclaimed by someone else meanwhile
+            LOGGER.warning(f'Lease of job {job_id} expired; returned it to the queue.')
+            reclaimed.append(job_id)
+        return reclaimed
+
+    def _finish(self, claimed, job_id, state, record):
+        _write_json_atomic(self._dir(state) / f'{job_id}.json', record)
+        try:
+            claimed.unlink()
+        except FileNotFoundError:
+            pass
+
+    def counts(self):
+        """Count jobs in each state."""
+        counts = {state: len(list(self._dir(state).glob('*.json'))) for state in _STATES}
+        counts['claimed'] = len(list(self._dir('claimed').glob('*.json.*')))
+        return counts
+
+    def is_drained(self):
+        """Whether there are no pending nor in-flight jobs left."""
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['claimed'] == 0
+
+    def wait_for_job(self, poll_interval=10.0, should_stop=None):
+        """Block until a job can be claimed or the queue is drained.
+
+        While other workers still hold claims, this worker keeps polling so it
+        can pick up jobs whose leases expire.
+
+        Returns
+        -------
+        claim : :py:class:`Claim` or None
+            ``None`` once the queue is drained, or as soon as ``should_stop()``
+            returns ``True``.
+
+        """
+        while True:
+            if should_stop is not None and should_stop():
+                return None
+            claim = self.claim()
+            if claim is not None:
+                return claim
+            if self.reclaim_expired():
+                continue
+            if self.is_drained():
+                return None
+            time.sleep(poll_interval)
+
+
+class Claim:
+    """A job claimed by this worker, with a background heartbeat.
+
+    Use as a context manager so the heartbeat is always stopped::
+
+        with queue.claim() as job:
+            ...
+            job.complete()
+
+    """
+
+    def __init__(self, queue, path, job):
+        self.queue = queue
+        self.path = Path(path)
+        self.job = job
+        self.lease_lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def job_id(self):
+        return self.job['job_id']
+
+    def heartbeat(self):
+        """Refresh the lease once. Returns ``False`` if the claim was lost."""
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            self.lease_lost.set()
+            return False
+        return True
+
+    def _beat(self):
+        interval = max(self.queue.lease / 3.0, 0.05)
+        while not self._stop.wait(interval):
+            if not self.heartbeat():
+                LOGGER.warning(
+                    f'Lost the lease of job {self.job_id}; another worker may rerun it.'
+                )
+                return
+
+    def start(self):
+        """Start refreshing the lease in a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._beat, name=f'heartbeat-{self.job_id}', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the heartbeat thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def complete(self, **result):
+        """Mark the job as successfully processed."""
+        self._close('done', result)
+
+    def fail(self, **result):
+        """Mark the job as failed, or put it back in the queue if attempts remain."""
+        if self.job.get('attempts', 1) < self.queue.max_attempts and not result.pop(
+            'permanent', False
+        ):
+            self.stop()
+            try:
+                os.rename(self.path, self.queue.root / 'pending' / f'{self.job_id}.json')
+            except FileNotFoundError:
+                pass
+            return
+        self._close('failed', result)
+
+    def release(self):
+        """Put the job back in the queue without counting this attempt (e.g., on preemption)."""
+        self.stop()
+        if not self.path.exists():
+            return  # Lost the lease; the job is back in the queue already
+        job = {**self.job, 'attempts': max(int(self.job.get('attempts', 1)) - 1, 0)}
+        try:
+            _write_json_atomic(self.path, job)
+            os.rename(self.path, self.queue.root / 'pending' / f'{self.job_id}.json')
+        except FileNotFoundError:
+            pass
+
+    def _close(self, state, result):
+        self.stop()
+        record = {**self.job, **result, 'finished_at': time.time()}
+        self.queue._finish(self.path, self.job_id, state, record)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        if exc_type is not None and self.path.exists():
+            self.fail(error=repr(exc))
+        return False
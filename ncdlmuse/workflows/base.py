@@ -9,12 +9,12 @@ import re
 import shutil
 import subprocess
 import time
+from collections import defaultdict
 from importlib import resources as importlib_resources
 from pathlib import Path
 
 # ruff: noqa: F401
 import pandas as pd
-import torch
 from bids.layout import Query
 from nipype.interfaces import utility as niu
 from nipype.pipeline import engine as pe
@@ -34,7 +34,11 @@ from ..interfaces.reports import (
     SubjectSummary,
     WorkflowProvenanceReportlet,
 )
-from ..utils.bids import get_entities_from_file
+from ..utils.bids import collect_t1w_files
+from ..utils.drain import DRAIN_FILE
+from ..utils.profiles import DEFAULT_STEP_SIZE
+from ..utils.workqueue import job_id_for
+from .ncdlmuse.ncdlmuse import init_dlmuse_split_wf
 
 LOGGER = config.loggers.workflow
 
@@ -79,12 +83,24 @@ def init_ncdlmuse_wf(
     session_list = config.execution.session_label # Optional list of sessions
     device = config.workflow.dlmuse_device
     nthreads = config.nipype.n_procs
-    model_folder = config.workflow.dlmuse_model_folder
+    # The read-only copy prepared once for the run (see ncdlmuse.utils.models), if any
+    model_folder = config.workflow.dlmuse_shared_models or config.workflow.dlmuse_model_folder
     derived_roi_mappings_file = config.workflow.dlmuse_derived_roi_mappings_file
     muse_roi_mappings_file = config.workflow.dlmuse_muse_roi_mappings_file
     all_in_gpu = config.workflow.dlmuse_all_in_gpu
     disable_tta = config.workflow.dlmuse_disable_tta
-    clear_cache = config.workflow.dlmuse_clear_cache
+    step_size = config.workflow.dlmuse_step_size
+    inference_profile = config.workflow.dlmuse_inference_profile
+    adaptive_tta = config.workflow.dlmuse_adaptive_tta
+    qc_norms = config.workflow.dlmuse_qc_norms
+    reportlets = config.workflow.dlmuse_reportlets
+    split_stages = config.workflow.dlmuse_split_stages
+    backend = config.workflow.dlmuse_backend
+    onnx_threads = config.workflow.dlmuse_onnx_threads or config.nipype.omp_nthreads
+    onnx_cache = config.execution.onnx_cache_dir
+    extra_models = config.workflow.dlmuse_extra_models or {}
+    prefetch_dir = config.execution.prefetch_dir
+    hashed_layout = config.execution.work_dir_layout == 'hashed'
 
     # --- Basic Workflow Setup --- #
     workflow = Workflow(name=name)
@@ -157,38 +173,83 @@ and manages overall execution settings.
             f'Target atlas mappings TSV and JSON already exist in {output_dir}. Skipping copy.'
             )
 
-    # --- Iterate over subjects and sessions, query T1w files --- #
-    processed_file_count = 0
-    for subject_id in subject_list:
-        query_params = {
-            'subject': subject_id,
-            'suffix': 'T1w',
-            'extension': ['.nii', '.nii.gz'],
-            'return_type': 'file'
+    # Restrict to the T1w files selected at parse time (or claimed from a work queue)
+    selected_t1w = None
+    if config.execution.t1w_list:
+        selected_t1w = {str(Path(f).absolute()) for f in config.execution.t1w_list}
+
+    # T1w files with a valid completion manifest (e.g., from a drained run) are not rerun
+    from ncdlmuse.utils.workdir import is_complete, manifest_root, settings_signature
+
+    completed_root = manifest_root()
+    completion_signature = settings_signature() if completed_root else None
+
+    # Voxel-identical T1w files reuse the outputs of the first of them
+    duplicates = {}
+    if config.execution.deduplicate_inputs and config.execution.t1w_list:
+        from ncdlmuse.utils.dedup import FINGERPRINT_CACHE, find_duplicates
+
+        duplicates = {
+            str(Path(dup).absolute()): str(Path(rep).absolute())
+            for dup, rep in find_duplicates(
+                config.execution.t1w_list,
+                cache_file=Path(output_dir) / FINGERPRINT_CACHE,
+                n_workers=nthreads,
+            ).items()
         }
+    built_wfs = {}  # Single-T1w workflows, keyed by absolute T1w path
+    deferred = []  # Duplicates, built once all representatives are
+
+    def _add_subject_wf(t1w_key, subject_wf):
+        if hashed_layout:
+            _add_to_fanout(workflow, subject_wf)
+        else:
+            workflow.add_nodes([subject_wf])
+        built_wfs[t1w_key] = subject_wf
+
+    # --- Query all T1w files at once, then iterate over subjects and sessions --- #
+    LOGGER.info(f'Querying T1w files for {len(subject_list)} participant(s).')
+    try:
+        t1w_records = collect_t1w_files(layout, subject_list, session_list)
+    except Exception as e:
+        LOGGER.error(f'Error querying BIDS layout for T1w files: {e}')
+        raise
+    records_by_session = defaultdict(dict)
+    for t1w_file, entities, sidecar in t1w_records:
+        session_key = entities.get('session') if session_list else None
+        records_by_session[(entities['subject'], session_key)][t1w_file] = (entities, sidecar)
 
+    processed_file_count = 0
+    completed_file_count = 0
+    for subject_id in subject_list:
         sessions_to_query = session_list if session_list else [None]
 
         for session_id in sessions_to_query:
-            if session_id:
-                query_params['session'] = session_id
-            else:
-                query_params.pop('session', None)
-
             subj_sess_prefix = f'sub-{subject_id}'
             if session_id:
                 subj_sess_prefix += f'_ses-{session_id}'
 
-            LOGGER.info(f'Querying T1w files for {subj_sess_prefix} with params: {query_params}')
-            try:
-                t1w_files = layout.get(**query_params)
-            except Exception as e:
-                import traceback
-                LOGGER.error(f'Error querying BIDS layout for {subj_sess_prefix}: {e}')
-                print('--- Full Traceback --- ')
-                traceback.print_exc()
-                print('--- End Traceback --- ')
-                continue
+            session_records = records_by_session.get((subject_id, session_id), {})
+            t1w_files = list(session_records)
+
+            if selected_t1w is not None:
+                t1w_files = [f for f in t1w_files if str(Path(f).absolute()) in selected_t1w]
+
+            if completion_signature is not None:
+                pending_t1w = [
+                    f
+                    for f in t1w_files
+                    if not is_complete(completed_root, f, completion_signature)
+                ]
+                if len(pending_t1w) < len(t1w_files):
+                    LOGGER.info(
+                        f'Skipping {len(t1w_files) - len(pending_t1w)} already completed '
+                        f'T1w file(s) for {subj_sess_prefix}.'
+                    )
+                    completed_file_count += len(t1w_files) - len(pending_t1w)
+                    if not pending_t1w:
+                        continue
+                t1w_files = pending_t1w
 
             if not t1w_files:
                 LOGGER.warning(f'No T1w files found for {subj_sess_prefix}. Skipping.')
@@ -203,25 +264,15 @@ and manages overall execution settings.
             for t1w_file in t1w_files:
                 processed_file_count += 1
                 LOGGER.info(f'Processing T1w file: {t1w_file}')
-                entities = get_entities_from_file(t1w_file, layout=layout)
+                entities, t1w_json = session_records[t1w_file]
 
                 # Use subject/session from entities for consistency in naming
                 subj_ent_id = entities.get('subject', subject_id)
                 sess_ent_id = entities.get('session', session_id)
                 node_prefix = f'sub-{subj_ent_id}' + (f'_ses-{sess_ent_id}' if sess_ent_id else '')
 
-                # Determine T1w JSON sidecar path
-                p = Path(t1w_file)
-                if p.name.endswith('.nii.gz'):
-                    base = p.with_name(p.name[:-7])
-                elif p.suffix == '.nii':
-                    base = p.with_suffix('')
-                else:
-                    base = p.with_suffix('') # Fallback for unexpected extensions
-                sidecar = base.with_suffix('.json')
-                t1w_json = str(sidecar) if sidecar.exists() else None
                 if not t1w_json:
-                    LOGGER.warning(f'No T1w JSON sidecar found at {sidecar}')
+                    LOGGER.warning(f'No T1w JSON sidecar found for {t1w_file}')
 
                 # Define reportlets directory for this subject/session
                 # This will be passed to init_single_subject_wf
@@ -233,33 +284,73 @@ and manages overall execution settings.
                 )
                 reportlets_dir.mkdir(parents=True, exist_ok=True)
 
+                subject_kwargs = {
+                    'subject_id': subj_ent_id,
+                    '_t1w_file_path': t1w_file,
+                    '_t1w_json_path': t1w_json,
+                    '_current_t1w_entities': entities,
+                    'mapping_tsv': mapping_tsv,
+                    'io_spec': io_spec,
+                    'roi_list_tsv': roi_list_tsv,
+                    'derivatives_dir': ncdlmuse_output_dir,
+                    'reportlets_dir': reportlets_dir,
+                    'device': device,
+                    'nthreads': nthreads,
+                    'work_dir': work_dir,
+                    'model_folder': model_folder,
+                    'derived_roi_mappings_file': derived_roi_mappings_file,
+                    'muse_roi_mappings_file': muse_roi_mappings_file,
+                    'all_in_gpu': all_in_gpu,
+                    'disable_tta': disable_tta,
+                    'step_size': step_size,
+                    'inference_profile': inference_profile,
+                    'adaptive_tta': adaptive_tta,
+                    'qc_norms': qc_norms,
+                    'reportlets': reportlets,
+                    'split_stages': split_stages,
+                    'backend': backend,
+                    'onnx_threads': onnx_threads,
+                    'onnx_cache': onnx_cache,
+                    'extra_models': extra_models,
+                    'prefetch_dir': prefetch_dir,
+                    'name': f'single_subject_{node_prefix}_wf',
+                }
+                t1w_key = str(Path(t1w_file).absolute())
+                if t1w_key in duplicates:
+                    deferred.append((t1w_key, subject_kwargs))
+                    continue
                 LOGGER.info(f'Creating workflow for {node_prefix} ({Path(t1w_file).name})')
-                subject_wf = init_single_subject_wf(
-                    subject_id=subj_ent_id,
-                    _t1w_file_path=t1w_file,
-                    _t1w_json_path=t1w_json,
-                    _current_t1w_entities=entities,
-                    mapping_tsv=mapping_tsv,
-                    io_spec=io_spec,
-                    roi_list_tsv=roi_list_tsv,
-                    derivatives_dir=ncdlmuse_output_dir,
-                    reportlets_dir=reportlets_dir,
-                    device=device,
-                    nthreads=nthreads,
-                    work_dir=work_dir,
-                    model_folder=model_folder,
-                    derived_roi_mappings_file=derived_roi_mappings_file,
-                    muse_roi_mappings_file=muse_roi_mappings_file,
-                    all_in_gpu=all_in_gpu,
-                    disable_tta=disable_tta,
-                    clear_cache=clear_cache,
-                    name=f'single_subject_{node_prefix}_wf',
-                )
-                workflow.add_nodes([subject_wf])
+                _add_subject_wf(t1w_key, init_single_subject_wf(**subject_kwargs))
     # --- END MODIFIED SECTION ---
 
+    for t1w_key, subject_kwargs in deferred:
+        representative = duplicates[t1w_key]
+        source_wf = built_wfs.get(representative)
+        if source_wf is None:
+            # The representative is complete or not selected: segment this copy instead
+            LOGGER.info(f'Creating workflow for {Path(t1w_key).name}')
+            _add_subject_wf(t1w_key, init_single_subject_wf(**subject_kwargs))
+            built_wfs[representative] = built_wfs[t1w_key]
+            continue
+        LOGGER.info(
+            f'{Path(t1w_key).name} is identical to {Path(representative).name}; '
+            'reusing its NiChart_DLMUSE outputs.'
+        )
+        subject_wf = init_single_subject_wf(**subject_kwargs, reuse_from=representative)
+        _add_subject_wf(t1w_key, subject_wf)
+        _connect_reused_outputs(
+            workflow,
+            source_wf,
+            subject_wf,
+            hashed_layout,
+            extra_models,
+            adaptive_tta=adaptive_tta and not split_stages,
+        )
+
     # Final check if any workflows were actually added
-    if processed_file_count == 0:
+    if processed_file_count == 0 and completed_file_count:
+        LOGGER.info(f'All {completed_file_count} selected T1w file(s) were already completed.')
+    elif processed_file_count == 0:
         raise RuntimeError(
             'No T1w files were found for the specified subjects/sessions. '
             'Check BIDS dataset structure and participant/session labels.'
@@ -270,6 +361,64 @@ and manages overall execution settings.
     return workflow
 
 
+def _add_to_fanout(workflow, subject_wf):
+    """Nest ``subject_wf`` in hashed fan-out workflows (``<workflow>/ab/cd/<subject_wf>``)."""
+    from ncdlmuse.utils.workdir import hashed_subdir
+
+    parent = workflow
+    for level in hashed_subdir(subject_wf.name).parts:
+        bucket = parent.get_node(level)
+        if bucket is None:
+            bucket = Workflow(name=level)
+            parent.add_nodes([bucket])
+        parent = bucket
+    parent.add_nodes([subject_wf])
+
+
+def _connect_reused_outputs(
+    workflow, source_wf, subject_wf, hashed_layout, extra_models=(), adaptive_tta=False
+):
+    """Feed the NiChart_DLMUSE outputs of ``source_wf`` to the reuse node of ``subject_wf``.
+
+    The connection is made in the innermost fan-out workflow containing both.
+    The outputs of each of the ``extra_models`` feed their own reuse node. With
+    ``adaptive_tta``, the decision of the source is recorded by the duplicate.
+    """
+    from ncdlmuse.utils.workdir import hashed_subdir
+
+    def _path(sub_wf):
+        levels = list(hashed_subdir(sub_wf.name).parts) if hashed_layout else []
+        return [*levels, sub_wf.name]
+
+    source_path, dest_path = _path(source_wf), _path(subject_wf)
+    parent = workflow
+    while source_path[0] == dest_path[0]:
+        parent = parent.get_node(source_path.pop(0))
+        dest_path.pop(0)
+    # NiChart_DLMUSE, or the outputs of its split stages (see init_dlmuse_split_wf)
+    dlmuse = 'dlmuse_wf.outputnode' if source_wf.get_node('dlmuse_wf') else 'nichartdlmuse_node'
+    source_node = '.'.join([*source_path[1:], dlmuse])
+    for suffix in ['', *(f'_{label}' for label in extra_models)]:
+        dest_node = '.'.join([*dest_path[1:], f'reuse_dlmuse_node{suffix}'])
+        for field in ('dlmuse_segmentation', 'dlicv_mask', 'dlmuse_volumes', 'n_attempts'):
+            # The DLICV mask is shared by all models
+            source_field = field if field == 'dlicv_mask' else f'{field}{suffix}'
+            parent.connect(
+                parent.get_node(source_path[0]),
+                f'{source_node}.{source_field}',
+                parent.get_node(dest_path[0]),
+                f'{dest_node}.{field}',
+            )
+    if adaptive_tta:
+        # The decision of adaptive TTA is recorded in the volumes JSON of duplicates too
+        parent.connect(
+            parent.get_node(source_path[0]),
+            f'{source_node}.tta_decision',
+            parent.get_node(dest_path[0]),
+            '.'.join([*dest_path[1:], 'create_volumes_json_node.tta_decision']),
+        )
+
+
 def init_single_subject_wf(
     subject_id: str,
     _t1w_file_path: str,
@@ -288,7 +437,19 @@ def init_single_subject_wf(
     muse_roi_mappings_file=None,
     all_in_gpu=False,
     disable_tta=False,
+    step_size=None,
+    inference_profile=None,
+    adaptive_tta=False,
+    qc_norms=None,
+    reportlets=True,
     clear_cache=False,
+    split_stages=False,
+    backend='pytorch',
+    onnx_threads=None,
+    onnx_cache=None,
+    extra_models=None,
+    prefetch_dir=None,
+    reuse_from=None,
     name='single_subject_wf',
 ):
     """Initialize the NCDLMUSE processing pipeline for a single subject/session T1w.
@@ -380,8 +541,52 @@ def init_single_subject_wf(
         Run all operations on GPU if available.
     disable_tta : bool, optional
         Disable Test-Time Augmentation.
+    step_size : float or None, optional
+        Sliding-window step of the DLICV and DLMUSE inference (default: the tools' own).
+        Only used with ``split_stages``.
+    inference_profile : str or None, optional
+        Name of the inference profile, recorded in the volumes JSON provenance
+        (see :py:mod:`ncdlmuse.utils.profiles`).
+    adaptive_tta : bool, optional
+        Run NiChart_DLMUSE without test-time augmentation, and again with it only
+        if the QC checks of :py:mod:`ncdlmuse.utils.qc` flag the segmentation.
+        The decision is recorded in the volumes JSON provenance. Not available
+        with ``split_stages``.
+    qc_norms : str or None, optional
+        TSV file of cohort norms of ROI volumes used by the QC checks of
+        ``adaptive_tta`` (see :py:func:`ncdlmuse.utils.qc.load_norms`).
+    reportlets : bool, optional
+        Draw the brain mask and segmentation reportlets (default: True).
     clear_cache : bool, optional
-        Clear model cache before running.
+        Have the tools clear their model cache before running. The command line
+        clears it once per run instead (see :py:mod:`ncdlmuse.utils.models`).
+    split_stages : bool, optional
+        Run the DLICV and DLMUSE stages as separate nodes
+        (see :py:func:`~ncdlmuse.workflows.ncdlmuse.ncdlmuse.init_dlmuse_split_wf`)
+        instead of NiChart_DLMUSE.
+    backend : {'pytorch', 'onnx'}, optional
+        Inference backend of the split stages: the tools' PyTorch models, or
+        their graphs exported to ``onnx_cache`` run with ONNX Runtime
+        (see :py:mod:`ncdlmuse.utils.onnx`) (default: 'pytorch').
+    onnx_threads : int or None, optional
+        Intra-op threads of each ONNX Runtime session (default: one per core).
+    onnx_cache : str or None, optional
+        Directory of the exported ONNX graphs (``backend='onnx'``).
+    extra_models : dict or None, optional
+        Additional DLMUSE model folders, by label, run on the DLICV outputs of
+        the split stages (``split_stages`` must be set, or a :py:exc:`ValueError`
+        is raised). Their segmentation and volumes are written with the
+        ``seg-<label>`` entity.
+    prefetch_dir : str or None, optional
+        Directory where the T1w file may have been staged by the prefetcher.
+        If given, NiChart_DLMUSE reads the staged copy when available and its
+        node is hashed by timestamp so the input is not read from slow storage
+        just to compute the hash.
+    reuse_from : str or None, optional
+        T1w file voxel-identical to this one (see :py:mod:`ncdlmuse.utils.dedup`).
+        If given, NiChart_DLMUSE is not run: the outputs of its run on ``reuse_from``
+        must be connected to the ``reuse_dlmuse_node`` of this workflow (and
+        those of ``extra_models`` to ``reuse_dlmuse_node_<label>``).
     name : str
         Workflow name (default: 'single_subject_wf').
 
@@ -390,6 +595,9 @@ def init_single_subject_wf(
     workflow : :py:class:`niworkflows.engine.workflows.LiterateWorkflow`
         The assembled Nipype workflow object for a single subject.
     """
+    if extra_models and not (split_stages or reuse_from):
+        raise ValueError('extra_models are only run by the split stages (split_stages=True).')
+
     workflow = Workflow(name=name) # Use LiterateWorkflow
     if work_dir:
         workflow.base_dir = str(work_dir)
@@ -484,27 +692,104 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
 
     # --- Instantiate Internal Nodes ---
 
-    # NiChartDLMUSE node (configured directly from function args)
-    dlmuse_node = pe.Node(
-        NiChartDLMUSE(
+    extra_models = extra_models or {}
+    if reuse_from:
+        # Links the outputs of NiChart_DLMUSE on the identical T1w file reuse_from
+        dlmuse_node = _init_reuse_node(reuse_from)
+        model_nodes = {
+            label: _init_reuse_node(reuse_from, name=f'reuse_dlmuse_node_{label}')
+            for label in extra_models
+        }
+        tool_nodes = []
+    elif split_stages:
+        # DLICV and DLMUSE as separate nodes, with the outputs of NiChartDLMUSE
+        dlmuse_node = init_dlmuse_split_wf(
             device=device,
+            model_folder=model_folder,
             all_in_gpu=all_in_gpu,
             disable_tta=disable_tta,
+            step_size=step_size,
             clear_cache=clear_cache,
-            **(({'model_folder': model_folder}) if model_folder else {}),
-            **(
-                ({'derived_roi_mappings_file': derived_roi_mappings_file})
-                if derived_roi_mappings_file
-                else {}
+            backend=backend,
+            onnx_threads=onnx_threads,
+            onnx_cache=onnx_cache,
+            mapping_tsv=muse_roi_mappings_file or mapping_tsv,
+            roi_list_tsv=roi_list_tsv,
+            prefetch_dir=prefetch_dir,
+            extra_models=extra_models,
+        )
+        model_nodes = dict.fromkeys(extra_models, dlmuse_node)
+        tool_nodes = [
+            (dlmuse_node.get_node('dlicv_node'), 'DLICV'),
+            (dlmuse_node.get_node('dlmuse_node'), 'DLMUSE'),
+            *(
+                (dlmuse_node.get_node(f'dlmuse_node_{label}'), f'DLMUSE_{label}')
+                for label in extra_models
             ),
-            **(
-                ({'muse_roi_mappings_file': muse_roi_mappings_file})
-                if muse_roi_mappings_file
-                else {}
+        ]
+    else:
+        # NiChartDLMUSE node (configured directly from function args)
+        dlmuse_node = pe.Node(
+            NiChartDLMUSE(
+                device=device,
+                all_in_gpu=all_in_gpu,
+                disable_tta=disable_tta,
+                clear_cache=clear_cache,
+                **(({'model_folder': model_folder}) if model_folder else {}),
+                **(({'adaptive_tta': True}) if adaptive_tta else {}),
+                **(({'qc_norms': str(qc_norms)}) if adaptive_tta and qc_norms else {}),
+                **(
+                    ({'derived_roi_mappings_file': derived_roi_mappings_file})
+                    if derived_roi_mappings_file
+                    else {}
+                ),
+                **(
+                    ({'muse_roi_mappings_file': muse_roi_mappings_file})
+                    if muse_roi_mappings_file
+                    else {}
+                ),
             ),
-        ),
-        name='nichartdlmuse_node',
-    )
+            name='nichartdlmuse_node',
+        )
+        if prefetch_dir:
+            dlmuse_node.inputs.prefetch_dir = str(prefetch_dir)
+            dlmuse_node.config = {'execution': {'hash_method': 'timestamp'}}
+        model_nodes = {}
+        tool_nodes = [(dlmuse_node, dlmuse_node.interface._tool)]
+    for tool_node, tool in tool_nodes:
+        # Watchdog and retries (these inputs do not affect the node's hash)
+        if config.execution.dlmuse_timeout == 'auto':
+            tool_node.inputs.auto_timeout = True
+        elif config.execution.dlmuse_timeout is not None:
+            tool_node.inputs.timeout = float(config.execution.dlmuse_timeout)
+        tool_node.inputs.inactivity_timeout = float(
+            config.execution.dlmuse_inactivity_timeout or 0
+        )
+        tool_node.inputs.max_retries = int(config.execution.dlmuse_retries or 0)
+        if config.execution.log_dir:
+            # Stream the tool's output and publish progress next to the run's logs
+            job_id = job_id_for(_t1w_file_path)
+            tool_node.inputs.job_id = job_id
+            tool_node.inputs.log_file = str(
+                Path(config.execution.log_dir) / f'{job_id}_{tool}.log'
+            )
+            if tool_node.name in ('nichartdlmuse_node', 'dlicv_node', 'dlmuse_node'):
+                # Additional models do not publish progress (one status file per T1w)
+                tool_node.inputs.status_file = str(
+                    Path(config.execution.log_dir) / 'status' / f'{job_id}.json'
+                )
+            # Stop admitting new T1w files once the run is asked to drain
+            tool_node.inputs.drain_file = str(Path(config.execution.log_dir) / DRAIN_FILE)
+    # Outputs of the split-stage sub-workflow are read from its outputnode
+    dlmuse_out = 'outputnode.' if split_stages and not reuse_from else ''
+
+    # Inference settings, recorded in the provenance of the volumes JSON
+    inference = {
+        'profile': inference_profile,
+        'disable_tta': bool(disable_tta),
+        'step_size': step_size if step_size is not None else DEFAULT_STEP_SIZE,
+        'backend': backend,
+    }
 
     # Node to create volumes JSON (pre-datasink)
     create_volumes_json_node = pe.Node(
@@ -514,6 +799,10 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
                 'source_t1w_json_path',
                 'device_used',
                 'roi_list_tsv',
+                'n_attempts',
+                'duplicate_of',
+                'inference',
+                'tta_decision',
             ],
             output_names=['output_json_path'],
             function=_create_volumes_json_file,
@@ -521,6 +810,9 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
         name='create_volumes_json_node',
     )
     create_volumes_json_node.inputs.device_used = device
+    create_volumes_json_node.inputs.inference = inference
+    if reuse_from:
+        create_volumes_json_node.inputs.duplicate_of = str(reuse_from)
     create_volumes_json_node.inputs.source_t1w_json_path = (
         _t1w_json_path if _t1w_json_path and Path(_t1w_json_path).exists() else None
     )
@@ -549,19 +841,31 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
 
     # --- Connect Workflow --- #
     # Connect BIDSDataGrabber outputs and InputNode to processing nodes
+    if not reuse_from:
+        dlmuse_in = 'inputnode.t1w_file' if split_stages else 'input_image'
+        workflow.connect(bidssrc, ('t1w', _select_first_from_list), dlmuse_node, dlmuse_in)
     workflow.connect([
-        (bidssrc, dlmuse_node, [(('t1w', _select_first_from_list), 'input_image')]),
         (bidssrc, create_meta_node, [(('t1w', _select_first_from_list), 'raw_source_file')]),
         (bidssrc, create_seg_meta_node, [(('t1w', _select_first_from_list), 'raw_source_file')]),
         (inputnode, create_volumes_json_node, [('roi_list_tsv', 'roi_list_tsv')]),
     ])
 
     # Connect internal processing nodes
-    workflow.connect(dlmuse_node, 'dlmuse_volumes', create_volumes_json_node, 'volumes_csv')
+    workflow.connect(
+        dlmuse_node, f'{dlmuse_out}dlmuse_volumes', create_volumes_json_node, 'volumes_csv'
+    )
+    workflow.connect(
+        dlmuse_node, f'{dlmuse_out}n_attempts', create_volumes_json_node, 'n_attempts'
+    )
+    if adaptive_tta and not (split_stages or reuse_from):
+        # Duplicates receive it from their source (see _connect_reused_outputs)
+        workflow.connect(dlmuse_node, 'tta_decision', create_volumes_json_node, 'tta_decision')
 
     # Connect processing nodes to OutputNode
-    workflow.connect(dlmuse_node, 'dlmuse_segmentation', outputnode, 'dlmuse_segmentation')
-    workflow.connect(dlmuse_node, 'dlicv_mask', outputnode, 'dlicv_mask')
+    workflow.connect(
+        dlmuse_node, f'{dlmuse_out}dlmuse_segmentation', outputnode, 'dlmuse_segmentation'
+    )
+    workflow.connect(dlmuse_node, f'{dlmuse_out}dlicv_mask', outputnode, 'dlicv_mask')
     workflow.connect(create_meta_node, 'meta_dict', outputnode, 'brain_mask_meta')
     workflow.connect(
         create_volumes_json_node, 'output_json_path',
@@ -635,11 +939,11 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
     ])
 
     # a) Connect DLMUSE segmentation NIfTI
-    workflow.connect(dlmuse_node, 'dlmuse_segmentation', ds_seg_nii, 'in_file')
+    workflow.connect(dlmuse_node, f'{dlmuse_out}dlmuse_segmentation', ds_seg_nii, 'in_file')
     workflow.connect(create_seg_meta_node, 'meta_dict', ds_seg_nii, 'meta_dict')
 
     # b) Connect Brain mask NIfTI + metadata
-    workflow.connect(dlmuse_node, 'dlicv_mask', ds_brain_mask, 'in_file')
+    workflow.connect(dlmuse_node, f'{dlmuse_out}dlicv_mask', ds_brain_mask, 'in_file')
     workflow.connect(create_meta_node, 'meta_dict', ds_brain_mask, 'meta_dict')
 
     # d) Connect Volumes JSON generation and copying
@@ -652,6 +956,88 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
     # Connect pathfinder output path to copy node out_file
     workflow.connect(ds_volumes_json_pathfinder, 'out_file', copy_json_node, 'out_file')
 
+    # e) Segmentation and volumes JSON of each additional model, labelled seg-<label>
+    for label, extra_model_folder in extra_models.items():
+        model_node = model_nodes[label]
+        model_fields = {
+            field: field if reuse_from else f'outputnode.{field}_{label}'
+            for field in ('dlmuse_segmentation', 'dlmuse_volumes', 'n_attempts')
+        }
+        create_model_json = pe.Node(
+            niu.Function(
+                input_names=[
+                    'volumes_csv',
+                    'source_t1w_json_path',
+                    'device_used',
+                    'roi_list_tsv',
+                    'n_attempts',
+                    'duplicate_of',
+                    'inference',
+                    'model_folder',
+                ],
+                output_names=['output_json_path'],
+                function=_create_volumes_json_file,
+            ),
+            name=f'create_volumes_json_node_{label}',
+        )
+        create_model_json.inputs.device_used = device
+        create_model_json.inputs.inference = inference
+        create_model_json.inputs.model_folder = str(extra_model_folder)
+        create_model_json.inputs.source_t1w_json_path = (
+            _t1w_json_path if _t1w_json_path and Path(_t1w_json_path).exists() else None
+        )
+        if reuse_from:
+            create_model_json.inputs.duplicate_of = str(reuse_from)
+        ds_model_seg = pe.Node(
+            DerivativesDataSink(
+                base_directory=str(derivatives_dir),
+                compress=True,
+                datatype='anat',
+                space='T1w',
+                segmentation=label,
+                suffix='dseg',
+                extension='nii.gz',
+            ),
+            name=f'ds_seg_nii_{label}',
+            run_without_submitting=True,
+        )
+        ds_model_json = pe.Node(
+            DerivativesDataSink(
+                base_directory=str(derivatives_dir),
+                compress=False,
+                datatype='anat',
+                segmentation=label,
+                suffix='T1w',
+                extension='json',
+                check_hdr=False,
+            ),
+            name=f'ds_volumes_json_pathfinder_{label}',
+            run_without_submitting=True,
+        )
+        copy_model_json = pe.Node(
+            niu.Function(
+                input_names=['in_file', 'out_file'],
+                output_names=['copied_file'],
+                function=_copy_single_file,
+            ),
+            name=f'copy_volumes_json_{label}',
+        )
+        workflow.connect([
+            (inputnode, create_model_json, [('roi_list_tsv', 'roi_list_tsv')]),
+            (inputnode, ds_model_json, [('io_spec', 'io_spec')]),
+            (model_node, create_model_json, [
+                (model_fields['dlmuse_volumes'], 'volumes_csv'),
+                (model_fields['n_attempts'], 'n_attempts'),
+            ]),
+            (bidssrc, ds_model_seg, [(('t1w', _select_first_from_list), 'source_file')]),
+            (model_node, ds_model_seg, [(model_fields['dlmuse_segmentation'], 'in_file')]),
+            (create_seg_meta_node, ds_model_seg, [('meta_dict', 'meta_dict')]),
+            (bidssrc, ds_model_json, [(('t1w', _select_first_from_list), 'source_file')]),
+            (create_model_json, ds_model_json, [('output_json_path', 'in_file')]),
+            (create_model_json, copy_model_json, [('output_json_path', 'in_file')]),
+            (ds_model_json, copy_model_json, [('out_file', 'out_file')]),
+        ])  # fmt:skip
+
     # --- Add Reportlet Generation Nodes --- #
     LOGGER.info(
         f'[{subject_id_str}] Adding reportlet nodes. '
@@ -665,40 +1051,43 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
     t1w_path = Path(_t1w_file_path)
     base_filename = t1w_path.stem.replace('_T1w.nii.gz', '').replace('_T1w.nii', '')
 
-    # Reportlet for Brain Mask
-    plot_brain_mask = pe.Node(
-        ROIsPlot(
-            colors=['#FF0000'],  # Red contour
-            levels=[0.5],
-            out_report=\
-                str(current_reportlets_dir.absolute() / f'{base_filename}_desc-brainMask_T1w.svg')
-        ),
-        name='plot_brain_mask',
-        mem_gb=0.2 # Slightly more memory for plotting
-    )
+    # The inference profile may skip the mosaics (see ncdlmuse.utils.profiles)
+    if reportlets:
+        # Reportlet for Brain Mask
+        plot_brain_mask = pe.Node(
+            ROIsPlot(
+                colors=['#FF0000'],  # Red contour
+                levels=[0.5],
+                out_report=str(
+                    current_reportlets_dir.absolute() / f'{base_filename}_desc-brainMask_T1w.svg'
+                ),
+            ),
+            name='plot_brain_mask',
+            mem_gb=0.2 # Slightly more memory for plotting
+        )
 
-    # Reportlet for DLMUSE Segmentation
-    plot_dlmuse_seg = pe.Node(
-        ROIsPlot(
-            out_report=\
-                str(current_reportlets_dir.absolute() / \
-                    f'{base_filename}_desc-dlmuseSegmentation_T1w.svg')
-        ),
-        name='plot_dlmuse_seg',
-        mem_gb=0.2 # Slightly more memory for plotting
-    )
+        # Reportlet for DLMUSE Segmentation
+        plot_dlmuse_seg = pe.Node(
+            ROIsPlot(
+                out_report=\
+                    str(current_reportlets_dir.absolute() / \
+                        f'{base_filename}_desc-dlmuseSegmentation_T1w.svg')
+            ),
+            name='plot_dlmuse_seg',
+            mem_gb=0.2 # Slightly more memory for plotting
+        )
 
-    # Connect T1w (background) and masks/segmentations (foreground)
-    # T1w input for plots comes from BIDSDataGrabber
-    workflow.connect([
-        (bidssrc, plot_brain_mask, [(('t1w', _select_first_from_list), 'in_file')]),
-        (dlmuse_node, plot_brain_mask, [('dlicv_mask', 'in_rois')])
-    ])
+        # Connect T1w (background) and masks/segmentations (foreground)
+        # T1w input for plots comes from BIDSDataGrabber
+        workflow.connect([
+            (bidssrc, plot_brain_mask, [(('t1w', _select_first_from_list), 'in_file')]),
+            (dlmuse_node, plot_brain_mask, [(f'{dlmuse_out}dlicv_mask', 'in_rois')])
+        ])
 
-    workflow.connect([
-        (bidssrc, plot_dlmuse_seg, [(('t1w', _select_first_from_list), 'in_file')]),
-        (dlmuse_node, plot_dlmuse_seg, [('dlmuse_segmentation', 'in_rois')])
-    ])
+        workflow.connect([
+            (bidssrc, plot_dlmuse_seg, [(('t1w', _select_first_from_list), 'in_file')]),
+            (dlmuse_node, plot_dlmuse_seg, [(f'{dlmuse_out}dlmuse_segmentation', 'in_rois')])
+        ])
 
     # --- END Reportlet Generation ---
 
@@ -718,8 +1107,8 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
     workflow.connect([
         (bidssrc, subject_summary_node, [(('t1w', _make_list), 't1w')]),
         (dlmuse_node, subject_summary_node, [
-            ('dlicv_mask', 'brain_mask_file'),
-            ('dlmuse_segmentation', 'dlmuse_seg_file')
+            (f'{dlmuse_out}dlicv_mask', 'brain_mask_file'),
+            (f'{dlmuse_out}dlmuse_segmentation', 'dlmuse_seg_file')
         ]),
     ])
 
@@ -839,8 +1228,8 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
 
         # Error Report
         (dlmuse_node, check_dlmuse_outputs_node, [
-            ('dlmuse_segmentation', 'segmentation_file'),
-            ('dlmuse_volumes', 'volumes_csv_file')
+            (f'{dlmuse_out}dlmuse_segmentation', 'segmentation_file'),
+            (f'{dlmuse_out}dlmuse_volumes', 'volumes_csv_file')
         ]),
         (check_dlmuse_outputs_node, error_report_node, \
             [('error_messages_list', 'error_messages')]),
@@ -860,6 +1249,58 @@ NCDLMUSE is built using Nipype {config.environment.nipype_version}
 
     return clean_datasinks(workflow) # Apply clean_datasinks
 
+
+def _init_reuse_node(reuse_from, name='reuse_dlmuse_node'):
+    """Node linking the NiChart_DLMUSE outputs of the identical T1w file ``reuse_from``."""
+    node = pe.Node(
+        niu.Function(
+            input_names=[
+                'dlmuse_segmentation',
+                'dlicv_mask',
+                'dlmuse_volumes',
+                'n_attempts',
+                'source_t1w',
+            ],
+            output_names=[
+                'dlmuse_segmentation',
+                'dlicv_mask',
+                'dlmuse_volumes',
+                'n_attempts',
+            ],
+            function=_reuse_dlmuse_outputs,
+        ),
+        name=name,
+    )
+    node.inputs.source_t1w = str(reuse_from)
+    return node
+
+
+def _reuse_dlmuse_outputs(
+    dlmuse_segmentation, dlicv_mask, dlmuse_volumes, n_attempts=None, source_t1w=None
+):
+    """Link the NiChart_DLMUSE outputs of an identical T1w file into this node's directory.
+
+    Files are hard-linked (copied across filesystems), so they remain available if
+    the working directory of ``source_t1w`` is pruned.
+    """
+    from pathlib import Path
+    from shutil import copyfile
+
+    from ncdlmuse import config
+
+    def _link(in_file):
+        out_file = Path.cwd() / Path(in_file).name
+        out_file.unlink(missing_ok=True)
+        try:
+            out_file.hardlink_to(in_file)
+        except OSError:
+            copyfile(in_file, out_file)
+        return str(out_file)
+
+    config.loggers.workflow.info(f'Reusing the NiChart_DLMUSE outputs of {source_t1w}')
+    return _link(dlmuse_segmentation), _link(dlicv_mask), _link(dlmuse_volumes), n_attempts
+
+
 # --- Helper functions for _create_volumes_json_file ---
 
 def _check_dlmuse_outputs(segmentation_file, volumes_csv_file):
@@ -999,7 +1440,12 @@ def _create_volumes_json_file(
     source_t1w_json_path,
     device_used,
     roi_list_tsv,
-    source_file=None):
+    n_attempts=None,
+    duplicate_of=None,
+    source_file=None,
+    inference=None,
+    model_folder=None,
+    tta_decision=None):
     """Create JSON with raw T1w metadata, provenance, and volumes, writing it to a file.
 
     Uses roi_list_tsv to map NiChartDLMUSE output keys to Full_Name.
@@ -1014,10 +1460,10 @@ def _create_volumes_json_file(
     from pathlib import Path
 
     import pandas as pd  # noqa: F401
-    import torch  # noqa: F401
 
     from ncdlmuse import __version__ as bids_ncdlmuse_version
     from ncdlmuse import config
+    from ncdlmuse.utils.misc import torch_versions
 
     # Define helper function locally for Nipype Function scope
     def _to_snake_case(text):
@@ -1143,21 +1589,9 @@ def _create_volumes_json_file(
     except Exception as e:
         LOGGER.warning(f'An unexpected error occurred while getting NiChart_DLMUSE version: {e}')
 
-    torch_version = None
-    cuda_version = None
-    cudnn_version = None
-    try:
-        torch_version = torch.__version__
-        if torch.cuda.is_available():
-            cuda_version = torch.version.cuda
-            cudnn_version = torch.backends.cudnn.version()
-            LOGGER.info(f'PyTorch: {torch_version}, CUDA: {cuda_version}, cuDNN: {cudnn_version}')
-        else:
-            LOGGER.info(f'PyTorch: {torch_version}, CUDA: Not available.')
-            cuda_version = 'N/A'
-            cudnn_version = 'N/A'
-    except Exception as e:
-        LOGGER.warning(f'Error getting Torch/CUDA/cuDNN versions: {e}')
+    # Read from package metadata: importing torch here would take longer than the node
+    torch_version, cuda_version, cudnn_version = torch_versions(device_used)
+    LOGGER.info(f'PyTorch: {torch_version}, CUDA: {cuda_version}, cuDNN: {cudnn_version}')
 
     provenance = {
         'bids_ncdlmuse_version': bids_ncdlmuse_version,
@@ -1166,7 +1600,16 @@ def _create_volumes_json_file(
         'cuda_version': cuda_version,
         'cudnn_version': cudnn_version,
         'device_used': device_used,
+        'nichartdlmuse_attempts': n_attempts,
+        'duplicate_of': duplicate_of,
+        'inference': inference,
     }
+    if tta_decision:
+        # QC signals, and whether NiChart_DLMUSE ran again with TTA (see --adaptive-tta)
+        provenance['inference'] = {**(inference or {}), 'adaptive_tta': tta_decision}
+    if model_folder is not None:
+        # Outputs of an additional model (see --compare-models)
+        provenance['model_folder'] = model_folder
 
     # Assemble final dictionary
     final_json_dict = {
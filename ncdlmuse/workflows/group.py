@@ -5,6 +5,8 @@ from pathlib import Path
 import pandas as pd
 from bids import BIDSLayout
 
+from ncdlmuse.utils.bids import parse_entities
+
 
 def aggregate_volumes(derivatives_dir, output_file):
     """Aggregates volumetric data from individual *_T1w.json files.
@@ -25,6 +27,9 @@ def aggregate_volumes(derivatives_dir, output_file):
         layout = BIDSLayout(derivatives_dir, validate=False)
         # Adjust filters if needed to be more specific
         json_files = layout.get(suffix='T1w', extension='json', return_type='file')
+        # Volumes of the models added with --compare-models (seg-<label>) are not
+        # mixed with those of the default model
+        json_files = [f for f in json_files if '_seg-' not in Path(f).name]
 
         if not json_files:
             print(f'WARNING: No T1w JSON files found in {derivatives_dir}', file=sys.stderr)
@@ -35,7 +40,7 @@ def aggregate_volumes(derivatives_dir, output_file):
 
         for json_path in json_files:
             try:
-                entities = layout.parse_file_entities(json_path)
+                entities = parse_entities(json_path, layout=layout)
                 subject_id = f"sub-{entities['subject']}"
                 session_id = f"ses-{entities['session']}" if 'session' in entities else None
 
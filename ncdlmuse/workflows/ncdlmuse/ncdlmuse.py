@@ -155,3 +155,362 @@ interface, responsible for segmentation and volume calculation on a T1w image.
     )
 
     return workflow
+
+
+def init_dlmuse_split_wf(
+    name='dlmuse_wf',
+    device='cpu',
+    model_folder=None,
+    all_in_gpu=False,
+    disable_tta=False,
+    step_size=None,
+    clear_cache=False,
+    backend='pytorch',
+    onnx_threads=None,
+    onnx_cache=None,
+    mapping_tsv=None,
+    roi_list_tsv=None,
+    prefetch_dir=None,
+    extra_models=None,
+):
+    """Initialize the split-stage variant of the core NiChart_DLMUSE sub-workflow.
+
+    Instead of running ``NiChart_DLMUSE`` as one opaque process, this workflow
+    runs its stages as separate nodes: the T1w image is reoriented to LPS,
+    skull-stripped by :py:class:`~ncdlmuse.interfaces.ncdlmuse.DLICV`, masked,
+    parcellated by :py:class:`~ncdlmuse.interfaces.ncdlmuse.DLMUSE`, and the
+    parcellation is relabelled to MUSE indices (voxels of the brain mask left
+    unlabelled get label 1) and reoriented back, before ROI volumes are computed.
+    The execution engine can thus run the DLICV stage of one T1w image while
+    another is in its DLMUSE stage, and the DLICV results are cached (and
+    reused when only the DLMUSE stage must run again) on their own.
+    Both stage interfaces also take batches of images.
+
+    With ``extra_models``, the masked image is also parcellated by each
+    additional DLMUSE model, so comparing models runs DLICV (and input
+    staging) only once per T1w image.
+
+    Workflow Graph
+        .. workflow::
+            :graph2use: orig
+            :simple_form: yes
+
+            from ncdlmuse.workflows.ncdlmuse.ncdlmuse import init_dlmuse_split_wf
+            wf = init_dlmuse_split_wf(name='dlmuse_sub_wf', device='cpu')
+
+    Parameters
+    ----------
+    name : str, optional
+        Workflow name (default: 'dlmuse_wf').
+    device : {'cpu', 'cuda', 'mps'}, optional
+        Device to use for model inference (default: 'cpu').
+    model_folder : str or None, optional
+        Path to the folder containing custom nnU-Net models (DLICV and DLMUSE).
+    all_in_gpu : bool, optional
+        Attempt to load and run the entire model on the GPU (if available) (default: False).
+    disable_tta : bool, optional
+        Disable Test-Time Augmentation for inference (default: False).
+    step_size : float or None, optional
+        Sliding-window step of the DLICV and DLMUSE inference (default: the tools' own).
+    clear_cache : bool, optional
+        Clear the model download cache before running (default: False).
+    backend : {'pytorch', 'onnx'}, optional
+        Run the stages with the tools' PyTorch models (default), or with ONNX
+        Runtime on the CPU (:py:class:`~ncdlmuse.interfaces.ncdlmuse.DLICVOnnx`
+        and :py:class:`~ncdlmuse.interfaces.ncdlmuse.DLMUSEOnnx`).
+    onnx_threads : int or None, optional
+        Intra-op threads of each ONNX Runtime session (default: one per core).
+    onnx_cache : str or None, optional
+        Directory of the ONNX graphs exported from the models (required with
+        ``backend='onnx'``).
+    mapping_tsv : str or None, optional
+        Table mapping consecutive indices to MUSE indices
+        (default: ``data/MUSE_mapping_consecutive_indices.tsv``).
+    roi_list_tsv : str or None, optional
+        Table of the (single and derived) MUSE ROIs whose volumes are computed
+        (default: ``data/MUSE_ROI_complete_list.tsv``).
+    prefetch_dir : str or None, optional
+        Directory where the T1w file may have been staged by the prefetcher.
+    extra_models : dict or None, optional
+        Additional DLMUSE model folders, by label.
+
+    Inputs
+    ------
+    t1w_file
+        Path to the T1w file.
+
+    Outputs
+    -------
+    dlmuse_segmentation
+        MUSE segmentation, in the space of the T1w image.
+    dlicv_mask
+        DLICV brain mask, in the space of the T1w image.
+    dlmuse_volumes
+        ROI volumes (TSV).
+    dlmuse_volumes_csv
+        ROI volumes, in the CSV format of NiChart_DLMUSE.
+    n_attempts
+        Number of attempts until the slowest stage succeeded.
+    <output>_<label>
+        The outputs above (but ``dlicv_mask``, which is shared) of each model
+        in ``extra_models``.
+
+    The outputs are named as those of
+    :py:class:`~ncdlmuse.interfaces.ncdlmuse.NiChartDLMUSE`, so both can be
+    connected alike.
+
+    """
+    from importlib import resources as importlib_resources
+
+    if backend == 'onnx':
+        from ...interfaces.ncdlmuse import DLICVOnnx as DLICV
+        from ...interfaces.ncdlmuse import DLMUSEOnnx as DLMUSE
+    else:
+        from ...interfaces.ncdlmuse import DLICV, DLMUSE
+
+    data_dir = importlib_resources.files('ncdlmuse.data')
+    if mapping_tsv is None:
+        mapping_tsv = str(data_dir / 'MUSE_mapping_consecutive_indices.tsv')
+    if roi_list_tsv is None:
+        roi_list_tsv = str(data_dir / 'MUSE_ROI_complete_list.tsv')
+
+    extra_models = extra_models or {}
+    model_fields = ['dlmuse_segmentation', 'dlmuse_volumes', 'dlmuse_volumes_csv', 'n_attempts']
+
+    workflow = Workflow(name=name)
+    workflow.__desc__ = """\
+Core NiChart_DLMUSE processing sub-workflow, with separate skull-stripping (DLICV)
+and parcellation (DLMUSE) stages.
+"""
+
+    inputnode = pe.Node(niu.IdentityInterface(fields=['t1w_file']), name='inputnode')
+    outputnode = pe.Node(
+        niu.IdentityInterface(
+            fields=[
+                'dlmuse_segmentation',
+                'dlicv_mask',
+                'dlmuse_volumes',
+                'dlmuse_volumes_csv',
+                'n_attempts',
+                *(f'{field}_{label}' for label in extra_models for field in model_fields),
+            ]
+        ),
+        name='outputnode',
+    )
+
+    reorient = pe.Node(
+        niu.Function(
+            input_names=['in_file', 'prefetch_dir'],
+            output_names=['out_file'],
+            function=_reorient_to_lps,
+        ),
+        name='reorient_node',
+    )
+    if prefetch_dir:
+        reorient.inputs.prefetch_dir = str(prefetch_dir)
+        reorient.config = {'execution': {'hash_method': 'timestamp'}}
+
+    tool_args = {
+        'device': device,
+        'all_in_gpu': all_in_gpu,
+        'disable_tta': disable_tta,
+        'clear_cache': clear_cache,
+    }
+    if model_folder is not None:
+        tool_args['model_folder'] = str(model_folder)
+    if step_size is not None:
+        tool_args['step_size'] = step_size
+    if backend == 'onnx':
+        tool_args['onnx_cache'] = str(onnx_cache)
+        if onnx_threads:
+            tool_args['onnx_threads'] = int(onnx_threads)
+    dlicv = pe.Node(DLICV(**tool_args), name='dlicv_node')
+    apply_mask = pe.Node(
+        niu.Function(
+            input_names=['in_file', 'mask_file'],
+            output_names=['out_file'],
+            function=_apply_mask,
+        ),
+        name='apply_mask_node',
+    )
+    workflow.connect([
+        (inputnode, reorient, [('t1w_file', 'in_file')]),
+        (reorient, dlicv, [('out_file', 'in_files')]),
+        (reorient, apply_mask, [('out_file', 'in_file')]),
+        (dlicv, apply_mask, [('out_files', 'mask_file')]),
+    ])  # fmt:skip
+
+    # One DLMUSE stage per model, all parcellating the same masked image
+    models = {'': model_folder, **{f'_{label}': folder for label, folder in extra_models.items()}}
+    for suffix, folder in models.items():
+        dlmuse = pe.Node(
+            DLMUSE(**{**tool_args, **({'model_folder': str(folder)} if folder else {})}),
+            name=f'dlmuse_node{suffix}',
+        )
+        dlmuse_outputs = pe.Node(
+            niu.Function(
+                input_names=[
+                    't1w_file',
+                    'mask_file',
+                    'segmentation_file',
+                    'mapping_tsv',
+                    'roi_list_tsv',
+                    'n_attempts',
+                ],
+                output_names=[
+                    'dlmuse_segmentation',
+                    'dlicv_mask',
+                    'dlmuse_volumes',
+                    'dlmuse_volumes_csv',
+                    'n_attempts',
+                ],
+                function=_dlmuse_outputs,
+            ),
+            name=f'dlmuse_outputs_node{suffix}',
+        )
+        dlmuse_outputs.inputs.mapping_tsv = str(mapping_tsv)
+        dlmuse_outputs.inputs.roi_list_tsv = str(roi_list_tsv)
+        merge_attempts = pe.Node(
+            niu.Merge(2), name=f'merge_attempts{suffix}', run_without_submitting=True
+        )
+
+        workflow.connect([
+            (apply_mask, dlmuse, [('out_file', 'in_files')]),
+            (inputnode, dlmuse_outputs, [('t1w_file', 't1w_file')]),
+            (dlicv, dlmuse_outputs, [('out_files', 'mask_file')]),
+            (dlmuse, dlmuse_outputs, [('out_files', 'segmentation_file')]),
+            (dlicv, merge_attempts, [('n_attempts', 'in1')]),
+            (dlmuse, merge_attempts, [('n_attempts', 'in2')]),
+            (merge_attempts, dlmuse_outputs, [('out', 'n_attempts')]),
+            (dlmuse_outputs, outputnode, [
+                (field, f'{field}{suffix}') for field in model_fields
+            ]),
+        ])  # fmt:skip
+        if not suffix:
+            workflow.connect(dlmuse_outputs, 'dlicv_mask', outputnode, 'dlicv_mask')
+
+    return workflow
+
+
+def _reorient_to_lps(in_file, prefetch_dir=None):
+    """Reorient an image to LPS (as the DLICV and DLMUSE models expect).
+
+    The output keeps the base name of ``in_file``, as ``<base>.nii.gz`` (the
+    stages only write outputs named after compressed inputs).
+    """
+    import os
+    from pathlib import Path
+
+    import nibabel as nb
+    from nibabel.orientations import axcodes2ornt, io_orientation, ornt_transform
+
+    from ncdlmuse.utils.prefetch import consume, release
+
+    staged = consume(in_file, prefetch_dir) if prefetch_dir else None
+    try:
+        img = nb.load(staged or in_file)
+        lps = img.as_reoriented(ornt_transform(io_orientation(img.affine), axcodes2ornt('LPS')))
+        base_name = Path(in_file).name.replace('.nii.gz', '').replace('.nii', '')
+        out_file = Path(os.getcwd()) / f'{base_name}.nii.gz'
+        lps.to_filename(out_file)
+    finally:
+        if staged is not None:
+            release(staged)
+    return str(out_file)
+
+
+def _apply_mask(in_file, mask_file):
+    """Zero the voxels of ``in_file`` outside ``mask_file``, as ``<base>.nii.gz``."""
+    import os
+    from pathlib import Path
+
+    import nibabel as nb
+    import numpy as np
+
+    img = nb.load(in_file)
+    mask = np.asanyarray(nb.load(mask_file).dataobj) > 0
+    masked = nb.Nifti1Image(img.get_fdata(dtype=np.float32) * mask, img.affine, img.header)
+    masked.set_data_dtype(np.float32)
+    base_name = Path(in_file).name.replace('.nii.gz', '').replace('.nii', '')
+    out_file = Path(os.getcwd()) / f'{base_name}.nii.gz'
+    masked.to_filename(out_file)
+    return str(out_file)
+
+
+def _dlmuse_outputs(t1w_file, mask_file, segmentation_file, mapping_tsv, roi_list_tsv, n_attempts):
+    """Write the outputs of NiChart_DLMUSE from those of its DLICV and DLMUSE stages.
+
+    The DLMUSE parcellation is relabelled from consecutive to MUSE indices,
+    the voxels of the brain mask it left unlabelled get label 1, and the
+    segmentation and mask are reoriented to the T1w image. The volumes (in
+    mm³) of the ROIs in ``roi_list_tsv`` are written both as a TSV and as a
+    CSV with the columns of NiChart_DLMUSE (``MRID`` and the ROI indices);
+    as in NiChart_DLMUSE, the cortical CSF (600) is the volume of label 1.
+    """
+    import os
+    from pathlib import Path
+
+    import nibabel as nb
+    import numpy as np
+    import pandas as pd
+    from nibabel.orientations import io_orientation, ornt_transform
+
+    t1w = nb.load(t1w_file)
+    base_name = Path(t1w_file).name.replace('.nii.gz', '').replace('.nii', '')
+    out_dir = Path(os.getcwd())
+
+    mapping = pd.read_csv(mapping_tsv, sep=None, engine='python')
+    lookup = np.zeros(mapping['IndexConsecutive'].max() + 1, dtype=np.uint8)
+    lookup[mapping['IndexConsecutive'].to_numpy()] = mapping['IndexMUSE'].to_numpy()
+    seg_img = nb.load(segmentation_file)
+    consecutive = np.asanyarray(seg_img.dataobj).astype(np.int64)
+    if consecutive.min() < 0 or consecutive.max() >= lookup.size:
+        raise ValueError(f'{segmentation_file} has labels missing from {mapping_tsv}.')
+    labels = lookup[consecutive]
+    mask = np.asanyarray(nb.load(mask_file).dataobj) > 0
+    labels[mask & (labels == 0)] = 1
+
+    to_t1w = ornt_transform(io_orientation(seg_img.affine), io_orientation(t1w.affine))
+    outputs = {
+        'dlmuse_segmentation': (labels, out_dir / f'{base_name}_DLMUSE.nii.gz'),
+        'dlicv_mask': (mask.astype(np.uint8), out_dir / f'{base_name}_DLICV.nii.gz'),
+    }
+    for data, out_file in outputs.values():
+        reoriented = nb.Nifti1Image(data, seg_img.affine).as_reoriented(to_t1w)
+        nb.Nifti1Image(np.asanyarray(reoriented.dataobj), t1w.affine).to_filename(out_file)
+
+    counts = np.bincount(labels.ravel(), minlength=int(lookup.max()) + 1)
+    known_labels = set(mapping['IndexMUSE'].tolist()) | {1}
+    # NiChart_DLMUSE derives the cortical CSF (600) from label 1: the voxels of
+    # the brain mask that DLMUSE left unlabelled
+    derived = {600: [1]}
+    voxel_volume = float(np.prod(t1w.header.get_zooms()[:3]))
+    volumes = {'MRID': base_name}
+    rois = pd.read_csv(roi_list_tsv, sep='\t')
+    for roi_id, components in zip(rois['ID'], rois['Consisting_of_ROIS'], strict=True):
+        if int(roi_id) in derived:
+            indices = derived[int(roi_id)]
+        elif pd.notna(components):
+            indices = [int(index) for index in str(components).split(',')]
+        else:
+            indices = [int(roi_id)]
+        unknown = sorted(set(indices) - known_labels)
+        if unknown:
+            raise ValueError(
+                f'ROI {roi_id} of {roi_list_tsv} consists of labels {unknown}, '
+                f'which are not in {mapping_tsv}.'
+            )
+        volumes[str(roi_id)] = voxel_volume * sum(int(counts[index]) for index in indices)
+    volumes = pd.DataFrame([volumes])
+    volumes_csv = out_dir / f'{base_name}_DLMUSE_Volumes.csv'
+    volumes.to_csv(volumes_csv, index=False)
+    volumes_tsv = out_dir / 'dlmuse_volumes.tsv'
+    volumes.to_csv(volumes_tsv, index=False, sep='\t')
+
+    return (
+        str(outputs['dlmuse_segmentation'][1]),
+        str(outputs['dlicv_mask'][1]),
+        str(volumes_tsv),
+        str(volumes_csv),
+        max(n_attempts),
+    )